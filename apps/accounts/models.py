@@ -203,6 +203,18 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def get_role_snapshot(self):
+        """
+        Permisos, módulos y navegación del rol (ver role_cache). Se memoiza en la
+        instancia, que vive lo que dura el request (request.user), y se comparte
+        entre requests a través de la caché.
+        """
+        memo = self.__dict__.get('_role_snapshot')
+        if memo is None or memo[0] != self.role_id:
+            from .role_cache import snapshot_rol
+            memo = self._role_snapshot = (self.role_id, snapshot_rol(self.role_id))
+        return memo[1]
+
     def get_user_groups(self):
         """Obtiene los grupos/módulos del usuario a través de su rol"""
         if self.role:
@@ -211,19 +223,15 @@ class User(AbstractUser):
 
     def has_module_access(self, group_name):
         """Verifica si el usuario tiene acceso a un módulo específico"""
-        return self.get_user_groups().filter(name=group_name).exists()
+        return group_name in self.get_role_snapshot()['modulos']
 
     def get_permissions(self):
         """Obtiene todos los permisos del usuario a través de su rol"""
-        if not self.role:
+        if not self.role_id:
             return set()
 
-        permissions = set()
-        for group in self.role.groups.all():
-            for permission in group.permissions.all():
-                permissions.add(permission)
-
-        return permissions
+        from django.contrib.auth.models import Permission
+        return set(Permission.objects.filter(group__roles__id=self.role_id).distinct())
     
     def has_perm(self, perm, obj=None):
         """
@@ -234,18 +242,11 @@ class User(AbstractUser):
             return True
         
         # Si no tiene permisos directos, verificar a través del rol
-        if not self.role:
+        if not self.role_id:
             return False
             
         # Verificar si tiene el permiso a través de su rol
-        for group in self.role.groups.all():
-            if group.permissions.filter(
-                content_type__app_label=perm.split('.')[0],
-                codename=perm.split('.')[1]
-            ).exists():
-                return True
-                
-        return False
+        return perm in self.get_role_snapshot()['permisos']
     
     def has_perms(self, perm_list, obj=None):
         """
@@ -258,43 +259,23 @@ class User(AbstractUser):
 
     def get_navigation_items(self):
         """Obtiene elementos de navegación del usuario"""
-        if not self.role:
+        if not self.role_id:
             return []
 
-        navigation_items = []
-        for group in self.role.groups.all():
-            try:
-                nav_item = group.navigation
-                if nav_item.is_active:
-                    navigation_items.append(nav_item)
-            except Navigation.DoesNotExist:
-                continue
+        # Ya ordenados por categoría y orden
+        return list(self.get_role_snapshot()['navegacion'])
 
-        # Ordenar por categoría y orden
-        return sorted(navigation_items, key=lambda x: (x.category.order, x.order))
+    def get_navigation_menu(self):
+        """Menú del rol agrupado por categorías, precalculado y cacheado por rol"""
+        return self.get_role_snapshot()['menu']
 
     def get_navigation_by_categories(self):
         """Obtiene elementos de navegación organizados por categorías"""
-        navigation_items = self.get_navigation_items()
-
-        # Organizar por categorías
-        categories_dict = {}
-        for nav_item in navigation_items:
-            category_name = nav_item.category.name
-            if category_name not in categories_dict:
-                categories_dict[category_name] = {
-                    'category': nav_item.category,
-                    'items': []
-                }
-            categories_dict[category_name]['items'].append(nav_item)
-
-        # Ordenar categorías por su campo order
-        ordered_categories = dict(sorted(
-            categories_dict.items(),
-            key=lambda x: x[1]['category'].order
-        ))
-
-        return ordered_categories
+        # {nombre: {'category': {...}, 'items': [...]}} en el orden de las categorías
+        return {
+            categoria['name']: {'category': categoria, 'items': categoria['items']}
+            for categoria in self.get_navigation_menu()
+        }
     
     def get_coordenadas(self):
         """Obtiene las coordenadas geográficas como tupla"""
@@ -387,75 +368,38 @@ class User(AbstractUser):
         return subordinados
     
     def _get_supervisores_jerarquia_normal(self, equipo_venta=None):
-        """Obtiene supervisores según jerarquía normal"""
-        supervisores = []
-        
-        # Buscar en vendedores (supervisor = team leader)
-        vendedores = self.vendedores.filter(activo=True)
-        if equipo_venta:
-            vendedores = vendedores.filter(
-                team_leader__jefe_venta__gerente_equipo__equipo_venta=equipo_venta
-            )
-        
-        for vendedor in vendedores:
-            supervisores.append((vendedor.team_leader.usuario, 'Team Leader (Jerarquía Normal)'))
-        
-        # Buscar en team leaders (supervisor = jefe venta)
-        team_leaders = self.team_leaders.filter(activo=True)
-        if equipo_venta:
-            team_leaders = team_leaders.filter(
-                jefe_venta__gerente_equipo__equipo_venta=equipo_venta
-            )
-        
-        for tl in team_leaders:
-            supervisores.append((tl.jefe_venta.usuario, 'Jefe de Venta (Jerarquía Normal)'))
-        
-        # Buscar en jefes de venta (supervisor = gerente)
-        jefes_venta = self.jefe_ventas.filter(activo=True)
-        if equipo_venta:
-            jefes_venta = jefes_venta.filter(
-                gerente_equipo__equipo_venta=equipo_venta
-            )
-        
-        for jefe in jefes_venta:
-            supervisores.append((jefe.gerente_equipo.usuario, 'Gerente de Equipo (Jerarquía Normal)'))
-        
-        return supervisores
+        """Obtiene supervisores según jerarquía normal (índice de jerarquía, una consulta de usuarios)"""
+        return self._get_relacionados_jerarquia_normal('supervisor', equipo_venta)
     
     def _get_subordinados_jerarquia_normal(self, equipo_venta=None):
         """Obtiene subordinados según jerarquía normal"""
-        subordinados = []
-        
-        # Si es gerente (subordinados = jefes de venta)
-        gerencias = self.gerente_equipos.filter(activo=True)
-        if equipo_venta:
-            gerencias = gerencias.filter(equipo_venta=equipo_venta)
-        
-        for gerencia in gerencias:
-            for jefe in gerencia.jefeventas.filter(activo=True):
-                subordinados.append((jefe.usuario, 'Jefe de Venta (Jerarquía Normal)'))
-        
-        # Si es jefe de venta (subordinados = team leaders)
-        jefaturas = self.jefe_ventas.filter(activo=True)
-        if equipo_venta:
-            jefaturas = jefaturas.filter(gerente_equipo__equipo_venta=equipo_venta)
+        return self._get_relacionados_jerarquia_normal('subordinate', equipo_venta)
+    
+    def _get_relacionados_jerarquia_normal(self, lado, equipo_venta=None):
+        """
+        Supervisores (lado='supervisor') o subordinados (lado='subordinate')
+        inmediatos por relaciones NORMAL activas: [(usuario, descripción)]
+        """
+        from apps.sales_team_management.hierarchy_index import get_hierarchy_index
         
-        for jefatura in jefaturas:
-            for tl in jefatura.teamleaders.filter(activo=True):
-                subordinados.append((tl.usuario, 'Team Leader (Jerarquía Normal)'))
+        index = get_hierarchy_index()
+        unit_id = equipo_venta.pk if equipo_venta else None
         
-        # Si es team leader (subordinados = vendedores)
-        team_leaderships = self.team_leaders.filter(activo=True)
-        if equipo_venta:
-            team_leaderships = team_leaderships.filter(
-                jefe_venta__gerente_equipo__equipo_venta=equipo_venta
+        relacionados = []
+        for membership_id in index.user_memberships(self.pk, unit_id):
+            relaciones = (
+                index.supervisor_relations(membership_id) if lado == 'supervisor'
+                else index.subordinate_relations(membership_id)
             )
+            for relacion in relaciones:
+                if relacion.relation_type == 'NORMAL':
+                    relacionados.append(index.memberships[getattr(relacion, lado)])
         
-        for tl in team_leaderships:
-            for vendedor in tl.vendedores.filter(activo=True):
-                subordinados.append((vendedor.usuario, 'Vendedor (Jerarquía Normal)'))
-        
-        return subordinados
+        usuarios = User.objects.in_bulk({info.user_id for info in relacionados})
+        return [
+            (usuarios[info.user_id], f'{info.position_name} (Jerarquía Normal)')
+            for info in relacionados if info.user_id in usuarios
+        ]
     
     def get_equipo_venta(self):
         """Obtiene el equipo de venta al que pertenece este usuario"""
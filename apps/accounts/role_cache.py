@@ -0,0 +1,147 @@
+"""
+Caché de permisos por rol: permisos, módulos y navegación de cada Role
+calculados en dos consultas y guardados en la caché de Django bajo una
+versión por rol (invalidada por signals al cambiar roles, grupos o navegación).
+"""
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ROLE_CACHE_TIMEOUT = getattr(settings, 'ROLE_CACHE_TIMEOUT', 60 * 60)
+
+PREFIX = 'accounts:rol'
+# Versión compartida por todos los roles (cambios de categorías del menú)
+GLOBAL = 'global'
+
+# Snapshot de un usuario sin rol
+SNAPSHOT_VACIO = {
+    'permisos': frozenset(),
+    'modulos': frozenset(),
+    'navegacion': [],
+    'menu': [],
+}
+
+
+def _clave_version(rol_id):
+    return f'{PREFIX}:version:{rol_id}'
+
+
+def _versiones(rol_id):
+    """Versión del rol y versión global; crea las que no existen"""
+    claves = [_clave_version(rol_id), _clave_version(GLOBAL)]
+    existentes = cache.get_many(claves)
+    nuevas = {clave: uuid.uuid4().hex for clave in claves if clave not in existentes}
+    if nuevas:
+        cache.set_many(nuevas, timeout=None)
+    return [existentes.get(clave) or nuevas[clave] for clave in claves]
+
+
+def calcular_snapshot(rol_id):
+    """Permisos, módulos y navegación ordenada del rol en dos consultas"""
+    from django.contrib.auth.models import Group, Permission
+
+    permisos = frozenset(
+        f'{app_label}.{codename}'
+        for app_label, codename in Permission.objects.filter(
+            group__roles__id=rol_id
+        ).values_list('content_type__app_label', 'codename').distinct()
+    )
+
+    modulos = set()
+    navegacion = []
+    grupos = Group.objects.filter(roles__id=rol_id).select_related('navigation__category')
+    for grupo in grupos:
+        modulos.add(grupo.name)
+        nav_item = getattr(grupo, 'navigation', None)
+        if nav_item is not None and nav_item.is_active:
+            navegacion.append(nav_item)
+
+    # Ordenar por categoría y orden (mismo criterio que User.get_navigation_items)
+    navegacion.sort(key=lambda x: (x.category.order, x.order))
+
+    return {
+        'permisos': permisos,
+        'modulos': frozenset(modulos),
+        'navegacion': navegacion,
+        'menu': construir_menu(navegacion),
+    }
+
+
+def construir_menu(navegacion):
+    """
+    Menú del sidebar ya agrupado y ordenado por categoría, como datos planos
+    (sin instancias de modelos) para que la plantilla no haga consultas:
+    [{'name', 'icon', 'color', 'description', 'order', 'items': [{'name', 'url', 'icon'}]}]
+    """
+    categorias = {}
+    for nav_item in navegacion:
+        categoria = nav_item.category
+        if categoria.name not in categorias:
+            categorias[categoria.name] = {
+                'name': categoria.name,
+                'icon': categoria.icon,
+                'color': categoria.color,
+                'description': categoria.description,
+                'order': categoria.order,
+                'items': [],
+            }
+        categorias[categoria.name]['items'].append({
+            'name': nav_item.name,
+            'url': nav_item.url,
+            'icon': nav_item.icon,
+        })
+
+    # Ordenar categorías por su campo order (orden estable, como el menú original)
+    return sorted(categorias.values(), key=lambda categoria: categoria['order'])
+
+
+def snapshot_rol(rol_id):
+    """Snapshot del rol desde la caché (se calcula si falta o cambió su versión)"""
+    if rol_id is None:
+        return SNAPSHOT_VACIO
+
+    try:
+        version_rol, version_global = _versiones(rol_id)
+        clave = f'{PREFIX}:snapshot:{rol_id}:{version_rol}:{version_global}'
+        snapshot = cache.get(clave)
+    except Exception as e:
+        logger.warning(f"Caché de roles no disponible: {e}")
+        return calcular_snapshot(rol_id)
+
+    if snapshot is None:
+        snapshot = calcular_snapshot(rol_id)
+        try:
+            cache.set(clave, snapshot, timeout=ROLE_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el rol {rol_id} en caché: {e}")
+    return snapshot
+
+
+def invalidar_roles(rol_ids=()):
+    """Invalida los snapshots de los roles indicados (sin ids: todos los roles)"""
+    from django.db import transaction
+
+    claves = [_clave_version(rol_id) for rol_id in rol_ids] or [_clave_version(GLOBAL)]
+
+    def cambiar_versiones():
+        try:
+            cache.set_many({clave: uuid.uuid4().hex for clave in claves}, timeout=None)
+        except Exception as e:
+            logger.warning(f"No se pudo invalidar la caché de roles: {e}")
+
+    cambiar_versiones()
+    # Repetir al confirmar para descartar snapshots calculados con datos previos al commit
+    transaction.on_commit(cambiar_versiones)
+
+
+def invalidar_roles_de_grupos(group_ids):
+    """Invalida los roles que incluyen alguno de los grupos"""
+    from .models import Role
+
+    rol_ids = list(Role.objects.filter(groups__id__in=list(group_ids)).values_list('id', flat=True).distinct())
+    if rol_ids:
+        invalidar_roles(rol_ids)
@@ -1,10 +1,12 @@
 """
 Signals para asignación automática de roles basada en posiciones jerárquicas
 """
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.models import Group
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.apps import apps
-from .models import Role
+from .models import MenuCategory, Navigation, Role
+from .role_cache import invalidar_roles, invalidar_roles_de_grupos
 
 
 # Mapeo de modelos a roles
@@ -171,4 +173,66 @@ def gerente_proyecto_deleted(sender, instance, **kwargs):
 @receiver(post_delete, sender='real_estate_projects.JefeProyecto')  
 def jefe_proyecto_deleted(sender, instance, **kwargs):
     """Signal cuando se elimina un JefeProyecto"""
-    update_user_role(instance.usuario)
\ No newline at end of file
+    update_user_role(instance.usuario)
+
+
+# ============================================================
+# INVALIDACIÓN DE LA CACHÉ DE PERMISOS POR ROL (role_cache)
+# ============================================================
+
+M2M_CAMBIOS = ('post_add', 'post_remove', 'post_clear')
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_changed(sender, instance, **kwargs):
+    """Signal cuando se crea, edita o elimina un Role"""
+    invalidar_roles([instance.pk])
+
+
+@receiver(m2m_changed, sender=Role.groups.through)
+def role_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Signal cuando cambian los módulos (grupos) de un rol"""
+    if action not in M2M_CAMBIOS:
+        return
+    if not reverse:
+        invalidar_roles([instance.pk])
+    elif pk_set:
+        invalidar_roles(pk_set)
+    else:
+        # group.roles.clear(): no se conocen los roles afectados
+        invalidar_roles()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Signal cuando cambian los permisos de un grupo"""
+    if action not in M2M_CAMBIOS:
+        return
+    if not reverse:
+        invalidar_roles_de_grupos([instance.pk])
+    elif pk_set:
+        invalidar_roles_de_grupos(pk_set)
+    else:
+        invalidar_roles()
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Signal cuando se renombra o elimina un grupo (antes de perder sus roles)"""
+    invalidar_roles_de_grupos([instance.pk])
+
+
+@receiver(post_save, sender=Navigation)
+@receiver(post_delete, sender=Navigation)
+def navigation_changed(sender, instance, **kwargs):
+    """Signal cuando cambia un elemento de navegación"""
+    invalidar_roles_de_grupos([instance.group_id])
+
+
+@receiver(post_save, sender=MenuCategory)
+@receiver(post_delete, sender=MenuCategory)
+def menu_category_changed(sender, instance, **kwargs):
+    """Signal cuando cambia una categoría del menú (afecta a todos los roles)"""
+    invalidar_roles()
@@ -4,7 +4,8 @@ from .models import (
     WhatsAppConfig, Cliente, Lead, Conversacion, Mensaje, TipoPago,
     ProcesoVenta, VentaInmutable, Contrato, SeguimientoLead,
     AsignacionLead, Cita, WhatsAppTemplate, CampañaMarketing,
-    LeadDistributionConfig, LeadAssignment
+    LeadDistributionConfig, LeadAssignment, WebhookEvent, AudioTranscode,
+    LeadDistributionCounter
 )
 
 
@@ -186,4 +187,42 @@ class LeadAssignmentAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).select_related(
             'lead__cliente', 'organizational_unit', 'assigned_to_user', 'assigned_by'
-        )
\ No newline at end of file
+        )
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'numero_telefono', 'estado', 'intentos', 'disponible_at', 'worker', 'created_at']
+    list_filter = ['estado', 'created_at']
+    search_fields = ['numero_telefono', 'ultimo_error']
+    readonly_fields = ['created_at', 'procesado_at', 'bloqueado_at']
+    actions = ['reencolar']
+
+    @admin.action(description='Volver a encolar los eventos descartados seleccionados')
+    def reencolar(self, request, queryset):
+        from .services.webhook_queue_service import WebhookQueueService
+
+        reencolados = WebhookQueueService.requeue_dead(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f'{reencolados} eventos vueltos a encolar')
+
+
+@admin.register(AudioTranscode)
+class AudioTranscodeAdmin(admin.ModelAdmin):
+    list_display = ['id', 'mensaje', 'estado', 'intentos', 'duracion_ms', 'worker', 'created_at', 'terminado_at']
+    list_filter = ['estado', 'created_at']
+    search_fields = ['hash_contenido', 'ultimo_error']
+    readonly_fields = ['created_at', 'iniciado_at', 'terminado_at']
+    raw_id_fields = ['mensaje']
+    actions = ['reencolar']
+
+    @admin.action(description='Volver a encolar las conversiones seleccionadas')
+    def reencolar(self, request, queryset):
+        reencolados = queryset.exclude(estado='procesando').update(estado='pendiente', intentos=0)
+        self.message_user(request, f'{reencolados} conversiones vueltas a encolar')
+
+
+@admin.register(LeadDistributionCounter)
+class LeadDistributionCounterAdmin(admin.ModelAdmin):
+    list_display = ['organizational_unit', 'periodo', 'fecha', 'total', 'updated_at']
+    list_filter = ['periodo', 'fecha']
+    readonly_fields = ['organizational_unit', 'periodo', 'fecha', 'total', 'updated_at']
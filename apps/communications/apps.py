@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class CommunicationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.communications'
-    verbose_name = 'Communications & CRM'
\ No newline at end of file
+    verbose_name = 'Communications & CRM'
+
+    def ready(self):
+        """Registra los signals del estado desnormalizado de conversaciones"""
+        from . import signals
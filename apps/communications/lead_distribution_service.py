@@ -1,7 +1,13 @@
 # apps/communications/lead_distribution_service.py
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
 from django.utils import timezone
 from decimal import Decimal
 from .models import LeadDistributionConfig, LeadAssignment, Lead
+from .services.lead_counter_service import LeadCounterService
+from .services.conversation_state_service import ConversationStateService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,66 +19,50 @@ class LeadDistributionService:
     """
     
     def __init__(self):
-        self.today = timezone.now().date()
+        # Fecha local: los contadores y assigned_date__date usan la zona horaria del proyecto
+        self.today = timezone.localdate()
     
-    def get_next_sales_force_for_lead(self, lead=None):
+    def get_next_sales_force_for_lead(self, lead=None, lock=False):
         """
         Algoritmo de Contador Acumulativo:
         
-        1. Obtiene fuerzas de venta elegibles (activas + dentro de límites)
-        2. Calcula total de leads asignados HOY
+        1. Lee los contadores de HOY y de la semana (LeadCounterService)
+        2. Obtiene fuerzas de venta elegibles (activas + dentro de límites)
         3. Para cada fuerza: calcula cuántos DEBERÍA tener vs cuántos TIENE
         4. Asigna al que tenga mayor DÉFICIT
         
+        Con lock=True (dentro de una transacción) bloquea antes las configuraciones
+        activas, así la lectura de contadores y la asignación son un solo paso.
+        
         Returns:
             LeadDistributionConfig o None
         """
         try:
-            # 1. Obtener configuraciones elegibles
-            eligible_configs = self._get_eligible_configs()
+            if lock:
+                self._lock_configs()
+            
+            # 1. Contadores del día y de la semana y total de HOY (una consulta,
+            #    sin COUNT por fuerza de venta)
+            leads_today, leads_week, total_leads_today = LeadCounterService.get_counts(self.today)
+            
+            # 2. Obtener configuraciones elegibles según los contadores
+            eligible_configs = self._get_eligible_configs(leads_today, leads_week)
             
             if not eligible_configs:
                 logger.warning("No hay fuerzas de venta elegibles para recibir leads")
                 return None
             
-            # 2. Obtener total de leads asignados HOY
-            total_leads_today = LeadAssignment.objects.filter(
-                assigned_date__date=self.today,
-                is_active=True
-            ).count()
-            
             # 3. Calcular déficits y encontrar el ganador
-            best_config = None
-            max_deficit = -999999  # Empezar con valor muy bajo
-            
             logger.info(f"Calculando distribución para lead #{total_leads_today + 1}")
-            
-            for config in eligible_configs:
-                # Lo que DEBERÍA tener después de asignar este lead
-                expected_after_assignment = (
-                    float(config.distribution_percentage) / 100
-                ) * (total_leads_today + 1)
-                
-                # Lo que TIENE actualmente
-                current_leads = config.current_leads_today
-                
-                # Su déficit después de la asignación
-                deficit = expected_after_assignment - current_leads
-                
-                logger.info(
-                    f"  {config.organizational_unit.name}: "
-                    f"{config.distribution_percentage}% | "
-                    f"Debería: {expected_after_assignment:.2f} | "
-                    f"Tiene: {current_leads} | "
-                    f"Déficit: {deficit:.2f}"
-                )
-                
-                # Elegir el que tenga mayor déficit
-                if deficit > max_deficit:
-                    max_deficit = deficit
-                    best_config = config
+            best_config, max_deficit = self._select_by_deficit(
+                eligible_configs, leads_today, total_leads_today, verbose=True
+            )
             
             if best_config:
+                # Déficit actual (antes de asignar), para la nota de la asignación
+                best_config.deficit = (
+                    float(best_config.distribution_percentage) / 100
+                ) * total_leads_today - leads_today.get(best_config.organizational_unit_id, 0)
                 logger.info(
                     f"✓ Elegido: {best_config.organizational_unit.name} "
                     f"(déficit: {max_deficit:.2f})"
@@ -86,11 +76,67 @@ class LeadDistributionService:
             logger.error(f"Error en algoritmo de distribución: {str(e)}")
             return None
     
-    def _get_eligible_configs(self):
+    def _select_by_deficit(self, configs, leads_today, total_leads_today, verbose=False):
+        """
+        Fuerza de venta con mayor déficit después de asignar el próximo lead
+        (en empate gana la primera según el orden de configs).
+        Devuelve (config, déficit) o (None, None).
+        """
+        best_config = None
+        max_deficit = -999999  # Empezar con valor muy bajo
+        
+        for config in configs:
+            # Lo que DEBERÍA tener después de asignar este lead
+            expected_after_assignment = (
+                float(config.distribution_percentage) / 100
+            ) * (total_leads_today + 1)
+            
+            # Lo que TIENE actualmente
+            current_leads = leads_today.get(config.organizational_unit_id, 0)
+            
+            # Su déficit después de la asignación
+            deficit = expected_after_assignment - current_leads
+            
+            if verbose:
+                logger.info(
+                    f"  {config.organizational_unit.name}: "
+                    f"{config.distribution_percentage}% | "
+                    f"Debería: {expected_after_assignment:.2f} | "
+                    f"Tiene: {current_leads} | "
+                    f"Déficit: {deficit:.2f}"
+                )
+            
+            # Elegir el que tenga mayor déficit
+            if deficit > max_deficit:
+                max_deficit = deficit
+                best_config = config
+        
+        return best_config, (max_deficit if best_config else None)
+    
+    def _within_limits(self, config, today_count, week_count):
+        """Verifica los límites diario y semanal de la configuración"""
+        return (
+            (not config.max_leads_per_day or today_count < config.max_leads_per_day)
+            and (not config.max_leads_per_week or week_count < config.max_leads_per_week)
+        )
+    
+    def _lock_configs(self):
+        """
+        Bloquea (SELECT ... FOR UPDATE, en orden de id) las configuraciones activas
+        hasta el fin de la transacción: los demás distribuidores esperan y luego leen
+        los contadores ya actualizados
+        """
+        list(
+            LeadDistributionConfig.objects.select_for_update().filter(
+                is_active_for_leads=True
+            ).order_by('id').values_list('id', flat=True)
+        )
+    
+    def _get_eligible_configs(self, leads_today, leads_week):
         """
         Obtiene configuraciones elegibles para recibir leads:
         - Activas para leads
-        - Dentro de límites diarios/semanales
+        - Dentro de límites diarios/semanales (según los contadores)
         - Ordenadas por nombre de unidad organizacional
         """
         configs = LeadDistributionConfig.objects.filter(
@@ -99,14 +145,17 @@ class LeadDistributionService:
         
         eligible = []
         for config in configs:
-            if config.can_receive_more_leads:
+            today_count = leads_today.get(config.organizational_unit_id, 0)
+            week_count = leads_week.get(config.organizational_unit_id, 0)
+            
+            if self._within_limits(config, today_count, week_count):
                 eligible.append(config)
             else:
                 logger.info(
                     f"Saltando {config.organizational_unit.name}: "
-                    f"límites alcanzados (día: {config.current_leads_today}/"
+                    f"límites alcanzados (día: {today_count}/"
                     f"{config.max_leads_per_day or '∞'}, "
-                    f"semana: {config.current_leads_this_week}/"
+                    f"semana: {week_count}/"
                     f"{config.max_leads_per_week or '∞'})"
                 )
         
@@ -125,24 +174,28 @@ class LeadDistributionService:
             LeadAssignment o None
         """
         try:
-            # 1. Obtener fuerza de venta usando el algoritmo
-            selected_config = self.get_next_sales_force_for_lead(lead)
-            
-            if not selected_config:
-                logger.warning(f"No se pudo asignar lead #{lead.id}: no hay fuerzas disponibles")
-                return None
-            
-            # 2. Crear la asignación
-            assignment = LeadAssignment.objects.create(
-                lead=lead,
-                organizational_unit=selected_config.organizational_unit,
-                assignment_type=assignment_type,
-                status='ASSIGNED',
-                assigned_by=assigned_by_user,  # Puede ser None para asignaciones automáticas
-                notes=f'Asignado {"automáticamente" if assigned_by_user is None else "manualmente"} '
-                      f'usando algoritmo de Contador Acumulativo. '
-                      f'Déficit: {self._calculate_deficit(selected_config):.2f}'
-            )
+            # Elección e inserción como un solo paso atómico: con las configuraciones
+            # bloqueadas dos workers no pueden leer los mismos contadores y elegir
+            # la misma fuerza de venta
+            with transaction.atomic():
+                # 1. Obtener fuerza de venta usando el algoritmo
+                selected_config = self.get_next_sales_force_for_lead(lead, lock=True)
+                
+                if not selected_config:
+                    logger.warning(f"No se pudo asignar lead #{lead.id}: no hay fuerzas disponibles")
+                    return None
+                
+                # 2. Crear la asignación (actualiza los contadores en la misma transacción)
+                assignment = LeadAssignment.objects.create(
+                    lead=lead,
+                    organizational_unit=selected_config.organizational_unit,
+                    assignment_type=assignment_type,
+                    status='ASSIGNED',
+                    assigned_by=assigned_by_user,  # Puede ser None para asignaciones automáticas
+                    notes=f'Asignado {"automáticamente" if assigned_by_user is None else "manualmente"} '
+                          f'usando algoritmo de Contador Acumulativo. '
+                          f'Déficit: {selected_config.deficit:.2f}'
+                )
             
             logger.info(
                 f"✓ Lead #{lead.id} asignado a {selected_config.organizational_unit.name} "
@@ -155,21 +208,162 @@ class LeadDistributionService:
             logger.error(f"Error asignando lead #{lead.id}: {str(e)}")
             return None
     
+    def plan_bulk_distribution(self, leads, exclude_unit_ids=()):
+        """
+        Reparte en memoria una lista de leads con el mismo Contador Acumulativo y
+        los mismos límites que assign_lead_to_sales_force, lead por lead en el
+        orden recibido, sin escribir nada (sirve también como dry-run).
+        
+        Las asignaciones activas previas de cada lead se descuentan después de
+        elegirle fuerza, igual que al desactivarlas LeadAssignment.save().
+        
+        Args:
+            leads: lista o queryset de Lead
+            exclude_unit_ids: unidades que no deben recibir leads (reasignaciones)
+            
+        Returns:
+            dict con 'assignments' [(lead, config, déficit)], 'unassigned' [lead],
+            'configs' y los contadores de hoy antes ('leads_today_before') y
+            después ('leads_today_after')
+        """
+        leads = list(leads)
+        exclude_unit_ids = set(exclude_unit_ids)
+        week_start = self.today - timedelta(days=self.today.weekday())
+        
+        leads_today, leads_week, total_leads_today = LeadCounterService.get_counts(self.today)
+        leads_today_before = dict(leads_today)
+        leads_today, leads_week = Counter(leads_today), Counter(leads_week)
+        
+        configs = [
+            config for config in LeadDistributionConfig.objects.filter(
+                is_active_for_leads=True
+            ).select_related('organizational_unit').order_by('organizational_unit__name')
+            if config.organizational_unit_id not in exclude_unit_ids
+        ]
+        
+        # Asignaciones activas que se desactivarán: (unidad, fecha local) por lead
+        previous = {}
+        for lead_id, unit_id, assigned_date in LeadAssignment.objects.filter(
+            lead_id__in=[lead.id for lead in leads], is_active=True
+        ).values_list('lead_id', 'organizational_unit_id', 'assigned_date'):
+            previous.setdefault(lead_id, []).append(
+                (unit_id, timezone.localdate(assigned_date))
+            )
+        
+        assignments, unassigned = [], []
+        for lead in leads:
+            eligible = [
+                config for config in configs
+                if self._within_limits(
+                    config,
+                    leads_today[config.organizational_unit_id],
+                    leads_week[config.organizational_unit_id]
+                )
+            ]
+            best_config, _ = self._select_by_deficit(eligible, leads_today, total_leads_today)
+            
+            if not best_config:
+                unassigned.append(lead)
+                continue
+            
+            unit_id = best_config.organizational_unit_id
+            # Déficit actual (antes de asignar), como en la asignación individual
+            deficit = (
+                float(best_config.distribution_percentage) / 100
+            ) * total_leads_today - leads_today[unit_id]
+            assignments.append((lead, best_config, deficit))
+            
+            leads_today[unit_id] += 1
+            leads_week[unit_id] += 1
+            total_leads_today += 1
+            
+            for previous_unit_id, previous_day in previous.pop(lead.id, ()):
+                if previous_day == self.today:
+                    leads_today[previous_unit_id] -= 1
+                    total_leads_today -= 1
+                if previous_day - timedelta(days=previous_day.weekday()) == week_start:
+                    leads_week[previous_unit_id] -= 1
+        
+        return {
+            'assignments': assignments,
+            'unassigned': unassigned,
+            'configs': configs,
+            'leads_today_before': leads_today_before,
+            'leads_today_after': {unit_id: total for unit_id, total in leads_today.items() if total},
+        }
+    
+    def assign_leads_bulk(self, leads, assigned_by_user=None, assignment_type='AUTOMATIC',
+                          exclude_unit_ids=(), batch_size=1000):
+        """
+        Asigna muchos leads de una vez (backlog, importación de campañas,
+        reasignación de una fuerza de venta): el reparto se calcula en memoria
+        con plan_bulk_distribution y se escribe con un UPDATE para desactivar
+        las asignaciones previas, bulk_create de las nuevas y un ajuste de
+        contadores por unidad, todo en una transacción con las configuraciones
+        bloqueadas.
+        
+        bulk_create no dispara señales: los contadores y el estado de las
+        conversaciones se actualizan aquí.
+        
+        Returns:
+            el dict de plan_bulk_distribution con 'created' [LeadAssignment]
+        """
+        with transaction.atomic():
+            self._lock_configs()
+            plan = self.plan_bulk_distribution(leads, exclude_unit_ids)
+            plan['created'] = []
+            
+            if not plan['assignments']:
+                return plan
+            
+            lead_ids = [lead.id for lead, _, _ in plan['assignments']]
+            LeadCounterService.deactivate(LeadAssignment.objects.filter(lead_id__in=lead_ids))
+            
+            modo = "automáticamente" if assigned_by_user is None else "manualmente"
+            plan['created'] = LeadAssignment.objects.bulk_create([
+                LeadAssignment(
+                    lead=lead,
+                    organizational_unit=config.organizational_unit,
+                    assignment_type=assignment_type,
+                    status='ASSIGNED',
+                    assigned_by=assigned_by_user,
+                    notes=f'Asignado {modo} usando algoritmo de Contador Acumulativo. '
+                          f'Déficit: {deficit:.2f}',
+                    distribution_config_snapshot={
+                        'distribution_percentage': float(config.distribution_percentage),
+                        'max_leads_per_day': config.max_leads_per_day,
+                        'max_leads_per_week': config.max_leads_per_week,
+                        'assigned_at': None
+                    },
+                )
+                for lead, config, deficit in plan['assignments']
+            ], batch_size=batch_size)
+            
+            LeadCounterService.apply(Counter(
+                LeadCounterService.counter_key(assignment) for assignment in plan['created']
+            ))
+            ConversationStateService.refresh_for_leads(lead_ids)
+        
+        logger.info(
+            f"✓ {len(plan['created'])} leads asignados en bloque "
+            f"({len(plan['unassigned'])} sin fuerza disponible)"
+        )
+        return plan
+    
     def _calculate_deficit(self, config):
         """Calcula el déficit actual de una configuración"""
-        total_today = LeadAssignment.objects.filter(
-            assigned_date__date=self.today,
-            is_active=True
-        ).count()
+        leads_today, _, total_today = LeadCounterService.get_counts(self.today)
         
         expected = (float(config.distribution_percentage) / 100) * total_today
-        actual = config.current_leads_today
+        actual = leads_today.get(config.organizational_unit_id, 0)
         
         return expected - actual
     
     def simulate_distribution(self, num_leads=100):
         """
-        Simula la distribución de N leads para testing
+        Simula la distribución de N leads en un día con las configuraciones
+        activas y sus límites (ver DistributionSimulationService para series de
+        varios días)
         
         Args:
             num_leads: Número de leads a simular
@@ -177,65 +371,36 @@ class LeadDistributionService:
         Returns:
             dict con resultados de la simulación
         """
+        from .services.distribution_simulation_service import DistributionSimulationService
+        
         # Obtener configuraciones activas
         active_configs = LeadDistributionConfig.objects.filter(
             is_active_for_leads=True
-        ).order_by('organizational_unit__name')
+        ).select_related('organizational_unit').order_by('organizational_unit__name')
         
         if not active_configs:
             return {'error': 'No hay configuraciones activas'}
         
-        # Resetear contadores para simulación
+        units = DistributionSimulationService.get_units(active_configs)
+        result = DistributionSimulationService.simulate(units, [num_leads], self.today)
+        summary = DistributionSimulationService.summary(result)
+        
         simulation_results = {}
-        for config in active_configs:
-            simulation_results[config.organizational_unit.name] = {
-                'config': config,
-                'expected_percentage': float(config.distribution_percentage),
-                'assigned_count': 0,
-                'final_percentage': 0.0,
-                'assignments': []  # Para tracking detallado
+        for unit, data in zip(units, summary['units']):
+            final_percentage = (data['assigned'] / num_leads) * 100 if num_leads else 0.0
+            simulation_results[unit['name']] = {
+                'expected_percentage': unit['distribution_percentage'],
+                'assigned_count': data['assigned'],
+                'final_percentage': final_percentage,
+                'max_deviation': data['max_deviation'],
+                'accuracy': 100 - abs(unit['distribution_percentage'] - final_percentage),
             }
         
-        # Simular asignación lead por lead
-        for lead_num in range(1, num_leads + 1):
-            # Calcular déficits actuales
-            best_unit = None
-            max_deficit = -999999
-            
-            for unit_name, data in simulation_results.items():
-                config = data['config']
-                
-                # Lo que debería tener
-                expected = (data['expected_percentage'] / 100) * lead_num
-                
-                # Lo que tiene
-                current = data['assigned_count']
-                
-                # Déficit
-                deficit = expected - current
-                
-                if deficit > max_deficit:
-                    max_deficit = deficit
-                    best_unit = unit_name
-            
-            # Asignar al ganador
-            if best_unit:
-                simulation_results[best_unit]['assigned_count'] += 1
-                simulation_results[best_unit]['assignments'].append({
-                    'lead_number': lead_num,
-                    'deficit': max_deficit
-                })
-        
-        # Calcular porcentajes finales
-        for unit_name, data in simulation_results.items():
-            data['final_percentage'] = (data['assigned_count'] / num_leads) * 100
-            data['accuracy'] = 100 - abs(data['expected_percentage'] - data['final_percentage'])
-        
         return {
             'total_leads': num_leads,
             'results': simulation_results,
             'summary': {
-                'total_assigned': sum(data['assigned_count'] for data in simulation_results.values()),
+                'total_assigned': summary['total_assigned'],
                 'average_accuracy': sum(data['accuracy'] for data in simulation_results.values()) / len(simulation_results)
             }
         }
@@ -244,21 +409,18 @@ class LeadDistributionService:
         """
         Obtiene estadísticas actuales de distribución para el día
         """
-        total_today = LeadAssignment.objects.filter(
-            assigned_date__date=self.today,
-            is_active=True
-        ).count()
+        leads_today, _, total_today = LeadCounterService.get_counts(self.today)
         
         if total_today == 0:
             return {'message': 'No hay leads asignados hoy'}
         
         active_configs = LeadDistributionConfig.objects.filter(
             is_active_for_leads=True
-        )
+        ).select_related('organizational_unit')
         
         stats = {}
         for config in active_configs:
-            current_leads = config.current_leads_today
+            current_leads = leads_today.get(config.organizational_unit_id, 0)
             expected_leads = (float(config.distribution_percentage) / 100) * total_today
             deficit = expected_leads - current_leads
             
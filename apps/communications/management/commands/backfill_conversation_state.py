@@ -0,0 +1,39 @@
+# apps/communications/management/commands/backfill_conversation_state.py
+from django.core.management.base import BaseCommand
+
+from apps.communications.models import Conversacion
+from apps.communications.services.conversation_state_service import ConversationStateService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde los mensajes el estado desnormalizado de las conversaciones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Conversaciones por lote (default: 500)',
+        )
+        parser.add_argument(
+            '--conversation',
+            type=int,
+            action='append',
+            help='Solo recalcular la conversación indicada (se puede repetir)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        conversation_ids = Conversacion.objects.order_by('id').values_list('id', flat=True)
+        if options['conversation']:
+            conversation_ids = conversation_ids.filter(id__in=options['conversation'])
+        conversation_ids = list(conversation_ids)
+
+        self.stdout.write(f'🔄 Recalculando {len(conversation_ids)} conversaciones...')
+
+        total = 0
+        for start in range(0, len(conversation_ids), batch_size):
+            total += ConversationStateService.refresh(conversation_ids[start:start + batch_size])
+            self.stdout.write(f'  • {total}/{len(conversation_ids)}')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Estado actualizado en {total} conversaciones'))
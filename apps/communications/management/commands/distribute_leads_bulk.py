@@ -0,0 +1,112 @@
+# apps/communications/management/commands/distribute_leads_bulk.py
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef
+
+from apps.communications.lead_distribution_service import LeadDistributionService
+from apps.communications.models import Lead, LeadAssignment
+
+
+class Command(BaseCommand):
+    help = (
+        'Distribuye leads en bloque (backlog sin asignar, importaciones de campañas o '
+        'leads de una fuerza de venta dada de baja) con el algoritmo de Contador Acumulativo'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--unassigned',
+            action='store_true',
+            help='Leads activos sin asignación activa',
+        )
+        parser.add_argument(
+            '--from-unit',
+            type=int,
+            default=None,
+            help='Reasigna los leads activos de esta unidad organizacional (ID) al resto',
+        )
+        parser.add_argument(
+            '--origen',
+            default=None,
+            help='Solo leads de este origen (p. ej. campana)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Máximo de leads a distribuir (los más antiguos primero)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra el reparto previsto sin guardar nada',
+        )
+
+    def handle(self, *args, **options):
+        if options['unassigned'] == (options['from_unit'] is not None):
+            raise CommandError('Indique --unassigned o --from-unit (solo uno)')
+
+        leads = Lead.objects.filter(is_active=True)
+        active_assignments = LeadAssignment.objects.filter(lead=OuterRef('pk'), is_active=True)
+        exclude_unit_ids = ()
+
+        if options['unassigned']:
+            leads = leads.filter(~Exists(active_assignments))
+        else:
+            exclude_unit_ids = (options['from_unit'],)
+            leads = leads.filter(Exists(active_assignments.filter(
+                organizational_unit_id=options['from_unit']
+            )))
+
+        if options['origen']:
+            leads = leads.filter(origen=options['origen'])
+
+        leads = leads.order_by('created_at', 'id')
+        if options['limit']:
+            leads = leads[:options['limit']]
+        leads = list(leads)
+
+        if not leads:
+            self.stdout.write(self.style.SUCCESS('✅ No hay leads para distribuir'))
+            return
+
+        service = LeadDistributionService()
+        if options['dry_run']:
+            self.stdout.write(f'🧪 Simulando distribución de {len(leads)} leads (no se guarda nada)...')
+            plan = service.plan_bulk_distribution(leads, exclude_unit_ids)
+        else:
+            self.stdout.write(f'🚀 Distribuyendo {len(leads)} leads...')
+            plan = service.assign_leads_bulk(leads, exclude_unit_ids=exclude_unit_ids)
+
+        self.show_report(plan)
+
+        if plan['unassigned']:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {len(plan['unassigned'])} leads sin fuerza de venta disponible (límites alcanzados)"
+            ))
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"✅ Simulación: {len(plan['assignments'])} leads se asignarían"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(plan['created'])} leads asignados"))
+
+    def show_report(self, plan):
+        """Reparto de hoy por fuerza de venta antes y después de la distribución"""
+        nuevos = {}
+        for _, config, _ in plan['assignments']:
+            nuevos[config.organizational_unit_id] = nuevos.get(config.organizational_unit_id, 0) + 1
+
+        before, after = plan['leads_today_before'], plan['leads_today_after']
+        total_after = sum(after.values())
+
+        self.stdout.write('\n📊 Reparto de hoy:')
+        self.stdout.write(
+            f"{'Fuerza de Venta':<25} {'%':>6} {'Antes':>8} {'Nuevos':>8} {'Después':>8} {'Esperado':>9}"
+        )
+        for config in plan['configs']:
+            unit_id = config.organizational_unit_id
+            expected = float(config.distribution_percentage) / 100 * total_after
+            self.stdout.write(
+                f'{config.organizational_unit.name:<25} {config.distribution_percentage:>6} '
+                f'{before.get(unit_id, 0):>8d} {nuevos.get(unit_id, 0):>8d} '
+                f'{after.get(unit_id, 0):>8d} {expected:>9.1f}'
+            )
+        self.stdout.write('')
@@ -0,0 +1,23 @@
+# apps/communications/management/commands/media_stub_server.py
+from django.core.management.base import BaseCommand
+
+from apps.communications.utils.media_stub_server import MediaStubServer
+
+
+class Command(BaseCommand):
+    help = 'Servidor local que imita la API de medios de WhatsApp (pruebas de descarga)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directorio con los archivos a servir (nombre = media_id)')
+        parser.add_argument('--host', default='127.0.0.1', help='Host (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Puerto (default: 8765)')
+
+    def handle(self, *args, **options):
+        server = MediaStubServer(options['directory'], options['host'], options['port'])
+        self.stdout.write(self.style.SUCCESS(f'🧪 Stub de medios en {server.url}'))
+        self.stdout.write(f"   Configurar WHATSAPP_GRAPH_API_URL = '{server.url}'")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
+            self.stdout.write('🛑 Stub detenido')
@@ -0,0 +1,51 @@
+# apps/communications/management/commands/process_audio_queue.py
+from django.core.management.base import BaseCommand
+
+from apps.communications.services.audio_transcode_service import AudioTranscodeService
+from apps.communications.utils.queue_worker import add_worker_arguments, run_pool
+
+
+class Command(BaseCommand):
+    help = 'Convierte a OGG los audios recibidos con un pool de procesos ffmpeg'
+
+    def add_arguments(self, parser):
+        add_worker_arguments(
+            parser,
+            batch_size=5,
+            workers_help='Cantidad de procesos worker, cada uno con un ffmpeg a la vez',
+            batch_help='Conversiones que toma cada worker por vuelta',
+            stats_help='Solo mostrar la profundidad de la cola y las latencias',
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.write_stats()
+            return
+
+        workers = max(options['workers'], 1)
+        self.stdout.write(self.style.SUCCESS(f'🎧 Convirtiendo audios con {workers} worker(s)...'))
+
+        procesados = run_pool(
+            AudioTranscodeService.claim,
+            AudioTranscodeService.process,
+            AudioTranscodeService.release_stale,
+            workers, options['batch_size'], options['sleep'], options['once'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {procesados} conversiones procesadas'))
+        self.write_stats()
+
+    def write_stats(self):
+        stats = AudioTranscodeService.stats()
+        self.stdout.write('📊 Cola de conversión de audio:')
+        for estado, total in stats['cola'].items():
+            self.stdout.write(f'  • {estado}: {total}')
+        self.stdout.write(f'  ⏳ Pendiente más antiguo: {stats["pendiente_mas_antiguo_s"]}s')
+        self.stdout.write(
+            f'  ⏱️ Últimas {stats["muestra"]} conversiones ({stats["reutilizados"]} reutilizadas de la caché):'
+        )
+        for nombre, clave in [('desde que se encoló', 'latencia_total'), ('ffmpeg', 'latencia_ffmpeg')]:
+            latencia = stats[clave]
+            self.stdout.write(
+                f'    - {nombre}: promedio {latencia["promedio_ms"]} ms, p95 {latencia["p95_ms"]} ms'
+            )
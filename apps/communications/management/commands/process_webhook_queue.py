@@ -0,0 +1,52 @@
+# apps/communications/management/commands/process_webhook_queue.py
+from django.core.management.base import BaseCommand
+
+from apps.communications.services.message_service import MessageService
+from apps.communications.services.webhook_queue_service import WebhookQueueService
+from apps.communications.utils.queue_worker import add_worker_arguments, run_pool
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de eventos del webhook de WhatsApp con un pool de workers'
+
+    def add_arguments(self, parser):
+        add_worker_arguments(
+            parser,
+            batch_size=10,
+            workers_help='Cantidad de procesos worker',
+            batch_help='Eventos que toma cada worker por vuelta',
+            stats_help='Solo mostrar la cantidad de eventos por estado',
+        )
+        parser.add_argument(
+            '--requeue-dead',
+            action='store_true',
+            help='Volver a encolar los eventos descartados antes de empezar',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            reencolados = WebhookQueueService.requeue_dead()
+            self.stdout.write(f'🔁 {reencolados} eventos descartados vueltos a encolar')
+
+        if options['stats']:
+            self.write_stats()
+            return
+
+        workers = max(options['workers'], 1)
+        self.stdout.write(self.style.SUCCESS(f'🚀 Procesando cola del webhook con {workers} worker(s)...'))
+
+        procesados = run_pool(
+            WebhookQueueService.claim,
+            WebhookQueueService.process_event,
+            WebhookQueueService.release_stale,
+            workers, options['batch_size'], options['sleep'], options['once'],
+        )
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {procesados} eventos procesados'))
+        self.write_stats()
+
+    def write_stats(self):
+        self.stdout.write('📊 Cola del webhook:')
+        for estado, total in WebhookQueueService.stats().items():
+            self.stdout.write(f'  • {estado}: {total}')
+        self.stdout.write(f'  🔁 Mensajes duplicados descartados: {MessageService.duplicate_count()}')
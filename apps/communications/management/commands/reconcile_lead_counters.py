@@ -0,0 +1,44 @@
+# apps/communications/management/commands/reconcile_lead_counters.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.communications.services.lead_counter_service import LeadCounterService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde LeadAssignment los contadores diarios y semanales de distribución de leads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Días hacia atrás a recalcular, incluido hoy (default: 7)',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=None,
+            help='Borrar contadores con más de N días de antigüedad',
+        )
+
+    def handle(self, *args, **options):
+        end = timezone.localdate()
+        start = end - timedelta(days=max(options['days'], 1) - 1)
+
+        self.stdout.write(f'🔄 Recalculando contadores del {start} al {end}...')
+        differences = LeadCounterService.reconcile(start, end)
+
+        for unit_id, periodo, fecha, saved, real in differences:
+            self.stdout.write(f'  • Unidad {unit_id} - {periodo} {fecha}: {saved} → {real}')
+
+        if differences:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(differences)} contadores corregidos'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✅ Contadores al día'))
+
+        if options['keep_days'] is not None:
+            borrados = LeadCounterService.prune(options['keep_days'])
+            self.stdout.write(f'🧹 {borrados} contadores antiguos borrados')
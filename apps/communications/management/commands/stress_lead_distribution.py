@@ -0,0 +1,178 @@
+# apps/communications/management/commands/stress_lead_distribution.py
+import multiprocessing
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+
+from apps.communications.lead_distribution_service import LeadDistributionService
+from apps.communications.models import Cliente, Lead, LeadAssignment, LeadDistributionConfig
+
+
+def assign_leads(lead_ids):
+    """Worker: asigna sus leads uno por uno con el distribuidor real"""
+    # Cada proceso abre su propia conexión a la BD
+    connections.close_all()
+
+    asignados = fallidos = 0
+    for lead in Lead.objects.filter(id__in=lead_ids).order_by('id'):
+        if LeadDistributionService().assign_lead_to_sales_force(lead):
+            asignados += 1
+        else:
+            fallidos += 1
+
+    connections.close_all()
+    return asignados, fallidos
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga del distribuidor de leads: asigna miles de leads en paralelo '
+        'sobre una base de datos de prueba temporal y verifica que el reparto respete '
+        'distribution_percentage'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--assignments',
+            type=int,
+            default=2000,
+            help='Cantidad de leads a asignar (default: 2000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=16,
+            help='Procesos asignando en paralelo (default: 16)',
+        )
+        parser.add_argument(
+            '--percentages',
+            default='40,30,20,10',
+            help='Porcentajes de las fuerzas de venta de prueba (default: 40,30,20,10)',
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=1.0,
+            help='Desvío máximo permitido en leads respecto de lo esperado (default: 1)',
+        )
+
+    def handle(self, *args, **options):
+        percentages = [Decimal(value.strip()) for value in options['percentages'].split(',') if value.strip()]
+        if not percentages or sum(percentages) > 100:
+            raise CommandError('Los porcentajes deben sumar como máximo 100')
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise CommandError(
+                'La prueba usa varios procesos: configure DATABASES["default"]["TEST"]["NAME"] '
+                'con un archivo (o use PostgreSQL)'
+            )
+
+        # Base de datos de prueba: nunca se tocan los datos reales
+        self.stdout.write('🧪 Creando base de datos de prueba...')
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            self.run_stress(options, percentages)
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            self.stdout.write('🧹 Base de datos de prueba eliminada')
+
+    def run_stress(self, options, percentages):
+        from django.contrib.auth import get_user_model
+        from apps.sales_team_management.models import OrganizationalUnit
+
+        total = options['assignments']
+        workers = max(options['workers'], 1)
+
+        admin_user = get_user_model().objects.create(username='stress_admin', is_superuser=True)
+        configs = []
+        for number, percentage in enumerate(percentages, start=1):
+            unit = OrganizationalUnit.objects.create(
+                name=f'Fuerza Stress {number}', code=f'STRESS{number}', unit_type='SALES'
+            )
+            configs.append(LeadDistributionConfig.objects.create(
+                organizational_unit=unit,
+                is_active_for_leads=True,
+                distribution_percentage=percentage,
+                created_by=admin_user,
+                last_modified_by=admin_user,
+            ))
+
+        clientes = Cliente.objects.bulk_create([
+            Cliente(numero_whatsapp=f'99{number:08d}', nombre=f'Stress {number}')
+            for number in range(total)
+        ])
+        leads = Lead.objects.bulk_create([Lead(cliente=cliente) for cliente in clientes])
+        lead_ids = [lead.id for lead in leads]
+
+        # Repartir en lotes intercalados para que todos los workers compitan a la vez
+        batches = [lead_ids[start::workers] for start in range(workers)]
+
+        self.stdout.write(f'🚀 Asignando {total} leads con {workers} procesos...')
+        started = time.monotonic()
+        connections.close_all()
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(assign_leads, batches)
+        elapsed = time.monotonic() - started
+
+        asignados = sum(result[0] for result in results)
+        fallidos = sum(result[1] for result in results)
+        self.stdout.write(
+            f'⏱️ {asignados} asignados, {fallidos} fallidos en {elapsed:.1f}s '
+            f'({asignados / elapsed if elapsed else 0:.0f}/s)'
+        )
+
+        self.check_distribution(configs, asignados, fallidos, options['tolerance'])
+
+    def check_distribution(self, configs, asignados, fallidos, tolerance):
+        """
+        Compara el reparto final y el de cada prefijo de la secuencia de asignaciones
+        (orden de inserción) con lo esperado: el Contador Acumulativo nunca debería
+        desviarse más de un lead
+        """
+        total_percentage = sum(float(config.distribution_percentage) for config in configs)
+        shares = {
+            config.organizational_unit_id: float(config.distribution_percentage) / total_percentage
+            for config in configs
+        }
+        sequence = list(
+            LeadAssignment.objects.filter(is_active=True).order_by('id').values_list(
+                'organizational_unit_id', flat=True
+            )
+        )
+
+        counts = dict.fromkeys(shares, 0)
+        max_prefix_deviation = 0.0
+        for position, unit_id in enumerate(sequence, start=1):
+            counts[unit_id] += 1
+            for other_id, share in shares.items():
+                max_prefix_deviation = max(max_prefix_deviation, abs(counts[other_id] - share * position))
+
+        self.stdout.write('\n📊 Reparto final:')
+        self.stdout.write(f"{'Fuerza de Venta':<22} {'Esperado':>10} {'Obtenido':>10} {'Desvío':>10}")
+        max_final_deviation = 0.0
+        for config in configs:
+            unit_id = config.organizational_unit_id
+            expected = shares[unit_id] * len(sequence)
+            deviation = counts[unit_id] - expected
+            max_final_deviation = max(max_final_deviation, abs(deviation))
+            self.stdout.write(
+                f'{config.organizational_unit.name:<22} {expected:>10.1f} {counts[unit_id]:>10d} {deviation:>+10.1f}'
+            )
+
+        self.stdout.write(f'\n📐 Desvío máximo final: {max_final_deviation:.2f} leads')
+        self.stdout.write(f'📐 Desvío máximo durante la secuencia: {max_prefix_deviation:.2f} leads')
+
+        errores = []
+        if fallidos or len(sequence) != asignados:
+            errores.append(f'{fallidos} asignaciones fallidas, {len(sequence)} activas de {asignados}')
+        if max_final_deviation > tolerance:
+            errores.append(f'desvío final {max_final_deviation:.2f} > {tolerance}')
+        if max_prefix_deviation > tolerance:
+            errores.append(f'desvío durante la secuencia {max_prefix_deviation:.2f} > {tolerance}')
+
+        if errores:
+            raise CommandError('❌ Reparto fuera de tolerancia: ' + '; '.join(errores))
+        self.stdout.write(self.style.SUCCESS('✅ El reparto respeta distribution_percentage'))
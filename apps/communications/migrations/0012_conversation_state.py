@@ -0,0 +1,47 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0011_fix_media_url_nullable'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversacion',
+            name='respondido_desde_asignacion',
+            field=models.BooleanField(default=False, help_text='El vendedor asignado respondió después de la asignación'),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='sin_responder',
+            field=models.BooleanField(default=False, help_text='El último mensaje entrante no tiene respuesta del vendedor asignado'),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultimo_entrante_at',
+            field=models.DateTimeField(blank=True, help_text='Fecha del último mensaje entrante', null=True),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultimo_mensaje_contenido',
+            field=models.TextField(blank=True, default='', help_text='Contenido del último mensaje'),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='ultimo_mensaje_direccion',
+            field=models.CharField(blank=True, default='', help_text='Dirección del último mensaje (incoming/outgoing)', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='conversacion',
+            name='vendedor_respondio',
+            field=models.BooleanField(default=False, help_text='El vendedor asignado respondió alguna vez'),
+        ),
+        migrations.AddIndex(
+            model_name='conversacion',
+            index=models.Index(fields=['sin_responder', 'ultimo_entrante_at'], name='conv_sin_responder_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0012_conversation_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_telefono', models.CharField(blank=True, default='', help_text='Número del remitente; los eventos de un mismo número se procesan en orden', max_length=20)),
+                ('raw_data', models.JSONField(help_text='Payload del webhook')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('procesado', 'Procesado'), ('muerto', 'Descartado tras reintentos')], default='pendiente', help_text='Estado en la cola', max_length=20)),
+                ('intentos', models.PositiveIntegerField(default=0, help_text='Intentos de procesamiento realizados')),
+                ('disponible_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Fecha desde la que puede procesarse (reintentos con espera)')),
+                ('worker', models.CharField(blank=True, default='', help_text='Worker que tiene tomado el evento', max_length=100)),
+                ('bloqueado_at', models.DateTimeField(blank=True, help_text='Fecha en que el worker tomó el evento', null=True)),
+                ('ultimo_error', models.TextField(blank=True, default='', help_text='Error del último intento')),
+                ('procesado_at', models.DateTimeField(blank=True, help_text='Fecha de procesamiento exitoso', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook',
+                'verbose_name_plural': 'Eventos de Webhook',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'disponible_at'], name='webhook_evento_cola_idx'), models.Index(fields=['numero_telefono', 'id'], name='webhook_evento_numero_idx')],
+            },
+        ),
+    ]
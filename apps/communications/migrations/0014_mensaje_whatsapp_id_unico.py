@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0013_webhook_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mensaje',
+            name='whatsapp_message_id',
+            field=models.CharField(help_text='ID del mensaje en WhatsApp (único cuando no está vacío)', max_length=100),
+        ),
+        migrations.AddConstraint(
+            model_name='mensaje',
+            constraint=models.UniqueConstraint(condition=models.Q(('whatsapp_message_id', ''), _negated=True), fields=('whatsapp_message_id',), name='mensaje_whatsapp_id_unico'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0014_mensaje_whatsapp_id_unico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioTranscode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('listo', 'Listo'), ('error', 'Error')], default='pendiente', help_text='Estado de la conversión', max_length=20)),
+                ('hash_contenido', models.CharField(blank=True, default='', help_text='SHA-256 del audio original y los parámetros de conversión', max_length=64)),
+                ('archivo_ogg', models.CharField(blank=True, default='', help_text='Ruta del OGG convertido, relativa a MEDIA_ROOT', max_length=255)),
+                ('intentos', models.PositiveIntegerField(default=0, help_text='Intentos de conversión realizados')),
+                ('worker', models.CharField(blank=True, default='', help_text='Worker que tiene tomada la conversión', max_length=100)),
+                ('iniciado_at', models.DateTimeField(blank=True, help_text='Fecha en que un worker tomó la conversión', null=True)),
+                ('terminado_at', models.DateTimeField(blank=True, help_text='Fecha en que terminó la conversión', null=True)),
+                ('duracion_ms', models.PositiveIntegerField(blank=True, help_text='Tiempo de ffmpeg en milisegundos (0 si se reutilizó la salida)', null=True)),
+                ('ultimo_error', models.TextField(blank=True, default='', help_text='Error del último intento')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('mensaje', models.OneToOneField(help_text='Mensaje de audio a convertir', on_delete=django.db.models.deletion.CASCADE, related_name='transcodificacion', to='communications.mensaje')),
+            ],
+            options={
+                'verbose_name': 'Conversión de Audio',
+                'verbose_name_plural': 'Conversiones de Audio',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['estado', 'id'], name='audio_conversion_cola_idx'), models.Index(fields=['hash_contenido'], name='audio_conversion_hash_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:13
+
+from collections import Counter
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_counters(apps, schema_editor):
+    """
+    Carga los contadores de la semana actual (cada día hasta hoy y la semana)
+    desde las asignaciones activas, como LeadCounterService.reconcile, para que
+    la distribución no arranque con todas las unidades en cero
+    """
+    LeadAssignment = apps.get_model('communications', 'LeadAssignment')
+    LeadDistributionCounter = apps.get_model('communications', 'LeadDistributionCounter')
+
+    today = timezone.localdate()
+    week_start = today - timedelta(days=today.weekday())
+    per_day = LeadAssignment.objects.filter(
+        is_active=True,
+        assigned_date__date__gte=week_start,
+        assigned_date__date__lte=today,
+    ).annotate(
+        dia=TruncDate('assigned_date')
+    ).order_by().values_list('organizational_unit_id', 'dia').annotate(total=Count('id'))
+
+    expected = Counter()
+    for unit_id, day, total in per_day:
+        expected[(unit_id, 'dia', day)] += total
+        expected[(unit_id, 'semana', week_start)] += total
+
+    LeadDistributionCounter.objects.bulk_create([
+        LeadDistributionCounter(organizational_unit_id=unit_id, periodo=periodo, fecha=fecha, total=total)
+        for (unit_id, periodo, fecha), total in expected.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0015_audio_transcode'),
+        ('sales_team_management', '0010_remove_supervisiondirecta_equipo_venta_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadDistributionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('dia', 'Día'), ('semana', 'Semana')], help_text='Día o semana', max_length=10)),
+                ('fecha', models.DateField(help_text='Día, o lunes de la semana')),
+                ('total', models.IntegerField(default=0, help_text='Asignaciones activas en el período')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organizational_unit', models.ForeignKey(help_text='Fuerza de venta', on_delete=django.db.models.deletion.CASCADE, related_name='lead_counters', to='sales_team_management.organizationalunit')),
+            ],
+            options={
+                'verbose_name': 'Contador de Distribución de Leads',
+                'verbose_name_plural': 'Contadores de Distribución de Leads',
+                'ordering': ['-fecha', 'organizational_unit_id'],
+                'indexes': [models.Index(fields=['periodo', 'fecha'], name='contador_leads_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('organizational_unit', 'periodo', 'fecha'), name='contador_leads_unico')],
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
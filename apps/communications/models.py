@@ -1,5 +1,6 @@
 # apps/whatsapp_business/models.py
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
@@ -350,6 +351,37 @@ class Conversacion(models.Model):
         default=True,
         help_text="Indica si la conversación está activa"
     )
+
+    # Estado desnormalizado, mantenido al crear mensajes (ConversationStateService)
+    ultimo_mensaje_contenido = models.TextField(
+        blank=True,
+        default='',
+        help_text="Contenido del último mensaje"
+    )
+    ultimo_mensaje_direccion = models.CharField(
+        max_length=10,
+        blank=True,
+        default='',
+        help_text="Dirección del último mensaje (incoming/outgoing)"
+    )
+    ultimo_entrante_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha del último mensaje entrante"
+    )
+    sin_responder = models.BooleanField(
+        default=False,
+        help_text="El último mensaje entrante no tiene respuesta del vendedor asignado"
+    )
+    vendedor_respondio = models.BooleanField(
+        default=False,
+        help_text="El vendedor asignado respondió alguna vez"
+    )
+    respondido_desde_asignacion = models.BooleanField(
+        default=False,
+        help_text="El vendedor asignado respondió después de la asignación"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -357,6 +389,10 @@ class Conversacion(models.Model):
         verbose_name = 'Conversación'
         verbose_name_plural = 'Conversaciones'
         ordering = ['-ultimo_mensaje_at']
+        indexes = [
+            # Conversaciones sin responder por antigüedad (SLA de 24h)
+            models.Index(fields=['sin_responder', 'ultimo_entrante_at'], name='conv_sin_responder_idx'),
+        ]
 
     def __str__(self):
         return f"Conversación: {self.cliente.nombre_completo}"
@@ -398,8 +434,7 @@ class Mensaje(models.Model):
     )
     whatsapp_message_id = models.CharField(
         max_length=100,
-        unique=True,
-        help_text="ID del mensaje en WhatsApp"
+        help_text="ID del mensaje en WhatsApp (único cuando no está vacío)"
     )
     tipo = models.CharField(
         max_length=20,
@@ -502,10 +537,27 @@ class Mensaje(models.Model):
         verbose_name = 'Mensaje'
         verbose_name_plural = 'Mensajes'
         ordering = ['-timestamp_whatsapp']
+        constraints = [
+            # Índice de deduplicación de reenvíos del webhook (insert-or-ignore)
+            models.UniqueConstraint(
+                fields=['whatsapp_message_id'],
+                condition=~models.Q(whatsapp_message_id=''),
+                name='mensaje_whatsapp_id_unico',
+            ),
+        ]
 
     def __str__(self):
         return f"Mensaje {self.tipo} - {self.conversacion.cliente.nombre_completo}"
 
+    def get_archivo_protegido_url(self):
+        """URL protegida del archivo (verifica el acceso a la conversación); los audios salen convertidos a OGG"""
+        if not self.archivo_local:
+            return None
+        from django.urls import reverse
+        if self.tipo == 'audio':
+            return reverse('communications:serve_audio_converted', args=[self.id])
+        return reverse('communications:serve_message_media', args=[self.id])
+
 
 # ============================================================
 # TIPOS DE PAGO
@@ -1697,10 +1749,10 @@ class LeadAssignment(models.Model):
     def save(self, *args, **kwargs):
         # Al crear una nueva asignación activa, desactivar las anteriores
         if self.is_active and not self.pk:
-            LeadAssignment.objects.filter(
-                lead=self.lead,
-                is_active=True
-            ).update(is_active=False)
+            from .services.lead_counter_service import LeadCounterService
+            LeadCounterService.deactivate(
+                LeadAssignment.objects.filter(lead=self.lead, is_active=True)
+            )
         
         # Guardar snapshot de la configuración
         if not self.distribution_config_snapshot:
@@ -1720,6 +1772,56 @@ class LeadAssignment(models.Model):
         super().save(*args, **kwargs)
 
 
+class LeadDistributionCounter(models.Model):
+    """
+    Asignaciones activas por fuerza de venta y por día / semana (fecha local).
+    Se mantiene al crear, desactivar, reasignar o borrar asignaciones
+    (LeadCounterService) para que la distribución no cuente con COUNT en cada lead;
+    reconcile_lead_counters lo recalcula desde LeadAssignment.
+    """
+    PERIODOS = [
+        ('dia', 'Día'),
+        ('semana', 'Semana'),
+    ]
+
+    organizational_unit = models.ForeignKey(
+        'sales_team_management.OrganizationalUnit',
+        on_delete=models.CASCADE,
+        related_name='lead_counters',
+        help_text="Fuerza de venta"
+    )
+    periodo = models.CharField(
+        max_length=10,
+        choices=PERIODOS,
+        help_text="Día o semana"
+    )
+    fecha = models.DateField(
+        help_text="Día, o lunes de la semana"
+    )
+    total = models.IntegerField(
+        default=0,
+        help_text="Asignaciones activas en el período"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Contador de Distribución de Leads'
+        verbose_name_plural = 'Contadores de Distribución de Leads'
+        ordering = ['-fecha', 'organizational_unit_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['organizational_unit', 'periodo', 'fecha'],
+                name='contador_leads_unico',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['periodo', 'fecha'], name='contador_leads_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.organizational_unit_id} - {self.periodo} {self.fecha}: {self.total}"
+
+
 # ============================================================
 # MENSAJES DE DEBUG Y TESTING
 # ============================================================
@@ -1778,6 +1880,159 @@ class WebhookDebugMessage(models.Model):
         return f"{self.tipo} - {self.numero_telefono} - {self.created_at}"
 
 
+class WebhookEvent(models.Model):
+    """
+    Cola persistente de callbacks del webhook de WhatsApp: la vista guarda el
+    payload y responde de inmediato; los workers (process_webhook_queue) lo procesan
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('procesado', 'Procesado'),
+        ('muerto', 'Descartado tras reintentos'),
+    ]
+
+    numero_telefono = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        help_text="Número del remitente; los eventos de un mismo número se procesan en orden"
+    )
+    raw_data = models.JSONField(
+        help_text="Payload del webhook"
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='pendiente',
+        help_text="Estado en la cola"
+    )
+    intentos = models.PositiveIntegerField(
+        default=0,
+        help_text="Intentos de procesamiento realizados"
+    )
+    disponible_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Fecha desde la que puede procesarse (reintentos con espera)"
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Worker que tiene tomado el evento"
+    )
+    bloqueado_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha en que el worker tomó el evento"
+    )
+    ultimo_error = models.TextField(
+        blank=True,
+        default='',
+        help_text="Error del último intento"
+    )
+    procesado_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha de procesamiento exitoso"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Evento de Webhook'
+        verbose_name_plural = 'Eventos de Webhook'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'disponible_at'], name='webhook_evento_cola_idx'),
+            models.Index(fields=['numero_telefono', 'id'], name='webhook_evento_numero_idx'),
+        ]
+
+    def __str__(self):
+        return f"Evento {self.id} - {self.numero_telefono} - {self.estado}"
+
+
+class AudioTranscode(models.Model):
+    """
+    Conversión a OGG de un audio recibido, procesada en segundo plano
+    (process_audio_queue). La salida se guarda por hash de contenido en
+    MEDIA_ROOT/audio_cache, así un mismo audio reenviado se convierte una vez.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    ]
+
+    mensaje = models.OneToOneField(
+        Mensaje,
+        on_delete=models.CASCADE,
+        related_name='transcodificacion',
+        help_text="Mensaje de audio a convertir"
+    )
+    estado = models.CharField(
+        max_length=20,
+        choices=ESTADOS,
+        default='pendiente',
+        help_text="Estado de la conversión"
+    )
+    hash_contenido = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        help_text="SHA-256 del audio original y los parámetros de conversión"
+    )
+    archivo_ogg = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="Ruta del OGG convertido, relativa a MEDIA_ROOT"
+    )
+    intentos = models.PositiveIntegerField(
+        default=0,
+        help_text="Intentos de conversión realizados"
+    )
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Worker que tiene tomada la conversión"
+    )
+    iniciado_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha en que un worker tomó la conversión"
+    )
+    terminado_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Fecha en que terminó la conversión"
+    )
+    duracion_ms = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Tiempo de ffmpeg en milisegundos (0 si se reutilizó la salida)"
+    )
+    ultimo_error = models.TextField(
+        blank=True,
+        default='',
+        help_text="Error del último intento"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Conversión de Audio'
+        verbose_name_plural = 'Conversiones de Audio'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='audio_conversion_cola_idx'),
+            models.Index(fields=['hash_contenido'], name='audio_conversion_hash_idx'),
+        ]
+
+    def __str__(self):
+        return f"Audio {self.mensaje_id} - {self.estado}"
+
+
 class TestMessage(models.Model):
     """
     Modelo para almacenar configuraciones de mensajes de prueba
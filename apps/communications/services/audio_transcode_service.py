@@ -0,0 +1,277 @@
+# apps/communications/services/audio_transcode_service.py
+import hashlib
+import os
+import subprocess
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from ..models import AudioTranscode
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parámetros de ffmpeg (forman parte del hash: si cambian, se vuelve a convertir)
+AUDIO_TRANSCODE_ARGS = [
+    '-c:a', 'libvorbis',  # Codec de audio Vorbis
+    '-q:a', '4',  # Calidad media
+    '-ac', '1',  # Mono
+    '-ar', '22050',  # Sample rate reducido
+]
+# Carpeta de salida dentro de MEDIA_ROOT
+AUDIO_TRANSCODE_CACHE_DIR = getattr(settings, 'AUDIO_TRANSCODE_CACHE_DIR', 'audio_cache')
+AUDIO_TRANSCODE_TIMEOUT = getattr(settings, 'AUDIO_TRANSCODE_TIMEOUT', 60)
+AUDIO_TRANSCODE_MAX_ATTEMPTS = getattr(settings, 'AUDIO_TRANSCODE_MAX_ATTEMPTS', 3)
+# Tiempo sin terminar una conversión (desde que empezó) tras el cual se considera
+# caído su worker y vuelve a la cola contando un intento
+AUDIO_TRANSCODE_LEASE_SECONDS = getattr(settings, 'AUDIO_TRANSCODE_LEASE_SECONDS', 300)
+# Sin workers (desarrollo): convertir dentro de la misma petición al encolar
+AUDIO_TRANSCODE_QUEUE_ENABLED = getattr(settings, 'AUDIO_TRANSCODE_QUEUE_ENABLED', True)
+# Conversiones recientes usadas para las métricas de latencia
+AUDIO_TRANSCODE_LATENCY_SAMPLE = 200
+
+
+class AudioTranscodeService:
+    """
+    Conversión de audios a OGG en segundo plano: cola en la tabla AudioTranscode,
+    workers en process_audio_queue y salida guardada por hash de contenido
+    """
+
+    @staticmethod
+    def enqueue(mensaje):
+        """
+        Encola la conversión de un mensaje de audio (una sola por mensaje)
+        """
+        if mensaje.tipo != 'audio' or not mensaje.archivo_local:
+            return None
+
+        job, created = AudioTranscode.objects.get_or_create(mensaje=mensaje)
+        output_missing = job.estado == 'listo' and not os.path.exists(
+            AudioTranscodeService.output_path(job.archivo_ogg)
+        )
+        if not created and (job.estado == 'error' or output_missing):
+            # Reintentar si falló antes o si se borró la salida de la caché
+            job.estado = 'pendiente'
+            job.intentos = 0
+            job.save(update_fields=['estado', 'intentos'])
+
+        if not AUDIO_TRANSCODE_QUEUE_ENABLED and job.estado == 'pendiente':
+            AudioTranscodeService.process(job)
+        return job
+
+    @staticmethod
+    def claim(worker, limit=5):
+        """
+        Toma hasta `limit` conversiones pendientes (SKIP LOCKED evita que dos workers
+        tomen la misma)
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            jobs = list(
+                AudioTranscode.objects.select_for_update(skip_locked=True).filter(
+                    estado='pendiente'
+                ).select_related('mensaje').order_by('id')[:limit]
+            )
+            if jobs:
+                AudioTranscode.objects.filter(id__in=[job.id for job in jobs]).update(
+                    estado='procesando', worker=worker, iniciado_at=now
+                )
+                for job in jobs:
+                    job.estado, job.worker, job.iniciado_at = 'procesando', worker, now
+        return jobs
+
+    @staticmethod
+    def start(job):
+        """
+        Renueva el lease de una conversión tomada justo antes de ejecutarla (el lease
+        cuenta por conversión, no por lote). False si el worker ya la perdió por release_stale.
+        """
+        if not job.worker:
+            # Conversión dentro de la petición (enqueue sin cola o convert_now)
+            return True
+        job.iniciado_at = timezone.now()
+        return AudioTranscode.objects.filter(
+            id=job.id, estado='procesando', worker=job.worker
+        ).update(iniciado_at=job.iniciado_at) == 1
+
+    @staticmethod
+    def content_hash(path):
+        """
+        SHA-256 del archivo (leído por bloques) y de los parámetros de conversión
+        """
+        digest = hashlib.sha256(' '.join(AUDIO_TRANSCODE_ARGS).encode())
+        with open(path, 'rb') as audio_file:
+            for chunk in iter(lambda: audio_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def output_path(relative_path):
+        return os.path.join(settings.MEDIA_ROOT, relative_path)
+
+    @staticmethod
+    def transcode(input_path):
+        """
+        Convierte el archivo a OGG en la caché por contenido. Si la salida ya
+        existe (mismo audio) no llama a ffmpeg.
+        Devuelve (ruta relativa, hash, milisegundos de ffmpeg)
+        """
+        content_hash = AudioTranscodeService.content_hash(input_path)
+        relative_path = os.path.join(AUDIO_TRANSCODE_CACHE_DIR, content_hash[:2], f'{content_hash}.ogg')
+        ogg_path = AudioTranscodeService.output_path(relative_path)
+        if os.path.exists(ogg_path):
+            return relative_path, content_hash, 0
+
+        os.makedirs(os.path.dirname(ogg_path), exist_ok=True)
+        # Escribir a un temporal y renombrar: nunca se sirve un OGG a medio escribir
+        temp_path = f'{ogg_path}.{os.getpid()}.tmp'
+        cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-i', input_path, *AUDIO_TRANSCODE_ARGS, '-f', 'ogg', temp_path]
+
+        started = time.monotonic()
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=AUDIO_TRANSCODE_TIMEOUT)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr.strip() or f'ffmpeg terminó con código {result.returncode}')
+            os.replace(temp_path, ogg_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+        return relative_path, content_hash, int((time.monotonic() - started) * 1000)
+
+    @staticmethod
+    def process(job):
+        """
+        Procesa una conversión y registra el resultado (listo, reintento o error)
+        """
+        if not AudioTranscodeService.start(job):
+            logger.warning(f'Conversión {job.id} devuelta a la cola antes de empezar: se omite')
+            return False
+
+        job.intentos += 1
+        job.worker = ''
+        try:
+            mensaje = job.mensaje
+            if not mensaje.archivo_local:
+                raise RuntimeError('El mensaje no tiene archivo de audio')
+
+            job.archivo_ogg, job.hash_contenido, job.duracion_ms = AudioTranscodeService.transcode(
+                mensaje.archivo_local.path
+            )
+            job.estado = 'listo'
+            job.ultimo_error = ''
+            logger.info(f'Audio convertido: mensaje {mensaje.id} -> {job.archivo_ogg} ({job.duracion_ms} ms)')
+        except subprocess.TimeoutExpired:
+            job.ultimo_error = f'Timeout en conversión ({AUDIO_TRANSCODE_TIMEOUT}s)'
+        except Exception as e:
+            job.ultimo_error = str(e)
+
+        if job.estado != 'listo':
+            job.estado = 'pendiente' if job.intentos < AUDIO_TRANSCODE_MAX_ATTEMPTS else 'error'
+            logger.error(f'Error convirtiendo audio del mensaje {job.mensaje_id}: {job.ultimo_error}')
+
+        job.terminado_at = timezone.now()
+        job.save(update_fields=[
+            'estado', 'intentos', 'worker', 'archivo_ogg', 'hash_contenido',
+            'duracion_ms', 'ultimo_error', 'terminado_at'
+        ])
+        return job.estado == 'listo'
+
+    @staticmethod
+    def convert_now(mensaje):
+        """
+        Convierte en la petición actual si todavía no está lista (debug y compatibilidad).
+        Devuelve (éxito, ruta absoluta o error)
+        """
+        job = AudioTranscodeService.enqueue(mensaje)
+        if not job:
+            return False, "No es un mensaje de audio válido"
+        # Sin cola, enqueue ya lo procesó en esta petición. Con cola, tomarla solo si
+        # sigue pendiente (update condicional): si un worker ya la tomó, no se repite
+        if AUDIO_TRANSCODE_QUEUE_ENABLED and job.estado == 'pendiente':
+            tomada = AudioTranscode.objects.filter(pk=job.pk, estado='pendiente').update(
+                estado='procesando', worker='peticion', iniciado_at=timezone.now()
+            )
+            if tomada:
+                AudioTranscodeService.process(job)
+        if job.estado != 'listo':
+            return False, job.ultimo_error
+        return True, AudioTranscodeService.output_path(job.archivo_ogg)
+
+    @staticmethod
+    def get_converted_path(mensaje_id):
+        """
+        Ruta absoluta del OGG si la conversión está lista y el archivo existe
+        """
+        relative_path = AudioTranscode.objects.filter(
+            mensaje_id=mensaje_id, estado='listo'
+        ).values_list('archivo_ogg', flat=True).first()
+        if not relative_path:
+            return None
+        ogg_path = AudioTranscodeService.output_path(relative_path)
+        return ogg_path if os.path.exists(ogg_path) else None
+
+    @staticmethod
+    def release_stale():
+        """
+        Devuelve a la cola las conversiones tomadas por workers que no terminaron a tiempo.
+        Cuenta como un intento: un audio que tumba a su worker termina en 'error'.
+        """
+        vencidas = AudioTranscode.objects.filter(
+            estado='procesando',
+            iniciado_at__lt=timezone.now() - timedelta(seconds=AUDIO_TRANSCODE_LEASE_SECONDS),
+        )
+        error = 'El worker no terminó la conversión a tiempo'
+        fallidas = vencidas.filter(intentos__gte=AUDIO_TRANSCODE_MAX_ATTEMPTS - 1).update(
+            estado='error', intentos=F('intentos') + 1, worker='', ultimo_error=error,
+            terminado_at=timezone.now(),
+        )
+        if fallidas:
+            logger.error(f'{fallidas} conversiones de audio en error: sus workers no terminaron a tiempo')
+        return fallidas + vencidas.update(
+            estado='pendiente', intentos=F('intentos') + 1, worker='', ultimo_error=error
+        )
+
+    @staticmethod
+    def stats():
+        """
+        Profundidad de la cola y latencias de las últimas conversiones
+        (espera total desde que se encoló y tiempo de ffmpeg)
+        """
+        counts = dict(
+            AudioTranscode.objects.order_by().values_list('estado').annotate(total=Count('id'))
+        )
+        oldest_pending = AudioTranscode.objects.filter(estado='pendiente').aggregate(
+            oldest=Min('created_at')
+        )['oldest']
+
+        recent = list(
+            AudioTranscode.objects.filter(estado='listo', terminado_at__isnull=False).order_by(
+                '-terminado_at'
+            ).values_list('created_at', 'terminado_at', 'duracion_ms')[:AUDIO_TRANSCODE_LATENCY_SAMPLE]
+        )
+        total_ms = sorted(int((terminado - creado).total_seconds() * 1000) for creado, terminado, _ in recent)
+        ffmpeg_ms = sorted(duracion for _, _, duracion in recent if duracion)
+
+        def summary(values):
+            if not values:
+                return {'promedio_ms': None, 'p95_ms': None}
+            return {
+                'promedio_ms': sum(values) // len(values),
+                'p95_ms': values[min(len(values) - 1, int(len(values) * 0.95))],
+            }
+
+        return {
+            'cola': {estado: counts.get(estado, 0) for estado, _ in AudioTranscode.ESTADOS},
+            'pendiente_mas_antiguo_s': (
+                int((timezone.now() - oldest_pending).total_seconds()) if oldest_pending else 0
+            ),
+            'muestra': len(recent),
+            'reutilizados': len(recent) - len(ffmpeg_ms),
+            'latencia_total': summary(total_ms),
+            'latencia_ffmpeg': summary(ffmpeg_ms),
+        }
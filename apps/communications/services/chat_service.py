@@ -1,9 +1,11 @@
 # apps/communications/services/chat_service.py
 from django.utils import timezone
 from datetime import timedelta
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from ..models import Conversacion, Mensaje, WhatsAppConfig, Lead, LeadAssignment
-from apps.sales_team_management.models import TeamMembership
+from .conversation_state_service import ConversationStateService
+from .lead_visibility_service import LeadVisibilityService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,58 +32,9 @@ class ChatService:
     def get_user_accessible_leads_for_supervision(user):
         """
         Para SUPERVISIÓN: Leads de subalternos + todos si no tiene equipo
+        (queryset filtrado por la visibilidad cacheada del usuario)
         """
-        from apps.sales_team_management.models import HierarchyRelation
-        
-        # Verificar si el usuario tiene equipo
-        user_membership = TeamMembership.objects.filter(
-            user=user,
-            is_active=True
-        ).select_related('organizational_unit').first()
-        
-        if not user_membership:
-            # Usuario sin equipo (admin, gerente comercial) - TODOS los leads
-            return Lead.objects.filter(is_active=True).select_related('cliente')
-        
-        # Usuario con equipo - verificar si es gerente del equipo completo
-        subordinate_users = set()
-        
-        # Verificar si es gerente/líder del equipo (puede ver todo el equipo)
-        if user_membership.position_type and user_membership.position_type.name in ['Gerente de Equipo', 'Team Manager']:
-            # Gerente de equipo: puede ver TODOS los miembros de su equipo
-            all_team_members = TeamMembership.objects.filter(
-                organizational_unit=user_membership.organizational_unit,
-                is_active=True
-            ).values_list('user', flat=True)
-            subordinate_users.update(all_team_members)
-        else:
-            # Lógica normal de supervisión jerárquica
-            # 1. Supervisión directa
-            direct_subordinates = HierarchyRelation.objects.filter(
-                supervisor_membership__user=user,
-                is_active=True,
-                relation_type='DIRECT_SUPERVISION'
-            ).values_list('subordinate_membership__user', flat=True)
-            subordinate_users.update(direct_subordinates)
-            
-            # 2. Supervisión rígida (jerárquica)
-            hierarchical_subordinates = HierarchyRelation.objects.filter(
-                supervisor_membership__user=user,
-                is_active=True,
-                relation_type='HIERARCHICAL'
-            ).values_list('subordinate_membership__user', flat=True)
-            subordinate_users.update(hierarchical_subordinates)
-            
-            # 3. Incluir al propio usuario (puede ver sus propios chats también)
-            subordinate_users.add(user.id)
-        
-        # Obtener leads asignados a todos los subalternos
-        subordinate_assignments = LeadAssignment.objects.filter(
-            assigned_to_user_id__in=subordinate_users,
-            is_active=True
-        ).select_related('lead__cliente')
-        
-        return [assignment.lead for assignment in subordinate_assignments]
+        return LeadVisibilityService.visible_leads(user, LeadVisibilityService.SUPERVISION)
     
     @staticmethod
     def get_user_accessible_leads(user):
@@ -129,9 +82,10 @@ class ChatService:
         if not config:
             return [], "No hay configuración activa"
         
-        # Obtener leads accesibles para supervisión
-        accessible_leads = ChatService.get_user_accessible_leads_for_supervision(user)
-        lead_phone_numbers = [lead.cliente.numero_whatsapp for lead in accessible_leads]
+        # Números de los leads accesibles para supervisión (subconsulta, sin cargar los leads)
+        lead_phone_numbers = Lead.objects.filter(
+            LeadVisibilityService.lead_filter(user, LeadVisibilityService.SUPERVISION)
+        ).values('cliente__numero_whatsapp')
         
         # Obtener conversaciones
         conversations = Conversacion.objects.filter(
@@ -146,80 +100,42 @@ class ChatService:
         """
         Construye datos estructurados de una conversación
         """
-        last_message = conversation.mensajes.order_by('-created_at').first()
-        
-        # Último mensaje entrante para verificar 24h
-        last_incoming_message = conversation.mensajes.filter(
-            direccion='incoming'
-        ).order_by('-created_at').first()
-        
-        # Buscar asignación del lead (lo hacemos primero para reutilizar)
-        lead_assignment = None
-        try:
-            lead_assignment = LeadAssignment.objects.filter(
-                lead__cliente__numero_whatsapp=conversation.numero_whatsapp,
-                is_active=True
-            ).select_related('assigned_to_user', 'organizational_unit').first()
-        except:
-            pass
-        
-        # Verificar si el vendedor ha respondido después de la asignación
-        has_vendedor_response = False
-        has_ever_responded = False
-        if lead_assignment and lead_assignment.assigned_to_user:
-            # Respuesta después de asignación (para hora A)
-            vendedor_responses = conversation.mensajes.filter(
-                direccion='outgoing',
-                enviado_por=lead_assignment.assigned_to_user,
-                created_at__gte=lead_assignment.assigned_date
-            )
-            has_vendedor_response = vendedor_responses.exists()
-            
-            # Respuesta alguna vez (para determinar color de vencimiento)
-            ever_responded = conversation.mensajes.filter(
-                direccion='outgoing',
-                enviado_por=lead_assignment.assigned_to_user
-            )
-            has_ever_responded = ever_responded.exists()
-        
-        # Verificar respuesta después del último mensaje entrante
-        has_response_after_incoming = False
-        is_expired = False
-        
-        if last_incoming_message:
-            try:
-                # Si hay un vendedor asignado específicamente, verificar solo sus respuestas
-                if lead_assignment and lead_assignment.assigned_to_user:
-                    response_after_incoming = conversation.mensajes.filter(
-                        direccion='outgoing',
-                        created_at__gt=last_incoming_message.created_at,
-                        enviado_por=lead_assignment.assigned_to_user
-                    ).exists()
-                else:
-                    # Si no hay vendedor específico asignado, verificar cualquier respuesta
-                    response_after_incoming = conversation.mensajes.filter(
-                        direccion='outgoing',
-                        created_at__gt=last_incoming_message.created_at
-                    ).exists()
-                
-                has_response_after_incoming = response_after_incoming
-                
-                # Verificar si han pasado 24 horas sin respuesta DEL VENDEDOR ASIGNADO
-                if not has_response_after_incoming:
-                    hours_since_incoming = (timezone.now() - last_incoming_message.created_at).total_seconds() / 3600
-                    is_expired = hours_since_incoming > 24
-            except:
-                # Fallback: usar lógica original si hay error
-                response_after_incoming = conversation.mensajes.filter(
-                    direccion='outgoing',
-                    created_at__gt=last_incoming_message.created_at
-                ).exists()
-                
-                has_response_after_incoming = response_after_incoming
-                
-                if not has_response_after_incoming:
-                    hours_since_incoming = (timezone.now() - last_incoming_message.created_at).total_seconds() / 3600
-                    is_expired = hours_since_incoming > 24
+        return ChatService.build_conversations_data([conversation])[0]
+    
+    @staticmethod
+    def build_conversations_data(conversations):
+        """
+        Construye los datos de una lista de conversaciones con un número fijo de
+        consultas: el estado de mensajes viene desnormalizado en la conversación
+        (ConversationStateService) y las asignaciones se cargan en bloque
+        """
+        conversations = list(conversations)
+        if not conversations:
+            return []
+        
+        # Asignación activa por número (la primera según el orden del modelo, como .first())
+        assignments = {}
+        for assignment in LeadAssignment.objects.filter(
+            lead__cliente__numero_whatsapp__in={c.numero_whatsapp for c in conversations},
+            is_active=True
+        ).select_related('assigned_to_user', 'organizational_unit').annotate(
+            numero_whatsapp=F('lead__cliente__numero_whatsapp')
+        ).order_by('-assigned_date'):
+            assignments.setdefault(assignment.numero_whatsapp, assignment)
+        
+        now = timezone.now()
+        return [
+            ChatService._conversation_dict(conversation, assignments.get(conversation.numero_whatsapp), now)
+            for conversation in conversations
+        ]
+    
+    @staticmethod
+    def _conversation_dict(conversation, lead_assignment, now):
+        """
+        Arma el diccionario de una conversación a partir de su estado desnormalizado
+        """
+        last_message_content = conversation.ultimo_mensaje_contenido
+        last_incoming_at = conversation.ultimo_entrante_at
         
         # Información del vendedor asignado y equipo
         assigned_salesperson = None
@@ -252,21 +168,21 @@ class ChatService:
             'estado': conversation.estado,
             'mensajes_no_leidos': conversation.mensajes_no_leidos,
             'ultimo_mensaje_at': conversation.ultimo_mensaje_at.isoformat() if conversation.ultimo_mensaje_at else None,
-            'ultimo_mensaje_contenido': last_message.contenido if last_message else '',
-            'ultimo_mensaje_preview': last_message.contenido[:50] + '...' if last_message and len(last_message.contenido) > 50 else (last_message.contenido if last_message else ''),
-            'ultimo_mensaje_tipo': last_message.direccion if last_message else 'incoming',
+            'ultimo_mensaje_contenido': last_message_content,
+            'ultimo_mensaje_preview': last_message_content[:50] + '...' if len(last_message_content) > 50 else last_message_content,
+            'ultimo_mensaje_tipo': conversation.ultimo_mensaje_direccion or 'incoming',
             'assigned_salesperson': assigned_salesperson,
             'team_info': team_info,
             'has_assignment': lead_assignment is not None,
             'assignment_status': 'assigned' if assigned_salesperson else ('team_only' if lead_assignment else 'unassigned'),
             'lead_management_url': lead_management_url,
-            'is_expired': is_expired,
-            'has_unanswered_message': last_incoming_message and not has_response_after_incoming,
-            'last_incoming_at': last_incoming_message.created_at.isoformat() if last_incoming_message else None,
+            'is_expired': ConversationStateService.is_expired(conversation, now),
+            'has_unanswered_message': conversation.sin_responder if last_incoming_at else None,
+            'last_incoming_at': last_incoming_at.isoformat() if last_incoming_at else None,
             # Nuevos campos para las horas especiales
             'assignment_date': lead_assignment.assigned_date.isoformat() if lead_assignment else None,
-            'has_vendedor_response': has_vendedor_response,
-            'has_ever_responded': has_ever_responded
+            'has_vendedor_response': conversation.respondido_desde_asignacion,
+            'has_ever_responded': conversation.vendedor_respondio
         }
     
     @staticmethod
@@ -286,72 +202,23 @@ class ChatService:
     def user_has_conversation_access_for_supervision(user, conversation):
         """
         Para SUPERVISIÓN: Verifica acceso basado en jerarquía o si no tiene equipo
+        (un solo predicado sobre el lead de la conversación)
         """
-        from apps.sales_team_management.models import HierarchyRelation
-        
-        # Verificar si el usuario tiene equipo
-        user_membership = TeamMembership.objects.filter(
-            user=user,
-            is_active=True
-        ).select_related('organizational_unit').first()
-        
-        if not user_membership:
-            # Usuario sin equipo (admin, gerente comercial) - acceso completo
-            return True
-        
-        # Obtener el lead asociado a la conversación
-        try:
-            lead = Lead.objects.get(
-                cliente__numero_whatsapp=conversation.numero_whatsapp,
-                is_active=True
-            )
-            assignment = lead.assignments.filter(is_active=True).first()
-            
-            if not assignment or not assignment.assigned_to_user:
-                return False
-            
-            assigned_user = assignment.assigned_to_user
-            
-            # Verificar si es el propio usuario
-            if assigned_user.id == user.id:
-                return True
-            
-            # Verificar si es gerente del equipo (puede acceder a todos los miembros de su equipo)
-            if user_membership.position_type and user_membership.position_type.name in ['Gerente de Equipo', 'Team Manager']:
-                # Verificar si el usuario asignado pertenece al mismo equipo
-                assigned_user_membership = TeamMembership.objects.filter(
-                    user=assigned_user,
-                    organizational_unit=user_membership.organizational_unit,
-                    is_active=True
-                ).exists()
-                
-                if assigned_user_membership:
-                    return True
-            
-            # Verificar si supervisa directamente al usuario asignado
-            direct_supervision = HierarchyRelation.objects.filter(
-                supervisor_membership__user=user,
-                subordinate_membership__user=assigned_user,
-                is_active=True,
-                relation_type='DIRECT_SUPERVISION'
-            ).exists()
-            
-            if direct_supervision:
-                return True
-            
-            # Verificar supervisión jerárquica
-            hierarchical_supervision = HierarchyRelation.objects.filter(
-                supervisor_membership__user=user,
-                subordinate_membership__user=assigned_user,
-                is_active=True,
-                relation_type='HIERARCHICAL'
-            ).exists()
-            
-            return hierarchical_supervision
-            
-        except Lead.DoesNotExist:
-            return False
+        return LeadVisibilityService.can_see_conversation(user, conversation, LeadVisibilityService.SUPERVISION)
     
+    @staticmethod
+    def user_has_media_access(user, conversation):
+        """
+        Para ARCHIVOS DE CHAT: acceso si puede ver la conversación desde el chat
+        vendedor o desde supervisión
+        """
+        if user.is_superuser:
+            return True
+        return (
+            ChatService.user_has_conversation_access_for_chat(user, conversation)
+            or ChatService.user_has_conversation_access_for_supervision(user, conversation)
+        )
+
     @staticmethod
     def user_has_conversation_access(user, conversation):
         """
@@ -385,7 +252,7 @@ class ChatService:
                 'created_at': msg.created_at.isoformat(),
                 'enviado_por': msg.enviado_por.get_full_name() if msg.enviado_por else None,
                 'media_url': msg.media_url if msg.media_url else None,
-                'archivo_local': msg.archivo_local.url if msg.archivo_local else None,
+                'archivo_protegido_url': msg.get_archivo_protegido_url(),
                 'archivo_tipo_mime': msg.archivo_tipo_mime,
                 'archivo_nombre': msg.archivo_nombre,
                 'archivo_tamaño': msg.archivo_tamaño,
@@ -433,7 +300,7 @@ class ChatService:
                 'created_at': msg.created_at.isoformat(),
                 'enviado_por': msg.enviado_por.get_full_name() if msg.enviado_por else None,
                 'media_url': msg.media_url if msg.media_url else None,
-                'archivo_local': msg.archivo_local.url if msg.archivo_local else None,
+                'archivo_protegido_url': msg.get_archivo_protegido_url(),
                 'archivo_tipo_mime': msg.archivo_tipo_mime,
                 'archivo_nombre': msg.archivo_nombre,
                 'archivo_tamaño': msg.archivo_tamaño,
@@ -0,0 +1,232 @@
+# apps/communications/services/conversation_state_service.py
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from ..models import Conversacion, Mensaje, Lead, LeadAssignment
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Campos desnormalizados de Conversacion que mantiene este servicio
+STATE_FIELDS = [
+    'ultimo_mensaje_contenido',
+    'ultimo_mensaje_direccion',
+    'ultimo_entrante_at',
+    'sin_responder',
+    'vendedor_respondio',
+    'respondido_desde_asignacion',
+]
+
+# Horas sin respuesta para considerar vencida una conversación
+SLA_HOURS = 24
+
+
+class ConversationStateService:
+    """
+    Mantiene el estado desnormalizado de las conversaciones (último mensaje,
+    último entrante y respuestas del vendedor asignado) para listar y filtrar
+    por SLA sin recorrer los mensajes
+    """
+
+    @staticmethod
+    def get_active_assignment(numero_whatsapp):
+        """
+        Asignación activa del número (la primera según el orden del modelo)
+        """
+        return LeadAssignment.objects.filter(
+            lead__cliente__numero_whatsapp=numero_whatsapp,
+            is_active=True
+        ).order_by('-assigned_date').first()
+
+    @staticmethod
+    def register_message(mensaje):
+        """
+        Actualiza el estado de la conversación con un mensaje recién creado,
+        con la fila de la conversación bloqueada
+        """
+        with transaction.atomic():
+            conversation = Conversacion.objects.select_for_update().get(pk=mensaje.conversacion_id)
+
+            conversation.ultimo_mensaje_contenido = mensaje.contenido or ''
+            conversation.ultimo_mensaje_direccion = mensaje.direccion
+
+            if mensaje.direccion == 'incoming':
+                if not conversation.ultimo_entrante_at or mensaje.created_at > conversation.ultimo_entrante_at:
+                    conversation.ultimo_entrante_at = mensaje.created_at
+                conversation.sin_responder = True
+            else:
+                assignment = ConversationStateService.get_active_assignment(conversation.numero_whatsapp)
+                assigned_user_id = assignment.assigned_to_user_id if assignment else None
+
+                if assigned_user_id and mensaje.enviado_por_id == assigned_user_id:
+                    conversation.vendedor_respondio = True
+                    if mensaje.created_at >= assignment.assigned_date:
+                        conversation.respondido_desde_asignacion = True
+
+                # Sin vendedor asignado cuenta cualquier respuesta
+                counts_as_response = not assigned_user_id or mensaje.enviado_por_id == assigned_user_id
+                if (counts_as_response and conversation.ultimo_entrante_at
+                        and mensaje.created_at > conversation.ultimo_entrante_at):
+                    conversation.sin_responder = False
+
+            conversation.save(update_fields=STATE_FIELDS)
+
+        # Mantener al día la instancia en memoria para que un save() posterior no pise el estado
+        if Mensaje._meta.get_field('conversacion').is_cached(mensaje):
+            for field in STATE_FIELDS:
+                setattr(mensaje.conversacion, field, getattr(conversation, field))
+
+    @staticmethod
+    def apply_incoming(conversation, mensaje):
+        """
+        Aplica en memoria un mensaje entrante al estado de la conversación (sin guardar);
+        para las inserciones en bloque, que no disparan post_save
+        """
+        conversation.ultimo_mensaje_contenido = mensaje.contenido or ''
+        conversation.ultimo_mensaje_direccion = 'incoming'
+        if not conversation.ultimo_entrante_at or mensaje.created_at > conversation.ultimo_entrante_at:
+            conversation.ultimo_entrante_at = mensaje.created_at
+        conversation.sin_responder = True
+
+    @staticmethod
+    def compute_states(conversations):
+        """
+        Calcula desde los mensajes el estado de varias conversaciones con un número
+        fijo de consultas: {conversation_id: {campo: valor}}
+        """
+        conversations = list(conversations)
+        if not conversations:
+            return {}
+
+        conversation_ids = [conversation.id for conversation in conversations]
+
+        # Último mensaje y último mensaje entrante de cada conversación (una consulta)
+        last_messages = {}
+        last_incoming_at = {}
+        latest_messages = Mensaje.objects.filter(
+            conversacion_id__in=conversation_ids
+        ).annotate(
+            rank_total=Window(
+                RowNumber(),
+                partition_by=[F('conversacion_id')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            ),
+            rank_direccion=Window(
+                RowNumber(),
+                partition_by=[F('conversacion_id'), F('direccion')],
+                order_by=[F('created_at').desc(), F('id').desc()],
+            ),
+        ).filter(Q(rank_total=1) | Q(rank_direccion=1)).only(
+            'conversacion_id', 'contenido', 'direccion', 'created_at'
+        )
+        for message in latest_messages:
+            if message.rank_total == 1:
+                last_messages[message.conversacion_id] = message
+            if message.rank_direccion == 1 and message.direccion == 'incoming':
+                last_incoming_at[message.conversacion_id] = message.created_at
+
+        # Asignación activa por número (la primera según el orden del modelo, como .first())
+        assignments = {}
+        for assignment in LeadAssignment.objects.filter(
+            lead__cliente__numero_whatsapp__in={c.numero_whatsapp for c in conversations},
+            is_active=True
+        ).annotate(
+            numero_whatsapp=F('lead__cliente__numero_whatsapp')
+        ).order_by('-assigned_date'):
+            assignments.setdefault(assignment.numero_whatsapp, assignment)
+
+        # Última respuesta saliente por conversación y remitente
+        outgoing_by_sender = {}
+        for row in Mensaje.objects.filter(
+            conversacion_id__in=conversation_ids,
+            direccion='outgoing'
+        ).order_by().values('conversacion_id', 'enviado_por_id').annotate(last_at=Max('created_at')):
+            outgoing_by_sender.setdefault(row['conversacion_id'], {})[row['enviado_por_id']] = row['last_at']
+
+        states = {}
+        for conversation in conversations:
+            last_message = last_messages.get(conversation.id)
+            incoming_at = last_incoming_at.get(conversation.id)
+            assignment = assignments.get(conversation.numero_whatsapp)
+            responses = outgoing_by_sender.get(conversation.id, {})
+            assigned_user_id = assignment.assigned_to_user_id if assignment else None
+
+            # Respuestas del vendedor asignado (o de cualquiera si no hay vendedor)
+            last_vendedor_response = responses.get(assigned_user_id) if assigned_user_id else None
+            if assigned_user_id:
+                counted_responses = [last_vendedor_response]
+            else:
+                counted_responses = responses.values()
+
+            states[conversation.id] = {
+                'ultimo_mensaje_contenido': last_message.contenido if last_message else '',
+                'ultimo_mensaje_direccion': last_message.direccion if last_message else '',
+                'ultimo_entrante_at': incoming_at,
+                'sin_responder': incoming_at is not None and not any(
+                    response_at is not None and response_at > incoming_at
+                    for response_at in counted_responses
+                ),
+                'vendedor_respondio': last_vendedor_response is not None,
+                'respondido_desde_asignacion': (
+                    last_vendedor_response is not None
+                    and last_vendedor_response >= assignment.assigned_date
+                ),
+            }
+        return states
+
+    @staticmethod
+    def refresh(conversation_ids):
+        """
+        Recalcula y guarda el estado de las conversaciones (backfill o cambio de asignación)
+        """
+        with transaction.atomic():
+            conversations = list(
+                Conversacion.objects.select_for_update().filter(id__in=list(conversation_ids)).order_by('id')
+            )
+            states = ConversationStateService.compute_states(conversations)
+            for conversation in conversations:
+                for field, value in states[conversation.id].items():
+                    setattr(conversation, field, value)
+            Conversacion.objects.bulk_update(conversations, STATE_FIELDS)
+        return len(conversations)
+
+    @staticmethod
+    def refresh_for_lead(lead_id):
+        """
+        Recalcula las conversaciones del cliente de un lead (cambió su asignación)
+        """
+        return ConversationStateService.refresh_for_leads([lead_id])
+
+    @staticmethod
+    def refresh_for_leads(lead_ids):
+        """
+        Igual que refresh_for_lead para muchos leads a la vez (asignación en bloque)
+        """
+        conversation_ids = Conversacion.objects.filter(
+            numero_whatsapp__in=Lead.objects.filter(pk__in=list(lead_ids)).values('cliente__numero_whatsapp')
+        ).values_list('id', flat=True)
+        return ConversationStateService.refresh(conversation_ids)
+
+    @staticmethod
+    def is_expired(conversation, now=None):
+        """
+        Han pasado más de SLA_HOURS desde el último entrante sin respuesta
+        """
+        if not conversation.sin_responder or not conversation.ultimo_entrante_at:
+            return False
+        now = now or timezone.now()
+        return (now - conversation.ultimo_entrante_at).total_seconds() / 3600 > SLA_HOURS
+
+    @staticmethod
+    def filter_expired(queryset, hours=SLA_HOURS):
+        """
+        Conversaciones sin responder hace más de `hours` horas (usa el índice conv_sin_responder_idx)
+        """
+        return queryset.filter(
+            sin_responder=True,
+            ultimo_entrante_at__lt=timezone.now() - timedelta(hours=hours)
+        )
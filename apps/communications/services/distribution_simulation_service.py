@@ -0,0 +1,333 @@
+# apps/communications/services/distribution_simulation_service.py
+import csv
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import Lead, LeadAssignment, LeadDistributionConfig
+import logging
+
+logger = logging.getLogger(__name__)
+
+SIN_LIMITE = np.iinfo(np.int64).max
+
+
+class _SequenceCache:
+    """
+    Secuencias de elección del Contador Acumulativo por estado de partida.
+
+    Para un conjunto de fuerzas elegibles, sus porcentajes, sus contadores del día
+    y el total del día, la secuencia de ganadores es siempre la misma: se calcula
+    una vez (extendiéndola cuando hace falta) y se reutiliza en todos los días que
+    pasan por ese estado. Así el bucle lead por lead en Python solo corre para los
+    estados nuevos, no para cada lead simulado.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, indexes, percentages, counts, total, length):
+        key = (indexes, percentages, counts, total)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = {
+                'chunks': [], 'length': 0, 'counts': list(counts), 'total': total
+            }
+        if entry['length'] < length:
+            chunk = self._greedy(indexes, percentages, entry, length - entry['length'])
+            entry['chunks'] = [np.concatenate(entry['chunks'] + [chunk])]
+            entry['length'] += len(chunk)
+        return entry['chunks'][0][:length]
+
+    @staticmethod
+    def _greedy(indexes, percentages, entry, length):
+        """
+        Mismo cálculo que LeadDistributionService._select_by_deficit (mismas
+        operaciones de punto flotante y desempate por orden de nombre)
+        """
+        counts, total = entry['counts'], entry['total']
+        shares = [percentage / 100 for percentage in percentages]
+        positions = range(len(indexes))
+        picks = np.empty(length, dtype=np.int32)
+
+        for step in range(length):
+            after = total + 1
+            best, max_deficit = -1, -999999
+            for position in positions:
+                deficit = shares[position] * after - counts[position]
+                if deficit > max_deficit:
+                    max_deficit, best = deficit, position
+            counts[best] += 1
+            total = after
+            picks[step] = indexes[best]
+
+        entry['total'] = total
+        return picks
+
+
+class DistributionSimulationService:
+    """
+    Simulación del reparto de leads (capacidad / what-if): reproduce una serie de
+    llegadas diarias con los límites diarios y semanales y los cambios de
+    configuración en el tiempo, y mide con NumPy el desvío de cada fuerza de venta
+    respecto de su porcentaje
+    """
+
+    @staticmethod
+    def get_units(configs=None):
+        """
+        Estado inicial de las fuerzas de venta (todas las configuraciones, activas
+        o no, en el orden de desempate del distribuidor: nombre de la unidad)
+        """
+        if configs is None:
+            configs = LeadDistributionConfig.objects.select_related(
+                'organizational_unit'
+            ).order_by('organizational_unit__name')
+
+        return [
+            {
+                'unit_id': config.organizational_unit_id,
+                'name': config.organizational_unit.name,
+                'distribution_percentage': float(config.distribution_percentage),
+                'max_leads_per_day': config.max_leads_per_day,
+                'max_leads_per_week': config.max_leads_per_week,
+                'is_active_for_leads': config.is_active_for_leads,
+            }
+            for config in configs
+        ]
+
+    @staticmethod
+    def historical_arrivals(days, end=None):
+        """
+        Leads creados por día local en los últimos `days` días (hasta `end`, incluido).
+        Devuelve (fecha inicial, array de leads por día).
+        """
+        end = end or timezone.localdate()
+        start = end - timedelta(days=days - 1)
+
+        volumes = np.zeros(days, dtype=np.int64)
+        per_day = Lead.objects.filter(
+            created_at__date__gte=start, created_at__date__lte=end
+        ).annotate(dia=TruncDate('created_at')).order_by().values_list('dia').annotate(total=Count('id'))
+        for day, total in per_day:
+            volumes[(day - start).days] = total
+
+        return start, volumes
+
+    @staticmethod
+    def poisson_arrivals(days, leads_per_day, start_date, seed=None, weekday_weights=None):
+        """
+        Serie sintética desde start_date: leads por día ~ Poisson(leads_per_day),
+        opcionalmente modulada por día de la semana (weekday_weights[0] = lunes, media 1)
+        """
+        rng = np.random.default_rng(seed)
+        means = np.full(days, float(leads_per_day))
+        if weekday_weights is not None:
+            weekdays = (np.arange(days) + start_date.weekday()) % 7
+            means *= np.asarray(weekday_weights, dtype=float)[weekdays]
+        return rng.poisson(means).astype(np.int64)
+
+    @staticmethod
+    def weekday_weights(days=90):
+        """
+        Peso de cada día de la semana en las llegadas históricas (lunes primero, media 1)
+        """
+        start, volumes = DistributionSimulationService.historical_arrivals(days)
+        weekdays = (np.arange(days) + start.weekday()) % 7
+        per_weekday = np.bincount(weekdays, weights=volumes, minlength=7) / np.maximum(
+            np.bincount(weekdays, minlength=7), 1
+        )
+        if not per_weekday.any():
+            return None
+        return per_weekday / per_weekday.mean()
+
+    @staticmethod
+    def historical_changes(start, end):
+        """
+        Cambios de configuración registrados en el snapshot de cada asignación
+        entre start y end: [{'day', 'unit_id', campos...}] cuando el porcentaje o
+        los límites de una unidad difieren de su asignación anterior.
+        Las activaciones / desactivaciones no quedan en el snapshot.
+        """
+        changes, last = [], {}
+        rows = LeadAssignment.objects.filter(
+            assigned_date__date__gte=start, assigned_date__date__lte=end
+        ).order_by('assigned_date').values_list(
+            'organizational_unit_id', 'assigned_date', 'distribution_config_snapshot'
+        )
+        for unit_id, assigned_date, snapshot in rows.iterator(chunk_size=5000):
+            if not snapshot or 'distribution_percentage' not in snapshot:
+                continue
+            values = {
+                field: snapshot.get(field)
+                for field in ('distribution_percentage', 'max_leads_per_day', 'max_leads_per_week')
+            }
+            if last.get(unit_id) != values:
+                last[unit_id] = values
+                changes.append({
+                    'day': (timezone.localdate(assigned_date) - start).days,
+                    'unit_id': unit_id,
+                    **values,
+                })
+        return changes
+
+    @staticmethod
+    def simulate(units, volumes, start_date, changes=()):
+        """
+        Reproduce la distribución día por día.
+
+        Args:
+            units: lista de get_units()
+            volumes: leads que llegan cada día (array o lista)
+            start_date: fecha del primer día (los contadores semanales se
+                reinician los lunes y arrancan en cero)
+            changes: [{'day': índice de día, 'unit_id': id, campo: valor}]
+                aplicados al inicio de ese día
+
+        Returns:
+            dict con 'dates', 'units' y arrays NumPy por día y unidad:
+            'assigned', 'week_total', 'max_deviation' (máximo desvío en leads
+            durante el día), 'close_deviation' (desvío al cierre), y por día
+            'arrivals' y 'unassigned'
+        """
+        volumes = np.asarray(volumes, dtype=np.int64)
+        days, size = len(volumes), len(units)
+        index_of = {unit['unit_id']: index for index, unit in enumerate(units)}
+
+        percentages = np.array([unit['distribution_percentage'] for unit in units], dtype=float)
+        day_caps = np.array([unit['max_leads_per_day'] or SIN_LIMITE for unit in units], dtype=np.int64)
+        week_caps = np.array([unit['max_leads_per_week'] or SIN_LIMITE for unit in units], dtype=np.int64)
+        active = np.array([bool(unit['is_active_for_leads']) for unit in units], dtype=bool)
+
+        changes_by_day = {}
+        for change in changes:
+            if change['unit_id'] in index_of:
+                changes_by_day.setdefault(change['day'], []).append(change)
+
+        assigned = np.zeros((days, size), dtype=np.int64)
+        week_total = np.zeros((days, size), dtype=np.int64)
+        max_deviation = np.zeros((days, size), dtype=float)
+        close_deviation = np.zeros((days, size), dtype=float)
+        unassigned = np.zeros(days, dtype=np.int64)
+
+        cache = _SequenceCache()
+        week_counts = np.zeros(size, dtype=np.int64)
+        unit_range = np.arange(size)
+
+        for day in range(days):
+            date = start_date + timedelta(days=day)
+            if date.weekday() == 0:
+                week_counts[:] = 0
+
+            for change in changes_by_day.get(day, ()):
+                index = index_of[change['unit_id']]
+                if 'distribution_percentage' in change:
+                    percentages[index] = float(change['distribution_percentage'])
+                if 'max_leads_per_day' in change:
+                    day_caps[index] = change['max_leads_per_day'] or SIN_LIMITE
+                if 'max_leads_per_week' in change:
+                    week_caps[index] = change['max_leads_per_week'] or SIN_LIMITE
+                if 'is_active_for_leads' in change:
+                    active[index] = bool(change['is_active_for_leads'])
+
+            counts = np.zeros(size, dtype=np.int64)
+            total, pending, segments = 0, int(volumes[day]), []
+
+            while pending > 0:
+                eligible = np.flatnonzero(active & (counts < day_caps) & (week_counts < week_caps))
+                if not len(eligible):
+                    break
+
+                picks = cache.get(
+                    tuple(int(index) for index in eligible),
+                    tuple(float(percentages[index]) for index in eligible),
+                    tuple(int(counts[index]) for index in eligible),
+                    total,
+                    pending,
+                )
+
+                # Cortar donde una fuerza alcanza su límite: desde ahí el conjunto elegible cambia
+                cut = pending
+                remaining = np.minimum(day_caps - counts, week_caps - week_counts)
+                for index in eligible:
+                    if remaining[index] >= cut:
+                        continue
+                    positions = np.flatnonzero(picks[:cut] == index)
+                    if len(positions) > remaining[index]:
+                        cut = int(positions[remaining[index] - 1]) + 1
+
+                segment = picks[:cut]
+                added = np.bincount(segment, minlength=size)
+                counts += added
+                week_counts += added
+                total += cut
+                pending -= cut
+                segments.append(segment)
+
+            unassigned[day] = pending
+            assigned[day] = counts
+            week_total[day] = week_counts
+
+            if total:
+                # Curva del día: acumulado de cada fuerza vs porcentaje × leads asignados
+                sequence = np.concatenate(segments)
+                cumulative = np.cumsum(sequence[:, None] == unit_range[None, :], axis=0)
+                expected = np.outer(np.arange(1, total + 1), np.where(active, percentages, 0.0) / 100)
+                deviation = cumulative - expected
+                max_deviation[day] = np.abs(deviation).max(axis=0)
+                close_deviation[day] = deviation[-1]
+
+        return {
+            'dates': [start_date + timedelta(days=day) for day in range(days)],
+            'units': units,
+            'arrivals': volumes,
+            'assigned': assigned,
+            'unassigned': unassigned,
+            'week_total': week_total,
+            'max_deviation': max_deviation,
+            'close_deviation': close_deviation,
+        }
+
+    @staticmethod
+    def summary(result):
+        """Totales por unidad del periodo simulado"""
+        total_assigned = int(result['assigned'].sum())
+        per_unit = result['assigned'].sum(axis=0)
+        return {
+            'total_arrivals': int(result['arrivals'].sum()),
+            'total_assigned': total_assigned,
+            'total_unassigned': int(result['unassigned'].sum()),
+            'units': [
+                {
+                    'name': unit['name'],
+                    'assigned': int(per_unit[index]),
+                    'final_percentage': per_unit[index] / total_assigned * 100 if total_assigned else 0.0,
+                    'max_deviation': float(result['max_deviation'][:, index].max()) if len(result['dates']) else 0.0,
+                }
+                for index, unit in enumerate(result['units'])
+            ],
+        }
+
+    @staticmethod
+    def write_csv(result, output):
+        """Una fila por día y fuerza de venta (para descargar desde la configuración)"""
+        writer = csv.writer(output)
+        writer.writerow([
+            'Fecha', 'Fuerza de Venta', 'Leads del Día', 'Asignados', 'Acumulado Semana',
+            'Desvío Máximo', 'Desvío al Cierre', 'Sin Asignar (día)'
+        ])
+        for day, date in enumerate(result['dates']):
+            for index, unit in enumerate(result['units']):
+                writer.writerow([
+                    date.isoformat(),
+                    unit['name'],
+                    int(result['arrivals'][day]),
+                    int(result['assigned'][day, index]),
+                    int(result['week_total'][day, index]),
+                    f"{result['max_deviation'][day, index]:.2f}",
+                    f"{result['close_deviation'][day, index]:+.2f}",
+                    int(result['unassigned'][day]),
+                ])
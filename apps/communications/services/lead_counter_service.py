@@ -0,0 +1,194 @@
+# apps/communications/services/lead_counter_service.py
+from collections import Counter
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ..models import LeadAssignment, LeadDistributionCounter
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LeadCounterService:
+    """
+    Contadores de asignaciones activas por fuerza de venta (día y semana) en
+    LeadDistributionCounter, actualizados con F() en cada cambio de asignación
+    """
+
+    @staticmethod
+    def periods_for(assigned_date):
+        """
+        Claves (periodo, fecha) que cuentan una asignación: su día local y el lunes de esa semana
+        """
+        day = timezone.localdate(assigned_date)
+        return [('dia', day), ('semana', day - timedelta(days=day.weekday()))]
+
+    @staticmethod
+    def counter_key(assignment):
+        """
+        (unidad, fecha de asignación) si la asignación cuenta, o None si está inactiva
+        """
+        if not assignment.is_active or not assignment.assigned_date:
+            return None
+        return assignment.organizational_unit_id, assignment.assigned_date
+
+    @staticmethod
+    def apply(deltas):
+        """
+        Aplica {(unidad, fecha de asignación): delta} a los contadores
+        """
+        changes = Counter()
+        for (unit_id, assigned_date), delta in deltas.items():
+            for periodo, fecha in LeadCounterService.periods_for(assigned_date):
+                changes[(unit_id, periodo, fecha)] += delta
+
+        for (unit_id, periodo, fecha), delta in sorted(changes.items()):
+            if not delta:
+                continue
+            counter = LeadDistributionCounter.objects.filter(
+                organizational_unit_id=unit_id, periodo=periodo, fecha=fecha
+            )
+            if counter.update(total=F('total') + delta):
+                continue
+            try:
+                with transaction.atomic():
+                    LeadDistributionCounter.objects.create(
+                        organizational_unit_id=unit_id, periodo=periodo, fecha=fecha, total=delta
+                    )
+            except IntegrityError:
+                # Otro proceso creó la fila entre el update y el create
+                counter.update(total=F('total') + delta)
+
+    @staticmethod
+    def register_change(old_key, new_key):
+        """
+        Pasa una asignación de old_key a new_key (cualquiera puede ser None)
+        """
+        if old_key == new_key:
+            return
+        deltas = Counter()
+        if old_key:
+            deltas[old_key] -= 1
+        if new_key:
+            deltas[new_key] += 1
+        LeadCounterService.apply(deltas)
+
+    @staticmethod
+    def deactivate(queryset):
+        """
+        Desactiva en bloque las asignaciones del queryset descontándolas de los contadores
+        (update() no dispara señales)
+        """
+        rows = list(
+            queryset.filter(is_active=True).values_list('id', 'organizational_unit_id', 'assigned_date')
+        )
+        if not rows:
+            return 0
+        LeadAssignment.objects.filter(id__in=[row[0] for row in rows]).update(is_active=False)
+        deltas = Counter()
+        for _, unit_id, assigned_date in rows:
+            deltas[(unit_id, assigned_date)] -= 1
+        LeadCounterService.apply(deltas)
+        return len(rows)
+
+    @staticmethod
+    def get_counts(today=None):
+        """
+        Contadores del día y de la semana en una consulta:
+        ({unidad: leads hoy}, {unidad: leads esta semana}, total de leads hoy)
+        """
+        today = today or timezone.localdate()
+        week_start = today - timedelta(days=today.weekday())
+
+        leads_today, leads_week = {}, {}
+        for unit_id, periodo, total in LeadDistributionCounter.objects.filter(
+            Q(periodo='dia', fecha=today) | Q(periodo='semana', fecha=week_start)
+        ).values_list('organizational_unit_id', 'periodo', 'total'):
+            (leads_today if periodo == 'dia' else leads_week)[unit_id] = total
+
+        return leads_today, leads_week, sum(leads_today.values())
+
+    @staticmethod
+    def compute_from_assignments(start, end):
+        """
+        Valores reales desde LeadAssignment para los días [start, end] y las
+        semanas que los contienen (completas): {(unidad, periodo, fecha): total}
+        """
+        week_from = start - timedelta(days=start.weekday())
+        week_to = end + timedelta(days=6 - end.weekday())
+        per_day = LeadAssignment.objects.filter(
+            is_active=True,
+            assigned_date__date__gte=week_from,
+            assigned_date__date__lte=week_to,
+        ).annotate(
+            dia=TruncDate('assigned_date')
+        ).order_by().values_list('organizational_unit_id', 'dia').annotate(total=Count('id'))
+
+        expected = Counter()
+        for unit_id, day, total in per_day:
+            if start <= day <= end:
+                expected[(unit_id, 'dia', day)] += total
+            expected[(unit_id, 'semana', day - timedelta(days=day.weekday()))] += total
+        return expected
+
+    @staticmethod
+    def reconcile(start, end):
+        """
+        Recalcula los contadores de los días [start, end] y de sus semanas.
+        Devuelve las diferencias corregidas [(unidad, periodo, fecha, guardado, real)].
+
+        Bloquea primero (el mismo bloqueo que el distribuidor y los contadores) y
+        recién después cuenta las asignaciones: una asignación confirmada antes ya
+        entra en el conteo y una posterior suma sobre el valor corregido.
+        """
+        from ..lead_distribution_service import LeadDistributionService
+
+        week_from = start - timedelta(days=start.weekday())
+
+        with transaction.atomic():
+            LeadDistributionService()._lock_configs()
+            stored = {
+                (counter.organizational_unit_id, counter.periodo, counter.fecha): counter
+                for counter in LeadDistributionCounter.objects.select_for_update().filter(
+                    Q(periodo='dia', fecha__gte=start, fecha__lte=end)
+                    | Q(periodo='semana', fecha__gte=week_from, fecha__lte=end)
+                )
+            }
+            expected = LeadCounterService.compute_from_assignments(start, end)
+
+            differences = []
+            to_update, to_create = [], []
+            for key in set(stored) | set(expected):
+                real = expected.get(key, 0)
+                counter = stored.get(key)
+                saved = counter.total if counter else 0
+                if saved == real:
+                    continue
+                differences.append((*key, saved, real))
+                if counter:
+                    counter.total = real
+                    to_update.append(counter)
+                else:
+                    unit_id, periodo, fecha = key
+                    to_create.append(LeadDistributionCounter(
+                        organizational_unit_id=unit_id, periodo=periodo, fecha=fecha, total=real
+                    ))
+
+            LeadDistributionCounter.objects.bulk_update(to_update, ['total'])
+            LeadDistributionCounter.objects.bulk_create(to_create)
+
+        if differences:
+            logger.warning(f'Contadores de distribución corregidos: {len(differences)}')
+        return sorted(differences, key=lambda row: (row[2], row[1], row[0]))
+
+    @staticmethod
+    def prune(keep_days):
+        """
+        Borra contadores más antiguos que keep_days días
+        """
+        limite = timezone.localdate() - timedelta(days=keep_days)
+        return LeadDistributionCounter.objects.filter(fecha__lt=limite).delete()[0]
@@ -4,6 +4,8 @@ from datetime import timedelta
 from django.db.models import Count, Q
 from django.shortcuts import get_object_or_404
 from ..models import Lead, LeadAssignment, LeadDistributionConfig
+from .lead_counter_service import LeadCounterService
+from .lead_visibility_service import LeadVisibilityService
 from apps.sales_team_management.models import TeamMembership, OrganizationalUnit
 import logging
 
@@ -120,9 +122,6 @@ class LeadService:
         """
         Obtiene configuraciones de distribución para todos los equipos
         """
-        from django.utils import timezone
-        from datetime import timedelta
-        
         # Obtener todas las configuraciones activas
         configs = LeadDistributionConfig.objects.filter(
             organizational_unit__unit_type='SALES',
@@ -130,18 +129,13 @@ class LeadService:
         ).select_related('organizational_unit').order_by('organizational_unit__name')
         
         configs_data = []
-        today = timezone.now().date()
-        week_start = today - timedelta(days=today.weekday())
+        # Contadores de asignaciones activas del día y la semana (una consulta)
+        counts_today, counts_week, _ = LeadCounterService.get_counts()
         
         for config in configs:
             # Estadísticas para este equipo
-            team_assignments = LeadAssignment.objects.filter(
-                organizational_unit=config.organizational_unit,
-                is_active=True
-            )
-            
-            leads_today = team_assignments.filter(assigned_date__date=today).count()
-            leads_week = team_assignments.filter(assigned_date__date__gte=week_start).count()
+            leads_today = counts_today.get(config.organizational_unit_id, 0)
+            leads_week = counts_week.get(config.organizational_unit_id, 0)
             team_members = TeamMembership.objects.filter(
                 organizational_unit=config.organizational_unit,
                 is_active=True
@@ -208,9 +202,9 @@ class LeadService:
         # Aplicar filtro de acceso jerárquico
         if team_info['is_team_member'] and team_info['user_team']:
             # Usuario con equipo - obtener leads accesibles según jerarquía
-            accessible_leads = LeadService.get_accessible_leads_for_management(user)
-            lead_ids = [lead.id for lead in accessible_leads]
-            queryset = queryset.filter(id__in=lead_ids).distinct()
+            queryset = queryset.filter(
+                LeadVisibilityService.lead_filter(user, LeadVisibilityService.MANAGEMENT)
+            )
         # Si no tiene equipo específico - puede ver TODOS los leads (sin filtro)
         
         # Aplicar filtros adicionales
@@ -237,93 +231,9 @@ class LeadService:
     def get_accessible_leads_for_management(user):
         """
         Obtiene leads accesibles para gestión según jerarquía del usuario
+        (queryset filtrado por la visibilidad cacheada, ver LeadVisibilityService)
         """
-        import logging
-        logger = logging.getLogger(__name__)
-        
-        from apps.sales_team_management.models import HierarchyRelation
-        
-        logger.info(f"🔍 DEBUG get_accessible_leads_for_management: user={user.username}")
-        
-        # Verificar si el usuario tiene equipo
-        user_membership = TeamMembership.objects.filter(
-            user=user,
-            is_active=True
-        ).select_related('organizational_unit', 'position_type').first()
-        
-        logger.info(f"🔍 DEBUG user_membership: {user_membership}")
-        if user_membership:
-            logger.info(f"🔍 DEBUG unit: {user_membership.organizational_unit.name} (type: {user_membership.organizational_unit.unit_type})")
-        
-        if not user_membership:
-            # Usuario sin equipo (admin, gerente comercial) - TODOS los leads
-            logger.info("🔍 DEBUG: Usuario sin equipo - devolviendo todos los leads")
-            return Lead.objects.filter(is_active=True).select_related('cliente')
-        
-        # Para equipos de venta (SALES), todos los miembros pueden ver todos los leads del equipo
-        # independientemente de la jerarquía
-        if user_membership.organizational_unit.unit_type == 'SALES':
-            logger.info(f"🔍 DEBUG: Usuario de equipo SALES - buscando leads del equipo {user_membership.organizational_unit.name}")
-            # Obtener TODOS los leads asignados al equipo (sin importar jerarquía)
-            team_assignments = LeadAssignment.objects.filter(
-                organizational_unit=user_membership.organizational_unit,
-                is_active=True
-            ).select_related('lead__cliente')
-            
-            logger.info(f"🔍 DEBUG: Encontradas {team_assignments.count()} asignaciones para el equipo")
-            
-            leads = [assignment.lead for assignment in team_assignments]
-            logger.info(f"🔍 DEBUG: Devolviendo {len(leads)} leads del equipo")
-            return leads
-        
-        # Para otros tipos de equipos, mantener la lógica jerárquica original
-        # Si es gerente de equipo, puede ver todos los leads de su equipo
-        if user_membership.position_type and 'gerente' in user_membership.position_type.name.lower():
-            # Gerente puede ver todos los leads asignados a su equipo
-            team_assignments = LeadAssignment.objects.filter(
-                organizational_unit=user_membership.organizational_unit,
-                is_active=True
-            ).select_related('lead__cliente')
-            
-            return [assignment.lead for assignment in team_assignments]
-        
-        # Usuario con equipo (no de ventas) - obtener leads de subalternos (lógica original)
-        subordinate_users = set()
-        
-        # 1. Supervisión directa
-        direct_subordinates = HierarchyRelation.objects.filter(
-            supervisor_membership__user=user,
-            is_active=True,
-            relation_type='DIRECT_SUPERVISION'
-        ).values_list('subordinate_membership__user', flat=True)
-        subordinate_users.update(direct_subordinates)
-        
-        # 2. Supervisión rígida (jerárquica)
-        hierarchical_subordinates = HierarchyRelation.objects.filter(
-            supervisor_membership__user=user,
-            is_active=True,
-            relation_type='HIERARCHICAL'
-        ).values_list('subordinate_membership__user', flat=True)
-        subordinate_users.update(hierarchical_subordinates)
-        
-        # 3. Incluir al propio usuario (puede ver sus propios leads también)
-        subordinate_users.add(user.id)
-        
-        # Si no tiene subalternos configurados pero está en un equipo, incluir todo el equipo
-        if not subordinate_users or len(subordinate_users) == 1:  # Solo tiene su propio usuario
-            team_members = TeamMembership.objects.filter(
-                organizational_unit=user_membership.organizational_unit,
-                is_active=True
-            ).values_list('user', flat=True)
-            subordinate_users.update(team_members)
-        
-        # Obtener leads asignados a todos los subalternos
-        subordinate_assignments = LeadAssignment.objects.filter(
-            assigned_to_user_id__in=subordinate_users,
-            is_active=True
-        ).select_related('lead__cliente')
-        
-        return [assignment.lead for assignment in subordinate_assignments]
+        return LeadVisibilityService.visible_leads(user, LeadVisibilityService.MANAGEMENT)
     
     @staticmethod
     def assign_lead_to_user(lead_id, assigned_to_user_id, assigned_by_user):
@@ -0,0 +1,132 @@
+# apps/communications/services/lead_visibility_service.py
+"""
+Visibilidad de leads por usuario: los usuarios y unidades cuyos leads puede ver
+(supervisión de chats o gestión de leads), calculados una vez desde el índice de
+jerarquía y guardados en la caché de Django bajo la versión de la jerarquía, que
+invalidan los signals de membresías, relaciones, posiciones, unidades y usuarios.
+
+Se expone como un filtro (Q) para componer en cualquier consulta de leads, de
+modo que listas y chequeos de acceso sean un solo predicado en SQL.
+"""
+import logging
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from ..models import Lead, LeadAssignment
+from apps.sales_team_management.hierarchy_index import PREFIX, get_hierarchy_index, hierarchy_version
+from apps.sales_team_management.models import TeamMembership
+
+logger = logging.getLogger(__name__)
+
+VISIBILITY_CACHE_TIMEOUT = getattr(settings, 'VISIBILITY_CACHE_TIMEOUT', 60 * 60)
+
+# all_leads: sin equipo (admin, gerente comercial), ve todos los leads activos;
+# si no, leads con asignación activa a alguno de user_ids o de unit_ids
+Visibility = namedtuple('Visibility', 'all_leads user_ids unit_ids')
+TODOS = Visibility(True, frozenset(), frozenset())
+
+GERENTES_EQUIPO = ('Gerente de Equipo', 'Team Manager')
+
+
+class LeadVisibilityService:
+    """
+    Alcances:
+    - SUPERVISION: leads del propio usuario y de todos sus subordinados (a
+      cualquier nivel); un gerente de equipo ve además a todo su equipo
+    - MANAGEMENT: en equipos de ventas o para gerentes, los leads asignados a la
+      unidad; si no, los de sus subordinados (o de todo el equipo si no tiene)
+    """
+
+    SUPERVISION = 'supervision'
+    MANAGEMENT = 'management'
+
+    @staticmethod
+    def compute(user_id, scope=SUPERVISION):
+        """Calcula la visibilidad sin caché (membresía activa más reciente del usuario)"""
+        membership = TeamMembership.objects.filter(
+            user_id=user_id,
+            is_active=True
+        ).select_related('organizational_unit', 'position_type').first()
+
+        if not membership:
+            return TODOS
+
+        unit = membership.organizational_unit
+        position_name = membership.position_type.name if membership.position_type else ''
+
+        def team_user_ids():
+            return TeamMembership.objects.filter(
+                organizational_unit=unit,
+                is_active=True
+            ).values_list('user_id', flat=True)
+
+        if scope == LeadVisibilityService.MANAGEMENT:
+            if unit.unit_type == 'SALES' or 'gerente' in position_name.lower():
+                return Visibility(False, frozenset(), frozenset([unit.id]))
+            user_ids = get_hierarchy_index().subordinate_user_ids(user_id) | {user_id}
+            if len(user_ids) == 1:
+                # Sin subalternos configurados: todo el equipo
+                user_ids.update(team_user_ids())
+            return Visibility(False, frozenset(user_ids), frozenset())
+
+        user_ids = get_hierarchy_index().subordinate_user_ids(user_id) | {user_id}
+        if position_name in GERENTES_EQUIPO:
+            user_ids.update(team_user_ids())
+        return Visibility(False, frozenset(user_ids), frozenset())
+
+    @staticmethod
+    def get_visibility(user, scope=SUPERVISION):
+        """Visibilidad vigente del usuario (caché de Django, luego cálculo)"""
+        try:
+            clave = f'{PREFIX}:visibilidad:{hierarchy_version()}:{scope}:{user.id}'
+            visibility = cache.get(clave)
+        except Exception as e:
+            logger.warning(f"Caché de visibilidad no disponible: {e}")
+            return LeadVisibilityService.compute(user.id, scope)
+
+        if visibility is None:
+            visibility = LeadVisibilityService.compute(user.id, scope)
+            try:
+                cache.set(clave, visibility, timeout=VISIBILITY_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar la visibilidad en caché: {e}")
+        return visibility
+
+    @staticmethod
+    def lead_filter(user, scope=SUPERVISION):
+        """
+        Q sobre Lead con los leads visibles para el usuario; componible con otros
+        filtros (Lead.objects.filter(LeadVisibilityService.lead_filter(user), ...))
+        """
+        visibility = LeadVisibilityService.get_visibility(user, scope)
+        if visibility.all_leads:
+            return Q(is_active=True)
+
+        assignment_filter = Q(pk__in=[])
+        if visibility.user_ids:
+            assignment_filter |= Q(assigned_to_user_id__in=visibility.user_ids)
+        if visibility.unit_ids:
+            assignment_filter |= Q(organizational_unit_id__in=visibility.unit_ids)
+
+        return Q(Exists(LeadAssignment.objects.filter(
+            assignment_filter, lead=OuterRef('pk'), is_active=True
+        )))
+
+    @staticmethod
+    def visible_leads(user, scope=SUPERVISION):
+        """Queryset de leads visibles para el usuario"""
+        return Lead.objects.filter(LeadVisibilityService.lead_filter(user, scope)).select_related('cliente')
+
+    @staticmethod
+    def can_see_conversation(user, conversation, scope=SUPERVISION):
+        """¿El lead activo de la conversación es visible para el usuario? (una consulta)"""
+        if LeadVisibilityService.get_visibility(user, scope).all_leads:
+            return True
+        return Lead.objects.filter(
+            LeadVisibilityService.lead_filter(user, scope),
+            cliente__numero_whatsapp=conversation.numero_whatsapp,
+            is_active=True
+        ).exists()
@@ -0,0 +1,189 @@
+# apps/communications/services/media_fetch_service.py
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections
+from django.utils import timezone
+
+from ..models import WhatsAppConfig
+import requests
+from requests.adapters import HTTPAdapter
+import logging
+
+logger = logging.getLogger(__name__)
+
+# API de medios de WhatsApp (se puede apuntar al stub local: python manage.py media_stub_server)
+WHATSAPP_GRAPH_API_URL = getattr(settings, 'WHATSAPP_GRAPH_API_URL', 'https://graph.facebook.com/v22.0')
+
+# Tamaño máximo por tipo de medio (límites de WhatsApp Cloud API)
+MEDIA_DOWNLOAD_MAX_BYTES = {
+    'image': 5 * 1024 * 1024,
+    'audio': 16 * 1024 * 1024,
+    'video': 16 * 1024 * 1024,
+    'document': 100 * 1024 * 1024,
+    **getattr(settings, 'MEDIA_DOWNLOAD_MAX_BYTES', {}),
+}
+# Descargas simultáneas por proceso
+MEDIA_DOWNLOAD_CONCURRENCY = getattr(settings, 'MEDIA_DOWNLOAD_CONCURRENCY', 4)
+# (conexión, lectura entre bloques) en segundos
+MEDIA_DOWNLOAD_TIMEOUT = getattr(settings, 'MEDIA_DOWNLOAD_TIMEOUT', (5, 30))
+MEDIA_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class MediaTooLarge(Exception):
+    """El archivo supera el tamaño máximo permitido para su tipo"""
+
+
+class MediaFetchService:
+    """
+    Descarga de archivos multimedia de WhatsApp: sesión HTTP con pool de
+    conexiones, descarga por bloques a disco (sin cargar el archivo en memoria),
+    límite de tamaño por tipo y concurrencia acotada
+    """
+
+    @staticmethod
+    def get_session():
+        """
+        Sesión HTTP compartida por el proceso (reutiliza conexiones keep-alive)
+        """
+        global _session
+        if _session is None:
+            with _session_lock:
+                if _session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=MEDIA_DOWNLOAD_CONCURRENCY,
+                        pool_maxsize=MEDIA_DOWNLOAD_CONCURRENCY * 2,
+                        max_retries=2,
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    _session = session
+        return _session
+
+    @staticmethod
+    def fetch_many(items, max_workers=None):
+        """
+        Descarga varios medios en paralelo.
+        items: [(mensaje, media_url_or_id, message_type, media_data)]; devuelve [bool]
+        """
+        items = list(items)
+        if not items:
+            return []
+
+        config = WhatsAppConfig.objects.filter(is_active=True).first()
+        if not config:
+            logger.error("No hay configuración activa para descargar media")
+            return [False] * len(items)
+
+        def fetch_in_thread(item):
+            try:
+                return MediaFetchService.fetch(*item, config=config)
+            finally:
+                # Cada hilo usa su propia conexión a la BD
+                connections.close_all()
+
+        if len(items) == 1:
+            return [MediaFetchService.fetch(*items[0], config=config)]
+
+        with ThreadPoolExecutor(max_workers=max_workers or MEDIA_DOWNLOAD_CONCURRENCY) as executor:
+            return list(executor.map(fetch_in_thread, items))
+
+    @staticmethod
+    def fetch(mensaje, media_url_or_id, message_type, media_data, config=None):
+        """
+        Descarga un medio y lo guarda en archivo_local, completando tamaño y tipo MIME
+        """
+        media_data = media_data or {}
+        temp_path = None
+        try:
+            config = config or WhatsAppConfig.objects.filter(is_active=True).first()
+            if not config:
+                logger.error("No hay configuración activa para descargar media")
+                return False
+
+            session = MediaFetchService.get_session()
+            headers = {'Authorization': f'Bearer {config.access_token}'}
+            max_bytes = MEDIA_DOWNLOAD_MAX_BYTES.get(message_type, MEDIA_DOWNLOAD_MAX_BYTES['document'])
+
+            # Si es un ID (formato nuevo), obtener información del archivo primero
+            if media_url_or_id and not media_url_or_id.startswith('http'):
+                info_response = session.get(
+                    f'{WHATSAPP_GRAPH_API_URL}/{media_url_or_id}',
+                    headers=headers,
+                    timeout=MEDIA_DOWNLOAD_TIMEOUT
+                )
+                if info_response.status_code != 200:
+                    logger.error(f"Error obteniendo info de media con ID {media_url_or_id}: {info_response.status_code}")
+                    return False
+                media_info = info_response.json()
+                download_url = media_info.get('url')
+                mime_type = media_info.get('mime_type', 'application/octet-stream')
+                declared_size = media_info.get('file_size')
+            else:
+                # Es una URL directa (formato antiguo)
+                download_url = media_url_or_id
+                mime_type = media_data.get('mime_type', 'application/octet-stream')
+                declared_size = media_data.get('file_size')
+
+            if not download_url:
+                logger.error("No se encontró URL de descarga")
+                return False
+            if declared_size and int(declared_size) > max_bytes:
+                raise MediaTooLarge(f'{declared_size} bytes (máximo {max_bytes})')
+
+            # Descargar por bloques a un archivo temporal
+            with session.get(download_url, headers=headers, stream=True, timeout=MEDIA_DOWNLOAD_TIMEOUT) as response:
+                if response.status_code != 200:
+                    logger.error(f"Error descargando archivo: {response.status_code}")
+                    return False
+                content_length = response.headers.get('Content-Length')
+                if content_length and int(content_length) > max_bytes:
+                    raise MediaTooLarge(f'{content_length} bytes (máximo {max_bytes})')
+
+                size = 0
+                fd, temp_path = tempfile.mkstemp(prefix='whatsapp_media_', dir=settings.FILE_UPLOAD_TEMP_DIR)
+                with os.fdopen(fd, 'wb') as temp_file:
+                    for chunk in response.iter_content(chunk_size=MEDIA_DOWNLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise MediaTooLarge(f'más de {max_bytes} bytes')
+                        temp_file.write(chunk)
+
+            # Generar nombre de archivo
+            from .message_service import MessageService
+            file_extension = MessageService._get_file_extension_from_mime(mime_type)
+            filename = f"{message_type}_{mensaje.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}{file_extension}"
+
+            # Copiar al storage (MEDIA_ROOT) por bloques y actualizar el mensaje
+            with open(temp_path, 'rb') as temp_file:
+                mensaje.archivo_local.save(filename, File(temp_file), save=False)
+            mensaje.archivo_tipo_mime = mime_type
+            mensaje.archivo_nombre = media_data.get('filename', filename)
+            mensaje.archivo_tamaño = size
+            mensaje.save(update_fields=['archivo_local', 'archivo_tipo_mime', 'archivo_nombre', 'archivo_tamaño'])
+
+            logger.info(f"Archivo descargado y guardado: {filename} ({size} bytes)")
+
+            # Los audios se convierten a OGG en segundo plano (process_audio_queue)
+            if message_type == 'audio':
+                from .audio_transcode_service import AudioTranscodeService
+                AudioTranscodeService.enqueue(mensaje)
+            return True
+
+        except MediaTooLarge as e:
+            logger.warning(f"Archivo multimedia del mensaje {mensaje.id} descartado por tamaño: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Error descargando archivo multimedia: {str(e)}")
+            return False
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
@@ -1,17 +1,40 @@
 # apps/communications/services/message_service.py
 from django.utils import timezone
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
 from ..models import Mensaje, Conversacion, WhatsAppConfig, Cliente, WebhookDebugMessage
+from .media_fetch_service import MediaFetchService
+from .audio_transcode_service import AudioTranscodeService
 import requests
 import logging
 import os
 import tempfile
-import subprocess
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Estados de entrega del webhook de Meta -> Mensaje.estado
+WEBHOOK_STATUS_MAP = {
+    'sent': 'enviado',
+    'delivered': 'entregado',
+    'read': 'leido',
+    'failed': 'error',
+}
+# Estados posteriores a cada uno (un mensaje no retrocede de estado)
+WEBHOOK_STATUS_LATER = {
+    'enviado': ['entregado', 'leido', 'error'],
+    'entregado': ['leido', 'error'],
+    'leido': ['error'],
+    'error': [],
+}
+
+# IDs de mensajes ya guardados, recordados en caché para descartar reenvíos de Meta
+WEBHOOK_SEEN_TIMEOUT = getattr(settings, 'WEBHOOK_SEEN_TIMEOUT', 60 * 60 * 24)
+WEBHOOK_SEEN_PREFIX = 'webhook:wamid'
+WEBHOOK_DUPLICATES_COUNTER = 'webhook:contador:duplicados'
+
 
 class MessageService:
     """
@@ -297,45 +320,12 @@ class MessageService:
     @staticmethod
     def convert_audio_to_ogg(message_id):
         """
-        Convierte audio a formato OGG para reproducción web
+        Convierte audio a formato OGG para reproducción web (en la petición actual;
+        lo normal es que lo haga process_audio_queue al recibir el audio)
         """
         try:
             mensaje = Mensaje.objects.get(id=message_id)
-            
-            if not mensaje.archivo_local or mensaje.tipo != 'audio':
-                return False, "No es un mensaje de audio válido"
-            
-            # Verificar si ya existe conversión
-            ogg_path = mensaje.archivo_local.path.replace('.m4a', '.ogg').replace('.mp3', '.ogg')
-            if os.path.exists(ogg_path):
-                return True, ogg_path
-            
-            # Convertir usando ffmpeg
-            input_path = mensaje.archivo_local.path
-            
-            # Comando ffmpeg para conversión optimizada
-            cmd = [
-                'ffmpeg', '-y',  # -y para sobrescribir
-                '-i', input_path,
-                '-c:a', 'libvorbis',  # Codec de audio Vorbis
-                '-q:a', '4',  # Calidad media
-                '-ac', '1',  # Mono
-                '-ar', '22050',  # Sample rate reducido
-                ogg_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-            
-            if result.returncode == 0:
-                logger.info(f'Audio convertido: {input_path} -> {ogg_path}')
-                return True, ogg_path
-            else:
-                logger.error(f'Error conversión audio: {result.stderr}')
-                return False, result.stderr
-                
-        except subprocess.TimeoutExpired:
-            logger.error(f'Timeout convirtiendo audio {message_id}')
-            return False, "Timeout en conversión"
+            return AudioTranscodeService.convert_now(mensaje)
         except Exception as e:
             logger.error(f'Error convirtiendo audio {message_id}: {str(e)}')
             return False, str(e)
@@ -343,119 +333,349 @@ class MessageService:
     @staticmethod
     def process_incoming_webhook_message(webhook_data):
         """
-        Procesa un mensaje entrante del webhook de WhatsApp
+        Procesa un payload del webhook de WhatsApp: todas las entries, changes,
+        mensajes y estados, con las escrituras en bloque dentro de una transacción
         """
         try:
-            # Extraer datos del webhook
-            entry = webhook_data.get('entry', [{}])[0]
-            changes = entry.get('changes', [{}])[0]
-            value = changes.get('value', {})
-            messages = value.get('messages', [])
+            incoming, statuses = MessageService._parse_webhook_payload(webhook_data)
+            
+            if statuses:
+                MessageService._apply_message_statuses(statuses)
+            
+            # Descartar reenvíos antes de cualquier otro trabajo
+            parsed = incoming
+            incoming = MessageService._discard_seen_messages(parsed)
+            mensajes = []
+            if incoming:
+                with transaction.atomic():
+                    mensajes, incoming = MessageService._store_incoming_messages(incoming)
+            
+            # Leads antes de las descargas (lentas): si el worker cae o pierde el evento
+            # después, el reintento descarta los mensajes como ya vistos, pero los
+            # números que quedaron sin lead lo reciben igual
+            stored_ids = {message['id'] for message in incoming}
+            redelivered = [message for message in parsed if message['id'] not in stored_ids]
+            MessageService._create_leads(incoming + MessageService._without_lead(redelivered))
+            
+            if not incoming:
+                return True, "Mensajes procesados correctamente"
+            
+            # Descargas fuera de la transacción (llamadas HTTP); los medios se
+            # descargan en paralelo con concurrencia acotada
+            MediaFetchService.fetch_many([
+                (mensaje, message['media_url'], message['type'], message['media_data'])
+                for mensaje, message in zip(mensajes, incoming)
+                if message['media_url'] and message['type'] in ['image', 'audio', 'video', 'document']
+            ])
+            
+            logger.info(f'{len(incoming)} mensajes procesados de {len({m["from"] for m in incoming})} números')
+            return True, "Mensajes procesados correctamente"
             
-            for message_data in messages:
-                phone_number = message_data.get('from', '')
-                message_type = message_data.get('type', 'text')
-                timestamp = message_data.get('timestamp')
-                
-                # Buscar o crear cliente primero
-                cliente, cliente_created = Cliente.objects.get_or_create(
-                    numero_whatsapp=phone_number,
-                    defaults={
-                        'nombre': f'Cliente {phone_number}',
-                        'apellido': '',
-                        'origen': 'whatsapp',
-                        'estado': 'prospecto'
-                    }
-                )
-                
-                # Buscar o crear conversación con cliente
-                conversation, created = Conversacion.objects.get_or_create(
-                    numero_whatsapp=phone_number,
-                    defaults={
-                        'cliente': cliente,
-                        'estado': 'abierta',
-                        'ultimo_mensaje_at': timezone.now()
-                    }
+        except Exception as e:
+            logger.error(f'Error procesando webhook: {str(e)}')
+            return False, str(e)
+    
+    @staticmethod
+    def _create_leads(incoming):
+        """
+        Crea el lead automáticamente y lo asigna usando el algoritmo. Tras el primer
+        mensaje que genera lead, los siguientes del mismo número encuentran el lead
+        o su asignación y no hacen nada más
+        """
+        phones_with_lead = set()
+        for message in incoming:
+            if message['from'] in phones_with_lead:
+                continue
+            if not MessageService._should_create_lead(message['content'], message['type']):
+                continue
+            try:
+                lead = MessageService._create_lead_from_message(
+                    message['from'], message['content'], message['type']
                 )
+                if lead:
+                    phones_with_lead.add(message['from'])
+            except Exception as lead_error:
+                logger.error(f'⚠️ Error al crear lead automático: {str(lead_error)}')
+    
+    @staticmethod
+    def _without_lead(incoming):
+        """
+        Mensajes de números que todavía no tienen ningún lead (una consulta)
+        """
+        from ..models import Lead
+        
+        if not incoming:
+            return []
+        def clean(phone):
+            # Mismo número que usa _create_lead_from_message para el cliente
+            return phone.replace('+', '').replace(' ', '')
+        
+        with_lead = set(Lead.objects.filter(
+            cliente__numero_whatsapp__in={clean(message['from']) for message in incoming}
+        ).values_list('cliente__numero_whatsapp', flat=True))
+        return [message for message in incoming if clean(message['from']) not in with_lead]
+    
+    @staticmethod
+    def _parse_webhook_payload(webhook_data):
+        """
+        Recorre entries y changes del payload y devuelve (mensajes entrantes normalizados,
+        {whatsapp_message_id: estado} con el último estado informado de cada mensaje)
+        """
+        incoming = []
+        statuses = {}
+        
+        for entry in webhook_data.get('entry') or []:
+            for change in entry.get('changes') or []:
+                value = change.get('value') or {}
                 
-                # Si la conversación existe pero no tiene cliente, asignarlo
-                if not conversation.cliente:
-                    conversation.cliente = cliente
-                    conversation.save()
-                
-                # Procesar contenido según tipo
-                content = ""
-                media_url = None
-                
-                if message_type == 'text':
-                    content = message_data.get('text', {}).get('body', '')
-                elif message_type in ['image', 'audio', 'video', 'document']:
-                    media_data = message_data.get(message_type, {})
-                    # Nuevo formato de WhatsApp: usar 'id' en lugar de 'url'
-                    media_url = media_data.get('url') or media_data.get('id')
-                    content = media_data.get('caption', f'Archivo {message_type}')
-                
-                # Crear mensaje
-                # Convertir timestamp de WhatsApp a datetime timezone-aware
-                timestamp_dt = None
-                if timestamp:
-                    try:
-                        timestamp_dt = timezone.make_aware(datetime.fromtimestamp(int(timestamp)))
-                    except (ValueError, TypeError):
-                        timestamp_dt = timezone.now()
-                else:
+                for message_data in value.get('messages') or []:
+                    message_type = message_data.get('type', 'text')
+                    
+                    # Procesar contenido según tipo
+                    content = ""
+                    media_url = None
+                    media_data = None
+                    if message_type == 'text':
+                        content = message_data.get('text', {}).get('body', '')
+                    elif message_type in ['image', 'audio', 'video', 'document']:
+                        media_data = message_data.get(message_type, {})
+                        # Nuevo formato de WhatsApp: usar 'id' en lugar de 'url'
+                        media_url = media_data.get('url') or media_data.get('id')
+                        content = media_data.get('caption', f'Archivo {message_type}')
+                    
+                    # Convertir timestamp de WhatsApp a datetime timezone-aware
+                    timestamp = message_data.get('timestamp')
                     timestamp_dt = timezone.now()
+                    if timestamp:
+                        try:
+                            timestamp_dt = timezone.make_aware(datetime.fromtimestamp(int(timestamp)))
+                        except (ValueError, TypeError):
+                            pass
+                    
+                    incoming.append({
+                        'from': message_data.get('from', ''),
+                        'id': message_data.get('id', ''),
+                        'type': message_type,
+                        'content': content,
+                        'media_url': media_url,
+                        'media_data': media_data,
+                        'timestamp': timestamp_dt,
+                        'raw': message_data,
+                    })
                 
-                mensaje = Mensaje.objects.create(
-                    conversacion=conversation,
-                    contenido=content,
-                    tipo=message_type,
-                    direccion='incoming',
-                    estado='received',
-                    timestamp_whatsapp=timestamp_dt,
-                    media_url=media_url or '',  # Asegurar que no sea None
-                    whatsapp_message_id=message_data.get('id', '')
+                for status_data in value.get('statuses') or []:
+                    estado = WEBHOOK_STATUS_MAP.get(status_data.get('status'))
+                    if estado and status_data.get('id'):
+                        statuses[status_data['id']] = estado
+        
+        return incoming, statuses
+    
+    @staticmethod
+    def _discard_seen_messages(incoming):
+        """
+        Quita los mensajes repetidos dentro del payload y los que la caché ya
+        registró como guardados (reenvíos de Meta)
+        """
+        unique, duplicates = [], 0
+        seen_ids = set()
+        for message in incoming:
+            if message['id'] and message['id'] in seen_ids:
+                duplicates += 1
+                continue
+            seen_ids.add(message['id'])
+            unique.append(message)
+        
+        try:
+            cached = cache.get_many([f'{WEBHOOK_SEEN_PREFIX}:{message_id}' for message_id in seen_ids if message_id])
+        except Exception as e:
+            logger.warning(f'Caché de mensajes vistos no disponible: {e}')
+            cached = {}
+        if cached:
+            before = len(unique)
+            unique = [m for m in unique if f'{WEBHOOK_SEEN_PREFIX}:{m["id"]}' not in cached]
+            duplicates += before - len(unique)
+        
+        MessageService._count_duplicates(duplicates)
+        return unique
+    
+    @staticmethod
+    def _remember_seen_messages(message_ids):
+        """
+        Registra en caché los IDs guardados (llamar tras el commit)
+        """
+        try:
+            cache.set_many(
+                {f'{WEBHOOK_SEEN_PREFIX}:{message_id}': 1 for message_id in message_ids if message_id},
+                timeout=WEBHOOK_SEEN_TIMEOUT
+            )
+        except Exception as e:
+            logger.warning(f'No se pudieron registrar los mensajes vistos: {e}')
+    
+    @staticmethod
+    def _count_duplicates(duplicates):
+        """
+        Suma al contador de mensajes duplicados descartados
+        """
+        if not duplicates:
+            return
+        logger.info(f'🔁 {duplicates} mensajes duplicados descartados')
+        try:
+            cache.add(WEBHOOK_DUPLICATES_COUNTER, 0, timeout=None)
+            cache.incr(WEBHOOK_DUPLICATES_COUNTER, duplicates)
+        except Exception as e:
+            logger.warning(f'No se pudo actualizar el contador de duplicados: {e}')
+    
+    @staticmethod
+    def duplicate_count():
+        """
+        Mensajes duplicados descartados desde que se reinició el contador
+        """
+        return cache.get(WEBHOOK_DUPLICATES_COUNTER, 0)
+    
+    @staticmethod
+    def _apply_message_statuses(statuses):
+        """
+        Actualiza el estado de los mensajes salientes: un UPDATE por estado,
+        sin retroceder mensajes que ya tienen un estado posterior
+        """
+        ids_by_estado = {}
+        for message_id, estado in statuses.items():
+            ids_by_estado.setdefault(estado, []).append(message_id)
+        
+        for estado, message_ids in ids_by_estado.items():
+            Mensaje.objects.filter(
+                whatsapp_message_id__in=message_ids,
+                direccion='outgoing'
+            ).exclude(
+                estado__in=[estado] + WEBHOOK_STATUS_LATER[estado]
+            ).update(estado=estado)
+    
+    @staticmethod
+    def _store_incoming_messages(incoming):
+        """
+        Guarda los mensajes entrantes en bloque: clientes y conversaciones de todos
+        los números en una consulta cada uno, mensajes y debug con bulk_create y
+        contadores de la conversación con F(). Los mensajes ya guardados se descartan.
+        Devuelve (Mensajes creados, mensajes del payload correspondientes).
+        """
+        from .conversation_state_service import ConversationStateService, STATE_FIELDS
+        
+        phones = list(dict.fromkeys(message['from'] for message in incoming))
+        config = WhatsAppConfig.objects.filter(is_active=True).first()
+        
+        # Buscar o crear clientes
+        clientes = {c.numero_whatsapp: c for c in Cliente.objects.filter(numero_whatsapp__in=phones)}
+        missing = [phone for phone in phones if phone not in clientes]
+        if missing:
+            Cliente.objects.bulk_create([
+                Cliente(
+                    numero_whatsapp=phone,
+                    nombre=f'Cliente {phone}',
+                    apellido='',
+                    origen='whatsapp',
+                    estado='prospecto'
                 )
-                
-                # Crear WebhookDebugMessage para mostrar en el historial de configuración
-                try:
-                    config = WhatsAppConfig.objects.filter(is_active=True).first()
-                    WebhookDebugMessage.objects.create(
+                for phone in missing
+            ], ignore_conflicts=True)
+            clientes.update({
+                c.numero_whatsapp: c for c in Cliente.objects.filter(numero_whatsapp__in=missing)
+            })
+        
+        # Buscar o crear conversaciones (bloqueadas para actualizar su estado)
+        conversations = {
+            c.numero_whatsapp: c
+            for c in Conversacion.objects.select_for_update().filter(numero_whatsapp__in=phones)
+        }
+        missing = [phone for phone in phones if phone not in conversations]
+        if missing:
+            nuevas = Conversacion.objects.bulk_create([
+                Conversacion(
+                    numero_whatsapp=phone,
+                    cliente=clientes[phone],
+                    estado='abierta',
+                    ultimo_mensaje_at=timezone.now()
+                )
+                for phone in missing
+            ])
+            conversations.update({c.numero_whatsapp: c for c in nuevas})
+        
+        # Descartar los ya guardados (con las conversaciones bloqueadas, un reenvío
+        # concurrente del mismo número espera aquí y ve los mensajes confirmados)
+        existing = set(Mensaje.objects.filter(
+            whatsapp_message_id__in=[message['id'] for message in incoming if message['id']]
+        ).values_list('whatsapp_message_id', flat=True))
+        if existing:
+            MessageService._count_duplicates(sum(1 for m in incoming if m['id'] in existing))
+            incoming = [message for message in incoming if message['id'] not in existing]
+        if not incoming:
+            return [], []
+        
+        # Crear mensajes: insert-or-ignore sobre el índice único de whatsapp_message_id
+        mensajes = [
+            Mensaje(
+                conversacion=conversations[message['from']],
+                contenido=message['content'],
+                tipo=message['type'],
+                direccion='incoming',
+                estado='received',
+                timestamp_whatsapp=message['timestamp'],
+                media_url=message['media_url'] or '',  # Asegurar que no sea None
+                whatsapp_message_id=message['id']
+            )
+            for message in incoming
+        ]
+        with_id = [mensaje for mensaje in mensajes if mensaje.whatsapp_message_id]
+        Mensaje.objects.bulk_create(with_id, ignore_conflicts=True)
+        Mensaje.objects.bulk_create([mensaje for mensaje in mensajes if not mensaje.whatsapp_message_id])
+        if with_id:
+            # ignore_conflicts no devuelve los pk: releerlos
+            pks = dict(Mensaje.objects.filter(
+                whatsapp_message_id__in=[mensaje.whatsapp_message_id for mensaje in with_id]
+            ).values_list('whatsapp_message_id', 'pk'))
+            for mensaje in with_id:
+                mensaje.pk = pks.get(mensaje.whatsapp_message_id)
+                mensaje._state.adding = False
+        
+        stored_ids = [mensaje.whatsapp_message_id for mensaje in mensajes]
+        transaction.on_commit(lambda: MessageService._remember_seen_messages(stored_ids))
+        
+        # Crear WebhookDebugMessage para mostrar en el historial de configuración
+        try:
+            with transaction.atomic():
+                WebhookDebugMessage.objects.bulk_create([
+                    WebhookDebugMessage(
                         tipo='incoming',
-                        numero_telefono=phone_number,
-                        contenido=content,
-                        raw_data=message_data,
+                        numero_telefono=message['from'],
+                        contenido=message['content'],
+                        raw_data=message['raw'],
                         estado='procesado',
                         config_utilizada=config
                     )
-                except Exception as debug_error:
-                    logger.warning(f'Error creando WebhookDebugMessage: {debug_error}')
-                
-                # Descargar y guardar archivo si es multimedia
-                if media_url and message_type in ['image', 'audio', 'video', 'document']:
-                    try:
-                        MessageService._download_and_save_media(mensaje, media_url, message_type, media_data)
-                    except Exception as download_error:
-                        logger.error(f'⚠️ Error descargando archivo: {str(download_error)}')
-                
-                # Actualizar contadores
-                conversation.mensajes_no_leidos += 1
-                conversation.ultimo_mensaje_at = timezone.now()
-                conversation.save()
-                
-                # NUEVA FUNCIONALIDAD: Crear lead automáticamente y asignar usando algoritmo
-                try:
-                    MessageService._create_lead_from_message(phone_number, content, message_type)
-                except Exception as lead_error:
-                    logger.error(f'⚠️ Error al crear lead automático: {str(lead_error)}')
-                
-                logger.info(f'Mensaje procesado: {phone_number} - {message_type}')
-            
-            return True, "Mensajes procesados correctamente"
-            
-        except Exception as e:
-            logger.error(f'Error procesando webhook: {str(e)}')
-            return False, str(e)
+                    for message in incoming
+                ])
+        except Exception as debug_error:
+            logger.warning(f'Error creando WebhookDebugMessage: {debug_error}')
+        
+        # Actualizar contadores y estado desnormalizado (bulk_create no dispara post_save)
+        received = {}
+        for mensaje in mensajes:
+            conversation = mensaje.conversacion
+            received[conversation.id] = received.get(conversation.id, 0) + 1
+            ConversationStateService.apply_incoming(conversation, mensaje)
+        
+        now = timezone.now()
+        updated = list({c.id: c for c in conversations.values() if c.id in received}.values())
+        for conversation in updated:
+            conversation.mensajes_no_leidos = F('mensajes_no_leidos') + received[conversation.id]
+            conversation.ultimo_mensaje_at = now
+        Conversacion.objects.bulk_update(
+            updated, ['mensajes_no_leidos', 'ultimo_mensaje_at'] + STATE_FIELDS
+        )
+        for conversation in updated:
+            # Dejar el contador diferido: se relee de la BD si se usa (no guardar la expresión F)
+            del conversation.mensajes_no_leidos
+        
+        return mensajes, incoming
     
     @staticmethod
     def _create_lead_from_message(phone_number, content, message_type):
@@ -594,71 +814,9 @@ class MessageService:
     def _download_and_save_media(mensaje, media_url_or_id, message_type, media_data):
         """
         Descarga y guarda localmente un archivo multimedia de WhatsApp
-        Maneja tanto URLs directas como IDs de archivo
+        Maneja tanto URLs directas como IDs de archivo (ver MediaFetchService)
         """
-        try:
-            # Obtener configuración activa para el token
-            config = WhatsAppConfig.objects.filter(is_active=True).first()
-            if not config:
-                logger.error("No hay configuración activa para descargar media")
-                return False
-            
-            # Headers para la API de WhatsApp
-            headers = {
-                'Authorization': f'Bearer {config.access_token}',
-            }
-            
-            # Si es un ID (formato nuevo), obtener información del archivo primero
-            if media_url_or_id and not media_url_or_id.startswith('http'):
-                # Es un ID de archivo, obtener información primero
-                media_info_url = f"https://graph.facebook.com/v22.0/{media_url_or_id}"
-                media_info_response = requests.get(media_info_url, headers=headers, timeout=30)
-                
-                if media_info_response.status_code != 200:
-                    logger.error(f"Error obteniendo info de media con ID {media_url_or_id}: {media_info_response.status_code}")
-                    return False
-                
-                media_info = media_info_response.json()
-                download_url = media_info.get('url')
-                mime_type = media_info.get('mime_type', 'application/octet-stream')
-                
-            else:
-                # Es una URL directa (formato antiguo)
-                download_url = media_url_or_id
-                # Intentar obtener mime_type del media_data
-                mime_type = media_data.get('mime_type', 'application/octet-stream')
-            
-            if not download_url:
-                logger.error("No se encontró URL de descarga")
-                return False
-            
-            # Descargar el archivo
-            download_response = requests.get(download_url, headers=headers, timeout=60)
-            if download_response.status_code != 200:
-                logger.error(f"Error descargando archivo: {download_response.status_code}")
-                return False
-            
-            # Generar nombre de archivo
-            file_extension = MessageService._get_file_extension_from_mime(mime_type)
-            filename = f"{message_type}_{mensaje.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}{file_extension}"
-            
-            # Guardar archivo
-            from django.core.files.base import ContentFile
-            file_content = ContentFile(download_response.content, name=filename)
-            
-            # Actualizar el mensaje con el archivo
-            mensaje.archivo_local = file_content
-            mensaje.archivo_tipo_mime = mime_type
-            mensaje.archivo_nombre = media_data.get('filename', filename)
-            mensaje.archivo_tamaño = len(download_response.content)
-            mensaje.save()
-            
-            logger.info(f"Archivo descargado y guardado: {filename} ({len(download_response.content)} bytes)")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error descargando archivo multimedia: {str(e)}")
-            return False
+        return MediaFetchService.fetch(mensaje, media_url_or_id, message_type, media_data)
     
     @staticmethod
     def _get_file_extension_from_mime(mime_type):
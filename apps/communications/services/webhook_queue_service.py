@@ -0,0 +1,216 @@
+# apps/communications/services/webhook_queue_service.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from ..models import WebhookEvent
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Intentos antes de mandar el evento a la cola de descartados ('muerto')
+WEBHOOK_QUEUE_MAX_ATTEMPTS = getattr(settings, 'WEBHOOK_QUEUE_MAX_ATTEMPTS', 5)
+# Espera base entre reintentos (se duplica en cada intento)
+WEBHOOK_QUEUE_RETRY_SECONDS = getattr(settings, 'WEBHOOK_QUEUE_RETRY_SECONDS', 30)
+# Tiempo sin terminar un evento (desde que empezó a procesarlo) tras el cual se
+# considera caído su worker y el evento vuelve a la cola contando un intento
+WEBHOOK_QUEUE_LEASE_SECONDS = getattr(settings, 'WEBHOOK_QUEUE_LEASE_SECONDS', 300)
+# Sin workers (desarrollo): procesar el evento dentro de la misma petición
+WEBHOOK_QUEUE_ENABLED = getattr(settings, 'WEBHOOK_QUEUE_ENABLED', True)
+
+
+class WebhookQueueService:
+    """
+    Cola de callbacks del webhook en la tabla WebhookEvent: orden por número de
+    teléfono, reintentos con espera exponencial y descarte tras WEBHOOK_QUEUE_MAX_ATTEMPTS
+    """
+
+    @staticmethod
+    def split_payload(webhook_data):
+        """
+        Divide el payload en uno por número remitente (cada uno con sus mensajes y
+        contactos, bajo la entry original), para poder ordenar por número. Los
+        estados de entrega van solo en el payload sin número, una sola vez.
+        """
+        payloads = {}
+
+        def agregar(numero, entry, change, value):
+            payload = payloads.setdefault(numero, {'object': webhook_data.get('object'), 'entry': []})
+            entries = payload['entry']
+            if not entries or entries[-1]['id'] != entry.get('id'):
+                entries.append({'id': entry.get('id'), 'changes': []})
+            entries[-1]['changes'].append({**change, 'value': value})
+
+        for entry in webhook_data.get('entry') or []:
+            for change in entry.get('changes') or []:
+                value = change.get('value') or {}
+                messages = value.get('messages') or []
+
+                por_numero = {}
+                for message_data in messages:
+                    por_numero.setdefault(message_data.get('from', ''), []).append(message_data)
+
+                for numero, numero_messages in por_numero.items():
+                    numero_value = {
+                        clave: dato for clave, dato in value.items() if clave not in ('statuses', 'contacts')
+                    }
+                    numero_value['messages'] = numero_messages
+                    contactos = [
+                        contacto for contacto in value.get('contacts') or [] if contacto.get('wa_id') == numero
+                    ]
+                    if contactos:
+                        numero_value['contacts'] = contactos
+                    agregar(numero, entry, change, numero_value)
+
+                if value.get('statuses') or not messages:
+                    agregar('', entry, change, {
+                        clave: dato for clave, dato in value.items() if clave not in ('messages', 'contacts')
+                    })
+
+        if not payloads:
+            payloads[''] = webhook_data
+        return payloads
+
+    @staticmethod
+    def enqueue(webhook_data):
+        """
+        Guarda el payload en la cola (un evento por número) y devuelve los eventos
+        """
+        events = WebhookEvent.objects.bulk_create([
+            WebhookEvent(numero_telefono=numero[:20], raw_data=payload)
+            for numero, payload in WebhookQueueService.split_payload(webhook_data).items()
+        ])
+
+        if not WEBHOOK_QUEUE_ENABLED:
+            for event in events:
+                WebhookQueueService.process_event(event)
+        return events
+
+    @staticmethod
+    def claim(worker, limit=10):
+        """
+        Toma hasta `limit` eventos listos. Un evento solo se toma si no hay otro
+        anterior del mismo número pendiente o en proceso (orden por número);
+        SKIP LOCKED evita que dos workers tomen el mismo evento.
+        """
+        now = timezone.now()
+        anterior_sin_procesar = WebhookEvent.objects.filter(
+            numero_telefono=OuterRef('numero_telefono'),
+            id__lt=OuterRef('id'),
+            estado__in=['pendiente', 'procesando'],
+        )
+        with transaction.atomic():
+            events = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True).filter(
+                    estado='pendiente',
+                    disponible_at__lte=now,
+                ).filter(
+                    Q(numero_telefono='') | ~Exists(anterior_sin_procesar)
+                ).order_by('id')[:limit]
+            )
+            if events:
+                WebhookEvent.objects.filter(id__in=[event.id for event in events]).update(
+                    estado='procesando', worker=worker, bloqueado_at=now
+                )
+                for event in events:
+                    event.estado, event.worker, event.bloqueado_at = 'procesando', worker, now
+        return events
+
+    @staticmethod
+    def start(event):
+        """
+        Renueva el lease de un evento tomado justo antes de procesarlo (el lease cuenta
+        por evento, no por lote). False si el worker ya lo perdió por release_stale.
+        """
+        if not event.worker:
+            # Procesamiento dentro de la petición (cola desactivada)
+            return True
+        event.bloqueado_at = timezone.now()
+        return WebhookEvent.objects.filter(
+            id=event.id, estado='procesando', worker=event.worker
+        ).update(bloqueado_at=event.bloqueado_at) == 1
+
+    @staticmethod
+    def process_event(event):
+        """
+        Procesa un evento tomado y registra el resultado (procesado, reintento o descarte)
+        """
+        from .message_service import MessageService
+
+        if not WebhookQueueService.start(event):
+            logger.warning(f'Evento de webhook {event.id} devuelto a la cola antes de empezar: se omite')
+            return False
+
+        try:
+            success, message = MessageService.process_incoming_webhook_message(event.raw_data)
+        except Exception as e:
+            success, message = False, str(e)
+
+        event.intentos += 1
+        event.worker = ''
+        event.bloqueado_at = None
+        if success:
+            event.estado = 'procesado'
+            event.procesado_at = timezone.now()
+            event.ultimo_error = ''
+        else:
+            event.ultimo_error = message or ''
+            if event.intentos >= WEBHOOK_QUEUE_MAX_ATTEMPTS:
+                event.estado = 'muerto'
+                logger.error(f'☠️ Evento de webhook {event.id} descartado tras {event.intentos} intentos: {message}')
+            else:
+                event.estado = 'pendiente'
+                espera = WEBHOOK_QUEUE_RETRY_SECONDS * 2 ** (event.intentos - 1)
+                event.disponible_at = timezone.now() + timedelta(seconds=espera)
+                logger.warning(f'🔁 Evento de webhook {event.id} reintentará en {espera}s: {message}')
+
+        event.save(update_fields=[
+            'estado', 'intentos', 'worker', 'bloqueado_at', 'ultimo_error', 'procesado_at', 'disponible_at'
+        ])
+        return success
+
+    @staticmethod
+    def release_stale():
+        """
+        Devuelve a la cola los eventos tomados por workers que no terminaron a tiempo.
+        Cuenta como un intento: un evento que tumba a su worker termina en 'muerto'
+        en lugar de reencolarse para siempre (y bloquear a su número).
+        """
+        now = timezone.now()
+        vencidos = WebhookEvent.objects.filter(
+            estado='procesando',
+            bloqueado_at__lt=now - timedelta(seconds=WEBHOOK_QUEUE_LEASE_SECONDS),
+        )
+        error = 'El worker no terminó el evento a tiempo'
+        muertos = vencidos.filter(intentos__gte=WEBHOOK_QUEUE_MAX_ATTEMPTS - 1).update(
+            estado='muerto', intentos=F('intentos') + 1, worker='', bloqueado_at=None, ultimo_error=error
+        )
+        if muertos:
+            logger.error(f'☠️ {muertos} eventos de webhook descartados: sus workers no terminaron a tiempo')
+        return muertos + vencidos.update(
+            estado='pendiente', intentos=F('intentos') + 1, worker='', bloqueado_at=None,
+            ultimo_error=error, disponible_at=now,
+        )
+
+    @staticmethod
+    def requeue_dead(event_ids=None):
+        """
+        Vuelve a encolar los eventos descartados (todos o los indicados)
+        """
+        events = WebhookEvent.objects.filter(estado='muerto')
+        if event_ids:
+            events = events.filter(id__in=event_ids)
+        return events.update(estado='pendiente', intentos=0, disponible_at=timezone.now())
+
+    @staticmethod
+    def stats():
+        """
+        Cantidad de eventos por estado
+        """
+        counts = dict(
+            WebhookEvent.objects.order_by().values_list('estado').annotate(total=Count('id'))
+        )
+        return {estado: counts.get(estado, 0) for estado, _ in WebhookEvent.ESTADOS}
@@ -0,0 +1,59 @@
+"""
+Signals para mantener el estado desnormalizado de las conversaciones
+(ConversationStateService) al crear mensajes y al cambiar asignaciones, y los
+contadores de distribución de leads (LeadCounterService)
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Mensaje, LeadAssignment
+from .services.conversation_state_service import ConversationStateService
+from .services.lead_counter_service import LeadCounterService
+
+
+@receiver(post_save, sender=Mensaje)
+def mensaje_post_save(sender, instance, created, raw=False, **kwargs):
+    """Actualiza la conversación con el mensaje nuevo (webhook y envíos)"""
+    if raw or not created:
+        return
+    ConversationStateService.register_message(instance)
+
+
+@receiver(post_save, sender=LeadAssignment)
+@receiver(post_delete, sender=LeadAssignment)
+def lead_assignment_changed(sender, instance, raw=False, **kwargs):
+    """Las respuestas cuentan según el vendedor asignado: recalcular sus conversaciones"""
+    if raw:
+        return
+    ConversationStateService.refresh_for_lead(instance.lead_id)
+
+
+@receiver(pre_save, sender=LeadAssignment)
+def lead_assignment_pre_save(sender, instance, raw=False, **kwargs):
+    """Guarda cómo contaba la asignación antes del cambio"""
+    if raw:
+        return
+    previous = None
+    if instance.pk:
+        previous = LeadAssignment.objects.filter(pk=instance.pk).only(
+            'is_active', 'organizational_unit_id', 'assigned_date'
+        ).first()
+    instance._counter_key_anterior = LeadCounterService.counter_key(previous) if previous else None
+
+
+@receiver(post_save, sender=LeadAssignment)
+def lead_assignment_counters(sender, instance, raw=False, **kwargs):
+    """Alta, desactivación o reasignación: mover la asignación en los contadores"""
+    if raw:
+        return
+    LeadCounterService.register_change(
+        getattr(instance, '_counter_key_anterior', None),
+        LeadCounterService.counter_key(instance)
+    )
+    instance._counter_key_anterior = LeadCounterService.counter_key(instance)
+
+
+@receiver(post_delete, sender=LeadAssignment)
+def lead_assignment_counters_delete(sender, instance, **kwargs):
+    """Una asignación activa borrada deja de contar"""
+    LeadCounterService.register_change(LeadCounterService.counter_key(instance), None)
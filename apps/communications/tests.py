@@ -1,4 +1,177 @@
 # apps/whatsapp_business/tests.py
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
\ No newline at end of file
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .models import AudioTranscode, Cliente, Conversacion, Mensaje, WebhookEvent, WhatsAppConfig
+from .services import audio_transcode_service, media_fetch_service
+from .services import webhook_queue_service
+from .services.audio_transcode_service import AudioTranscodeService
+from .services.media_fetch_service import MediaFetchService
+from .services.message_service import MessageService
+from .services.webhook_queue_service import WebhookQueueService
+from .utils.media_stub_server import MediaStubServer
+
+
+class MediaFetchServiceTests(TestCase):
+    """Descarga de medios contra el stub local de la API de WhatsApp"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.stub_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.stub_dir, ignore_errors=True)
+
+        self.contenido = os.urandom(5 * media_fetch_service.MEDIA_DOWNLOAD_CHUNK_SIZE + 123)
+        with open(os.path.join(self.stub_dir, 'foto.jpg'), 'wb') as f:
+            f.write(self.contenido)
+
+        self.stub = MediaStubServer(self.stub_dir).start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch.object(media_fetch_service, 'WHATSAPP_GRAPH_API_URL', self.stub.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.config = WhatsAppConfig.objects.create(
+            phone_number_id='1', business_account_id='b', access_token='t',
+            webhook_verify_token='v', webhook_url='http://localhost/webhook/'
+        )
+        cliente = Cliente.objects.create(numero_whatsapp='593000000001')
+        conversacion = Conversacion.objects.create(cliente=cliente, numero_whatsapp='593000000001')
+        self.mensaje = Mensaje.objects.create(
+            conversacion=conversacion, tipo='image', direccion='incoming', contenido='',
+            whatsapp_message_id='wamid.1', timestamp_whatsapp=timezone.now()
+        )
+
+    def test_descarga_por_bloques(self):
+        self.assertTrue(MediaFetchService.fetch(self.mensaje, 'foto.jpg', 'image', {}, config=self.config))
+
+        self.mensaje.refresh_from_db()
+        self.assertEqual(self.mensaje.archivo_tamaño, len(self.contenido))
+        self.assertEqual(self.mensaje.archivo_tipo_mime, 'image/jpeg')
+        with self.mensaje.archivo_local.open('rb') as f:
+            self.assertEqual(f.read(), self.contenido)
+
+    def test_limite_de_tamano_declarado(self):
+        with mock.patch.dict(media_fetch_service.MEDIA_DOWNLOAD_MAX_BYTES, {'image': 1024}):
+            self.assertFalse(MediaFetchService.fetch(self.mensaje, 'foto.jpg', 'image', {}, config=self.config))
+
+        self.mensaje.refresh_from_db()
+        self.assertFalse(self.mensaje.archivo_local)
+
+    def test_limite_de_tamano_en_la_descarga(self):
+        # URL directa sin tamaño declarado: se corta por Content-Length / bloques leídos
+        url = f'{self.stub.url}/files/foto.jpg'
+        with mock.patch.dict(media_fetch_service.MEDIA_DOWNLOAD_MAX_BYTES, {'image': 1024}):
+            self.assertFalse(MediaFetchService.fetch(self.mensaje, url, 'image', {}, config=self.config))
+
+        self.mensaje.refresh_from_db()
+        self.assertFalse(self.mensaje.archivo_local)
+        self.assertEqual(os.listdir(self.media_root), [])
+
+
+class WebhookQueueLeaseTests(TestCase):
+    """Eventos de webhook que su worker no terminó a tiempo"""
+
+    def evento_vencido(self, intentos):
+        return WebhookEvent.objects.create(
+            numero_telefono='593000000001', raw_data={}, estado='procesando', intentos=intentos,
+            worker='host:1:0', bloqueado_at=timezone.now() - timedelta(
+                seconds=webhook_queue_service.WEBHOOK_QUEUE_LEASE_SECONDS + 1
+            ),
+        )
+
+    def test_liberar_cuenta_un_intento(self):
+        evento = self.evento_vencido(intentos=0)
+        ultimo = self.evento_vencido(intentos=webhook_queue_service.WEBHOOK_QUEUE_MAX_ATTEMPTS - 1)
+
+        self.assertEqual(WebhookQueueService.release_stale(), 2)
+
+        evento.refresh_from_db()
+        self.assertEqual((evento.estado, evento.intentos), ('pendiente', 1))
+        ultimo.refresh_from_db()
+        self.assertEqual(ultimo.estado, 'muerto')
+
+    def test_evento_liberado_no_se_procesa_dos_veces(self):
+        evento = self.evento_vencido(intentos=0)
+        WebhookQueueService.release_stale()
+
+        # El worker original todavía tiene el evento del lote en memoria
+        self.assertFalse(WebhookQueueService.start(evento))
+
+
+class AudioTranscodeLeaseTests(TestCase):
+    """Conversiones de audio que su worker no terminó a tiempo"""
+
+    def setUp(self):
+        cliente = Cliente.objects.create(numero_whatsapp='593000000001')
+        self.conversacion = Conversacion.objects.create(cliente=cliente, numero_whatsapp='593000000001')
+        self.vencido = timezone.now() - timedelta(
+            seconds=audio_transcode_service.AUDIO_TRANSCODE_LEASE_SECONDS + 1
+        )
+
+    def conversion_vencida(self, numero, intentos):
+        mensaje = Mensaje.objects.create(
+            conversacion=self.conversacion, tipo='audio', direccion='incoming', contenido='',
+            whatsapp_message_id=f'wamid.{numero}', timestamp_whatsapp=timezone.now()
+        )
+        return AudioTranscode.objects.create(
+            mensaje=mensaje, estado='procesando', intentos=intentos,
+            worker='host:1:0', iniciado_at=self.vencido,
+        )
+
+    def test_liberar_cuenta_un_intento(self):
+        job = self.conversion_vencida(1, intentos=0)
+        ultimo = self.conversion_vencida(2, intentos=audio_transcode_service.AUDIO_TRANSCODE_MAX_ATTEMPTS - 1)
+
+        self.assertEqual(AudioTranscodeService.release_stale(), 2)
+
+        # El worker original todavía tiene la conversión del lote en memoria
+        self.assertFalse(AudioTranscodeService.start(job))
+        job = AudioTranscode.objects.get(pk=job.pk)
+        self.assertEqual((job.estado, job.intentos), ('pendiente', 1))
+        ultimo.refresh_from_db()
+        self.assertEqual(ultimo.estado, 'error')
+
+
+class WebhookLeadRetryTests(TestCase):
+    """El reintento de un evento ya guardado no debe perder la creación del lead"""
+
+    def setUp(self):
+        cache.clear()
+        WhatsAppConfig.objects.create(
+            phone_number_id='1', business_account_id='b', access_token='t',
+            webhook_verify_token='v', webhook_url='http://localhost/webhook/'
+        )
+        self.payload = {'object': 'whatsapp_business_account', 'entry': [{'id': 'e1', 'changes': [{
+            'field': 'messages',
+            'value': {'messages': [{
+                'from': '593000000001', 'id': 'wamid.1', 'timestamp': '1700000000',
+                'type': 'text', 'text': {'body': 'Hola, quiero información'},
+            }]},
+        }]}]}
+
+    def test_reentrega_crea_el_lead_faltante(self):
+        # Primer intento: el worker cae después de guardar los mensajes
+        with mock.patch.object(MessageService, '_create_leads'):
+            MessageService.process_incoming_webhook_message(self.payload)
+        self.assertEqual(Mensaje.objects.filter(whatsapp_message_id='wamid.1').count(), 1)
+
+        with mock.patch.object(MessageService, '_should_create_lead', return_value=True), \
+                mock.patch.object(MessageService, '_create_lead_from_message') as crear_lead:
+            self.assertEqual(
+                MessageService.process_incoming_webhook_message(self.payload)[0], True
+            )
+
+        crear_lead.assert_called_once_with('593000000001', 'Hola, quiero información', 'text')
+        self.assertEqual(Mensaje.objects.filter(whatsapp_message_id='wamid.1').count(), 1)
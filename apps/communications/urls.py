@@ -60,11 +60,13 @@ urlpatterns = [
     path('api/supervision-chat/send-message/', views.send_supervision_message, name='send_supervision_message'),
     path('api/supervision-chat/send-media/', views.send_supervision_media, name='send_supervision_media'),
     path('api/supervision-chat/mark-read/', views.mark_supervision_conversation_read, name='mark_supervision_conversation_read'),
+    path('api/chat/media/<int:message_id>/', views.serve_message_media, name='serve_message_media'),
     path('api/chat/audio/<int:message_id>/', views.serve_audio_converted, name='serve_audio_converted'),
     path('api/chat/audio-debug/<int:message_id>/', views.test_audio_debug, name='test_audio_debug'),
     
     # Distribución de Leads
     path('lead-distribution/', views.lead_distribution_config, name='lead_distribution_config'),
+    path('lead-distribution/simulation/', views.lead_distribution_simulation, name='lead_distribution_simulation'),
     path('lead-distribution/history/', views.lead_assignments_history, name='lead_assignments_history'),
     path('lead-distribution/manual/', views.manual_lead_assignment, name='manual_lead_assignment'),
     path('api/lead-distribution/update/', views.update_lead_distribution, name='update_lead_distribution'),
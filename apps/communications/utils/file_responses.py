@@ -0,0 +1,129 @@
+# apps/communications/utils/file_responses.py
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Cómo se entregan los bytes de los archivos protegidos:
+#   'django'   -> FileResponse desde el worker de Python (desarrollo)
+#   'nginx'    -> X-Accel-Redirect a una location internal de nginx
+#   'sendfile' -> X-Sendfile (Apache mod_xsendfile / lighttpd)
+MEDIA_DELIVERY_MODE = getattr(settings, 'MEDIA_DELIVERY_MODE', 'django')
+# Location internal de nginx que apunta a MEDIA_ROOT (ver config/nginx)
+MEDIA_ACCEL_REDIRECT_PREFIX = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/_protected_media/')
+# Los archivos de los chats no cambian: el navegador puede reutilizarlos un tiempo
+MEDIA_CACHE_MAX_AGE = getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _iter_file_range(file_obj, start, length):
+    """Lee `length` bytes desde `start` por bloques y cierra el archivo al terminar"""
+    try:
+        file_obj.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = file_obj.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def _inline_disposition(filename):
+    return f"inline; filename*=UTF-8''{quote(filename)}"
+
+
+def ranged_file_response(request, path, content_type, filename=None, validators=()):
+    """
+    Sirve un archivo con soporte de Range (un solo rango, 206 / 416), necesario
+    para que <audio> y <video> puedan adelantar sin descargar todo el archivo.
+    Sin cabecera Range (o con varios rangos, o un If-Range que no coincide con
+    `validators`) responde el archivo completo.
+    """
+    size = os.path.getsize(path)
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+
+    # If-Range: el rango solo vale si el archivo no cambió desde que el cliente lo pidió
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if match and if_range and validators and if_range not in validators:
+        match = None
+
+    if not match or not (match.group(1) or match.group(2)):
+        response = FileResponse(open(path, 'rb'), content_type=content_type, filename=filename)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if match.group(1):
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    else:
+        # bytes=-N: los últimos N bytes
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+
+    if start >= size or start > end:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        _iter_file_range(open(path, 'rb'), start, length),
+        status=206,
+        content_type=content_type
+    )
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    if filename:
+        response['Content-Disposition'] = _inline_disposition(filename)
+    return response
+
+
+def media_file_response(request, path, content_type, filename=None):
+    """
+    Respuesta para un archivo de MEDIA_ROOT ya autorizado por la vista.
+    Resuelve en Django las peticiones condicionales (304 / 412) con solo un stat
+    y delega la transferencia según MEDIA_DELIVERY_MODE: con nginx o sendfile
+    el servidor web envía los bytes (y atiende Range) sin pasar por Python.
+    """
+    stat = os.stat(path)
+    # Mismo formato de ETag que nginx, para que los validadores coincidan en ambos modos
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    last_modified = http_date(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        real_path = os.path.realpath(path)
+        inside_media_root = os.path.commonpath([media_root, real_path]) == media_root
+
+        if MEDIA_DELIVERY_MODE == 'nginx' and inside_media_root:
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = MEDIA_ACCEL_REDIRECT_PREFIX + quote(
+                os.path.relpath(real_path, media_root).replace(os.sep, '/')
+            )
+        elif MEDIA_DELIVERY_MODE == 'sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = real_path
+        else:
+            response = ranged_file_response(
+                request, path, content_type, filename, validators=(etag, last_modified)
+            )
+
+        if filename:
+            response['Content-Disposition'] = _inline_disposition(filename)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = f'private, max-age={MEDIA_CACHE_MAX_AGE}'
+    return response
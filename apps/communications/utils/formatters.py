@@ -157,7 +157,7 @@ class DataFormatter:
                 'name': message.enviado_por.get_full_name()
             } if message.enviado_por else None,
             'media_url': message.media_url,
-            'archivo_local': message.archivo_local.url if message.archivo_local else None,
+            'archivo_protegido_url': message.get_archivo_protegido_url(),
             'archivo_tipo_mime': message.archivo_tipo_mime,
             'archivo_nombre': message.archivo_nombre,
             'archivo_tamaño': message.archivo_tamaño,
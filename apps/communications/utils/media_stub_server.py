@@ -0,0 +1,94 @@
+# apps/communications/utils/media_stub_server.py
+import json
+import mimetypes
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MediaStubServer:
+    """
+    Servidor HTTP local que imita la API de medios de WhatsApp para pruebas:
+    GET /<media_id> devuelve la info del archivo <media_id> del directorio
+    y GET /files/<media_id> lo descarga. Se usa con
+    WHATSAPP_GRAPH_API_URL = 'http://127.0.0.1:<puerto>'
+    """
+
+    def __init__(self, directory, host='127.0.0.1', port=0):
+        self.directory = os.path.abspath(directory)
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                if len(parts) == 2 and parts[0] == 'files':
+                    return self.send_file(parts[1])
+                if len(parts) == 1 and parts[0]:
+                    return self.send_info(parts[0])
+                self.send_error(404)
+
+            def file_path(self, media_id):
+                path = os.path.join(stub.directory, os.path.basename(media_id))
+                return path if os.path.isfile(path) else None
+
+            def send_info(self, media_id):
+                path = self.file_path(media_id)
+                if not path:
+                    return self.send_error(404)
+                body = json.dumps({
+                    'id': media_id,
+                    'url': f'{stub.url}/files/{media_id}',
+                    'mime_type': mimetypes.guess_type(path)[0] or 'application/octet-stream',
+                    'file_size': os.path.getsize(path),
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_file(self, media_id):
+                path = self.file_path(media_id)
+                if not path:
+                    return self.send_error(404)
+                self.send_response(200)
+                self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+                self.send_header('Content-Length', str(os.path.getsize(path)))
+                self.end_headers()
+                try:
+                    with open(path, 'rb') as f:
+                        while chunk := f.read(64 * 1024):
+                            self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    # El cliente cortó la descarga (p. ej. al superar el límite de tamaño)
+                    pass
+
+            def log_message(self, format, *args):
+                logger.debug(f'media stub: {format % args}')
+
+        return Handler
+
+    def start(self):
+        """Atiende en un hilo en segundo plano (para tests)"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
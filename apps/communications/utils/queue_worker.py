@@ -0,0 +1,96 @@
+# apps/communications/utils/queue_worker.py
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from django.db import connections
+
+
+def add_worker_arguments(parser, batch_size, workers_help, batch_help, stats_help):
+    """Argumentos comunes de los comandos que procesan una cola con un pool de workers"""
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=2,
+        help=f'{workers_help} (default: 2)',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=batch_size,
+        help=f'{batch_help} (default: {batch_size})',
+    )
+    parser.add_argument(
+        '--sleep',
+        type=float,
+        default=1.0,
+        help='Segundos de espera cuando la cola está vacía (default: 1)',
+    )
+    parser.add_argument(
+        '--once',
+        action='store_true',
+        help='Vaciar la cola y terminar (en lugar de quedar escuchando)',
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help=stats_help,
+    )
+
+
+def run_worker(worker_name, claim, process, release_stale, batch_size, sleep, once):
+    """
+    Bucle de un worker: libera lo abandonado, toma un lote con claim(worker_name, limit),
+    lo procesa elemento por elemento y espera si la cola está vacía
+    """
+    # Cada proceso abre su propia conexión a la BD
+    connections.close_all()
+
+    detener = {'valor': False}
+
+    def pedir_detencion(signum, frame):
+        detener['valor'] = True
+
+    signal.signal(signal.SIGTERM, pedir_detencion)
+    signal.signal(signal.SIGINT, pedir_detencion)
+
+    procesados = 0
+    while not detener['valor']:
+        release_stale()
+        items = claim(worker_name, limit=batch_size)
+        if not items:
+            if once:
+                break
+            time.sleep(sleep)
+            continue
+
+        for item in items:
+            process(item)
+            procesados += 1
+
+    connections.close_all()
+    return procesados
+
+
+def run_pool(claim, process, release_stale, workers, batch_size, sleep, once):
+    """
+    Ejecuta run_worker en `workers` procesos (o en este mismo si es uno) y devuelve
+    el total procesado. claim/process/release_stale deben poder enviarse a otro
+    proceso (funciones de módulo o métodos estáticos).
+    """
+    prefijo = f'{socket.gethostname()}:{os.getpid()}'
+    workers = max(workers, 1)
+    args = [
+        (f'{prefijo}:{numero}', claim, process, release_stale, batch_size, sleep, once)
+        for numero in range(workers)
+    ]
+
+    if workers == 1:
+        return run_worker(*args[0])
+
+    # Cerrar conexiones antes de crear los procesos para no compartirlas
+    connections.close_all()
+    with multiprocessing.Pool(workers) as pool:
+        return sum(pool.starmap(run_worker, args))
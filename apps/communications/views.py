@@ -15,6 +15,7 @@ from .views.lead_management import (
     lead_management_dashboard,
     leads_list,
     lead_distribution_config,
+    lead_distribution_simulation,
     lead_assignments_history
 )
 
@@ -51,6 +52,7 @@ from .views.config_media import (
     configuracion_whatsapp,
     activar_configuracion,
     eliminar_configuracion,
+    serve_message_media,
     serve_audio_converted,
     test_audio_debug,
     media_upload_test,
@@ -79,6 +81,7 @@ __all__ = [
     'lead_management_dashboard',
     'leads_list',
     'lead_distribution_config',
+    'lead_distribution_simulation',
     'lead_assignments_history',
     
     # API endpoints
@@ -111,6 +114,7 @@ __all__ = [
     'configuracion_whatsapp',
     'activar_configuracion',
     'eliminar_configuracion',
+    'serve_message_media',
     'serve_audio_converted',
     'test_audio_debug',
     'media_upload_test',
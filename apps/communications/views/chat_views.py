@@ -122,10 +122,7 @@ def get_conversations(request):
         conversations = conversations[:limit]
         
         # Formatear datos
-        conversations_data = []
-        for conv in conversations:
-            conversation_data = ChatService.build_conversation_data(conv)
-            conversations_data.append(conversation_data)
+        conversations_data = ChatService.build_conversations_data(conversations)
         
         response = JsonResponse({
             'success': True,  # Campo requerido por JavaScript
@@ -157,10 +154,7 @@ def get_vendedor_conversations(request):
             return ResponseFormatter.error_response(error, 400)
         
         # Formatear datos de conversaciones
-        conversations_data = []
-        for conv in conversations:
-            conversation_data = ChatService.build_conversation_data(conv)
-            conversations_data.append(conversation_data)
+        conversations_data = ChatService.build_conversations_data(conversations)
         
         response = JsonResponse({
             'success': True,  # Campo requerido por JavaScript
@@ -3,14 +3,18 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
-from django.http import JsonResponse, FileResponse, Http404
+from django.http import JsonResponse, Http404
+from django.core.exceptions import PermissionDenied
 from django.core.files.storage import default_storage
 from django.conf import settings
 from ..models import WhatsAppConfig, Mensaje
 from ..forms import WhatsAppConfigForm
 from ..services.message_service import MessageService
+from ..services.audio_transcode_service import AudioTranscodeService
+from ..services.chat_service import ChatService
 from ..utils.permissions import require_whatsapp_access, api_require_whatsapp_access
 from ..utils.formatters import ResponseFormatter
+from ..utils.file_responses import media_file_response
 import os
 import logging
 
@@ -126,38 +130,65 @@ def eliminar_configuracion(request, config_id):
     return redirect('communications:configuracion')
 
 
+def _get_authorized_message(request, message_id):
+    """
+    Mensaje con archivo que el usuario puede ver según las reglas de acceso a
+    conversaciones de ChatService (chat vendedor o supervisión)
+    """
+    mensaje = get_object_or_404(Mensaje.objects.select_related('conversacion'), id=message_id)
+    if not ChatService.user_has_media_access(request.user, mensaje.conversacion):
+        raise PermissionDenied("No tienes acceso a esta conversación")
+    if not mensaje.archivo_local or not os.path.exists(mensaje.archivo_local.path):
+        raise Http404("Archivo no encontrado")
+    return mensaje
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def serve_message_media(request, message_id):
+    """
+    Sirve el archivo de un mensaje del chat verificando el acceso a la conversación.
+    La transferencia (con Range y peticiones condicionales) la hace nginx si
+    MEDIA_DELIVERY_MODE lo permite.
+    """
+    mensaje = _get_authorized_message(request, message_id)
+    return media_file_response(
+        request,
+        mensaje.archivo_local.path,
+        mensaje.archivo_tipo_mime or 'application/octet-stream',
+        mensaje.archivo_nombre or os.path.basename(mensaje.archivo_local.name)
+    )
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
 def serve_audio_converted(request, message_id):
     """
-    Sirve archivos de audio convertidos a OGG para reproducción web
+    Sirve el audio convertido a OGG. Si la conversión aún no está lista la
+    encola y sirve el archivo original mientras tanto.
     """
-    try:
-        mensaje = get_object_or_404(Mensaje, id=message_id)
-        
-        # Verificar que es un mensaje de audio
-        if mensaje.tipo != 'audio' or not mensaje.archivo_local:
-            raise Http404("Archivo de audio no encontrado")
-        
-        # Intentar conversión a OGG si es necesario
-        success, result = MessageService.convert_audio_to_ogg(message_id)
-        
-        if not success:
-            logger.error(f'Error convirtiendo audio {message_id}: {result}')
-            raise Http404("Error procesando archivo de audio")
-        
-        # Servir archivo convertido
-        ogg_path = result
-        if os.path.exists(ogg_path):
-            return FileResponse(
-                open(ogg_path, 'rb'),
-                content_type='audio/ogg',
-                filename=f'audio_{message_id}.ogg'
-            )
-        else:
-            raise Http404("Archivo convertido no encontrado")
-    
-    except Exception as e:
-        logger.error(f'Error sirviendo audio convertido {message_id}: {str(e)}')
-        raise Http404("Error interno del servidor")
+    mensaje = _get_authorized_message(request, message_id)
+
+    # Verificar que es un mensaje de audio
+    if mensaje.tipo != 'audio':
+        raise Http404("Archivo de audio no encontrado")
+
+    ogg_path = AudioTranscodeService.get_converted_path(message_id)
+    if ogg_path:
+        return media_file_response(request, ogg_path, 'audio/ogg', f'audio_{message_id}.ogg')
+
+    # Sin conversión: encolar (no bloquea la petición) y servir el original
+    AudioTranscodeService.enqueue(mensaje)
+    response = media_file_response(
+        request,
+        mensaje.archivo_local.path,
+        mensaje.archivo_tipo_mime or 'application/octet-stream',
+        os.path.basename(mensaje.archivo_local.name)
+    )
+    # El original puede cambiar por el OGG en la próxima petición
+    response['Cache-Control'] = 'private, no-cache'
+    response['X-Audio-Transcode'] = 'pendiente'
+    return response
 
 
 @login_required
@@ -181,7 +212,8 @@ def test_audio_debug(request, message_id):
                 'size': mensaje.archivo_tamaño,
                 'mime_type': mensaje.archivo_tipo_mime
             },
-            'conversion_status': 'not_attempted'
+            'conversion_status': 'not_attempted',
+            'transcode_queue': AudioTranscodeService.stats()
         }
         
         if mensaje.archivo_local:
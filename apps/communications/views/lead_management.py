@@ -3,11 +3,14 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
 from django.core.paginator import Paginator
 from urllib.parse import urlencode
+from datetime import timedelta
 from ..models import Lead, LeadAssignment
 from ..services.lead_service import LeadService
+from ..services.distribution_simulation_service import DistributionSimulationService
 from ..utils.permissions import require_lead_management_access
 from ..utils.filters import LeadFilters, PaginationHelper
 from ..utils.formatters import DataFormatter
@@ -228,6 +231,76 @@ def lead_distribution_config(request):
     return render(request, 'communications/lead_distribution/config.html', context)
 
 
+def _int_param(request, name, default, minimum=0, maximum=None):
+    """Entero de GET acotado, o default si falta o es inválido"""
+    try:
+        value = max(int(request.GET.get(name, default)), minimum)
+    except (TypeError, ValueError):
+        return default
+    return min(value, maximum) if maximum is not None else value
+
+
+@login_required
+@require_lead_management_access
+def lead_distribution_simulation(request):
+    """
+    Descarga (CSV) de una simulación de la distribución día por día:
+    - fuente=historico: llegadas reales de los últimos `dias` días (Lead.created_at)
+      con los cambios de configuración registrados en las asignaciones
+    - fuente=poisson: `dias` días desde hoy con ~`leads_por_dia` leads diarios
+      y el perfil semanal histórico
+    Con pct_<unidad>, dia_<unidad> y semana_<unidad> se prueban otros porcentajes
+    o límites a partir del día `desde_dia`.
+    """
+    days = _int_param(request, 'dias', 90, minimum=1, maximum=366)
+    source = request.GET.get('fuente', 'historico')
+    if source not in ('historico', 'poisson'):
+        source = 'historico'
+    units = DistributionSimulationService.get_units()
+    
+    if source == 'poisson':
+        start = timezone.localdate()
+        weights = DistributionSimulationService.weekday_weights()
+        leads_per_day = _int_param(request, 'leads_por_dia', 100, maximum=200000)
+        seed = _int_param(request, 'semilla', None)
+        volumes = DistributionSimulationService.poisson_arrivals(
+            days, leads_per_day, start, seed=seed, weekday_weights=weights
+        )
+        changes = []
+    else:
+        start, volumes = DistributionSimulationService.historical_arrivals(days)
+        changes = DistributionSimulationService.historical_changes(
+            start, start + timedelta(days=days - 1)
+        )
+    
+    # Escenario what-if: nuevos valores desde un día dado
+    from_day = _int_param(request, 'desde_dia', 0, maximum=days - 1)
+    for unit in units:
+        change = {}
+        for param, field in (('pct', 'distribution_percentage'),
+                             ('dia', 'max_leads_per_day'),
+                             ('semana', 'max_leads_per_week')):
+            value = request.GET.get(f"{param}_{unit['unit_id']}", '').strip()
+            if value == '':
+                continue
+            try:
+                change[field] = float(value) if param == 'pct' else (int(value) or None)
+            except ValueError:
+                continue
+        if change:
+            changes.append({'day': from_day, 'unit_id': unit['unit_id'], **change})
+    
+    result = DistributionSimulationService.simulate(units, volumes, start, changes)
+    
+    response = HttpResponse(content_type='text/csv')
+    response['Content-Disposition'] = (
+        f'attachment; filename="simulacion_distribucion_{source}_{start.strftime("%Y%m%d")}_{days}d.csv"'
+    )
+    response.write('\ufeff')  # BOM para Excel
+    DistributionSimulationService.write_csv(result, response)
+    return response
+
+
 @login_required
 @require_lead_management_access
 def lead_assignments_history(request):
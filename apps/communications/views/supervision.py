@@ -6,6 +6,7 @@ from django.views.decorators.http import require_http_methods
 from django.http import JsonResponse
 from ..models import WhatsAppConfig, Conversacion, Lead, LeadAssignment
 from ..services.chat_service import ChatService
+from ..services.conversation_state_service import ConversationStateService
 from ..services.lead_service import LeadService
 from ..utils.permissions import require_chat_supervision_access, api_require_chat_supervision_access
 from ..utils.formatters import ResponseFormatter, DataFormatter
@@ -106,6 +107,7 @@ def get_supervision_conversations(request):
             'team_id': request.GET.get('team_id'),
             'assignment_status': request.GET.get('assignment_status'),
             'show_unread_only': request.GET.get('unread_only') == 'true',
+            'show_expired_only': request.GET.get('expired_only') == 'true',
             'date_from': request.GET.get('date_from'),
             'date_to': request.GET.get('date_to')
         }
@@ -123,6 +125,10 @@ def get_supervision_conversations(request):
         if filters['show_unread_only']:
             conversations = conversations.filter(mensajes_no_leidos__gt=0)
         
+        if filters['show_expired_only']:
+            # Sin responder hace más de 24h (consulta indexada sobre el estado desnormalizado)
+            conversations = ConversationStateService.filter_expired(conversations)
+        
         if filters['date_from']:
             conversations = conversations.filter(created_at__date__gte=filters['date_from'])
         
@@ -134,10 +140,7 @@ def get_supervision_conversations(request):
         conversations = conversations[:limit]
         
         # Formatear datos
-        conversations_data = []
-        for conv in conversations:
-            conversation_data = ChatService.build_conversation_data(conv)
-            conversations_data.append(conversation_data)
+        conversations_data = ChatService.build_conversations_data(conversations)
         
         response = JsonResponse({
             'success': True,  # Campo requerido por JavaScript
@@ -5,6 +5,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from ..models import WhatsAppConfig, WebhookDebugMessage
 from ..services.message_service import MessageService
+from ..services.webhook_queue_service import WebhookQueueService
 from .. import services
 from ..utils.permissions import api_require_whatsapp_access
 from ..utils.formatters import ResponseFormatter
@@ -49,34 +50,21 @@ def webhook_whatsapp(request):
             return JsonResponse({'error': 'Token de verificación incorrecto'}, status=403)
     
     elif request.method == 'POST':
-        # Procesar mensajes entrantes
+        # Encolar el payload y responder de inmediato; los workers lo procesan
+        # (python manage.py process_webhook_queue)
         try:
             data = json.loads(request.body)
             logger.info(f'Webhook recibido: {data}')
             
-            # Guardar datos para debug
-            try:
-                WebhookDebugMessage.objects.create(
-                    raw_data=data,
-                    status='received'
-                )
-            except Exception as debug_error:
-                logger.warning(f'Error guardando debug: {debug_error}')
-            
-            # Procesar mensajes usando el servicio
-            success, message = MessageService.process_incoming_webhook_message(data)
-            
-            if success:
-                return JsonResponse({'status': 'success'}, status=200)
-            else:
-                logger.error(f'Error procesando webhook: {message}')
-                return JsonResponse({'error': message}, status=500)
+            events = WebhookQueueService.enqueue(data)
+            return JsonResponse({'status': 'queued', 'events': len(events)}, status=200)
                 
         except json.JSONDecodeError:
             logger.error('Error al decodificar JSON del webhook')
             return JsonResponse({'error': 'JSON inválido'}, status=400)
         except Exception as e:
-            logger.error(f'Error al procesar webhook: {str(e)}')
+            # Sin encolar: responder error para que Meta reintente
+            logger.error(f'Error al encolar webhook: {str(e)}')
             return JsonResponse({'error': 'Error interno del servidor'}, status=500)
     
     return JsonResponse({'error': 'Método no permitido'}, status=405)
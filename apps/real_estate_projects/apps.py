@@ -5,3 +5,7 @@ class RealEstateProjectsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.real_estate_projects'
     verbose_name = 'Real Estate Projects'
+
+    def ready(self):
+        """Registra los signals del precio materializado"""
+        from . import signals
@@ -0,0 +1,253 @@
+# apps/real_estate_projects/inventory_cache.py
+# CACHÉ VERSIONADA DE INVENTARIO (PROYECTO / FASE / DASHBOARD)
+
+import logging
+import uuid
+from typing import Callable, Dict, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+
+logger = logging.getLogger(__name__)
+
+# Tiempo de vida de los snapshots; las claves de versión no expiran
+INVENTORY_CACHE_TIMEOUT = getattr(settings, 'INVENTORY_CACHE_TIMEOUT', 60 * 60)
+
+PREFIX = 'inventario'
+GLOBAL = 'global'
+CONTADOR_HITS = f'{PREFIX}:contador:hits'
+CONTADOR_MISSES = f'{PREFIX}:contador:misses'
+
+
+def _clave_version(alcance, obj_id=None):
+    return f'{PREFIX}:version:{alcance}' + (f':{obj_id}' if obj_id is not None else '')
+
+
+def _clave_snapshot(alcance, obj_id, version):
+    return f'{PREFIX}:snapshot:{alcance}:{obj_id}:{version}'
+
+
+def _incrementar(clave, cantidad=1):
+    """Incremento atómico del contador (Redis INCR); lo crea si no existe"""
+    try:
+        cache.add(clave, 0, timeout=None)
+        cache.incr(clave, cantidad)
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el contador {clave}: {e}")
+
+
+def _versiones(alcance, ids) -> Dict:
+    """Versión vigente de cada objeto; crea las que no existen"""
+    claves = {obj_id: _clave_version(alcance, obj_id) for obj_id in ids}
+    existentes = cache.get_many(list(claves.values()))
+
+    versiones, nuevas = {}, {}
+    for obj_id, clave in claves.items():
+        version = existentes.get(clave)
+        if version is None:
+            version = uuid.uuid4().hex
+            nuevas[clave] = version
+        versiones[obj_id] = version
+    if nuevas:
+        cache.set_many(nuevas, timeout=None)
+    return versiones
+
+
+def _obtener_muchos(alcance, ids: Iterable, calcular: Callable[[list], Dict]) -> Dict:
+    """
+    Devuelve {id: snapshot} leyendo de caché y calculando solo los faltantes
+    (en una sola llamada a `calcular`). Si la caché falla, calcula todo.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+
+    try:
+        versiones = _versiones(alcance, ids)
+        claves = {obj_id: _clave_snapshot(alcance, obj_id, versiones[obj_id]) for obj_id in ids}
+        en_cache = cache.get_many(list(claves.values()))
+    except Exception as e:
+        logger.warning(f"Caché de inventario no disponible ({alcance}): {e}")
+        return calcular(ids)
+
+    resultado = {obj_id: en_cache[clave] for obj_id, clave in claves.items() if clave in en_cache}
+    faltantes = [obj_id for obj_id in ids if obj_id not in resultado]
+
+    if resultado:
+        _incrementar(CONTADOR_HITS, len(resultado))
+    if faltantes:
+        _incrementar(CONTADOR_MISSES, len(faltantes))
+        calculados = calcular(faltantes)
+        resultado.update(calculados)
+        try:
+            cache.set_many(
+                {claves[obj_id]: snapshot for obj_id, snapshot in calculados.items()},
+                timeout=INVENTORY_CACHE_TIMEOUT,
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el inventario en caché ({alcance}): {e}")
+
+    return resultado
+
+
+# ============================================================
+# CÁLCULO DE SNAPSHOTS
+# ============================================================
+
+def _q_ubicados():
+    """
+    Inmuebles ubicados en torres/pisos (departamentos) o sectores/manzanas (terrenos):
+    el mismo conjunto que suman los total_inmuebles del modelo recorriendo la estructura
+    """
+    return (
+        Q(fase__proyecto__tipo='departamentos', piso__isnull=False) |
+        Q(~Q(fase__proyecto__tipo='departamentos'), manzana__isnull=False)
+    )
+
+
+def _calcular_proyectos(proyecto_ids) -> Dict:
+    """Inventario de varios proyectos en una consulta agrupada (mismo criterio que los @property)"""
+    from .models import Inmueble
+
+    filas = Inmueble.objects.filter(
+        fase__proyecto_id__in=proyecto_ids
+    ).order_by().values('fase__proyecto_id').annotate(
+        total=Count('id', filter=_q_ubicados()),
+        disponibles=Count('id', filter=Q(disponible=True, estado='disponible')),
+        vendidos=Count('id', filter=Q(estado='vendido')),
+    )
+    snapshots = {
+        proyecto_id: {'total_inmuebles': 0, 'inmuebles_disponibles': 0, 'inmuebles_vendidos': 0}
+        for proyecto_id in proyecto_ids
+    }
+    for fila in filas:
+        snapshots[fila['fase__proyecto_id']] = {
+            'total_inmuebles': fila['total'],
+            'inmuebles_disponibles': fila['disponibles'],
+            'inmuebles_vendidos': fila['vendidos'],
+        }
+    for snapshot in snapshots.values():
+        total = snapshot['total_inmuebles']
+        snapshot['porcentaje_vendido'] = (
+            round((snapshot['inmuebles_vendidos'] / total) * 100, 2) if total else 0
+        )
+    return snapshots
+
+
+def _calcular_fases(fase_ids) -> Dict:
+    """Inventario de varias fases en una consulta agrupada"""
+    from .models import Inmueble
+
+    filas = Inmueble.objects.filter(
+        fase_id__in=fase_ids
+    ).order_by().values('fase_id').annotate(
+        total=Count('id', filter=_q_ubicados()),
+        disponibles=Count('id', filter=Q(disponible=True, estado='disponible')),
+        vendidos=Count('id', filter=Q(estado='vendido')),
+        comercializables=Count('id', filter=Q(disponible_comercializacion=True)),
+    )
+    snapshots = {
+        fase_id: {
+            'total_inmuebles': 0, 'inmuebles_disponibles': 0,
+            'inmuebles_vendidos': 0, 'inmuebles_comercializables': 0,
+        }
+        for fase_id in fase_ids
+    }
+    for fila in filas:
+        snapshots[fila['fase_id']] = {
+            'total_inmuebles': fila['total'],
+            'inmuebles_disponibles': fila['disponibles'],
+            'inmuebles_vendidos': fila['vendidos'],
+            'inmuebles_comercializables': fila['comercializables'],
+        }
+    return snapshots
+
+
+# ============================================================
+# API PÚBLICA
+# ============================================================
+
+def snapshots_proyectos(proyecto_ids) -> Dict:
+    """Inventario cacheado de varios proyectos: {proyecto_id: snapshot}"""
+    return _obtener_muchos('proyecto', proyecto_ids, _calcular_proyectos)
+
+
+def snapshot_proyecto(proyecto_id) -> Dict:
+    """Inventario cacheado de un proyecto"""
+    return snapshots_proyectos([proyecto_id])[proyecto_id]
+
+
+def snapshots_fases(fase_ids) -> Dict:
+    """Inventario cacheado de varias fases: {fase_id: snapshot}"""
+    return _obtener_muchos('fase', fase_ids, _calcular_fases)
+
+
+def snapshot_fase(fase_id) -> Dict:
+    """Inventario cacheado de una fase"""
+    return snapshots_fases([fase_id])[fase_id]
+
+
+def precargar_proyectos(proyectos) -> list:
+    """Adjunta el snapshot a cada proyecto para que sus @property no consulten la BD"""
+    proyectos = list(proyectos)
+    snapshots = snapshots_proyectos(proyecto.pk for proyecto in proyectos)
+    for proyecto in proyectos:
+        proyecto._inventario_snapshot = snapshots[proyecto.pk]
+    return proyectos
+
+
+def precargar_fases(fases) -> list:
+    """Adjunta el snapshot a cada fase para que sus @property no consulten la BD"""
+    fases = list(fases)
+    snapshots = snapshots_fases(fase.pk for fase in fases)
+    for fase in fases:
+        fase._inventario_snapshot = snapshots[fase.pk]
+    return fases
+
+
+def obtener_dashboard(calcular: Callable[[], Dict]) -> Dict:
+    """Datos del dashboard cacheados bajo la versión global del inventario"""
+    return _obtener_muchos(GLOBAL, [GLOBAL], lambda ids: {GLOBAL: calcular()})[GLOBAL]
+
+
+def invalidar_inventario(proyecto_id=None, fase_id=None):
+    """
+    Invalida los snapshots afectados cambiando su versión (las entradas viejas
+    quedan huérfanas y expiran solas). Siempre invalida el dashboard global.
+    Se repite al confirmar la transacción para descartar snapshots calculados
+    por otros procesos con datos anteriores al commit.
+    """
+    _cambiar_versiones(proyecto_id, fase_id)
+    transaction.on_commit(lambda: _cambiar_versiones(proyecto_id, fase_id))
+
+
+def _cambiar_versiones(proyecto_id=None, fase_id=None):
+    nuevas = {_clave_version(GLOBAL, GLOBAL): uuid.uuid4().hex}
+    if proyecto_id is not None:
+        nuevas[_clave_version('proyecto', proyecto_id)] = uuid.uuid4().hex
+    if fase_id is not None:
+        nuevas[_clave_version('fase', fase_id)] = uuid.uuid4().hex
+    try:
+        cache.set_many(nuevas, timeout=None)
+    except Exception as e:
+        logger.warning(f"No se pudo invalidar la caché de inventario: {e}")
+
+
+def estadisticas_cache() -> Dict:
+    """Contadores de aciertos/fallos de la caché de inventario"""
+    valores = cache.get_many([CONTADOR_HITS, CONTADOR_MISSES])
+    hits = valores.get(CONTADOR_HITS, 0)
+    misses = valores.get(CONTADOR_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round((hits / total) * 100, 2) if total else 0,
+    }
+
+
+def reiniciar_estadisticas():
+    """Pone en cero los contadores de aciertos/fallos"""
+    cache.delete_many([CONTADOR_HITS, CONTADOR_MISSES])
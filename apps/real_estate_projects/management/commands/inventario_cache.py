@@ -0,0 +1,38 @@
+# apps/real_estate_projects/management/commands/inventario_cache.py
+
+from django.core.management.base import BaseCommand
+
+from apps.real_estate_projects.inventory_cache import (
+    estadisticas_cache, invalidar_inventario, reiniciar_estadisticas
+)
+
+
+class Command(BaseCommand):
+    help = 'Muestra los aciertos/fallos de la caché de inventario, o la invalida'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Pone en cero los contadores de aciertos/fallos',
+        )
+        parser.add_argument(
+            '--invalidar',
+            action='store_true',
+            help='Invalida el dashboard global de inventario',
+        )
+
+    def handle(self, *args, **options):
+        if options['invalidar']:
+            invalidar_inventario()
+            self.stdout.write(self.style.SUCCESS('🗑️  Dashboard de inventario invalidado'))
+
+        estadisticas = estadisticas_cache()
+        self.stdout.write(self.style.SUCCESS('📊 Caché de inventario'))
+        self.stdout.write(f"  ✅ Aciertos: {estadisticas['hits']}")
+        self.stdout.write(f"  ❌ Fallos: {estadisticas['misses']}")
+        self.stdout.write(f"  📈 Tasa de aciertos: {estadisticas['hit_ratio']}%")
+
+        if options['reset']:
+            reiniciar_estadisticas()
+            self.stdout.write('  🔄 Contadores reiniciados')
@@ -0,0 +1,59 @@
+# apps/real_estate_projects/management/commands/recalcular_precios.py
+
+from django.core.management.base import BaseCommand
+
+from apps.real_estate_projects.models import Inmueble
+from apps.real_estate_projects.pricing import (
+    PRICE_BATCH_SIZE, recalcular_precios, refrescar_precios_programados
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula el precio final materializado (precio_final / precio_m2_final) de los inmuebles. '
+        'Úsalo para el llenado inicial o para forzar un recálculo; con --programados (por cron) '
+        'aplica los ponderadores que entraron o salieron de vigencia por fecha.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--proyecto',
+            type=int,
+            help='ID del proyecto a recalcular (por defecto todos)',
+        )
+        parser.add_argument(
+            '--fase',
+            type=int,
+            help='ID de la fase a recalcular',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=PRICE_BATCH_SIZE,
+            help=f'Inmuebles por lote de UPDATE (por defecto {PRICE_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--programados',
+            action='store_true',
+            help='Solo aplicar los cambios de vigencia desde la última ejecución (para cron, cada minuto)',
+        )
+
+    def handle(self, *args, **options):
+        if options['programados']:
+            actualizados = refrescar_precios_programados()
+            self.stdout.write(f'  ✅ Precios actualizados por ponderadores programados: {actualizados}')
+            return
+
+        inmuebles = Inmueble.objects.all()
+        if options['proyecto']:
+            inmuebles = inmuebles.filter(fase__proyecto_id=options['proyecto'])
+        if options['fase']:
+            inmuebles = inmuebles.filter(fase_id=options['fase'])
+
+        total = inmuebles.count()
+        self.stdout.write(self.style.SUCCESS(f'🔄 Recalculando precios de {total} inmuebles...'))
+
+        actualizados = recalcular_precios(inmuebles, batch_size=options['batch_size'])
+
+        self.stdout.write(f'  ✅ Precios actualizados: {actualizados}')
+        self.stdout.write(f'  ⏭️  Sin cambios: {total - actualizados}')
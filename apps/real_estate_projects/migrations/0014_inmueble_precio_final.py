@@ -0,0 +1,102 @@
+# Generated by Django 5.2.2 on 2026-10-18 10:45
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Q
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def backfill_precios(apps, schema_editor):
+    """
+    Llena precio_final / precio_m2_final de los inmuebles existentes con la misma
+    fórmula que PriceEngine (pricing.calcular_precio_final), para que los filtros y
+    el orden por precio funcionen desde el despliegue sin correr recalcular_precios
+    """
+    Fase = apps.get_model('real_estate_projects', 'Fase')
+    Inmueble = apps.get_model('real_estate_projects', 'Inmueble')
+    Ponderador = apps.get_model('real_estate_projects', 'Ponderador')
+
+    now = timezone.now()
+
+    def vigentes(prefix=''):
+        return (
+            Q(**{f'{prefix}activo': True, f'{prefix}fecha_activacion__lte': now}) &
+            (Q(**{f'{prefix}fecha_desactivacion__isnull': True}) |
+             Q(**{f'{prefix}fecha_desactivacion__gte': now}))
+        )
+
+    def ajuste(monto_fijo, porcentaje):
+        """(monto a sumar, factor a multiplicar) de un ponderador"""
+        if monto_fijo:
+            return monto_fijo, Decimal('1')
+        if porcentaje is not None:
+            return Decimal('0'), Decimal('1') + (porcentaje / Decimal('100'))
+        return Decimal('0'), Decimal('1')
+
+    fases = {
+        fase_id: (proyecto_id, precio_m2)
+        for fase_id, proyecto_id, precio_m2 in Fase.objects.values_list('id', 'proyecto_id', 'precio_m2')
+    }
+    por_proyecto, por_fase, por_inmueble = defaultdict(list), defaultdict(list), defaultdict(list)
+    for nivel, proyecto_id, fase_id, monto_fijo, porcentaje in Ponderador.objects.filter(
+        vigentes(), nivel_aplicacion__in=['proyecto', 'fase']
+    ).values_list('nivel_aplicacion', 'proyecto_id', 'fase_id', 'monto_fijo', 'porcentaje'):
+        if nivel == 'proyecto':
+            por_proyecto[proyecto_id].append(ajuste(monto_fijo, porcentaje))
+        else:
+            por_fase[fase_id].append(ajuste(monto_fijo, porcentaje))
+    for inmueble_id, monto_fijo, porcentaje in Inmueble.ponderadores.through.objects.filter(
+        vigentes('ponderador__'), ponderador__nivel_aplicacion='inmueble'
+    ).values_list('inmueble_id', 'ponderador__monto_fijo', 'ponderador__porcentaje'):
+        por_inmueble[inmueble_id].append(ajuste(monto_fijo, porcentaje))
+
+    def precio(inmueble):
+        if inmueble.precio_manual:
+            return inmueble.precio_manual
+        proyecto_id, precio_m2 = fases.get(inmueble.fase_id, (None, None))
+        if not (inmueble.m2 > 0 and precio_m2):
+            return Decimal('0')
+        monto_adicional, factor_total = Decimal('0'), Decimal('1')
+        for monto, factor in por_proyecto[proyecto_id] + por_fase[inmueble.fase_id] + por_inmueble[inmueble.pk]:
+            monto_adicional += monto
+            factor_total *= factor
+        return round((inmueble.m2 * precio_m2 * inmueble.factor_precio + monto_adicional) * factor_total, 2)
+
+    queryset = Inmueble.objects.only('id', 'fase', 'm2', 'factor_precio', 'precio_manual').order_by('pk')
+    ultimo_pk = 0
+    while True:
+        lote = list(queryset.filter(pk__gt=ultimo_pk)[:BATCH_SIZE])
+        if not lote:
+            break
+        ultimo_pk = lote[-1].pk
+        for inmueble in lote:
+            inmueble.precio_final = precio(inmueble)
+            inmueble.precio_m2_final = (
+                round(inmueble.precio_final / inmueble.m2, 2) if inmueble.m2 > 0 else Decimal('0')
+            )
+        Inmueble.objects.bulk_update(lote, ['precio_final', 'precio_m2_final'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('real_estate_projects', '0013_rename_m2m_field'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inmueble',
+            name='precio_final',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, help_text='Precio final con ponderadores vigentes (calculado automáticamente)', max_digits=15, null=True),
+        ),
+        migrations.AddField(
+            model_name='inmueble',
+            name='precio_m2_final',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, help_text='Precio final por metro cuadrado (calculado automáticamente)', max_digits=12, null=True),
+        ),
+        migrations.RunPython(backfill_precios, migrations.RunPython.noop),
+    ]
@@ -110,43 +110,40 @@ class Proyecto(models.Model):
     def __str__(self):
         return self.nombre
 
+    @property
+    def inventario(self):
+        """Snapshot cacheado del inventario del proyecto (ver inventory_cache)"""
+        snapshot = self.__dict__.get('_inventario_snapshot')
+        if snapshot is None:
+            from .inventory_cache import snapshot_proyecto
+            snapshot = self._inventario_snapshot = snapshot_proyecto(self.pk)
+        return snapshot
+
     @property
     def total_inmuebles(self):
         """Cuenta el total de inmuebles del proyecto"""
-        total = 0
-        for fase in self.fases.all():
-            total += fase.total_inmuebles
-        return total
+        return self.inventario['total_inmuebles']
 
     @property
     def inmuebles_disponibles(self):
         """Cuenta los inmuebles disponibles"""
-        total = 0
-        for fase in self.fases.all():
-            total += fase.inmuebles_disponibles
-        return total
+        return self.inventario['inmuebles_disponibles']
 
     @property
     def inmuebles_vendidos(self):
         """Cuenta los inmuebles vendidos"""
-        total = 0
-        for fase in self.fases.all():
-            total += fase.inmuebles_vendidos
-        return total
+        return self.inventario['inmuebles_vendidos']
 
     @property
     def porcentaje_vendido(self):
         """Calcula el porcentaje de inmuebles vendidos"""
-        total = self.total_inmuebles
-        if total == 0:
-            return 0
-        return round((self.inmuebles_vendidos / total) * 100, 2)
-
+        return self.inventario['porcentaje_vendido']
 
     def can_be_deleted(self):
         """Verifica si el proyecto puede ser eliminado"""
+        from .inventory_cache import precargar_fases
         # No se puede eliminar si tiene fases con inmuebles
-        for fase in self.fases.all():
+        for fase in precargar_fases(self.fases.all()):
             if fase.total_inmuebles > 0:
                 return False
         return True
@@ -210,43 +207,47 @@ class Fase(models.Model):
     def __str__(self):
         return f"{self.proyecto.nombre} - Fase {self.numero_fase}: {self.nombre}"
 
+    @property
+    def inventario(self):
+        """Snapshot cacheado del inventario de la fase (ver inventory_cache)"""
+        snapshot = self.__dict__.get('_inventario_snapshot')
+        if snapshot is None:
+            from .inventory_cache import snapshot_fase
+            snapshot = self._inventario_snapshot = snapshot_fase(self.pk)
+        return snapshot
+
     @property
     def total_inmuebles(self):
         """Cuenta el total de inmuebles de la fase"""
-        if self.proyecto.tipo == 'departamentos':
-            total = 0
-            for torre in self.torres.all():
-                total += torre.total_inmuebles
-            return total
-        else:  # terrenos
-            total = 0
-            for sector in self.sectores.all():
-                total += sector.total_inmuebles
-            return total
+        return self.inventario['total_inmuebles']
 
     @property
     def inmuebles_disponibles(self):
         """Cuenta los inmuebles disponibles de la fase"""
-        return self.inmuebles.filter(disponible=True, estado='disponible').count()
+        return self.inventario['inmuebles_disponibles']
 
     @property
     def inmuebles_vendidos(self):
         """Cuenta los inmuebles vendidos de la fase"""
-        return self.inmuebles.filter(estado='vendido').count()
+        return self.inventario['inmuebles_vendidos']
     
     @property
     def es_comercializable(self):
         """Verifica si la fase tiene inmuebles comercializables"""
-        return self.inmuebles.filter(disponible_comercializacion=True).exists()
+        return self.inventario['inmuebles_comercializables'] > 0
     
     @property
     def inmuebles_comercializables(self):
         """Cuenta los inmuebles comercializables de la fase"""
-        return self.inmuebles.filter(disponible_comercializacion=True).count()
+        return self.inventario['inmuebles_comercializables']
     
     def marcar_comercializable(self, estado=True):
         """Marca todos los inmuebles de la fase como comercializables o no"""
-        return self.inmuebles.update(disponible_comercializacion=estado)
+        from .inventory_cache import invalidar_inventario
+        actualizados = self.inmuebles.update(disponible_comercializacion=estado)
+        invalidar_inventario(proyecto_id=self.proyecto_id, fase_id=self.pk)
+        self.__dict__.pop('_inventario_snapshot', None)
+        return actualizados
 
 
 # ============================================================
@@ -301,9 +302,12 @@ class Torre(models.Model):
     
     def marcar_comercializable(self, estado=True):
         """Marca todos los inmuebles de la torre como comercializables o no"""
-        return Inmueble.objects.filter(
+        from .inventory_cache import invalidar_inventario
+        actualizados = Inmueble.objects.filter(
             piso__torre=self
         ).update(disponible_comercializacion=estado)
+        invalidar_inventario(proyecto_id=self.fase.proyecto_id, fase_id=self.fase_id)
+        return actualizados
 
 
 class Piso(models.Model):
@@ -384,9 +388,12 @@ class Sector(models.Model):
     
     def marcar_comercializable(self, estado=True):
         """Marca todos los inmuebles del sector como comercializables o no"""
-        return Inmueble.objects.filter(
+        from .inventory_cache import invalidar_inventario
+        actualizados = Inmueble.objects.filter(
             manzana__sector=self
         ).update(disponible_comercializacion=estado)
+        invalidar_inventario(proyecto_id=self.fase.proyecto_id, fase_id=self.fase_id)
+        return actualizados
 
 
 class Manzana(models.Model):
@@ -653,28 +660,33 @@ class Ponderador(models.Model):
 
     def crear_nueva_version(self, usuario, **nuevos_datos):
         """Crea una nueva versión de este ponderador"""
-        # Desactivar la versión actual
-        self.desactivar(usuario)
+        from django.db import transaction
+        from .pricing import recalculo_diferido
         
-        # Crear nueva versión
-        nueva_version = Ponderador.objects.create(
-            proyecto=self.proyecto,
-            fase=self.fase,
-            nombre=nuevos_datos.get('nombre', self.nombre),
-            tipo=nuevos_datos.get('tipo', self.tipo),
-            nivel_aplicacion=nuevos_datos.get('nivel_aplicacion', self.nivel_aplicacion),
-            porcentaje=nuevos_datos.get('porcentaje', self.porcentaje),
-            monto_fijo=nuevos_datos.get('monto_fijo', self.monto_fijo),
-            fecha_activacion=nuevos_datos.get('fecha_activacion'),
-            fecha_desactivacion=nuevos_datos.get('fecha_desactivacion'),
-            descripcion=nuevos_datos.get('descripcion', self.descripcion),
-            justificacion=nuevos_datos.get('justificacion', ''),
-            created_by=usuario,
-            activated_by=usuario,
-            activo=True,
-            version=self.version + 1,
-            ponderador_padre=self
-        )
+        # Un solo recálculo de precios para la desactivación y la nueva versión
+        with transaction.atomic(), recalculo_diferido():
+            # Desactivar la versión actual
+            self.desactivar(usuario)
+            
+            # Crear nueva versión
+            nueva_version = Ponderador.objects.create(
+                proyecto=self.proyecto,
+                fase=self.fase,
+                nombre=nuevos_datos.get('nombre', self.nombre),
+                tipo=nuevos_datos.get('tipo', self.tipo),
+                nivel_aplicacion=nuevos_datos.get('nivel_aplicacion', self.nivel_aplicacion),
+                porcentaje=nuevos_datos.get('porcentaje', self.porcentaje),
+                monto_fijo=nuevos_datos.get('monto_fijo', self.monto_fijo),
+                fecha_activacion=nuevos_datos.get('fecha_activacion'),
+                fecha_desactivacion=nuevos_datos.get('fecha_desactivacion'),
+                descripcion=nuevos_datos.get('descripcion', self.descripcion),
+                justificacion=nuevos_datos.get('justificacion', ''),
+                created_by=usuario,
+                activated_by=usuario,
+                activo=True,
+                version=self.version + 1,
+                ponderador_padre=self
+            )
         
         return nueva_version
 
@@ -746,6 +758,26 @@ class Inmueble(models.Model):
         help_text="Precio manual que sobrescribe el cálculo automático"
     )
     
+    # Precio final materializado (mantenido por pricing.recalcular_precios)
+    precio_final = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="Precio final con ponderadores vigentes (calculado automáticamente)"
+    )
+    precio_m2_final = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text="Precio final por metro cuadrado (calculado automáticamente)"
+    )
+    
     # Ponderadores de precio
     ponderadores = models.ManyToManyField(
         'Ponderador',
@@ -776,58 +808,45 @@ class Inmueble(models.Model):
     @property
     def precio_calculado(self):
         """Calcula el precio automáticamente con sistema jerárquico de ponderadores"""
+        # Precio ya resuelto por el motor de precios por lotes (pricing.PriceEngine)
+        precio_lote = self.__dict__.get('_precio_calculado_lote')
+        if precio_lote is not None:
+            return precio_lote
+
         if self.precio_manual:
             return self.precio_manual
         
         if self.m2 > 0 and self.fase.precio_m2:
-            from django.utils import timezone
-            from django.db.models import Q
             from itertools import chain
+            from django.utils import timezone
+            from .pricing import calcular_precio_final, ponderadores_vigentes_q
             
-            precio_base = self.m2 * self.fase.precio_m2 * self.factor_precio
-            monto_adicional = Decimal('0')
-            factor_total = Decimal('1')
             now = timezone.now()
+            vigentes = ponderadores_vigentes_q(now)
             
             # 1. Ponderadores de PROYECTO (afectan todo el proyecto)
             ponderadores_proyecto = self.fase.proyecto.ponderadores.filter(
-                activo=True,
-                nivel_aplicacion='proyecto',
-                fecha_activacion__lte=now
-            ).filter(
-                Q(fecha_desactivacion__isnull=True) | Q(fecha_desactivacion__gte=now)
+                vigentes, nivel_aplicacion='proyecto'
             )
             
             # 2. Ponderadores de FASE (afectan solo esta fase)
             ponderadores_fase = self.fase.ponderadores.filter(
-                activo=True,
-                nivel_aplicacion='fase',
-                fecha_activacion__lte=now
-            ).filter(
-                Q(fecha_desactivacion__isnull=True) | Q(fecha_desactivacion__gte=now)
+                vigentes, nivel_aplicacion='fase'
             )
             
             # 3. Ponderadores de INMUEBLE (específicos de este inmueble)
             ponderadores_inmueble = self.ponderadores.filter(
-                activo=True,
-                nivel_aplicacion='inmueble',
-                fecha_activacion__lte=now
-            ).filter(
-                Q(fecha_desactivacion__isnull=True) | Q(fecha_desactivacion__gte=now)
+                vigentes, nivel_aplicacion='inmueble'
             )
             
-            # Aplicar todos los ponderadores vigentes
-            for ponderador in chain(ponderadores_proyecto, ponderadores_fase, ponderadores_inmueble):
-                if ponderador.monto_fijo:
-                    # Montos fijos se suman directamente al precio base
-                    monto_adicional += ponderador.monto_fijo
-                else:
-                    # Porcentajes se multiplican como factores
-                    factor_total *= ponderador.factor_multiplicador
-            
             # Calcular precio final: (precio_base + montos_fijos) * factores_porcentuales
-            precio_final = (precio_base + monto_adicional) * factor_total
-            return round(precio_final, 2)
+            return calcular_precio_final(
+                self.m2,
+                self.fase.precio_m2,
+                self.factor_precio,
+                self.precio_manual,
+                chain(ponderadores_proyecto, ponderadores_fase, ponderadores_inmueble),
+            )
         
         return Decimal('0')
 
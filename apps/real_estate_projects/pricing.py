@@ -0,0 +1,410 @@
+# apps/real_estate_projects/pricing.py
+# MOTOR DE PRECIOS POR LOTES PARA INMUEBLES
+
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from decimal import Decimal
+from typing import Dict, Iterable, List
+
+from django.core.cache import cache
+from django.db.models import Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de lote para los UPDATE masivos del precio materializado
+PRICE_BATCH_SIZE = 1000
+
+
+def ponderadores_vigentes_q(now=None, prefix=''):
+    """
+    Filtro Q de ponderadores vigentes (mismo criterio que Inmueble.precio_calculado).
+    `prefix` permite aplicarlo a través de una relación (ej: 'ponderador__').
+    """
+    now = now or timezone.now()
+    return (
+        Q(**{f'{prefix}activo': True, f'{prefix}fecha_activacion__lte': now}) &
+        (Q(**{f'{prefix}fecha_desactivacion__isnull': True}) |
+         Q(**{f'{prefix}fecha_desactivacion__gte': now}))
+    )
+
+
+def calcular_precio_final(m2, precio_m2, factor_precio, precio_manual, ponderadores) -> Decimal:
+    """
+    Fórmula de precio compartida por la propiedad del modelo y el motor por lotes:
+    (m2 * precio_m2 * factor_precio + montos_fijos) * factores_porcentuales
+    """
+    if precio_manual:
+        return precio_manual
+
+    if m2 > 0 and precio_m2:
+        precio_base = m2 * precio_m2 * factor_precio
+        monto_adicional = Decimal('0')
+        factor_total = Decimal('1')
+
+        for ponderador in ponderadores:
+            if ponderador.monto_fijo:
+                # Montos fijos se suman directamente al precio base
+                monto_adicional += ponderador.monto_fijo
+            else:
+                # Porcentajes se multiplican como factores
+                factor_total *= ponderador.factor_multiplicador
+
+        precio_final = (precio_base + monto_adicional) * factor_total
+        return round(precio_final, 2)
+
+    return Decimal('0')
+
+
+class PriceEngine:
+    """
+    Motor de precios por lotes.
+
+    Carga una sola vez los precios por m2 de las fases y todos los ponderadores
+    vigentes (proyecto, fase e inmueble) de los inmuebles recibidos, y calcula
+    los precios en memoria. Devuelve los mismos Decimal que Inmueble.precio_calculado
+    usando un número constante de consultas (3) sin importar la cantidad de inmuebles.
+    """
+
+    def __init__(self, inmuebles: Iterable, now=None):
+        from .models import Fase, Inmueble, Ponderador
+
+        self.now = now or timezone.now()
+        self.inmuebles = list(inmuebles)
+        self.precios: Dict[int, Decimal] = {}
+
+        fase_ids = {inmueble.fase_id for inmueble in self.inmuebles}
+        inmueble_ids = [inmueble.pk for inmueble in self.inmuebles if inmueble.pk]
+
+        # 1. Precio por m2 y proyecto de cada fase (una consulta)
+        self.fases: Dict[int, tuple] = {
+            fase_id: (proyecto_id, precio_m2)
+            for fase_id, proyecto_id, precio_m2 in Fase.objects.filter(
+                id__in=fase_ids
+            ).values_list('id', 'proyecto_id', 'precio_m2')
+        }
+        proyecto_ids = {proyecto_id for proyecto_id, _ in self.fases.values()}
+
+        # 2. Ponderadores vigentes de proyecto y de fase (una consulta)
+        self.por_proyecto: Dict[int, List] = defaultdict(list)
+        self.por_fase: Dict[int, List] = defaultdict(list)
+        if fase_ids:
+            ponderadores = Ponderador.objects.filter(
+                ponderadores_vigentes_q(self.now)
+            ).filter(
+                Q(nivel_aplicacion='proyecto', proyecto_id__in=proyecto_ids) |
+                Q(nivel_aplicacion='fase', fase_id__in=fase_ids)
+            )
+            for ponderador in ponderadores:
+                if ponderador.nivel_aplicacion == 'proyecto':
+                    self.por_proyecto[ponderador.proyecto_id].append(ponderador)
+                else:
+                    self.por_fase[ponderador.fase_id].append(ponderador)
+
+        # 3. Ponderadores vigentes asignados a inmuebles específicos (una consulta)
+        self.por_inmueble: Dict[int, List] = defaultdict(list)
+        if inmueble_ids:
+            asignaciones = Inmueble.ponderadores.through.objects.filter(
+                ponderadores_vigentes_q(self.now, prefix='ponderador__'),
+                inmueble_id__in=inmueble_ids,
+                ponderador__nivel_aplicacion='inmueble',
+            ).select_related('ponderador').order_by(
+                'ponderador__tipo', 'ponderador__nombre'
+            )
+            for asignacion in asignaciones:
+                self.por_inmueble[asignacion.inmueble_id].append(asignacion.ponderador)
+
+    def ponderadores_aplicables(self, inmueble) -> List:
+        """Ponderadores vigentes que afectan al inmueble, en orden proyecto → fase → inmueble"""
+        proyecto_id, _ = self.fases.get(inmueble.fase_id, (None, None))
+        return (
+            self.por_proyecto.get(proyecto_id, []) +
+            self.por_fase.get(inmueble.fase_id, []) +
+            self.por_inmueble.get(inmueble.pk, [])
+        )
+
+    def precio(self, inmueble) -> Decimal:
+        """Precio final del inmueble calculado con los ponderadores precargados"""
+        if inmueble.pk in self.precios:
+            return self.precios[inmueble.pk]
+
+        _, precio_m2 = self.fases.get(inmueble.fase_id, (None, None))
+        precio = calcular_precio_final(
+            inmueble.m2,
+            precio_m2,
+            inmueble.factor_precio,
+            inmueble.precio_manual,
+            self.ponderadores_aplicables(inmueble),
+        )
+        if inmueble.pk:
+            self.precios[inmueble.pk] = precio
+        return precio
+
+    def precio_por_m2(self, inmueble) -> Decimal:
+        """Precio por metro cuadrado (mismo redondeo que Inmueble.precio_por_m2)"""
+        if inmueble.m2 > 0:
+            return round(self.precio(inmueble) / inmueble.m2, 2)
+        return Decimal('0')
+
+    def calcular(self) -> Dict[int, Decimal]:
+        """Calcula el precio de todos los inmuebles del lote en una sola pasada"""
+        for inmueble in self.inmuebles:
+            self.precio(inmueble)
+        return self.precios
+
+    def aplicar(self) -> List:
+        """
+        Guarda el precio calculado en cada instancia para que `precio_calculado`,
+        `precio_por_m2` y `precio_venta` no vuelvan a consultar la base de datos
+        (útil para plantillas). Devuelve la lista de inmuebles.
+        """
+        for inmueble in self.inmuebles:
+            inmueble._precio_calculado_lote = self.precio(inmueble)
+        return self.inmuebles
+
+
+def aplicar_precios(inmuebles: Iterable, now=None) -> List:
+    """Atajo: calcula y fija los precios de un conjunto de inmuebles en un solo paso"""
+    return PriceEngine(inmuebles, now=now).aplicar()
+
+
+# ============================================================
+# PRECIO MATERIALIZADO (Inmueble.precio_final / precio_m2_final)
+# ============================================================
+
+def recalcular_precios(inmuebles, batch_size: int = PRICE_BATCH_SIZE, now=None) -> int:
+    """
+    Recalcula y guarda precio_final y precio_m2_final para un queryset de inmuebles.
+    Procesa por lotes: cada lote cuesta 3 consultas de lectura y un UPDATE masivo.
+    Devuelve la cantidad de inmuebles actualizados.
+    """
+    from .models import Inmueble
+
+    now = now or timezone.now()
+    queryset = inmuebles.only(
+        'id', 'fase', 'm2', 'factor_precio', 'precio_manual',
+        'precio_final', 'precio_m2_final'
+    ).order_by('pk')
+
+    actualizados = 0
+    ultimo_pk = 0
+    while True:
+        lote = list(queryset.filter(pk__gt=ultimo_pk)[:batch_size])
+        if not lote:
+            break
+        ultimo_pk = lote[-1].pk
+
+        engine = PriceEngine(lote, now=now)
+        cambiados = []
+        for inmueble in lote:
+            precio = engine.precio(inmueble)
+            precio_m2 = engine.precio_por_m2(inmueble)
+            if inmueble.precio_final != precio or inmueble.precio_m2_final != precio_m2:
+                inmueble.precio_final = precio
+                inmueble.precio_m2_final = precio_m2
+                cambiados.append(inmueble)
+
+        if cambiados:
+            Inmueble.objects.bulk_update(cambiados, ['precio_final', 'precio_m2_final'])
+            actualizados += len(cambiados)
+
+    return actualizados
+
+
+_diferido = threading.local()
+
+
+@contextmanager
+def recalculo_diferido():
+    """
+    Agrupa los recálculos solicitados dentro del bloque (por signals) y los ejecuta
+    una sola vez al salir. Si el bloque falla, los recálculos pendientes se descartan.
+    """
+    if getattr(_diferido, 'alcances', None) is not None:
+        # Bloque anidado: el bloque externo ejecuta los recálculos
+        yield
+        return
+
+    _diferido.alcances = {'proyecto': set(), 'fase': set(), 'inmueble': set()}
+    try:
+        yield
+        alcances = _diferido.alcances
+    finally:
+        _diferido.alcances = None
+
+    _ejecutar_recalculo(alcances)
+
+
+def programar_recalculo(proyecto_id=None, fase_id=None, inmueble_ids=()):
+    """
+    Solicita el recálculo del precio materializado para un alcance.
+    Se ejecuta de inmediato, o al salir del bloque `recalculo_diferido` activo.
+    """
+    alcances = {
+        'proyecto': {proyecto_id} if proyecto_id else set(),
+        'fase': {fase_id} if fase_id else set(),
+        'inmueble': set(inmueble_ids),
+    }
+    pendientes = getattr(_diferido, 'alcances', None)
+    if pendientes is not None:
+        for nivel, ids in alcances.items():
+            pendientes[nivel] |= ids
+        return
+    _ejecutar_recalculo(alcances)
+
+
+def _ejecutar_recalculo(alcances) -> int:
+    """Recalcula solo el alcance afectado: proyectos, fases e inmuebles sueltos"""
+    from .models import Inmueble
+
+    filtro = Q()
+    if alcances['proyecto']:
+        filtro |= Q(fase__proyecto_id__in=alcances['proyecto'])
+    if alcances['fase']:
+        filtro |= Q(fase_id__in=alcances['fase'])
+    if alcances['inmueble']:
+        filtro |= Q(pk__in=alcances['inmueble'])
+    if not filtro:
+        return 0
+    return recalcular_precios(Inmueble.objects.filter(filtro))
+
+
+def programar_recalculo_ponderador(ponderador, nivel_previo=None, fase_previa_id=None):
+    """Solicita el recálculo de los inmuebles afectados por un ponderador (y su alcance previo)"""
+    niveles = {ponderador.nivel_aplicacion, nivel_previo or ponderador.nivel_aplicacion}
+
+    if 'proyecto' in niveles:
+        programar_recalculo(proyecto_id=ponderador.proyecto_id)
+        return
+
+    if 'fase' in niveles:
+        for fase_id in {ponderador.fase_id, fase_previa_id} - {None}:
+            programar_recalculo(fase_id=fase_id)
+
+    if 'inmueble' in niveles and ponderador.pk:
+        programar_recalculo(
+            inmueble_ids=ponderador.inmuebles.values_list('pk', flat=True)
+        )
+
+
+# ============================================================
+# CAMBIOS PROGRAMADOS (fecha_activacion / fecha_desactivacion)
+# ============================================================
+
+# Estado en caché: {'corte': hasta cuándo precio_final está al día,
+#                   'proximo': primera fecha de vigencia posterior al corte (o None)}
+CLAVE_CAMBIOS_PROGRAMADOS = 'precios:cambios_programados'
+CLAVE_CANDADO_PROGRAMADOS = 'precios:cambios_programados:candado'
+# El candado expira solo si el proceso muere a mitad de un recálculo
+CANDADO_PROGRAMADOS_TIMEOUT = 30 * 60
+
+
+def proximo_cambio_programado(desde):
+    """
+    Primera fecha posterior a `desde` en que un ponderador activo entra o sale de
+    vigencia (None si no hay ninguna programada)
+    """
+    from .models import Ponderador
+
+    fechas = Ponderador.objects.filter(activo=True).aggregate(
+        activacion=Min('fecha_activacion', filter=Q(fecha_activacion__gt=desde)),
+        desactivacion=Min('fecha_desactivacion', filter=Q(fecha_desactivacion__gte=desde)),
+    )
+    return min((fecha for fecha in fechas.values() if fecha), default=None)
+
+
+def refrescar_precios_programados(now=None) -> int:
+    """
+    Aplica a precio_final los ponderadores que entraron o salieron de vigencia desde
+    el último corte (sin que se guarde ninguna fila, así que ningún signal lo hace).
+    Se ejecuta fuera de las peticiones (recalcular_precios --programados, por cron):
+    mientras no llegue el próximo cambio programado cuesta solo una lectura de caché
+    y sin estado en caché recalcula todos los inmuebles (solo guarda los que cambian).
+    Un candado en caché evita dos ejecuciones simultáneas.
+    Devuelve la cantidad de inmuebles actualizados.
+    """
+    now = now or timezone.now()
+    try:
+        estado = cache.get(CLAVE_CAMBIOS_PROGRAMADOS)
+        if estado and (estado['proximo'] is None or now < estado['proximo']):
+            return 0
+        if not cache.add(CLAVE_CANDADO_PROGRAMADOS, now, timeout=CANDADO_PROGRAMADOS_TIMEOUT):
+            logger.info("Refresco de precios programados ya en curso")
+            return 0
+    except Exception as e:
+        logger.warning(f"Caché de precios no disponible: {e}")
+        return 0
+
+    try:
+        actualizados = _refrescar_desde(estado['corte'] if estado else None, now)
+        cache.set(
+            CLAVE_CAMBIOS_PROGRAMADOS,
+            {'corte': now, 'proximo': proximo_cambio_programado(now)},
+            timeout=None,
+        )
+    finally:
+        cache.delete(CLAVE_CANDADO_PROGRAMADOS)
+    return actualizados
+
+
+def _refrescar_desde(corte, now) -> int:
+    """
+    Recalcula los inmuebles de los ponderadores con una fecha de vigencia en (corte, now]
+    (todos si no hay corte) e invalida la caché de inventario de lo que cambió
+    """
+    from .inventory_cache import invalidar_inventario
+    from .models import Inmueble, Ponderador
+
+    if corte is None:
+        actualizados = recalcular_precios(Inmueble.objects.all(), now=now)
+        if actualizados:
+            invalidar_inventario()
+        return actualizados
+
+    vencidos = Ponderador.objects.filter(activo=True).filter(
+        Q(fecha_activacion__gt=corte, fecha_activacion__lte=now) |
+        Q(fecha_desactivacion__gte=corte, fecha_desactivacion__lt=now)
+    )
+    alcances = {'proyecto': set(), 'fase': set(), 'inmueble': set()}
+    por_inmueble = []
+    for ponderador_id, nivel, proyecto_id, fase_id in vencidos.values_list(
+        'id', 'nivel_aplicacion', 'proyecto_id', 'fase_id'
+    ):
+        if nivel == 'proyecto':
+            alcances['proyecto'].add(proyecto_id)
+        elif nivel == 'fase' and fase_id:
+            alcances['fase'].add(fase_id)
+        elif nivel == 'inmueble':
+            por_inmueble.append(ponderador_id)
+    if por_inmueble:
+        alcances['inmueble'].update(Inmueble.ponderadores.through.objects.filter(
+            ponderador_id__in=por_inmueble
+        ).values_list('inmueble_id', flat=True))
+
+    actualizados = _ejecutar_recalculo(alcances)
+    if actualizados:
+        # bulk_update no dispara signals: invalidar el inventario de cada alcance
+        for proyecto_id in alcances['proyecto']:
+            invalidar_inventario(proyecto_id=proyecto_id)
+        fases = Inmueble.objects.filter(
+            Q(fase_id__in=alcances['fase']) | Q(pk__in=alcances['inmueble'])
+        ).order_by().values_list('fase__proyecto_id', 'fase_id').distinct()
+        for proyecto_id, fase_id in fases:
+            invalidar_inventario(proyecto_id=proyecto_id, fase_id=fase_id)
+    return actualizados
+
+
+def actualizar_proximo_cambio():
+    """
+    Un ponderador creado o editado puede adelantar el próximo cambio programado:
+    lo recalcula desde el corte guardado (sin estado no hay nada que actualizar)
+    """
+    try:
+        estado = cache.get(CLAVE_CAMBIOS_PROGRAMADOS)
+        if estado:
+            estado['proximo'] = proximo_cambio_programado(estado['corte'])
+            cache.set(CLAVE_CAMBIOS_PROGRAMADOS, estado, timeout=None)
+    except Exception as e:
+        logger.warning(f"No se pudo actualizar el próximo cambio de precios: {e}")
@@ -0,0 +1,130 @@
+"""
+Signals para mantener el precio materializado de los inmuebles (precio_final)
+y para invalidar la caché de inventario (inventory_cache)
+"""
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .inventory_cache import invalidar_inventario
+from .models import Proyecto, Fase, Inmueble, Ponderador
+from .pricing import actualizar_proximo_cambio, programar_recalculo, programar_recalculo_ponderador
+
+# Campos del inmueble que afectan su precio
+CAMPOS_PRECIO_INMUEBLE = {'fase', 'fase_id', 'm2', 'factor_precio', 'precio_manual'}
+
+
+@receiver(pre_save, sender=Fase)
+def fase_pre_save(sender, instance, raw=False, **kwargs):
+    """Guarda el precio_m2 anterior para detectar cambios de precio"""
+    instance._precio_m2_previo = None
+    if instance.pk and not raw:
+        instance._precio_m2_previo = Fase.objects.filter(
+            pk=instance.pk
+        ).values_list('precio_m2', flat=True).first()
+
+
+@receiver(post_save, sender=Fase)
+def fase_post_save(sender, instance, created, raw=False, **kwargs):
+    """Recalcula los precios de la fase solo si cambió su precio por m2"""
+    if raw or created:
+        return
+    if instance._precio_m2_previo is not None and instance._precio_m2_previo != instance.precio_m2:
+        programar_recalculo(fase_id=instance.pk)
+
+
+@receiver(pre_save, sender=Ponderador)
+def ponderador_pre_save(sender, instance, raw=False, **kwargs):
+    """Guarda el alcance anterior del ponderador (nivel y fase)"""
+    instance._alcance_previo = (None, None)
+    if instance.pk and not raw:
+        instance._alcance_previo = Ponderador.objects.filter(
+            pk=instance.pk
+        ).values_list('nivel_aplicacion', 'fase_id').first() or (None, None)
+
+
+@receiver(post_save, sender=Ponderador)
+def ponderador_post_save(sender, instance, raw=False, **kwargs):
+    """Activación, desactivación, edición o nueva versión de un ponderador"""
+    if raw:
+        return
+    nivel_previo, fase_previa_id = getattr(instance, '_alcance_previo', (None, None))
+    programar_recalculo_ponderador(instance, nivel_previo, fase_previa_id)
+    # Sus fechas de vigencia pueden adelantar el próximo cambio programado
+    actualizar_proximo_cambio()
+
+
+@receiver(pre_delete, sender=Ponderador)
+def ponderador_pre_delete(sender, instance, **kwargs):
+    """Guarda los inmuebles del ponderador: al borrarlo, sus filas M2M se eliminan sin m2m_changed"""
+    instance._inmuebles_previos = list(instance.inmuebles.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Ponderador)
+def ponderador_post_delete(sender, instance, **kwargs):
+    """Un ponderador eliminado deja de afectar a su alcance"""
+    if instance.nivel_aplicacion == 'proyecto':
+        programar_recalculo(proyecto_id=instance.proyecto_id)
+    elif instance.nivel_aplicacion == 'fase' and instance.fase_id:
+        programar_recalculo(fase_id=instance.fase_id)
+    elif getattr(instance, '_inmuebles_previos', None):
+        programar_recalculo(inmueble_ids=instance._inmuebles_previos)
+
+
+@receiver(post_save, sender=Inmueble)
+def inmueble_post_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Recalcula el precio del inmueble cuando cambian sus datos de precio"""
+    if raw:
+        return
+    if update_fields is not None and not CAMPOS_PRECIO_INMUEBLE.intersection(update_fields):
+        return
+    programar_recalculo(inmueble_ids=[instance.pk])
+
+
+@receiver(m2m_changed, sender=Inmueble.ponderadores.through)
+def inmueble_ponderadores_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Asignación o retiro de ponderadores específicos de inmuebles"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        # instance es un Inmueble
+        programar_recalculo(inmueble_ids=[instance.pk])
+    elif pk_set:
+        # instance es un Ponderador, pk_set son los inmuebles
+        programar_recalculo(inmueble_ids=pk_set)
+    elif action == 'post_clear':
+        # Ya no se conocen los inmuebles: recalcular el proyecto del ponderador
+        programar_recalculo(proyecto_id=instance.proyecto_id)
+
+
+# ============================================================
+# INVALIDACIÓN DE LA CACHÉ DE INVENTARIO
+# ============================================================
+
+@receiver(post_save, sender=Proyecto)
+@receiver(post_delete, sender=Proyecto)
+def proyecto_invalidar_inventario(sender, instance, **kwargs):
+    """Cambios de tipo/estado del proyecto afectan su inventario y el dashboard"""
+    invalidar_inventario(proyecto_id=instance.pk)
+
+
+@receiver(post_save, sender=Fase)
+@receiver(post_delete, sender=Fase)
+def fase_invalidar_inventario(sender, instance, **kwargs):
+    invalidar_inventario(proyecto_id=instance.proyecto_id, fase_id=instance.pk)
+
+
+@receiver(post_save, sender=Ponderador)
+@receiver(post_delete, sender=Ponderador)
+def ponderador_invalidar_inventario(sender, instance, **kwargs):
+    """El dashboard muestra el conteo de ponderadores activos"""
+    invalidar_inventario(proyecto_id=instance.proyecto_id, fase_id=instance.fase_id)
+
+
+@receiver(post_save, sender=Inmueble)
+@receiver(post_delete, sender=Inmueble)
+def inmueble_invalidar_inventario(sender, instance, **kwargs):
+    """Altas, bajas y cambios de estado o comercialización de un inmueble"""
+    proyecto_id = Fase.objects.filter(
+        pk=instance.fase_id
+    ).values_list('proyecto_id', flat=True).first()
+    invalidar_inventario(proyecto_id=proyecto_id, fase_id=instance.fase_id)
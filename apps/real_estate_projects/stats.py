@@ -0,0 +1,150 @@
+# apps/real_estate_projects/stats.py
+# ESTADÍSTICAS DE INVENTARIO CON AGREGACIÓN CONDICIONAL (UNA CONSULTA POR ALCANCE)
+
+from typing import Dict, List
+
+from django.db.models import Avg, Count, Q, Sum
+
+
+def _porcentaje(parte, total, decimales=1):
+    """Porcentaje redondeado, 0 si no hay total"""
+    if not total:
+        return 0
+    return round((parte / total) * 100, decimales)
+
+
+def _contadores_inventario():
+    """Expresiones de conteo condicional: total, comercializables y uno por estado"""
+    from .models import Inmueble
+
+    contadores = {
+        'total': Count('id'),
+        'comercializables': Count('id', filter=Q(disponible_comercializacion=True)),
+    }
+    for estado, _ in Inmueble.ESTADOS_INMUEBLE:
+        contadores[estado] = Count('id', filter=Q(estado=estado))
+    return contadores
+
+
+def inventario_stats(inmuebles, por_tipo=False) -> Dict:
+    """
+    Estadísticas de inventario de un queryset de inmuebles en una sola consulta:
+    conteos por estado, comercializables, área total/promedio y, opcionalmente,
+    el desglose por tipo de inmueble.
+    """
+    from .models import Inmueble
+
+    agregados = _contadores_inventario()
+    agregados['area_total_m2'] = Sum('m2')
+    agregados['area_promedio_m2'] = Avg('m2')
+
+    if por_tipo:
+        for tipo, _ in Inmueble.TIPOS_INMUEBLE:
+            agregados[f'tipo__{tipo}__total'] = Count('id', filter=Q(tipo=tipo))
+            agregados[f'tipo__{tipo}__vendidos'] = Count('id', filter=Q(tipo=tipo, estado='vendido'))
+            agregados[f'tipo__{tipo}__disponibles'] = Count('id', filter=Q(tipo=tipo, estado='disponible'))
+            agregados[f'tipo__{tipo}__comercializables'] = Count(
+                'id', filter=Q(tipo=tipo, disponible_comercializacion=True)
+            )
+
+    resultado = inmuebles.order_by().aggregate(**agregados)
+
+    stats = {
+        'total_inmuebles': resultado['total'],
+        'disponibles': resultado['disponible'],
+        'reservados': resultado['reservado'],
+        'vendidos': resultado['vendido'],
+        'bloqueados': resultado['bloqueado'],
+        'comercializables': resultado['comercializables'],
+        'area_total_m2': resultado['area_total_m2'] or 0,
+        'area_promedio_m2': resultado['area_promedio_m2'] or 0,
+    }
+    stats['porcentaje_vendidos'] = _porcentaje(stats['vendidos'], stats['total_inmuebles'])
+    stats['porcentaje_disponibles'] = _porcentaje(stats['disponibles'], stats['total_inmuebles'])
+    stats['porcentaje_comercializables'] = _porcentaje(stats['comercializables'], stats['total_inmuebles'])
+
+    if por_tipo:
+        # Mismo formato que values('tipo').annotate(...): solo tipos con inmuebles, ordenados por tipo
+        stats['por_tipo'] = [
+            {
+                'tipo': tipo,
+                'total': resultado[f'tipo__{tipo}__total'],
+                'vendidos': resultado[f'tipo__{tipo}__vendidos'],
+                'disponibles': resultado[f'tipo__{tipo}__disponibles'],
+                'comercializables': resultado[f'tipo__{tipo}__comercializables'],
+            }
+            for tipo in sorted(tipo for tipo, _ in Inmueble.TIPOS_INMUEBLE)
+            if resultado[f'tipo__{tipo}__total']
+        ]
+
+    return stats
+
+
+def ponderadores_stats(ponderadores=None) -> Dict:
+    """Conteo de ponderadores activos por nivel de aplicación en una sola consulta"""
+    from .models import Ponderador
+
+    if ponderadores is None:
+        ponderadores = Ponderador.objects.all()
+
+    activos = Q(activo=True)
+    resultado = ponderadores.order_by().aggregate(
+        total=Count('id', filter=activos),
+        proyecto=Count('id', filter=activos & Q(nivel_aplicacion='proyecto')),
+        fase=Count('id', filter=activos & Q(nivel_aplicacion='fase')),
+        inmueble=Count('id', filter=activos & Q(nivel_aplicacion='inmueble')),
+    )
+    return {
+        'total_ponderadores': resultado['total'],
+        'ponderadores_proyecto': resultado['proyecto'],
+        'ponderadores_fase': resultado['fase'],
+        'ponderadores_inmueble': resultado['inmueble'],
+    }
+
+
+def proyectos_resumen(proyectos) -> Dict:
+    """Conteo de proyectos por tipo en una sola consulta"""
+    resultado = proyectos.order_by().aggregate(
+        total=Count('id'),
+        departamentos=Count('id', filter=Q(tipo='departamentos')),
+        terrenos=Count('id', filter=Q(tipo='terrenos')),
+    )
+    return {
+        'total_proyectos': resultado['total'],
+        'proyectos_departamentos': resultado['departamentos'],
+        'proyectos_terrenos': resultado['terrenos'],
+    }
+
+
+def inventario_por_proyecto(proyectos, limite=None) -> List[Dict]:
+    """
+    Estadísticas de inventario agrupadas por proyecto en una sola consulta
+    (fases activas e inmuebles con disponible=True), sin importar cuántos proyectos haya.
+    """
+    prefix = 'fases__inmuebles__'
+    base = Q(fases__activo=True, fases__inmuebles__disponible=True)
+
+    proyectos = proyectos.annotate(
+        inv_total=Count(f'{prefix}id', filter=base),
+        inv_vendidos=Count(f'{prefix}id', filter=base & Q(**{f'{prefix}estado': 'vendido'})),
+        inv_disponibles=Count(f'{prefix}id', filter=base & Q(**{f'{prefix}estado': 'disponible'})),
+        inv_comercializables=Count(
+            f'{prefix}id', filter=base & Q(**{f'{prefix}disponible_comercializacion': True})
+        ),
+        inv_fases=Count('fases', filter=Q(fases__activo=True), distinct=True),
+    )
+    if limite:
+        proyectos = proyectos[:limite]
+
+    return [
+        {
+            'proyecto': proyecto,
+            'total_inmuebles': proyecto.inv_total,
+            'inmuebles_vendidos': proyecto.inv_vendidos,
+            'inmuebles_disponibles': proyecto.inv_disponibles,
+            'inmuebles_comercializables': proyecto.inv_comercializables,
+            'porcentaje_vendido': _porcentaje(proyecto.inv_vendidos, proyecto.inv_total),
+            'total_fases': proyecto.inv_fases,
+        }
+        for proyecto in proyectos
+    ]
@@ -0,0 +1,513 @@
+# apps/real_estate_projects/structure.py
+# GENERADOR MASIVO DE ESTRUCTURA (TORRES/PISOS/SECTORES/MANZANAS/INMUEBLES)
+
+import logging
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+from typing import Dict
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Filas por INSERT en los bulk_create de la estructura
+STRUCTURE_BATCH_SIZE = 1000
+
+# Valores por defecto de los inmuebles generados
+M2_DEPARTAMENTO = Decimal('85.00')
+M2_TERRENO = Decimal('450.00')
+
+
+class StructureBuilder:
+    """
+    Planifica en memoria el árbol Torre → Piso → Inmueble (o Sector → Manzana → Inmueble)
+    de una o varias fases y lo escribe nivel por nivel con bulk_create, en orden de
+    dependencias. Un proyecto con cientos de inmuebles se crea con unas pocas consultas
+    por nivel en lugar de un INSERT por fila.
+
+    Sin llamar a `guardar()` sirve como plan en seco: `conteos()` devuelve lo que se crearía.
+    """
+
+    def __init__(self, batch_size: int = STRUCTURE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.torres = []
+        self.pisos = []
+        self.sectores = []
+        self.manzanas = []
+        self.inmuebles = []
+
+    # ------------------------------------------------------------
+    # PLANIFICACIÓN
+    # ------------------------------------------------------------
+
+    def planificar_departamentos(self, fase, torres_data, fase_comercializable=False):
+        """Agrega al plan las torres, pisos y departamentos de una fase"""
+        from .models import Inmueble, Piso, Torre
+
+        for torre_num, torre_info in torres_data.items():
+            if not isinstance(torre_info, dict):
+                logger.warning(f"Torre {torre_num} ignorada: los datos no son un diccionario")
+                continue
+
+            pisos_data = torre_info.get('pisos', {})
+            if not pisos_data:
+                # Usar datos básicos si no hay pisos específicos
+                pisos_inicio = torre_info.get('pisos_inicio', 1)
+                pisos_fin = torre_info.get('pisos_fin', 1)
+                deptos_piso = torre_info.get('deptos_piso', 2)
+                pisos_data = {piso: deptos_piso for piso in range(pisos_inicio, pisos_fin + 1)}
+
+            torre = Torre(
+                fase=fase,
+                nombre=torre_info.get('nombre', f"Torre {torre_num}"),
+                numero_torre=int(torre_num),
+                numero_pisos=len(pisos_data),
+                descripcion=f"Torre {torre_num} de la {fase.nombre}"
+            )
+            self.torres.append(torre)
+
+            for piso_num, departamentos_count in pisos_data.items():
+                piso = Piso(
+                    torre=torre,
+                    numero_piso=int(piso_num),
+                    nombre=f"Piso {piso_num}",
+                    descripcion=f"Piso {piso_num} de la Torre {torre_num}"
+                )
+                self.pisos.append(piso)
+
+                for depto_num in range(1, int(departamentos_count) + 1):
+                    codigo = f"T{int(torre_num):02d}P{int(piso_num):02d}D{depto_num:02d}"
+                    self.inmuebles.append(Inmueble(
+                        fase=fase,
+                        piso=piso,
+                        codigo=codigo,
+                        tipo='departamento',
+                        m2=M2_DEPARTAMENTO,
+                        estado='disponible',
+                        disponible=True,
+                        disponible_comercializacion=fase_comercializable,
+                        caracteristicas=f"Departamento {codigo} en Torre {torre_num}, Piso {piso_num}"
+                    ))
+
+    def planificar_terrenos(self, fase, sectores_data, fase_comercializable=False):
+        """Agrega al plan los sectores, manzanas y terrenos de una fase"""
+        from .models import Inmueble, Manzana, Sector
+
+        for sector_num, sector_info in sectores_data.items():
+            if not isinstance(sector_info, dict):
+                logger.warning(f"Sector {sector_num} ignorado: los datos no son un diccionario")
+                continue
+
+            # Determinar comercialización del sector
+            inmuebles_comercializables = fase_comercializable or sector_info.get('comercializable', False)
+
+            try:
+                manzanas_inicio = int(sector_info.get('manzanas_inicio', 1))
+                manzanas_fin = int(sector_info.get('manzanas_fin', 10))
+                terrenos_por_manzana = int(sector_info.get('terrenos_manzana', 8))
+                sector_num_int = int(sector_num)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Sector {sector_num} ignorado: error convirtiendo a entero: {e}")
+                continue
+
+            # Validar rangos lógicos
+            if manzanas_inicio > manzanas_fin:
+                logger.warning(
+                    f"Sector {sector_num} ignorado: manzana inicio ({manzanas_inicio}) "
+                    f"mayor que manzana fin ({manzanas_fin})"
+                )
+                continue
+            if terrenos_por_manzana <= 0:
+                logger.warning(f"Sector {sector_num} ignorado: terrenos por manzana debe ser mayor a 0")
+                continue
+
+            nombre_sector = sector_info.get('nombre', f"Sector {sector_num}")
+            sector = Sector(
+                fase=fase,
+                nombre=nombre_sector,
+                numero_sector=sector_num_int,
+                descripcion=f"{nombre_sector} de la {fase.nombre}"
+            )
+            self.sectores.append(sector)
+
+            for manzana_num in range(manzanas_inicio, manzanas_fin + 1):
+                manzana = Manzana(
+                    sector=sector,
+                    numero_manzana=manzana_num,
+                    nombre=f"Manzana {manzana_num}",
+                    descripcion=f"Manzana {manzana_num} del {sector.nombre}"
+                )
+                self.manzanas.append(manzana)
+
+                for terreno_num in range(1, terrenos_por_manzana + 1):
+                    codigo = f"S{sector_num_int:02d}M{manzana_num:02d}T{terreno_num:02d}"
+                    self.inmuebles.append(Inmueble(
+                        fase=fase,
+                        manzana=manzana,
+                        codigo=codigo,
+                        tipo='terreno',
+                        m2=M2_TERRENO,
+                        estado='disponible',
+                        disponible=True,
+                        disponible_comercializacion=inmuebles_comercializables,
+                        caracteristicas=f"Terreno {codigo} en {sector.nombre}, Manzana {manzana_num}"
+                    ))
+
+    def planificar_fase(self, tipo_proyecto, fase, fase_info):
+        """Planifica la estructura de una fase según el tipo de proyecto"""
+        fase_comercializable = fase_info.get('comercializable', False)
+        if tipo_proyecto == 'departamentos' and fase_info.get('torres'):
+            self.planificar_departamentos(fase, fase_info['torres'], fase_comercializable)
+        elif tipo_proyecto == 'terrenos' and fase_info.get('sectores'):
+            self.planificar_terrenos(fase, fase_info['sectores'], fase_comercializable)
+
+    def conteos(self) -> Dict[str, int]:
+        """Cantidad de objetos planificados por nivel"""
+        return {
+            'torres': len(self.torres),
+            'pisos': len(self.pisos),
+            'sectores': len(self.sectores),
+            'manzanas': len(self.manzanas),
+            'inmuebles': len(self.inmuebles),
+        }
+
+    # ------------------------------------------------------------
+    # ESCRITURA
+    # ------------------------------------------------------------
+
+    def guardar(self) -> Dict[str, int]:
+        """
+        Escribe el plan con un bulk_create por nivel (padres antes que hijos).
+        Las fases deben existir. El precio materializado se calcula antes del INSERT
+        y la caché de inventario de las fases afectadas se invalida (bulk_create no
+        dispara signals). Devuelve los conteos creados.
+        """
+        from .inventory_cache import invalidar_inventario
+        from .models import Inmueble, Manzana, Piso, Sector, Torre
+        from .pricing import PriceEngine
+
+        if self.inmuebles:
+            for inmueble in self.inmuebles:
+                if inmueble.fase_id is None:
+                    # Fase creada en la misma operación: tomar su pk recién asignado
+                    inmueble.fase = inmueble.fase
+            engine = PriceEngine(self.inmuebles)
+            for inmueble in self.inmuebles:
+                inmueble.precio_final = engine.precio(inmueble)
+                inmueble.precio_m2_final = engine.precio_por_m2(inmueble)
+
+        with transaction.atomic():
+            # bulk_create toma el pk recién asignado del padre al guardar cada nivel
+            Torre.objects.bulk_create(self.torres, batch_size=self.batch_size)
+            Piso.objects.bulk_create(self.pisos, batch_size=self.batch_size)
+            Sector.objects.bulk_create(self.sectores, batch_size=self.batch_size)
+            Manzana.objects.bulk_create(self.manzanas, batch_size=self.batch_size)
+            Inmueble.objects.bulk_create(self.inmuebles, batch_size=self.batch_size)
+
+        fases = {inmueble.fase_id: inmueble.fase.proyecto_id for inmueble in self.inmuebles}
+        for fase_id, proyecto_id in fases.items():
+            invalidar_inventario(proyecto_id=proyecto_id, fase_id=fase_id)
+
+        conteos = self.conteos()
+        logger.info(f"Estructura creada: {conteos}")
+        return conteos
+
+
+def planificar_estructura(form_data) -> StructureBuilder:
+    """
+    Plan en seco de la estructura dinámica del formulario de proyecto (sin tocar la BD).
+    Usa fases sin guardar, así que los conteos son exactamente los que se crearían.
+    """
+    from .models import Fase
+
+    fases_data = form_data.get('dynamic_structure_data', {}).get('fases', {})
+    builder = StructureBuilder()
+    for fase_num, fase_info in fases_data.items():
+        fase = Fase(nombre=fase_info.get('nombre', f"Fase {fase_num}"), numero_fase=fase_num)
+        builder.planificar_fase(form_data.get('tipo'), fase, fase_info)
+    return builder
+
+
+# ============================================================
+# DIFERENCIAS DE ESTRUCTURA (EDICIÓN DE PROYECTOS)
+# ============================================================
+
+# Inmuebles que nunca se eliminan al editar la estructura
+ESTADOS_PROTEGIDOS = ('vendido', 'reservado')
+
+# Niveles de ubicación de cada tipo de proyecto (grupo → unidad → inmueble)
+Jerarquia = namedtuple('Jerarquia', [
+    'modelo_grupo', 'modelo_unidad', 'grupos', 'unidades', 'grupo', 'unidad',
+    'numero_grupo', 'numero_unidad', 'campos_grupo',
+])
+
+
+def _jerarquia(tipo_proyecto) -> Jerarquia:
+    """Torre → Piso para departamentos, Sector → Manzana para terrenos"""
+    from .models import Manzana, Piso, Sector, Torre
+
+    if tipo_proyecto == 'departamentos':
+        return Jerarquia(
+            Torre, Piso, 'torres', 'pisos', 'torre', 'piso',
+            'numero_torre', 'numero_piso', ['nombre', 'numero_pisos'],
+        )
+    return Jerarquia(
+        Sector, Manzana, 'sectores', 'manzanas', 'sector', 'manzana',
+        'numero_sector', 'numero_manzana', ['nombre', 'descripcion'],
+    )
+
+
+class EstructuraExistente:
+    """Árbol actual de un proyecto cargado con una consulta por nivel"""
+
+    def __init__(self, proyecto):
+        from .models import Inmueble, Manzana, Piso, Sector, Torre
+
+        self.fases = {fase.numero_fase: fase for fase in proyecto.fases.all()}
+        fase_ids = [fase.pk for fase in self.fases.values()]
+
+        self.torres = {
+            (torre.fase_id, torre.numero_torre): torre
+            for torre in Torre.objects.filter(fase_id__in=fase_ids)
+        }
+        self.pisos = {
+            (piso.torre_id, piso.numero_piso): piso
+            for piso in Piso.objects.filter(torre__fase_id__in=fase_ids)
+        }
+        self.sectores = {
+            (sector.fase_id, sector.numero_sector): sector
+            for sector in Sector.objects.filter(fase_id__in=fase_ids)
+        }
+        self.manzanas = {
+            (manzana.sector_id, manzana.numero_manzana): manzana
+            for manzana in Manzana.objects.filter(sector__fase_id__in=fase_ids)
+        }
+        self.inmuebles = {}
+        self.inmuebles_por_fase = defaultdict(list)
+        for inmueble in Inmueble.objects.filter(fase_id__in=fase_ids).only(
+            'id', 'fase', 'piso', 'manzana', 'codigo', 'estado', 'disponible_comercializacion'
+        ):
+            self.inmuebles[(inmueble.fase_id, inmueble.codigo)] = inmueble
+            self.inmuebles_por_fase[inmueble.fase_id].append(inmueble)
+
+    def inmuebles_de_fase(self, fase_id):
+        return self.inmuebles_por_fase.get(fase_id, [])
+
+
+class StructureDiff:
+    """
+    Compara la estructura dinámica enviada en la edición con el árbol existente y
+    calcula los conjuntos mínimos de inserción, actualización y eliminación, que luego
+    se aplican en bloque. El costo de escritura depende del tamaño del cambio, no del
+    tamaño del proyecto.
+
+    Reglas:
+    - Las fases nuevas se crean con su estructura; las fases que no vienen en el envío
+      se eliminan solo si no tienen inmuebles vendidos ni reservados.
+    - Una fase enviada sin torres ni sectores conserva su estructura (solo comercialización).
+    - Los inmuebles vendidos o reservados nunca se eliminan, ni su piso/manzana o torre/sector.
+    - Los inmuebles existentes solo actualizan su comercialización: no se pisan ajustes manuales.
+    """
+
+    def __init__(self, proyecto, fases_data, batch_size: int = STRUCTURE_BATCH_SIZE):
+        self.proyecto = proyecto
+        self.batch_size = batch_size
+        self.jerarquia = _jerarquia(proyecto.tipo)
+        self.existente = EstructuraExistente(proyecto)
+        self.inserciones = StructureBuilder(batch_size)
+
+        self.fases_nuevas = []
+        self.fases_eliminar = []
+        self.grupos_actualizar = []
+        self.inmuebles_actualizar = []
+        self.inmuebles_eliminar = []
+        self.unidades_eliminar = []
+        self.grupos_eliminar = []
+        self.fases_afectadas = set()
+
+        self._calcular(fases_data)
+
+    # ------------------------------------------------------------
+    # CÁLCULO
+    # ------------------------------------------------------------
+
+    def _calcular(self, fases_data):
+        from .models import Fase
+
+        enviadas = set()
+        for fase_num, fase_info in fases_data.items():
+            numero = int(fase_num)
+            enviadas.add(numero)
+            fase = self.existente.fases.get(numero)
+
+            if fase is None:
+                fase = Fase(
+                    proyecto=self.proyecto,
+                    nombre=fase_info.get('nombre', f"Fase {fase_num}"),
+                    descripcion=f"Fase {fase_num} del proyecto {self.proyecto.nombre}",
+                    numero_fase=numero,
+                )
+                self.fases_nuevas.append(fase)
+                self.inserciones.planificar_fase(self.proyecto.tipo, fase, fase_info)
+                continue
+
+            comercializable = fase_info.get('comercializable', False)
+            if fase_info.get('torres') or fase_info.get('sectores'):
+                plan = StructureBuilder()
+                plan.planificar_fase(self.proyecto.tipo, fase, fase_info)
+                self._comparar_fase(fase, plan)
+            else:
+                self._comparar_comercializacion(fase, comercializable)
+
+        for numero, fase in self.existente.fases.items():
+            if numero in enviadas:
+                continue
+            protegidos = any(
+                inmueble.estado in ESTADOS_PROTEGIDOS for inmueble in self.existente.inmuebles_de_fase(fase.pk)
+            )
+            if not protegidos:
+                self.fases_eliminar.append(fase)
+
+    def _comparar_comercializacion(self, fase, comercializable):
+        """Solo comercialización: actualiza los inmuebles cuyo estado difiere"""
+        for inmueble in self.existente.inmuebles_de_fase(fase.pk):
+            if inmueble.disponible_comercializacion != comercializable:
+                inmueble.disponible_comercializacion = comercializable
+                self.inmuebles_actualizar.append(inmueble)
+                self.fases_afectadas.add(fase.pk)
+
+    def _comparar_fase(self, fase, plan):
+        """Compara el plan de una fase existente con su árbol actual"""
+        j = self.jerarquia
+        grupos_existentes = getattr(self.existente, j.grupos)
+        unidades_existentes = getattr(self.existente, j.unidades)
+
+        # Destino de cada objeto planificado: el existente equivalente o el nuevo (por id() del plan)
+        destino = {}
+
+        # 1. Torres / sectores
+        grupos_planificados = set()
+        for grupo in getattr(plan, j.grupos):
+            numero = getattr(grupo, j.numero_grupo)
+            grupos_planificados.add(numero)
+            actual = grupos_existentes.get((fase.pk, numero))
+            if actual is None:
+                getattr(self.inserciones, j.grupos).append(grupo)
+                destino[id(grupo)] = grupo
+                continue
+            cambios = [campo for campo in j.campos_grupo if getattr(actual, campo) != getattr(grupo, campo)]
+            for campo in cambios:
+                setattr(actual, campo, getattr(grupo, campo))
+            if cambios:
+                self.grupos_actualizar.append(actual)
+            destino[id(grupo)] = actual
+
+        # 2. Pisos / manzanas
+        unidades_planificadas = set()
+        for unidad in getattr(plan, j.unidades):
+            grupo = destino[id(getattr(unidad, j.grupo))]
+            actual = unidades_existentes.get((grupo.pk, getattr(unidad, j.numero_unidad))) if grupo.pk else None
+            if actual is None:
+                setattr(unidad, j.grupo, grupo)
+                getattr(self.inserciones, j.unidades).append(unidad)
+                destino[id(unidad)] = unidad
+                continue
+            unidades_planificadas.add(actual.pk)
+            destino[id(unidad)] = actual
+
+        # 3. Inmuebles
+        codigos_planificados = set()
+        for inmueble in plan.inmuebles:
+            codigos_planificados.add(inmueble.codigo)
+            actual = self.existente.inmuebles.get((fase.pk, inmueble.codigo))
+            if actual is None:
+                setattr(inmueble, j.unidad, destino[id(getattr(inmueble, j.unidad))])
+                self.inserciones.inmuebles.append(inmueble)
+            elif actual.disponible_comercializacion != inmueble.disponible_comercializacion:
+                actual.disponible_comercializacion = inmueble.disponible_comercializacion
+                self.inmuebles_actualizar.append(actual)
+                self.fases_afectadas.add(fase.pk)
+
+        # 4. Eliminaciones: solo inmuebles de la estructura que ya no están en el plan
+        unidades_ocupadas = set()
+        for inmueble in self.existente.inmuebles_de_fase(fase.pk):
+            unidad_id = getattr(inmueble, f'{j.unidad}_id')
+            if unidad_id is None or inmueble.codigo in codigos_planificados:
+                continue
+            if inmueble.estado in ESTADOS_PROTEGIDOS:
+                unidades_ocupadas.add(unidad_id)
+            else:
+                self.inmuebles_eliminar.append(inmueble)
+                self.fases_afectadas.add(fase.pk)
+
+        grupos_con_unidades = set()
+        grupos_fase = {
+            grupo.pk: numero for (fase_id, numero), grupo in grupos_existentes.items() if fase_id == fase.pk
+        }
+        for (grupo_id, _), unidad in unidades_existentes.items():
+            if grupo_id not in grupos_fase:
+                continue
+            if unidad.pk in unidades_planificadas or unidad.pk in unidades_ocupadas:
+                grupos_con_unidades.add(grupo_id)
+            else:
+                self.unidades_eliminar.append(unidad)
+                self.fases_afectadas.add(fase.pk)
+
+        for grupo_id, numero in grupos_fase.items():
+            if numero not in grupos_planificados and grupo_id not in grupos_con_unidades:
+                self.grupos_eliminar.append(grupos_existentes[(fase.pk, numero)])
+
+    # ------------------------------------------------------------
+    # APLICACIÓN
+    # ------------------------------------------------------------
+
+    def conteos(self) -> Dict[str, int]:
+        """Tamaño de cada conjunto de cambios"""
+        insertados = self.inserciones.conteos()
+        return {
+            'fases_creadas': len(self.fases_nuevas),
+            'fases_eliminadas': len(self.fases_eliminar),
+            'inmuebles_creados': insertados['inmuebles'],
+            'inmuebles_actualizados': len(self.inmuebles_actualizar),
+            'inmuebles_eliminados': len(self.inmuebles_eliminar),
+            'ubicaciones_creadas': sum(insertados.values()) - insertados['inmuebles'],
+            'ubicaciones_actualizadas': len(self.grupos_actualizar),
+            'ubicaciones_eliminadas': len(self.unidades_eliminar) + len(self.grupos_eliminar),
+        }
+
+    def aplicar(self) -> Dict[str, int]:
+        """Aplica los cambios en bloque (hijos antes que padres al eliminar) y devuelve los conteos"""
+        from .inventory_cache import invalidar_inventario
+        from .models import Fase, Inmueble
+
+        j = self.jerarquia
+
+        with transaction.atomic():
+            for fase in self.fases_eliminar:
+                fase.delete()
+
+            if self.inmuebles_eliminar:
+                Inmueble.objects.filter(pk__in=[inmueble.pk for inmueble in self.inmuebles_eliminar]).delete()
+            if self.unidades_eliminar:
+                j.modelo_unidad.objects.filter(pk__in=[unidad.pk for unidad in self.unidades_eliminar]).delete()
+            if self.grupos_eliminar:
+                j.modelo_grupo.objects.filter(pk__in=[grupo.pk for grupo in self.grupos_eliminar]).delete()
+
+            j.modelo_grupo.objects.bulk_update(self.grupos_actualizar, j.campos_grupo, batch_size=self.batch_size)
+            Inmueble.objects.bulk_update(
+                self.inmuebles_actualizar, ['disponible_comercializacion'], batch_size=self.batch_size
+            )
+
+            # Las fases nuevas se insertan antes que su estructura
+            Fase.objects.bulk_create(self.fases_nuevas)
+            self.inserciones.guardar()
+
+        # bulk_update / bulk_create no disparan signals
+        if self.fases_nuevas or self.fases_afectadas:
+            for fase_id in self.fases_afectadas:
+                invalidar_inventario(proyecto_id=self.proyecto.pk, fase_id=fase_id)
+            invalidar_inventario(proyecto_id=self.proyecto.pk)
+
+        conteos = self.conteos()
+        logger.info(f"Estructura del proyecto {self.proyecto.pk} actualizada: {conteos}")
+        return conteos
@@ -1,3 +1,106 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.accounts.models import User
+
+from .inventory_cache import obtener_dashboard
+from .models import Fase, GerenteProyecto, Inmueble, Ponderador, Proyecto
+from .structure import StructureBuilder, StructureDiff
+from .views import _build_existing_structure_data
+
+
+class EdicionEstructuraTests(TestCase):
+    """Reenviar el formulario de edición sin cambios no debe modificar la estructura"""
+
+    def setUp(self):
+        usuario = User.objects.create(username='gerente')
+        gerente = GerenteProyecto.objects.create(usuario=usuario)
+        self.proyecto = Proyecto.objects.create(
+            nombre='Proyecto', descripcion='Proyecto de prueba', gerente_proyecto=gerente, tipo='departamentos'
+        )
+        fase = Fase.objects.create(
+            proyecto=self.proyecto, nombre='Fase 1', numero_fase=1, precio_m2=Decimal('1000.00')
+        )
+        builder = StructureBuilder()
+        builder.planificar_departamentos(fase, {1: {'nombre': 'Torre 1', 'pisos': {1: 4, 2: 4}}})
+        builder.guardar()
+
+    def conteos_reenvio(self):
+        fases_data = _build_existing_structure_data(self.proyecto)['fases']
+        return StructureDiff(self.proyecto, fases_data).conteos()
+
+    def test_reenvio_sin_cambios(self):
+        self.assertFalse(any(self.conteos_reenvio().values()))
+
+    def test_reenvio_tras_baja_de_inmueble(self):
+        # Baja lógica como en inmueble_delete
+        Inmueble.objects.filter(codigo='T01P02D02').update(disponible=False)
+
+        self.assertFalse(any(self.conteos_reenvio().values()))
+        self.assertEqual(Inmueble.objects.filter(fase__proyecto=self.proyecto).count(), 8)
+        self.assertTrue(Inmueble.objects.filter(codigo='T01P02D04').exists())
+
+    def test_fase_omitida_con_reservas_no_se_elimina(self):
+        Inmueble.objects.filter(codigo='T01P01D01').update(estado='reservado')
+
+        self.assertEqual(StructureDiff(self.proyecto, {}).conteos()['fases_eliminadas'], 0)
+
+
+class PonderadorProgramadoTests(TestCase):
+    """La lista filtra y ordena por precio_final: el cron debe seguir a los ponderadores con fechas"""
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create(username='vendedor')
+        gerente = GerenteProyecto.objects.create(usuario=User.objects.create(username='gerente'))
+        proyecto = Proyecto.objects.create(
+            nombre='Proyecto', descripcion='Proyecto de prueba', gerente_proyecto=gerente, tipo='departamentos'
+        )
+        fase = Fase.objects.create(
+            proyecto=proyecto, nombre='Fase 1', numero_fase=1, precio_m2=Decimal('1000.00')
+        )
+        self.barato = Inmueble.objects.create(fase=fase, codigo='A', tipo='departamento', m2=Decimal('100'))
+        self.caro = Inmueble.objects.create(fase=fase, codigo='B', tipo='departamento', m2=Decimal('110'))
+
+        self.inicio = timezone.now() + timedelta(days=1)
+        ponderador = Ponderador.objects.create(
+            proyecto=proyecto, nombre='Valorización', nivel_aplicacion='inmueble',
+            porcentaje=Decimal('20.00'), fecha_activacion=self.inicio,
+            fecha_desactivacion=self.inicio + timedelta(days=1),
+        )
+        ponderador.inmuebles.add(self.barato)
+        self.client.force_login(self.usuario)
+
+    def codigos(self, now):
+        """Corre el cron de ponderadores programados en `now` y lee la lista"""
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            call_command('recalcular_precios', '--programados', stdout=StringIO())
+            response = self.client.get(
+                reverse('projects:inmuebles_list'),
+                {'order_by': 'precio_calculado', 'precio_min': '105000'},
+            )
+        return [inmueble.codigo for inmueble in response.context['page_obj']]
+
+    def test_filtro_y_orden_siguen_las_fechas_de_vigencia(self):
+        # Antes de la activación: A = 100.000 queda fuera del filtro
+        self.assertEqual(self.codigos(timezone.now()), ['B'])
+
+        # Vigente: A = 120.000 pasa el filtro y queda después de B
+        obtener_dashboard(lambda: 'antes')
+        self.assertEqual(self.codigos(self.inicio + timedelta(hours=1)), ['B', 'A'])
+        self.barato.refresh_from_db()
+        self.assertEqual(self.barato.precio_final, Decimal('120000.00'))
+        self.assertEqual(obtener_dashboard(lambda: 'despues'), 'despues')
 
-# Create your tests here.
+        # Vencido: A vuelve a 100.000
+        self.assertEqual(self.codigos(self.inicio + timedelta(days=2)), ['B'])
+        self.barato.refresh_from_db()
+        self.assertEqual(self.barato.precio_final, Decimal('100000.00'))
@@ -4,115 +4,96 @@ from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db.models import Q, Count, F
 from django.contrib.auth import get_user_model
 import json
+import logging
 from .models import (
     Proyecto, Fase, Torre, Piso, Sector, Manzana, Inmueble,
     GerenteProyecto, JefeProyecto, Ponderador
 )
+from .pricing import aplicar_precios, recalculo_diferido
+from .stats import inventario_stats, inventario_por_proyecto, ponderadores_stats, proyectos_resumen
+from .inventory_cache import obtener_dashboard, precargar_fases, precargar_proyectos
+from .structure import StructureBuilder, StructureDiff, planificar_estructura
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
 @login_required
 def projects_dashboard(request):
     """Dashboard de proyectos con información completa y estadísticas útiles"""
-    from django.db.models import Avg, Sum, Case, When, Value, IntegerField
-    from decimal import Decimal
-    
-    # Estadísticas principales
-    proyectos_activos = Proyecto.objects.filter(activo=True)
-    inmuebles_totales = Inmueble.objects.filter(disponible=True, fase__activo=True, fase__proyecto__activo=True)
-    
-    stats = {
-        'total_proyectos': proyectos_activos.count(),
-        'total_inmuebles': inmuebles_totales.count(),
-        'proyectos_departamentos': proyectos_activos.filter(tipo='departamentos').count(),
-        'proyectos_terrenos': proyectos_activos.filter(tipo='terrenos').count(),
+    def calcular_dashboard():
+        # Estadísticas principales
+        proyectos_activos = Proyecto.objects.filter(activo=True)
+        inmuebles_totales = Inmueble.objects.filter(disponible=True, fase__activo=True, fase__proyecto__activo=True)
         
-        # Estadísticas de comercialización
-        'inmuebles_disponibles': inmuebles_totales.filter(estado='disponible').count(),
-        'inmuebles_reservados': inmuebles_totales.filter(estado='reservado').count(),
-        'inmuebles_vendidos': inmuebles_totales.filter(estado='vendido').count(),
-        'inmuebles_comercializables': inmuebles_totales.filter(disponible_comercializacion=True).count(),
+        # Una consulta por alcance: proyectos, inventario (con desglose por tipo) y ponderadores
+        inventario = inventario_stats(inmuebles_totales, por_tipo=True)
+        stats = {
+            **proyectos_resumen(proyectos_activos),
+            'total_inmuebles': inventario['total_inmuebles'],
         
-        # Estadísticas de área y precios
-        'area_total_m2': inmuebles_totales.aggregate(total=Sum('m2'))['total'] or 0,
-        'area_promedio_m2': inmuebles_totales.aggregate(avg=Avg('m2'))['avg'] or 0,
+            # Estadísticas de comercialización
+            'inmuebles_disponibles': inventario['disponibles'],
+            'inmuebles_reservados': inventario['reservados'],
+            'inmuebles_vendidos': inventario['vendidos'],
+            'inmuebles_comercializables': inventario['comercializables'],
         
-        # Ponderadores activos
-        'total_ponderadores': Ponderador.objects.filter(activo=True).count(),
-        'ponderadores_proyecto': Ponderador.objects.filter(activo=True, nivel_aplicacion='proyecto').count(),
-        'ponderadores_fase': Ponderador.objects.filter(activo=True, nivel_aplicacion='fase').count(),
-        'ponderadores_inmueble': Ponderador.objects.filter(activo=True, nivel_aplicacion='inmueble').count(),
-    }
-    
-    # Calcular porcentajes
-    if stats['total_inmuebles'] > 0:
-        stats['porcentaje_vendidos'] = round((stats['inmuebles_vendidos'] / stats['total_inmuebles']) * 100, 1)
-        stats['porcentaje_disponibles'] = round((stats['inmuebles_disponibles'] / stats['total_inmuebles']) * 100, 1)
-        stats['porcentaje_comercializables'] = round((stats['inmuebles_comercializables'] / stats['total_inmuebles']) * 100, 1)
-    else:
-        stats['porcentaje_vendidos'] = 0
-        stats['porcentaje_disponibles'] = 0
-        stats['porcentaje_comercializables'] = 0
-    
-    # Estadísticas por proyecto con rendimiento
-    proyectos_stats = []
-    for proyecto in proyectos_activos.select_related().prefetch_related('fases')[:8]:
-        inmuebles_proyecto = proyecto.fases.filter(activo=True).aggregate(
-            total=Count('inmuebles', filter=Q(inmuebles__disponible=True)),
-            vendidos=Count('inmuebles', filter=Q(inmuebles__estado='vendido', inmuebles__disponible=True)),
-            disponibles=Count('inmuebles', filter=Q(inmuebles__estado='disponible', inmuebles__disponible=True)),
-            comercializables=Count('inmuebles', filter=Q(inmuebles__disponible_comercializacion=True, inmuebles__disponible=True))
-        )
+            # Estadísticas de área y precios
+            'area_total_m2': inventario['area_total_m2'],
+            'area_promedio_m2': inventario['area_promedio_m2'],
         
-        total_inmuebles = inmuebles_proyecto['total'] or 0
-        vendidos = inmuebles_proyecto['vendidos'] or 0
+            # Porcentajes
+            'porcentaje_vendidos': inventario['porcentaje_vendidos'],
+            'porcentaje_disponibles': inventario['porcentaje_disponibles'],
+            'porcentaje_comercializables': inventario['porcentaje_comercializables'],
         
-        proyectos_stats.append({
-            'proyecto': proyecto,
-            'total_inmuebles': total_inmuebles,
-            'inmuebles_vendidos': vendidos,
-            'inmuebles_disponibles': inmuebles_proyecto['disponibles'] or 0,
-            'inmuebles_comercializables': inmuebles_proyecto['comercializables'] or 0,
-            'porcentaje_vendido': round((vendidos / total_inmuebles) * 100, 1) if total_inmuebles > 0 else 0,
-            'total_fases': proyecto.fases.filter(activo=True).count(),
-        })
-    
-    # Proyectos recientes (últimos 5)
-    proyectos_recientes = proyectos_activos.order_by('-created_at')[:5]
-    
-    # Actividad reciente - inmuebles vendidos recientemente
-    inmuebles_vendidos_recientes = Inmueble.objects.filter(
-        estado='vendido',
-        disponible=True,
-        fase__activo=True,
-        fase__proyecto__activo=True
-    ).select_related('fase', 'fase__proyecto').order_by('-updated_at')[:10]
-    
-    # Estadísticas de tipos de inmuebles
-    tipos_stats = inmuebles_totales.values('tipo').annotate(
-        total=Count('id'),
-        vendidos=Count(Case(When(estado='vendido', then=1), output_field=IntegerField())),
-        disponibles=Count(Case(When(estado='disponible', then=1), output_field=IntegerField())),
-        comercializables=Count(Case(When(disponible_comercializacion=True, then=1), output_field=IntegerField()))
-    ).order_by('tipo')
-    
-    # Rendimiento por fase (top 10 fases con más ventas)
-    fases_top_ventas = Fase.objects.filter(activo=True, proyecto__activo=True).annotate(
-        total_inmuebles=Count('inmuebles', filter=Q(inmuebles__disponible=True)),
-        vendidos=Count('inmuebles', filter=Q(inmuebles__estado='vendido', inmuebles__disponible=True))
-    ).filter(vendidos__gt=0).order_by('-vendidos')[:10]
-    
+            # Ponderadores activos
+            **ponderadores_stats(),
+        }
+        
+        # Estadísticas por proyecto con rendimiento (una sola consulta agrupada)
+        proyectos_stats = inventario_por_proyecto(proyectos_activos, limite=8)
+        
+        # Proyectos recientes (últimos 5)
+        proyectos_recientes = precargar_proyectos(proyectos_activos.order_by('-created_at')[:5])
+        
+        # Actividad reciente - inmuebles vendidos recientemente
+        inmuebles_vendidos_recientes = Inmueble.objects.filter(
+            estado='vendido',
+            disponible=True,
+            fase__activo=True,
+            fase__proyecto__activo=True
+        ).select_related('fase', 'fase__proyecto').order_by('-updated_at')[:10]
+        inmuebles_vendidos_recientes = aplicar_precios(inmuebles_vendidos_recientes)
+        
+        # Estadísticas de tipos de inmuebles
+        tipos_stats = inventario['por_tipo']
+        
+        # Rendimiento por fase (top 10 fases con más ventas)
+        fases_top_ventas = Fase.objects.filter(activo=True, proyecto__activo=True).annotate(
+            # No se puede anotar como total_inmuebles: choca con la @property de Fase
+            inmuebles_activos=Count('inmuebles', filter=Q(inmuebles__disponible=True)),
+            vendidos=Count('inmuebles', filter=Q(inmuebles__estado='vendido', inmuebles__disponible=True))
+        ).filter(vendidos__gt=0).order_by('-vendidos')[:10]
+
+        return {
+            'stats': stats,
+            'proyectos_stats': proyectos_stats,
+            'proyectos_recientes': proyectos_recientes,
+            'inmuebles_vendidos_recientes': inmuebles_vendidos_recientes,
+            'tipos_stats': tipos_stats,
+            'fases_top_ventas': list(fases_top_ventas),
+        }
+        
+    # Se recalcula solo cuando cambia el inventario (ver inventory_cache / signals)
+    dashboard = obtener_dashboard(calcular_dashboard)
+
     context = {
         'title': 'Dashboard de Proyectos Inmobiliarios',
-        'stats': stats,
-        'proyectos_stats': proyectos_stats,
-        'proyectos_recientes': proyectos_recientes,
-        'inmuebles_vendidos_recientes': inmuebles_vendidos_recientes,
-        'tipos_stats': tipos_stats,
-        'fases_top_ventas': fases_top_ventas,
+        **dashboard,
         'show_activity': True,  # Flag para mostrar sección de actividad reciente
         'show_performance': True,  # Flag para mostrar métricas de rendimiento
     }
@@ -142,6 +123,8 @@ def proyectos_list(request):
     paginator = Paginator(proyectos, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    # Inventario de todos los proyectos de la página desde la caché (una lectura)
+    page_obj.object_list = precargar_proyectos(page_obj.object_list)
     
     # Obtener tipos de proyecto de forma segura
     tipos_proyecto = getattr(Proyecto, 'TIPOS_PROYECTO', [
@@ -167,7 +150,7 @@ def proyectos_create(request):
         form = ProyectoForm(request.POST)
         if form.is_valid():
             try:
-                with transaction.atomic():
+                with transaction.atomic(), recalculo_diferido():
                     # Crear el proyecto
                     proyecto = form.save()
                     
@@ -208,14 +191,14 @@ def proyectos_create(request):
 def proyectos_detail(request, pk):
     """Detalle de proyecto"""
     proyecto = get_object_or_404(Proyecto, pk=pk, activo=True)
-    fases = proyecto.fases.filter(activo=True).order_by('numero_fase')
+    fases = precargar_fases(proyecto.fases.filter(activo=True).order_by('numero_fase'))
     
     # Ponderadores del proyecto
     ponderadores_proyecto = proyecto.ponderadores.filter(activo=True, nivel_aplicacion='proyecto').order_by('nombre')
     
     # Estadísticas del proyecto
     stats = {
-        'total_fases': fases.count(),
+        'total_fases': len(fases),
         'total_inmuebles': proyecto.total_inmuebles,
         'inmuebles_disponibles': proyecto.inmuebles_disponibles,
         'inmuebles_vendidos': proyecto.inmuebles_vendidos,
@@ -234,7 +217,7 @@ def proyectos_detail(request, pk):
         fase_info = {
             'fase': fase,
             'ponderadores': fase.ponderadores.filter(activo=True).order_by('nombre'),
-            'inmuebles_sample': fase.inmuebles.filter(disponible=True)[:5],  # Muestra de inmuebles
+            'inmuebles_sample': list(fase.inmuebles.filter(disponible=True)[:5]),  # Muestra de inmuebles
         }
         
         if proyecto.tipo == 'departamentos':
@@ -244,6 +227,11 @@ def proyectos_detail(request, pk):
         
         fases_data.append(fase_info)
     
+    # Precios de todas las muestras en una sola pasada
+    aplicar_precios(
+        inmueble for fase_info in fases_data for inmueble in fase_info['inmuebles_sample']
+    )
+    
     return render(request, 'real_estate_projects/proyectos/detail.html', {
         'title': f'Proyecto: {proyecto.nombre}',
         'proyecto': proyecto,
@@ -271,7 +259,7 @@ def proyectos_edit(request, pk):
         if form.is_valid():
             print(f"*** FORMULARIO VÁLIDO ***", file=sys.stderr)
             try:
-                with transaction.atomic():
+                with transaction.atomic(), recalculo_diferido():
                     # Guardar el proyecto editado
                     proyecto = form.save()
                     print(f"*** PROYECTO GUARDADO: {proyecto.nombre} ***", file=sys.stderr)
@@ -279,6 +267,12 @@ def proyectos_edit(request, pk):
                     # Si hay datos de estructura dinámica, procesar cambios en la estructura
                     dynamic_structure_data = form.cleaned_data.get('dynamic_structure_data', {})
                     
+                    # Estructura y comercialización primero (aplicando solo las diferencias),
+                    # así los ponderadores de fase pueden referirse a fases recién creadas
+                    if dynamic_structure_data.get('fases'):
+                        print(f"*** EJECUTANDO update_project_structure ***", file=sys.stderr)
+                        update_project_structure(proyecto, form.cleaned_data, request.user.id)
+                    
                     # Procesar ponderadores (nuevos y existentes) independientemente de las fases
                     ponderadores_nuevos = dynamic_structure_data.get('ponderadores', [])
                     ponderadores_existentes = dynamic_structure_data.get('existing_ponderadores', [])
@@ -295,19 +289,7 @@ def proyectos_edit(request, pk):
                         print(f"*** NO HAY PONDERADORES PARA PROCESAR ***", file=sys.stderr)
                         print(f"*** dynamic_structure_data keys: {list(dynamic_structure_data.keys())} ***", file=sys.stderr)
                     
-                    # Procesar comercialización independientemente de las fases
-                    fases_data = dynamic_structure_data.get('fases', {})
-                    if fases_data:
-                        print(f"*** PROCESANDO COMERCIALIZACIÓN ***", file=sys.stderr)
-                        process_comercializacion_only(proyecto, dynamic_structure_data)
-                    else:
-                        print(f"*** NO HAY DATOS DE COMERCIALIZACIÓN ***", file=sys.stderr)
-                    
                     if dynamic_structure_data.get('fases'):
-                        # Actualizar estructura del proyecto si se proporcionó
-                        print(f"*** EJECUTANDO update_project_structure ***", file=sys.stderr)
-                        update_project_structure(proyecto, form.cleaned_data, request.user.id)
-                        
                         total_inmuebles = count_total_properties(form.cleaned_data)
                         num_fases = len(dynamic_structure_data.get('fases', {}))
                         messages.success(request, f'Proyecto "{proyecto.nombre}" actualizado exitosamente con {num_fases} fase{"s" if num_fases != 1 else ""} y {total_inmuebles} inmuebles.')
@@ -410,6 +392,8 @@ def inmuebles_list(request):
     estado = request.GET.get('estado')
     tipo = request.GET.get('tipo')
     comercializable = request.GET.get('comercializable')
+    precio_min = request.GET.get('precio_min', '')
+    precio_max = request.GET.get('precio_max', '')
     search = request.GET.get('search', '')
     
     # Filtro por proyecto
@@ -434,6 +418,16 @@ def inmuebles_list(request):
     elif comercializable == 'false':
         inmuebles = inmuebles.filter(disponible_comercializacion=False)
     
+    # Filtro por rango de precio final (columna materializada e indexada)
+    from decimal import Decimal, InvalidOperation
+    try:
+        if precio_min:
+            inmuebles = inmuebles.filter(precio_final__gte=Decimal(precio_min))
+        if precio_max:
+            inmuebles = inmuebles.filter(precio_final__lte=Decimal(precio_max))
+    except InvalidOperation:
+        messages.warning(request, 'El rango de precio ingresado no es válido.')
+    
     # Búsqueda por texto
     if search:
         inmuebles = inmuebles.filter(
@@ -447,14 +441,10 @@ def inmuebles_list(request):
     order_by = request.GET.get('order_by', 'fase__proyecto__nombre')
     if order_by in ['codigo', 'estado', 'tipo', 'precio_calculado', 'area_total', 'fase__proyecto__nombre']:
         if order_by == 'precio_calculado':
-            # Para precio calculado, ordenar por precio_manual primero, luego por cálculo
-            inmuebles = inmuebles.extra(
-                select={'precio_orden': 'COALESCE(precio_manual, (m2 * precio_m2 * factor_precio))'}
-            ).order_by('precio_orden')
+            # Precio final materializado (incluye todos los ponderadores vigentes)
+            inmuebles = inmuebles.order_by(F('precio_final').asc(nulls_last=True), 'pk')
         elif order_by == 'area_total':
-            inmuebles = inmuebles.extra(
-                select={'area_orden': 'm2'}
-            ).order_by('area_orden')
+            inmuebles = inmuebles.order_by('m2', 'pk')
         else:
             inmuebles = inmuebles.order_by(order_by)
     
@@ -463,20 +453,17 @@ def inmuebles_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
+    # Precios de la página en un número constante de consultas
+    page_obj.object_list = aplicar_precios(page_obj.object_list)
+    
     # Datos para filtros
     proyectos = Proyecto.objects.filter(activo=True).order_by('nombre')
     fases = Fase.objects.filter(activo=True).select_related('proyecto').order_by('proyecto__nombre', 'numero_fase')
     estados = Inmueble.ESTADOS_INMUEBLE
     tipos = Inmueble.TIPOS_INMUEBLE
     
-    # Estadísticas
-    stats = {
-        'total_inmuebles': inmuebles.count(),
-        'disponibles': inmuebles.filter(estado='disponible').count(),
-        'reservados': inmuebles.filter(estado='reservado').count(),
-        'vendidos': inmuebles.filter(estado='vendido').count(),
-        'comercializables': inmuebles.filter(disponible_comercializacion=True).count(),
-    }
+    # Estadísticas (una sola consulta de agregación condicional)
+    stats = inventario_stats(inmuebles)
     
     return render(request, 'real_estate_projects/inmuebles/list.html', {
         'title': 'Gestión de Inmuebles',
@@ -492,6 +479,8 @@ def inmuebles_list(request):
             'estado': estado,
             'tipo': tipo,
             'comercializable': comercializable,
+            'precio_min': precio_min,
+            'precio_max': precio_max,
             'search': search,
             'order_by': order_by,
         },
@@ -839,13 +828,12 @@ def create_project_structure(proyecto, form_data):
                     print(f"ERROR ACTUALIZANDO PONDERADOR EXISTENTE: {e}", file=sys.stderr)
     
     # 2. CREAR FASES CON CONFIGURACIÓN DE COMERCIALIZACIÓN
+    # La estructura de todas las fases se planifica en memoria y se escribe al final por niveles
+    builder = StructureBuilder()
     for fase_num, fase_info in fases_data.items():
         print(f"=== CREANDO FASE {fase_num} ===", file=sys.stderr)
         print(f"FASE_INFO: {fase_info}", file=sys.stderr)
         
-        # Determinar si la fase es comercializable por defecto
-        fase_comercializable = fase_info.get('comercializable', False)
-        
         # Crear la fase
         fase = Fase.objects.create(
             proyecto=proyecto,
@@ -857,44 +845,42 @@ def create_project_structure(proyecto, form_data):
         print(f"FASE CREADA: {fase.nombre} (ID: {fase.id})", file=sys.stderr)
         
         # Procesar ponderadores específicos de la fase
-        fase_ponderadores = fase_info.get('ponderadores', [])
-        if fase_ponderadores:
-            print(f"  PROCESANDO PONDERADORES DE FASE: {fase_ponderadores}", file=sys.stderr)
-            for pond_data in fase_ponderadores:
-                if isinstance(pond_data, dict) and pond_data.get('nombre'):
-                    try:
-                        ponderador = Ponderador.objects.create(
-                            proyecto=proyecto,
-                            fase=fase,
-                            nombre=pond_data.get('nombre'),
-                            tipo=pond_data.get('tipo', 'valorizacion'),
-                            nivel_aplicacion='fase',
-                            porcentaje=pond_data.get('porcentaje', 0),
-                            monto_fijo=pond_data.get('monto_fijo', None),
-                            descripcion=pond_data.get('descripcion', ''),
-                            activo=True,
-                            created_by_id=form_data.get('user_id'),
-                            activated_by_id=form_data.get('user_id'),
-                        )
-                        print(f"  PONDERADOR FASE CREADO: {ponderador.nombre}", file=sys.stderr)
-                    except Exception as e:
-                        print(f"  ERROR CREANDO PONDERADOR FASE: {e}", file=sys.stderr)
+        _create_fase_ponderadores(proyecto, fase, fase_info.get('ponderadores', []), form_data.get('user_id'))
         
-        # Crear torres si es proyecto de departamentos
-        if proyecto.tipo == 'departamentos' and fase_info.get('torres'):
-            torres = fase_info['torres']
-            print(f"  TORRES DATA: {torres}", file=sys.stderr)
-            print(f"  CREANDO {len(torres)} TORRES", file=sys.stderr)
-            create_dynamic_apartments_structure(fase, torres, fase_comercializable)
-        
-        # Crear sectores si es proyecto de terrenos  
-        elif proyecto.tipo == 'terrenos' and fase_info.get('sectores'):
-            sectores = fase_info['sectores']
-            print(f"  SECTORES DATA: {sectores}", file=sys.stderr)
-            print(f"  CREANDO {len(sectores)} SECTORES", file=sys.stderr)
-            create_dynamic_land_structure(fase, sectores, fase_comercializable)
+        # Planificar torres (departamentos) o sectores (terrenos) de la fase
+        builder.planificar_fase(proyecto.tipo, fase, fase_info)
     
-    print(f"=== ESTRUCTURA COMPLETADA ===", file=sys.stderr)
+    conteos = builder.guardar()
+    print(f"=== ESTRUCTURA COMPLETADA: {conteos} ===", file=sys.stderr)
+    return conteos
+
+
+def _create_fase_ponderadores(proyecto, fase, ponderadores_data, user_id):
+    """Crea los ponderadores específicos de una fase recién creada"""
+    import sys
+    
+    if not ponderadores_data:
+        return
+    print(f"  PROCESANDO PONDERADORES DE FASE: {ponderadores_data}", file=sys.stderr)
+    for pond_data in ponderadores_data:
+        if isinstance(pond_data, dict) and pond_data.get('nombre'):
+            try:
+                ponderador = Ponderador.objects.create(
+                    proyecto=proyecto,
+                    fase=fase,
+                    nombre=pond_data.get('nombre'),
+                    tipo=pond_data.get('tipo', 'valorizacion'),
+                    nivel_aplicacion='fase',
+                    porcentaje=pond_data.get('porcentaje', 0),
+                    monto_fijo=pond_data.get('monto_fijo', None),
+                    descripcion=pond_data.get('descripcion', ''),
+                    activo=True,
+                    created_by_id=user_id,
+                    activated_by_id=user_id,
+                )
+                print(f"  PONDERADOR FASE CREADO: {ponderador.nombre}", file=sys.stderr)
+            except Exception as e:
+                print(f"  ERROR CREANDO PONDERADOR FASE: {e}", file=sys.stderr)
 
 
 def process_ponderadores_only(proyecto, dynamic_structure_data, user_id):
@@ -925,10 +911,6 @@ def process_ponderadores_only(proyecto, dynamic_structure_data, user_id):
                         activated_by_id=user_id,
                     )
                     print(f"*** NUEVO PONDERADOR CREADO EN DB: {ponderador.nombre} (ID: {ponderador.id}) ***", file=sys.stderr)
-                    
-                    # Verificar que se guardó en DB
-                    ponderador_verificado = Ponderador.objects.get(id=ponderador.id)
-                    print(f"*** VERIFICACIÓN DB: {ponderador_verificado.nombre} existe ***", file=sys.stderr)
                 except Exception as e:
                     print(f"ERROR CREANDO NUEVO PONDERADOR: {e}", file=sys.stderr)
     
@@ -938,12 +920,15 @@ def process_ponderadores_only(proyecto, dynamic_structure_data, user_id):
         print(f"=== PROCESANDO PONDERADORES DE FASE NUEVOS ===", file=sys.stderr)
         print(f"PONDERADORES FASE DATA: {ponderadores_fase_data}", file=sys.stderr)
         
+        # Fases activas del proyecto en una sola consulta
+        fases_activas = {fase.numero_fase: fase for fase in proyecto.fases.filter(activo=True)}
+        
         for pond_data in ponderadores_fase_data:
             if isinstance(pond_data, dict) and pond_data.get('nombre'):
                 try:
                     # Obtener la fase correspondiente
                     fase_numero = pond_data.get('fase_numero')
-                    fase = proyecto.fases.filter(numero_fase=fase_numero, activo=True).first()
+                    fase = fases_activas.get(int(fase_numero)) if fase_numero is not None else None
                     
                     if fase:
                         print(f"*** CREANDO PONDERADOR DE FASE ***", file=sys.stderr)
@@ -965,15 +950,9 @@ def process_ponderadores_only(proyecto, dynamic_structure_data, user_id):
                             activated_by_id=user_id,
                         )
                         print(f"*** NUEVO PONDERADOR DE FASE CREADO EN DB: ID={ponderador.id}, nombre='{ponderador.nombre}', nivel='{ponderador.nivel_aplicacion}', proyecto_id={ponderador.proyecto_id}, fase_id={ponderador.fase_id} ***", file=sys.stderr)
-                        
-                        # Verificar que se guardó en DB
-                        ponderador_verificado = Ponderador.objects.get(id=ponderador.id)
-                        print(f"*** VERIFICACIÓN DB FASE: {ponderador_verificado.nombre} - nivel: {ponderador_verificado.nivel_aplicacion} - fase: {ponderador_verificado.fase_id} ***", file=sys.stderr)
                     else:
                         print(f"*** FASE {fase_numero} NO ENCONTRADA PARA PONDERADOR {pond_data.get('nombre')} ***", file=sys.stderr)
-                        # Listar fases disponibles para debug
-                        fases_disponibles = proyecto.fases.filter(activo=True).values_list('numero_fase', 'nombre')
-                        print(f"*** FASES DISPONIBLES: {list(fases_disponibles)} ***", file=sys.stderr)
+                        print(f"*** FASES DISPONIBLES: {sorted(fases_activas)} ***", file=sys.stderr)
                 except Exception as e:
                     print(f"ERROR CREANDO PONDERADOR DE FASE: {e}", file=sys.stderr)
     
@@ -983,11 +962,20 @@ def process_ponderadores_only(proyecto, dynamic_structure_data, user_id):
         print(f"=== PROCESANDO PONDERADORES EXISTENTES ===", file=sys.stderr)
         print(f"EXISTING PONDERADORES DATA: {existing_ponderadores_data}", file=sys.stderr)
         
+        # Cargar todos los ponderadores referenciados en una sola consulta
+        ids_existentes = [
+            pond_data.get('id') for pond_data in existing_ponderadores_data
+            if isinstance(pond_data, dict) and pond_data.get('id')
+        ]
+        ponderadores_existentes = proyecto.ponderadores.in_bulk(ids_existentes)
+        
         for pond_data in existing_ponderadores_data:
             if isinstance(pond_data, dict) and pond_data.get('id'):
                 try:
                     ponderador_id = pond_data.get('id')
-                    ponderador = Ponderador.objects.get(id=ponderador_id, proyecto=proyecto)
+                    ponderador = ponderadores_existentes.get(int(ponderador_id))
+                    if ponderador is None:
+                        raise Ponderador.DoesNotExist
                     
                     # Actualizar campos
                     ponderador.nombre = pond_data.get('nombre', ponderador.nombre)
@@ -1005,40 +993,12 @@ def process_ponderadores_only(proyecto, dynamic_structure_data, user_id):
                     print(f"ERROR ACTUALIZANDO PONDERADOR EXISTENTE: {e}", file=sys.stderr)
 
 
-def process_comercializacion_only(proyecto, dynamic_structure_data):
-    """Procesar solo la comercialización de fases sin afectar la estructura"""
-    import sys
-    
-    print(f"=== PROCESANDO SOLO COMERCIALIZACIÓN ===", file=sys.stderr)
-    
-    fases_data = dynamic_structure_data.get('fases', {})
-    for fase_num, fase_info in fases_data.items():
-        try:
-            # Buscar la fase existente
-            fase = proyecto.fases.filter(numero_fase=fase_num, activo=True).first()
-            if not fase:
-                print(f"*** FASE {fase_num} NO ENCONTRADA ***", file=sys.stderr)
-                continue
-                
-            comercializable = fase_info.get('comercializable', False)
-            print(f"*** FASE {fase_num}: comercializable = {comercializable} ***", file=sys.stderr)
-            
-            # Actualizar todos los inmuebles de la fase
-            if comercializable:
-                # Marcar todos los inmuebles como comercializables
-                count = fase.inmuebles.update(disponible_comercializacion=True)
-                print(f"*** MARCADOS {count} INMUEBLES COMO COMERCIALIZABLES EN FASE {fase_num} ***", file=sys.stderr)
-            else:
-                # Marcar todos los inmuebles como NO comercializables
-                count = fase.inmuebles.update(disponible_comercializacion=False)
-                print(f"*** MARCADOS {count} INMUEBLES COMO NO COMERCIALIZABLES EN FASE {fase_num} ***", file=sys.stderr)
-                
-        except Exception as e:
-            print(f"ERROR PROCESANDO COMERCIALIZACIÓN DE FASE {fase_num}: {e}", file=sys.stderr)
-
-
 def _build_existing_structure_data(proyecto):
-    """Construir datos de estructura existente para pre-cargar en el formulario de edición"""
+    """
+    Construir datos de estructura existente para pre-cargar en el formulario de edición.
+    Usa un número fijo de consultas (una por nivel más los conteos agrupados),
+    sin importar cuántas torres, pisos o inmuebles tenga el proyecto.
+    """
     import sys
     
     print(f"=== CONSTRUYENDO ESTRUCTURA EXISTENTE ===", file=sys.stderr)
@@ -1049,10 +1009,8 @@ def _build_existing_structure_data(proyecto):
         'ponderadores': []
     }
     
-    # 1. OBTENER PONDERADORES DEL PROYECTO
-    ponderadores_proyecto = proyecto.ponderadores.filter(activo=True, nivel_aplicacion='proyecto')
-    for ponderador in ponderadores_proyecto:
-        structure_data['ponderadores'].append({
+    def ponderador_data(ponderador):
+        return {
             'id': ponderador.id,
             'nombre': ponderador.nombre,
             'tipo': ponderador.tipo,
@@ -1060,15 +1018,60 @@ def _build_existing_structure_data(proyecto):
             'monto_fijo': float(ponderador.monto_fijo) if ponderador.monto_fijo else None,
             'descripcion': ponderador.descripcion,
             'nivel_aplicacion': ponderador.nivel_aplicacion
-        })
-        print(f"  PONDERADOR: {ponderador.nombre} ({ponderador.tipo})", file=sys.stderr)
+        }
+    
+    # 1. OBTENER PONDERADORES ACTIVOS (PROYECTO Y FASES) EN UNA CONSULTA
+    ponderadores_por_fase = {}
+    for ponderador in proyecto.ponderadores.filter(activo=True):
+        if ponderador.nivel_aplicacion == 'proyecto':
+            structure_data['ponderadores'].append(ponderador_data(ponderador))
+            print(f"  PONDERADOR: {ponderador.nombre} ({ponderador.tipo})", file=sys.stderr)
+        if ponderador.fase_id:
+            ponderadores_por_fase.setdefault(ponderador.fase_id, []).append(ponderador_data(ponderador))
     
     # 2. OBTENER ESTRUCTURA DE FASES
-    fases = proyecto.fases.filter(activo=True).order_by('numero_fase')
+    fases = list(proyecto.fases.filter(activo=True).order_by('numero_fase'))
+    fase_ids = [fase.id for fase in fases]
+    
+    # Conteos agrupados: comercializables por fase y total/comercializables por piso o manzana.
+    # El total incluye los inmuebles dados de baja (disponible=False): siguen existiendo con su
+    # código, y reenviar el formulario sin cambios no debe eliminar otros inmuebles.
+    inmuebles = Inmueble.objects.filter(fase_id__in=fase_ids).order_by()
+    comercializables_por_fase = dict(
+        inmuebles.filter(disponible_comercializacion=True)
+        .values('fase_id').annotate(total=Count('id')).values_list('fase_id', 'total')
+    )
+    ubicacion = 'piso_id' if proyecto.tipo == 'departamentos' else 'manzana_id'
+    conteos_ubicacion = {
+        fila[ubicacion]: fila
+        for fila in inmuebles.filter(**{f'{ubicacion}__isnull': False}).values(ubicacion).annotate(
+            total=Count('id'),
+            comercializables=Count('id', filter=Q(disponible_comercializacion=True)),
+        )
+    }
+    
+    # Torres/pisos o sectores/manzanas activos, agrupados por su padre
+    if proyecto.tipo == 'departamentos':
+        grupos = Torre.objects.filter(fase_id__in=fase_ids, activo=True).order_by('numero_torre')
+        unidades = Piso.objects.filter(torre__fase_id__in=fase_ids, activo=True).order_by('numero_piso')
+        unidad_padre = 'torre_id'
+    elif proyecto.tipo == 'terrenos':
+        grupos = Sector.objects.filter(fase_id__in=fase_ids, activo=True).order_by('numero_sector')
+        unidades = Manzana.objects.filter(sector__fase_id__in=fase_ids, activo=True).order_by('numero_manzana')
+        unidad_padre = 'sector_id'
+    else:
+        grupos, unidades, unidad_padre = [], [], None
+    
+    grupos_por_fase = {}
+    for grupo in grupos:
+        grupos_por_fase.setdefault(grupo.fase_id, []).append(grupo)
+    unidades_por_grupo = {}
+    for unidad in unidades:
+        unidades_por_grupo.setdefault(getattr(unidad, unidad_padre), []).append(unidad)
+    
     for fase in fases:
         # Verificar si la fase es comercializable
-        inmuebles_comercializables = fase.inmuebles.filter(disponible_comercializacion=True).count()
-        es_comercializable = inmuebles_comercializables > 0
+        es_comercializable = comercializables_por_fase.get(fase.id, 0) > 0
         
         fase_data = {
             'id': fase.id,
@@ -1077,78 +1080,49 @@ def _build_existing_structure_data(proyecto):
             'comercializable': es_comercializable,
             'torres': {},
             'sectores': {},
-            'ponderadores': []
+            'ponderadores': ponderadores_por_fase.get(fase.id, [])
         }
         
-        # Ponderadores de la fase
-        ponderadores_fase = fase.ponderadores.filter(activo=True)
-        for ponderador in ponderadores_fase:
-            fase_data['ponderadores'].append({
-                'id': ponderador.id,
-                'nombre': ponderador.nombre,
-                'tipo': ponderador.tipo,
-                'porcentaje': float(ponderador.porcentaje) if ponderador.porcentaje else 0,
-                'monto_fijo': float(ponderador.monto_fijo) if ponderador.monto_fijo else None,
-                'descripcion': ponderador.descripcion,
-                'nivel_aplicacion': ponderador.nivel_aplicacion
-            })
-        
-        # Estructura de torres (para departamentos)
-        if proyecto.tipo == 'departamentos':
-            torres = fase.torres.filter(activo=True).order_by('numero_torre')
-            for torre in torres:
-                # Verificar si la torre es comercializable (a través de los pisos)
-                inmuebles_comercializables = 0
-                for piso in torre.pisos.filter(activo=True):
-                    inmuebles_comercializables += piso.inmuebles.filter(disponible_comercializacion=True).count()
-                es_comercializable = inmuebles_comercializables > 0
-                
+        for grupo in grupos_por_fase.get(fase.id, []):
+            unidades_grupo = unidades_por_grupo.get(grupo.id, [])
+            vacio = {'total': 0, 'comercializables': 0}
+            conteos = [conteos_ubicacion.get(unidad.id, vacio) for unidad in unidades_grupo]
+            
+            # El grupo es comercializable si alguno de sus inmuebles lo es
+            grupo_comercializable = sum(conteo['comercializables'] for conteo in conteos) > 0
+            
+            # Estructura de torres (para departamentos)
+            if proyecto.tipo == 'departamentos':
                 torre_data = {
-                    'id': torre.id,
-                    'nombre': torre.nombre,
-                    'numero_torre': torre.numero_torre,
-                    'comercializable': es_comercializable,
-                    'pisos': {}
+                    'id': grupo.id,
+                    'nombre': grupo.nombre,
+                    'numero_torre': grupo.numero_torre,
+                    'comercializable': grupo_comercializable,
+                    'pisos': {
+                        unidad.numero_piso: conteo['total']
+                        for unidad, conteo in zip(unidades_grupo, conteos)
+                    }
                 }
-                
-                # Obtener pisos y departamentos
-                pisos = torre.pisos.filter(activo=True).order_by('numero_piso')
-                for piso in pisos:
-                    departamentos_count = piso.inmuebles.filter(disponible=True).count()
-                    torre_data['pisos'][piso.numero_piso] = departamentos_count
-                
-                fase_data['torres'][torre.numero_torre] = torre_data
-                print(f"  TORRE: {torre.nombre} - {len(torre_data['pisos'])} pisos", file=sys.stderr)
-        
-        # Estructura de sectores (para terrenos)
-        elif proyecto.tipo == 'terrenos':
-            sectores = fase.sectores.filter(activo=True).order_by('numero_sector')
-            for sector in sectores:
-                # Verificar si el sector es comercializable (a través de las manzanas)
-                inmuebles_comercializables = 0
-                for manzana in sector.manzanas.filter(activo=True):
-                    inmuebles_comercializables += manzana.inmuebles.filter(disponible_comercializacion=True).count()
-                es_comercializable = inmuebles_comercializables > 0
-                
+                fase_data['torres'][grupo.numero_torre] = torre_data
+                print(f"  TORRE: {grupo.nombre} - {len(torre_data['pisos'])} pisos", file=sys.stderr)
+            
+            # Estructura de sectores (para terrenos)
+            else:
                 sector_data = {
-                    'id': sector.id,
-                    'nombre': sector.nombre,
-                    'numero_sector': sector.numero_sector,
-                    'comercializable': es_comercializable,
-                    'manzanas': {}
+                    'id': grupo.id,
+                    'nombre': grupo.nombre,
+                    'numero_sector': grupo.numero_sector,
+                    'comercializable': grupo_comercializable,
+                    'manzanas': {
+                        unidad.numero_manzana: conteo['total']
+                        for unidad, conteo in zip(unidades_grupo, conteos)
+                    }
                 }
-                
-                # Obtener manzanas y terrenos
-                manzanas = sector.manzanas.filter(activo=True).order_by('numero_manzana')
-                for manzana in manzanas:
-                    terrenos_count = manzana.inmuebles.filter(disponible=True).count()
-                    sector_data['manzanas'][manzana.numero_manzana] = terrenos_count
-                
-                fase_data['sectores'][sector.numero_sector] = sector_data
-                print(f"  SECTOR: {sector.nombre} - {len(sector_data['manzanas'])} manzanas", file=sys.stderr)
+                fase_data['sectores'][grupo.numero_sector] = sector_data
+                print(f"  SECTOR: {grupo.nombre} - {len(sector_data['manzanas'])} manzanas", file=sys.stderr)
         
         structure_data['fases'][fase.numero_fase] = fase_data
-        print(f"FASE: {fase.nombre} - comercializable: {fase.es_comercializable}", file=sys.stderr)
+        print(f"FASE: {fase.nombre} - comercializable: {es_comercializable}", file=sys.stderr)
     
     print(f"ESTRUCTURA EXISTENTE: {len(structure_data['fases'])} fases, {len(structure_data['ponderadores'])} ponderadores", file=sys.stderr)
     return structure_data
@@ -1239,261 +1213,44 @@ def create_land_structure(fase, fase_data):
 
 def create_dynamic_apartments_structure(fase, torres_data, fase_comercializable=False):
     """Crea la estructura para proyectos de departamentos con datos dinámicos REALES"""
-    import sys
-    print(f"=== CREANDO DEPARTAMENTOS DINÁMICOS ===", file=sys.stderr)
-    print(f"Fase: {fase.nombre}", file=sys.stderr)
-    print(f"Torres data: {torres_data}", file=sys.stderr)
-    
-    for torre_num, torre_info in torres_data.items():
-        print(f"PROCESANDO TORRE {torre_num}: {torre_info}", file=sys.stderr)
-        
-        # Validar que torre_info sea un diccionario
-        if not isinstance(torre_info, dict):
-            print(f"ERROR: Torre {torre_num} no es diccionario", file=sys.stderr)
-            continue
-        
-        # Obtener datos de la torre
-        pisos_data = torre_info.get('pisos', {})
-        if not pisos_data:
-            # Usar datos básicos si no hay pisos específicos
-            pisos_inicio = torre_info.get('pisos_inicio', 1)
-            pisos_fin = torre_info.get('pisos_fin', 1)
-            deptos_piso = torre_info.get('deptos_piso', 2)
-            pisos_data = {piso: deptos_piso for piso in range(pisos_inicio, pisos_fin + 1)}
-        
-        print(f"TORRE {torre_num} - Pisos data: {pisos_data}", file=sys.stderr)
-        
-        # Crear la torre
-        torre = Torre.objects.create(
-            fase=fase,
-            nombre=torre_info.get('nombre', f"Torre {torre_num}"),
-            numero_torre=int(torre_num),
-            numero_pisos=len(pisos_data),
-            descripcion=f"Torre {torre_num} de la {fase.nombre}"
-        )
-        
-        departamentos_creados = 0
-        
-        # Crear cada piso con sus departamentos específicos
-        for piso_num, departamentos_count in pisos_data.items():
-            print(f"CREANDO PISO {piso_num} con {departamentos_count} departamentos", file=sys.stderr)
-            
-            # Crear el piso
-            piso = Piso.objects.create(
-                torre=torre,
-                numero_piso=int(piso_num),
-                nombre=f"Piso {piso_num}",
-                descripcion=f"Piso {piso_num} de la Torre {torre_num}"
-            )
-            
-            # Crear los departamentos específicos de este piso
-            for depto_num in range(1, int(departamentos_count) + 1):
-                codigo = f"T{int(torre_num):02d}P{int(piso_num):02d}D{depto_num:02d}"
-                
-                Inmueble.objects.create(
-                    fase=fase,
-                    piso=piso,
-                    codigo=codigo,
-                    tipo='departamento',
-                    m2=85.0,
-                    estado='disponible',
-                    disponible=True,
-                    disponible_comercializacion=fase_comercializable,
-                    caracteristicas=f"Departamento {codigo} en Torre {torre_num}, Piso {piso_num}"
-                )
-                departamentos_creados += 1
-                print(f"  CREADO: {codigo}", file=sys.stderr)
-        
-        print(f"TORRE {torre_num} COMPLETADA: {departamentos_creados} departamentos", file=sys.stderr)
-    
-    print(f"=== ESTRUCTURA DEPARTAMENTOS COMPLETADA ===", file=sys.stderr)
+    builder = StructureBuilder()
+    builder.planificar_departamentos(fase, torres_data, fase_comercializable)
+    return builder.guardar()
 
 
 def create_dynamic_land_structure(fase, sectores_data, fase_comercializable=False):
     """Crea la estructura para proyectos de terrenos con datos dinámicos"""
-    print(f"DEBUG: Creando estructura de terrenos para fase {fase.nombre}")
-    print(f"DEBUG: Sectores data completo: {sectores_data}")
-    print(f"DEBUG: Tipo de sectores_data: {type(sectores_data)}")
-    
-    for sector_num, sector_info in sectores_data.items():
-        print(f"DEBUG: Procesando Sector {sector_num} (tipo: {type(sector_num)})")
-        print(f"DEBUG: Sector info: {sector_info}")
-        print(f"DEBUG: Tipo de sector_info: {type(sector_info)}")
-        
-        # Validar que sector_info sea un diccionario
-        if not isinstance(sector_info, dict):
-            print(f"ERROR: Sector {sector_num} - sector_info no es un diccionario: {sector_info}")
-            continue
-            
-        # Determinar comercialización del sector
-        sector_comercializable = sector_info.get('comercializable', False)
-        inmuebles_comercializables = fase_comercializable or sector_comercializable
-        
-        # Obtener y validar datos de configuración
-        manzanas_inicio = sector_info.get('manzanas_inicio', 1)
-        manzanas_fin = sector_info.get('manzanas_fin', 10)
-        terrenos_por_manzana = sector_info.get('terrenos_manzana', 8)
-        
-        # Asegurar que sean enteros
-        try:
-            manzanas_inicio = int(manzanas_inicio)
-            manzanas_fin = int(manzanas_fin)
-            terrenos_por_manzana = int(terrenos_por_manzana)
-            sector_num_int = int(sector_num)
-        except (ValueError, TypeError) as e:
-            print(f"ERROR: Sector {sector_num} - Error convirtiendo a entero: {e}")
-            print(f"  manzanas_inicio: {manzanas_inicio} (tipo: {type(manzanas_inicio)})")
-            print(f"  manzanas_fin: {manzanas_fin} (tipo: {type(manzanas_fin)})")
-            print(f"  terrenos_por_manzana: {terrenos_por_manzana} (tipo: {type(terrenos_por_manzana)})")
-            continue
-        
-        # Validar rangos lógicos
-        if manzanas_inicio > manzanas_fin:
-            print(f"ERROR: Sector {sector_num} - Manzana inicio ({manzanas_inicio}) mayor que manzana fin ({manzanas_fin})")
-            continue
-            
-        if terrenos_por_manzana <= 0:
-            print(f"ERROR: Sector {sector_num} - Terrenos por manzana debe ser mayor a 0: {terrenos_por_manzana}")
-            continue
-        
-        # Calcular total esperado
-        total_manzanas = manzanas_fin - manzanas_inicio + 1
-        total_terrenos_esperados = total_manzanas * terrenos_por_manzana
-        
-        print(f"DEBUG: Sector {sector_num} - Manzanas: {manzanas_inicio} a {manzanas_fin} (total: {total_manzanas} manzanas)")
-        print(f"DEBUG: Sector {sector_num} - Terrenos por manzana: {terrenos_por_manzana}")
-        print(f"DEBUG: Sector {sector_num} - Total terrenos esperados: {total_terrenos_esperados}")
-        
-        # Crear el sector
-        sector = Sector.objects.create(
-            fase=fase,
-            nombre=sector_info.get('nombre', f"Sector {sector_num}"),
-            numero_sector=sector_num_int,
-            descripcion=f"{sector_info.get('nombre', f'Sector {sector_num}')} de la {fase.nombre}"
-        )
-        
-        terrenos_creados = 0
-        manzanas_creadas = 0
-        
-        # Crear exactamente las manzanas solicitadas
-        for manzana_num in range(manzanas_inicio, manzanas_fin + 1):
-            print(f"DEBUG: Sector {sector_num} - Creando manzana {manzana_num}")
-            
-            # Crear la manzana
-            manzana = Manzana.objects.create(
-                sector=sector,
-                numero_manzana=manzana_num,
-                nombre=f"Manzana {manzana_num}",
-                descripcion=f"Manzana {manzana_num} del {sector.nombre}"
-            )
-            manzanas_creadas += 1
-            
-            # Crear exactamente los terrenos solicitados por manzana
-            for terreno_num in range(1, terrenos_por_manzana + 1):
-                codigo = f"S{sector_num_int:02d}M{manzana_num:02d}T{terreno_num:02d}"
-                
-                print(f"DEBUG: Sector {sector_num} - Creando terreno {codigo}")
-                
-                Inmueble.objects.create(
-                    fase=fase,
-                    manzana=manzana,
-                    codigo=codigo,
-                    tipo='terreno',
-                    m2=450.0,  # Área por defecto
-                    estado='disponible',
-                    disponible=True,
-                    disponible_comercializacion=inmuebles_comercializables,
-                    caracteristicas=f"Terreno {codigo} en {sector.nombre}, Manzana {manzana_num}"
-                )
-                terrenos_creados += 1
-        
-        print(f"DEBUG: Sector {sector_num} - RESUMEN:")
-        print(f"  Manzanas creadas: {manzanas_creadas} (esperadas: {total_manzanas})")
-        print(f"  Terrenos creados: {terrenos_creados} (esperados: {total_terrenos_esperados})")
-        
-        # Verificar que las cantidades coincidan
-        if manzanas_creadas != total_manzanas:
-            print(f"ERROR: Sector {sector_num} - Manzanas creadas ({manzanas_creadas}) != esperadas ({total_manzanas})")
-            
-        if terrenos_creados != total_terrenos_esperados:
-            print(f"ERROR: Sector {sector_num} - Terrenos creados ({terrenos_creados}) != esperados ({total_terrenos_esperados})")
-            
-    print(f"DEBUG: Estructura de terrenos completada para fase {fase.nombre}")
+    builder = StructureBuilder()
+    builder.planificar_terrenos(fase, sectores_data, fase_comercializable)
+    return builder.guardar()
 
 
 def count_total_properties(form_data):
-    """Calcula el total de inmuebles que se crearán con estructura dinámica"""
-    dynamic_structure_data = form_data.get('dynamic_structure_data', {})
-    fases_data = dynamic_structure_data.get('fases', {})
-    tipo_proyecto = form_data.get('tipo')
-    
-    total_inmuebles = 0
-    
-    print(f"DEBUG COUNT: Tipo proyecto: {tipo_proyecto}")
-    print(f"DEBUG COUNT: Fases data: {fases_data}")
-    
-    for fase_num, fase_info in fases_data.items():
-        if tipo_proyecto == 'departamentos' and fase_info.get('torres'):
-            print(f"DEBUG COUNT: Fase {fase_num} - Torres: {fase_info['torres']}")
-            for torre_num, torre_info in fase_info['torres'].items():
-                pisos_inicio = torre_info.get('pisos_inicio', 1)
-                pisos_fin = torre_info.get('pisos_fin', 10)
-                departamentos_por_piso = torre_info.get('deptos_piso', 4)
-                
-                # Usar la misma lógica que create_dynamic_apartments_structure
-                departamentos_torre = 0
-                for piso_num in range(pisos_inicio, pisos_fin + 1):
-                    departamentos_torre += departamentos_por_piso
-                
-                total_inmuebles += departamentos_torre
-                
-                print(f"DEBUG COUNT: Torre {torre_num} - Pisos: {pisos_inicio} a {pisos_fin}")
-                print(f"DEBUG COUNT: Torre {torre_num} - Departamentos/piso: {departamentos_por_piso}")
-                print(f"DEBUG COUNT: Torre {torre_num} - Total calculado: {departamentos_torre}")
-                print(f"DEBUG COUNT: Total acumulado: {total_inmuebles}")
-                
-        elif tipo_proyecto == 'terrenos' and fase_info.get('sectores'):
-            for sector_num, sector_info in fase_info['sectores'].items():
-                manzanas_inicio = sector_info.get('manzanas_inicio', 1)
-                manzanas_fin = sector_info.get('manzanas_fin', 10)
-                terrenos_por_manzana = sector_info.get('terrenos_manzana', 8)
-                
-                # Usar la misma lógica que create_dynamic_land_structure
-                terrenos_sector = 0
-                for manzana_num in range(manzanas_inicio, manzanas_fin + 1):
-                    terrenos_sector += terrenos_por_manzana
-                
-                total_inmuebles += terrenos_sector
-    
-    return total_inmuebles
+    """Calcula el total de inmuebles que se crearán con estructura dinámica (plan en seco)"""
+    return planificar_estructura(form_data).conteos()['inmuebles']
 
 
 def update_project_structure(proyecto, form_data, user_id):
-    """Actualiza la estructura del proyecto en modo edición - permite regeneración completa"""
+    """
+    Actualiza la estructura del proyecto en modo edición aplicando solo las diferencias
+    (inserciones, actualizaciones y eliminaciones mínimas) contra el árbol existente
+    """
     dynamic_structure_data = form_data.get('dynamic_structure_data', {})
+    fases_data = dynamic_structure_data.get('fases', {})
+    if not fases_data:
+        return {}
     
-    # Si se proporcionó nueva estructura, regenerar completamente
-    if dynamic_structure_data.get('fases'):
-        # Para simplificar en el edit, regenerar toda la estructura
-        # (En el futuro se podría hacer más granular)
-        
-        # Eliminar estructura existente (cuidadosamente)
-        # Solo eliminar si no hay inmuebles vendidos
-        fases_existentes = proyecto.fases.all()
-        for fase in fases_existentes:
-            if fase.inmuebles_vendidos == 0:
-                # Es seguro eliminar esta fase
-                fase.delete()
-            else:
-                # No eliminar fases con ventas - mantener estructura existente
-                continue
-        
-        # Preparar datos para create_project_structure incluyendo user_id
-        form_data_with_user = form_data.copy()
-        form_data_with_user['user_id'] = user_id
-        
-        # Crear nueva estructura
-        create_project_structure(proyecto, form_data_with_user)
+    diff = StructureDiff(proyecto, fases_data)
+    logger.debug(f"Diferencias de estructura del proyecto {proyecto.pk}: {diff.conteos()}")
+    cambios = diff.aplicar()
+    
+    # Ponderadores específicos de las fases nuevas
+    fases_info = {int(fase_num): fase_info for fase_num, fase_info in fases_data.items()}
+    for fase in diff.fases_nuevas:
+        fase_info = fases_info.get(fase.numero_fase, {})
+        _create_fase_ponderadores(proyecto, fase, fase_info.get('ponderadores', []), user_id)
+    
+    return cambios
 
 
 # ============================================================
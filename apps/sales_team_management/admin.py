@@ -2,7 +2,8 @@
 from django.contrib import admin
 from .models import (
     OrganizationalUnit, PositionType, TeamMembership, 
-    HierarchyRelation, CommissionStructure
+    HierarchyRelation, CommissionStructure,
+    CommissionSettlementRun, CommissionLedgerEntry
 )
 
 
@@ -112,4 +113,24 @@ class CommissionStructureAdmin(admin.ModelAdmin):
             return f"{total}%"
         return "0%"
     
-    total_percentage.short_description = 'Total %'
\ No newline at end of file
+    total_percentage.short_description = 'Total %'
+
+
+@admin.register(CommissionSettlementRun)
+class CommissionSettlementRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'date_from', 'date_to', 'organizational_unit', 'status', 'sales_processed',
+        'sales_skipped', 'entries_created', 'total_amount', 'started_at'
+    )
+    list_filter = ('status', 'organizational_unit', 'started_at')
+    ordering = ('-started_at',)
+    readonly_fields = ('timings', 'skipped_detail', 'started_at', 'finished_at')
+
+
+@admin.register(CommissionLedgerEntry)
+class CommissionLedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('sale_date', 'venta', 'user', 'role', 'percentage', 'amount', 'organizational_unit')
+    list_filter = ('role', 'relation_type', 'organizational_unit', 'sale_date')
+    search_fields = ('user__username', 'user__first_name', 'user__last_name', 'venta__codigo_venta')
+    ordering = ('-sale_date',)
+    raw_id_fields = ('settlement_run', 'venta', 'user', 'membership')
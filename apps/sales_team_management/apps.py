@@ -9,9 +9,5 @@ class SalesTeamManagementConfig(AppConfig):
 
     def ready(self):
         """Se ejecuta cuando la app está lista"""
-        try:
-            # Importar signals si los hay
-            # import apps.sales_team_management.signals
-            pass
-        except ImportError:
-            pass
\ No newline at end of file
+        # Signals de invalidación del índice de jerarquía
+        from . import signals
\ No newline at end of file
@@ -0,0 +1,276 @@
+# apps/sales_team_management/commission_settlement.py
+"""
+Liquidación de comisiones en lote: toma las ventas (VentaInmutable) de un rango
+de fechas, carga una sola vez las estructuras de comisiones, la jerarquía de
+posiciones por tipo de unidad, las membresías y el grafo de supervisión
+(hierarchy_index), calcula en memoria la distribución de cada venta con
+CommissionCalculator y la guarda en bloque en el libro de comisiones.
+"""
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.utils import timezone
+
+from .hierarchy_index import get_hierarchy_index
+from .models import (
+    CommissionLedgerEntry, CommissionSettlementRun, CommissionStructure,
+    HierarchyRelation, OrganizationalUnit, PositionType, TeamMembership,
+)
+from .utils import CommissionCalculator
+
+logger = logging.getLogger(__name__)
+
+CENTAVOS = Decimal('0.01')
+RELATION_TYPES = dict(HierarchyRelation.RELATION_TYPES)
+
+
+class CommissionSettlementEngine:
+    """
+    Liquida las ventas entre date_from y date_to (incluidas), de todas las
+    unidades o solo de organizational_unit. La unidad de una venta es la de la
+    membresía del vendedor, que se toma de vendedor_snapshot ('membership_id', o
+    'user_id' / 'id' más la unidad de 'organizational_unit_id' o de
+    equipo_venta_snapshot).
+
+    Liquidar de nuevo un rango reemplaza las comisiones ya liquidadas de esas
+    ventas (con organizational_unit, de las ventas que hoy resuelven a la
+    unidad); solo se guardan las comisiones mayores a cero.
+    """
+
+    def __init__(self, date_from, date_to, organizational_unit=None, index=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.organizational_unit = organizational_unit
+        self.index = index
+        self.timings = {}
+
+    # ------------------------------------------------------------
+    # Carga (una vez por ejecución)
+    # ------------------------------------------------------------
+
+    def load(self):
+        from apps.communications.models import VentaInmutable
+
+        started = time.perf_counter()
+        unit_id = self.organizational_unit.id if self.organizational_unit else None
+
+        self.index = self.index or get_hierarchy_index()
+        self.unit_types = dict(OrganizationalUnit.objects.values_list('id', 'unit_type'))
+
+        # Jerarquía de posiciones por tipo de unidad (mismo criterio que
+        # CommissionCalculator._build_position_hierarchy)
+        positions = list(
+            PositionType.objects.order_by('hierarchy_level').values_list('code', 'hierarchy_level', 'applicable_unit_types')
+        )
+        self.position_hierarchies = {
+            unit_type: {code: level for code, level, applicable in positions if unit_type in applicable}
+            for unit_type in set(self.unit_types.values())
+        }
+
+        # Estructuras vigentes en algún momento del rango, más reciente primero
+        structures = CommissionStructure.objects.filter(
+            is_active=True, effective_from__date__lte=self.date_to
+        ).exclude(effective_until__date__lt=self.date_from).order_by('-effective_from', '-id')
+        if unit_id:
+            structures = structures.filter(organizational_unit_id=unit_id)
+        self.structures = {}
+        for structure in structures:
+            self.structures.setdefault(structure.organizational_unit_id, []).append(structure)
+
+        # Membresías: (id, user_id, unit_id, código y nivel de posición, activa)
+        self.memberships, self.active_by_user = {}, {}
+        rows = TeamMembership.objects.values_list(
+            'id', 'user_id', 'organizational_unit_id', 'position_type__code',
+            'position_type__hierarchy_level', 'is_active'
+        )
+        for membership_id, user_id, membership_unit_id, code, level, is_active in rows:
+            self.memberships[membership_id] = (user_id, membership_unit_id, code, level)
+            if is_active:
+                self.active_by_user.setdefault(user_id, []).append(membership_id)
+
+        self.sales = list(
+            VentaInmutable.objects.filter(
+                fecha_venta__gte=self.date_from, fecha_venta__lte=self.date_to
+            ).order_by('fecha_venta', 'id').values_list(
+                'id', 'fecha_venta', 'valor_final', 'vendedor_snapshot', 'equipo_venta_snapshot'
+            )
+        )
+
+        self.timings['carga'] = time.perf_counter() - started
+
+    def _seller_membership(self, vendedor, equipo):
+        """Membresía del vendedor según los snapshots de la venta (None si no se puede resolver)"""
+        vendedor, equipo = vendedor or {}, equipo or {}
+
+        membership_id = vendedor.get('membership_id')
+        if membership_id in self.memberships:
+            return membership_id
+
+        user_id = vendedor.get('user_id') or vendedor.get('id')
+        unit_id = vendedor.get('organizational_unit_id') or equipo.get('organizational_unit_id') or equipo.get('id')
+        candidates = [
+            candidate for candidate in self.active_by_user.get(user_id, [])
+            if not unit_id or self.memberships[candidate][1] == unit_id
+        ]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def _structure_for(self, unit_id, sale_date):
+        for structure in self.structures.get(unit_id, ()):
+            if timezone.localdate(structure.effective_from) > sale_date:
+                continue
+            if structure.effective_until and timezone.localdate(structure.effective_until) < sale_date:
+                continue
+            return structure
+        return None
+
+    # ------------------------------------------------------------
+    # Cálculo en memoria
+    # ------------------------------------------------------------
+
+    def compute(self, settlement_run=None):
+        """
+        Distribución de todas las ventas cargadas.
+        Devuelve (entradas del libro sin guardar, ventas omitidas [{'venta_id', 'motivo'}]).
+        """
+        started = time.perf_counter()
+        calculators, entries, skipped = {}, [], []
+        self.sales_processed = 0
+        # Ventas del alcance de la liquidación: sus comisiones anteriores se reemplazan
+        self.sale_ids = [] if self.organizational_unit else [sale[0] for sale in self.sales]
+
+        for venta_id, sale_date, sale_amount, vendedor, equipo in self.sales:
+            seller_id = self._seller_membership(vendedor, equipo)
+            if seller_id is None:
+                skipped.append({'venta_id': venta_id, 'motivo': 'Vendedor sin membresía identificable'})
+                continue
+
+            seller_user_id, unit_id, seller_code, seller_level = self.memberships[seller_id]
+            if self.organizational_unit:
+                if unit_id != self.organizational_unit.id:
+                    continue
+                self.sale_ids.append(venta_id)
+
+            structure = self._structure_for(unit_id, sale_date)
+            if structure is None:
+                skipped.append({'venta_id': venta_id, 'motivo': 'Sin estructura de comisiones vigente'})
+                continue
+
+            calculator = calculators.get(structure.id)
+            if calculator is None:
+                calculator = calculators[structure.id] = CommissionCalculator(
+                    structure, self.position_hierarchies.get(self.unit_types.get(unit_id), {})
+                )
+
+            common = {
+                'settlement_run': settlement_run,
+                'venta_id': venta_id,
+                'organizational_unit_id': unit_id,
+                'commission_structure': structure,
+                'sale_date': sale_date,
+                'sale_amount': sale_amount,
+            }
+
+            # Mismo orden que calculate_distribution: vendedor y luego la cadena;
+            # un usuario que aparece dos veces queda con la última comisión
+            distribution = {
+                seller_user_id: {
+                    'membership_id': seller_id,
+                    'role': 'SELLER',
+                    'relation_type': '',
+                    'percentage': calculator.seller_commission_for_level(seller_level),
+                    'reason': f'Venta realizada como {seller_code}',
+                }
+            }
+            for relation in self.index.supervision_chain(seller_id):
+                supervisor = self.index.memberships[relation.supervisor]
+                percentage = calculator.supervisor_commission(
+                    relation.relation_type, supervisor.position_code, supervisor.hierarchy_level, seller_level
+                )
+                if percentage > 0:
+                    distribution[supervisor.user_id] = {
+                        'membership_id': relation.supervisor,
+                        'role': 'SUPERVISOR',
+                        'relation_type': relation.relation_type,
+                        'percentage': percentage,
+                        'reason': f'Supervisión {RELATION_TYPES.get(relation.relation_type, relation.relation_type)}',
+                    }
+
+            for user_id, item in distribution.items():
+                percentage = item.pop('percentage')
+                if percentage <= 0:
+                    continue
+                entries.append(CommissionLedgerEntry(
+                    user_id=user_id,
+                    percentage=percentage,
+                    amount=(sale_amount * percentage / 100).quantize(CENTAVOS, rounding=ROUND_HALF_UP),
+                    **common,
+                    **item,
+                ))
+            self.sales_processed += 1
+
+        self.timings['calculo'] = time.perf_counter() - started
+        return entries, skipped
+
+    # ------------------------------------------------------------
+    # Ejecución completa
+    # ------------------------------------------------------------
+
+    def settle(self, executed_by=None, dry_run=False, batch_size=1000):
+        """
+        Carga, calcula y (salvo dry_run) guarda en una transacción.
+        Devuelve la CommissionSettlementRun (sin guardar en dry_run) y las entradas.
+        """
+        started = time.perf_counter()
+        run = CommissionSettlementRun(
+            date_from=self.date_from,
+            date_to=self.date_to,
+            organizational_unit=self.organizational_unit,
+            executed_by=executed_by,
+        )
+        if not dry_run:
+            run.save()
+
+        try:
+            self.load()
+            entries, skipped = self.compute(None if dry_run else run)
+
+            write_started = time.perf_counter()
+            if not dry_run:
+                with transaction.atomic():
+                    # Por venta y no por unidad: una venta liquidada antes en otra
+                    # unidad también se reemplaza (una comisión por venta y usuario)
+                    for start in range(0, len(self.sale_ids), batch_size):
+                        CommissionLedgerEntry.objects.filter(
+                            venta_id__in=self.sale_ids[start:start + batch_size]
+                        ).delete()
+                    CommissionLedgerEntry.objects.bulk_create(entries, batch_size=batch_size)
+            self.timings['escritura'] = time.perf_counter() - write_started
+        except Exception:
+            logger.exception('Error en la liquidación de comisiones')
+            if not dry_run:
+                run.status = 'FAILED'
+                run.finished_at = timezone.now()
+                run.timings = self._final_timings(started)
+                run.save(update_fields=['status', 'finished_at', 'timings'])
+            raise
+
+        run.status = 'COMPLETED'
+        run.sales_processed = self.sales_processed
+        run.sales_skipped = len(skipped)
+        run.skipped_detail = skipped
+        run.entries_created = len(entries)
+        run.total_amount = sum((entry.amount for entry in entries), Decimal('0.00'))
+        run.finished_at = timezone.now()
+        run.timings = self._final_timings(started)
+        if not dry_run:
+            run.save()
+        return run, entries
+
+    def _final_timings(self, started):
+        timings = {stage: round(seconds, 4) for stage, seconds in self.timings.items()}
+        timings['total'] = round(time.perf_counter() - started, 4)
+        sales = getattr(self, 'sales_processed', 0)
+        timings['ventas_por_segundo'] = round(sales / timings['total'], 1) if timings['total'] else 0
+        return timings
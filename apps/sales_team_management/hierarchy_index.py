@@ -0,0 +1,223 @@
+# apps/sales_team_management/hierarchy_index.py
+"""
+Índice en memoria de la jerarquía: grafo de supervisión de las HierarchyRelation
+activas construido en una consulta y guardado en la caché de Django bajo una
+versión que invalidan los signals de HierarchyRelation y TeamMembership.
+Responde supervisores, subordinados, ancestros, descendientes, profundidad y
+"X está bajo Y" sin una consulta por nivel.
+"""
+import logging
+import uuid
+from collections import deque, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+HIERARCHY_CACHE_TIMEOUT = getattr(settings, 'HIERARCHY_CACHE_TIMEOUT', 60 * 60)
+
+PREFIX = 'jerarquia'
+CLAVE_VERSION = f'{PREFIX}:version'
+
+# Relación activa: supervisor -> subordinado (ids de TeamMembership)
+Relation = namedtuple('Relation', 'id supervisor subordinate relation_type is_primary')
+# Datos de la membresía necesarios para resolver usuarios y posiciones sin consultas
+MembershipInfo = namedtuple('MembershipInfo', 'user_id unit_id position_code position_name hierarchy_level')
+
+# Proceso actual: último índice deserializado y su versión
+_local = {'version': None, 'index': None}
+
+
+class HierarchyIndex:
+    """
+    Grafo de supervisión entre membresías. Los supervisores de cada membresía
+    quedan ordenados por (relation_type, id), el mismo criterio con el que
+    CommissionCalculator elige al supervisor de la cadena (DIRECT antes que NORMAL).
+    """
+
+    def __init__(self, relations, memberships):
+        self.memberships = memberships
+        self.supervisors_of = {}
+        self.subordinates_of = {}
+        self.memberships_by_user = {}
+
+        for relation in sorted(relations, key=lambda rel: (rel.relation_type, rel.id)):
+            self.supervisors_of.setdefault(relation.subordinate, []).append(relation)
+            self.subordinates_of.setdefault(relation.supervisor, []).append(relation)
+
+        for membership_id, info in memberships.items():
+            self.memberships_by_user.setdefault(info.user_id, []).append(membership_id)
+
+    @classmethod
+    def build(cls):
+        """Construye el índice con una sola consulta"""
+        from .models import HierarchyRelation
+
+        relations, memberships = [], {}
+        rows = HierarchyRelation.objects.filter(is_active=True).values_list(
+            'id', 'supervisor_membership_id', 'subordinate_membership_id', 'relation_type', 'is_primary',
+            'supervisor_membership__user_id', 'supervisor_membership__organizational_unit_id',
+            'supervisor_membership__position_type__code', 'supervisor_membership__position_type__name',
+            'supervisor_membership__position_type__hierarchy_level',
+            'subordinate_membership__user_id', 'subordinate_membership__organizational_unit_id',
+            'subordinate_membership__position_type__code', 'subordinate_membership__position_type__name',
+            'subordinate_membership__position_type__hierarchy_level',
+        )
+        for row in rows:
+            relations.append(Relation(*row[:5]))
+            memberships[row[1]] = MembershipInfo(*row[5:10])
+            memberships[row[2]] = MembershipInfo(*row[10:15])
+
+        return cls(relations, memberships)
+
+    # ------------------------------------------------------------
+    # Relaciones directas
+    # ------------------------------------------------------------
+
+    def supervisor_relations(self, membership_id):
+        return self.supervisors_of.get(membership_id, [])
+
+    def subordinate_relations(self, membership_id):
+        return self.subordinates_of.get(membership_id, [])
+
+    def primary_supervisor_count(self, membership_id):
+        return sum(1 for relation in self.supervisor_relations(membership_id) if relation.is_primary)
+
+    # ------------------------------------------------------------
+    # Recorridos
+    # ------------------------------------------------------------
+
+    def _reachable(self, membership_id, edges, target):
+        visited = set()
+        queue = deque([membership_id])
+        while queue:
+            current = queue.popleft()
+            for relation in edges.get(current, ()):
+                node = getattr(relation, target)
+                if node not in visited:
+                    visited.add(node)
+                    queue.append(node)
+        visited.discard(membership_id)
+        return visited
+
+    def ancestors(self, membership_id):
+        """Todas las membresías que supervisan (directa o indirectamente) a membership_id"""
+        return self._reachable(membership_id, self.supervisors_of, 'supervisor')
+
+    def descendants(self, membership_id):
+        """Todas las membresías bajo membership_id"""
+        return self._reachable(membership_id, self.subordinates_of, 'subordinate')
+
+    def is_under(self, membership_id, supervisor_membership_id):
+        """¿membership_id está (a cualquier nivel) bajo supervisor_membership_id?"""
+        return supervisor_membership_id in self.ancestors(membership_id)
+
+    def supervision_chain(self, membership_id):
+        """
+        Relaciones de la cadena de supervisión hacia arriba, tomando en cada nivel
+        el primer supervisor; se corta al volver a una membresía ya recorrida
+        """
+        chain, visited = [], set()
+        current = membership_id
+        while current is not None and current not in visited:
+            visited.add(current)
+            supervisors = self.supervisor_relations(current)
+            if not supervisors:
+                break
+            chain.append(supervisors[0])
+            current = supervisors[0].supervisor
+        return chain
+
+    def depth(self, membership_id):
+        """Niveles por encima de la membresía en su cadena de supervisión"""
+        return len(self.supervision_chain(membership_id))
+
+    # ------------------------------------------------------------
+    # Por usuario
+    # ------------------------------------------------------------
+
+    def user_memberships(self, user_id, unit_id=None):
+        return [
+            membership_id for membership_id in self.memberships_by_user.get(user_id, [])
+            if unit_id is None or self.memberships[membership_id].unit_id == unit_id
+        ]
+
+    def subordinate_user_ids(self, user_id, unit_id=None):
+        """Usuarios bajo cualquiera de las membresías del usuario (a cualquier nivel)"""
+        user_ids = set()
+        for membership_id in self.user_memberships(user_id, unit_id):
+            user_ids.update(self.memberships[node].user_id for node in self.descendants(membership_id))
+        user_ids.discard(user_id)
+        return user_ids
+
+    def supervisor_user_ids(self, user_id, unit_id=None):
+        """Usuarios que supervisan (a cualquier nivel) alguna membresía del usuario"""
+        user_ids = set()
+        for membership_id in self.user_memberships(user_id, unit_id):
+            user_ids.update(self.memberships[node].user_id for node in self.ancestors(membership_id))
+        user_ids.discard(user_id)
+        return user_ids
+
+    def is_user_under(self, user_id, supervisor_user_id):
+        """¿Alguna membresía de user_id está bajo alguna de supervisor_user_id?"""
+        return user_id in self.subordinate_user_ids(supervisor_user_id)
+
+
+def _version():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(CLAVE_VERSION, version, timeout=None):
+            version = cache.get(CLAVE_VERSION) or version
+    return version
+
+
+def hierarchy_version():
+    """
+    Versión vigente de la jerarquía, para cachés derivadas (árboles, visibilidad
+    de leads) que deben invalidarse junto con el índice
+    """
+    return _version()
+
+
+def get_hierarchy_index():
+    """Índice vigente (caché del proceso, luego caché de Django, luego la BD)"""
+    try:
+        version = _version()
+        if _local['version'] == version:
+            return _local['index']
+        clave = f'{PREFIX}:indice:{version}'
+        index = cache.get(clave)
+    except Exception as e:
+        logger.warning(f"Caché de jerarquía no disponible: {e}")
+        return HierarchyIndex.build()
+
+    if index is None:
+        index = HierarchyIndex.build()
+        try:
+            cache.set(clave, index, timeout=HIERARCHY_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar la jerarquía en caché: {e}")
+
+    _local['version'], _local['index'] = version, index
+    return index
+
+
+def invalidar_jerarquia():
+    """
+    Cambia la versión del índice (el anterior queda huérfano y expira solo).
+    Se repite al confirmar la transacción para descartar índices construidos
+    por otros procesos con datos anteriores al commit.
+    """
+    _cambiar_version()
+    transaction.on_commit(_cambiar_version)
+
+
+def _cambiar_version():
+    _local['version'] = None
+    try:
+        cache.set(CLAVE_VERSION, uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        logger.warning(f"No se pudo invalidar la caché de jerarquía: {e}")
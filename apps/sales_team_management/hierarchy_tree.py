@@ -0,0 +1,323 @@
+# apps/sales_team_management/hierarchy_tree.py
+"""
+Árbol jerárquico de una unidad (o de todas) construido con dos consultas:
+relaciones que tocan la unidad y membresías involucradas. Los nodos son objetos
+compactos con __slots__ (sin instancias de modelos) que comparten la lista de
+jerarquía, la vista por equipo, HierarchyAnalyzer y el endpoint JSON; los
+atributos imitan a los de los modelos para que las plantillas no cambien.
+
+Las filas de cada unidad se guardan en la caché de Django bajo la misma versión
+que el índice de jerarquía (hierarchy_index), que invalidan los signals de relaciones,
+membresías, posiciones, unidades y usuarios.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from .hierarchy_index import PREFIX, hierarchy_version
+
+logger = logging.getLogger(__name__)
+
+HIERARCHY_CACHE_TIMEOUT = getattr(settings, 'HIERARCHY_CACHE_TIMEOUT', 60 * 60)
+
+# Filas de la lista de jerarquía que no son relaciones reales
+HEAD, UNASSIGNED = 'HEAD', 'UNASSIGNED'
+EXTRA_RELATION_TYPES = {HEAD: 'Cabeza de Jerarquía', UNASSIGNED: 'Sin Supervisor'}
+
+# Proceso actual: árboles deserializados de la versión vigente
+_local = {'version': None, 'trees': {}}
+
+
+class TreeUser:
+    __slots__ = ('id', 'username', 'first_name', 'last_name', 'is_active')
+
+    def __init__(self, id, username, first_name, last_name, is_active):
+        self.id, self.username, self.first_name, self.last_name, self.is_active = (
+            id, username, first_name, last_name, is_active
+        )
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_full_name(self):
+        return f'{self.first_name} {self.last_name}'.strip()
+
+
+class TreePosition:
+    __slots__ = ('id', 'code', 'name', 'hierarchy_level')
+
+    def __init__(self, id, code, name, hierarchy_level):
+        self.id, self.code, self.name, self.hierarchy_level = id, code, name, hierarchy_level
+
+
+class TreeUnit:
+    __slots__ = ('id', 'name', 'unit_type')
+
+    def __init__(self, id, name, unit_type):
+        self.id, self.name, self.unit_type = id, name, unit_type
+
+
+class MemberNode:
+    """Membresía con sus relaciones: children (es supervisor) y supervisors (es subordinado)"""
+    __slots__ = (
+        'id', 'user', 'position_type', 'organizational_unit', 'is_active', 'status',
+        'created_at', 'children', 'supervisors',
+    )
+
+    def __init__(self, id, user, position_type, organizational_unit, is_active, status, created_at):
+        self.id = id
+        self.user = user
+        self.position_type = position_type
+        self.organizational_unit = organizational_unit
+        self.is_active = is_active
+        self.status = status
+        self.created_at = created_at
+        self.children = []
+        self.supervisors = []
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class RelationEdge:
+    """Relación jerárquica (o fila HEAD / UNASSIGNED de la lista, sin supervisor)"""
+    __slots__ = (
+        'id', 'supervisor_membership', 'subordinate_membership', 'relation_type',
+        'authority_level', 'is_primary', 'is_active', 'created_at',
+    )
+
+    def __init__(self, id, supervisor_membership, subordinate_membership, relation_type,
+                 authority_level, is_primary, is_active, created_at):
+        self.id = id
+        self.supervisor_membership = supervisor_membership
+        self.subordinate_membership = subordinate_membership
+        self.relation_type = relation_type
+        self.authority_level = authority_level
+        self.is_primary = is_primary
+        self.is_active = is_active
+        self.created_at = created_at
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_relation_type_display(self):
+        from .models import HierarchyRelation
+        return EXTRA_RELATION_TYPES.get(self.relation_type) or dict(HierarchyRelation.RELATION_TYPES).get(
+            self.relation_type, self.relation_type
+        )
+
+
+class ForestNode:
+    """Nodo del árbol anidado: membresía y sus subordinados"""
+    __slots__ = ('membership', 'children')
+
+    def __init__(self, membership, children):
+        self.membership, self.children = membership, children
+
+
+class HierarchyTree:
+    """
+    Membresías de la unidad (activas e inactivas), membresías de otras unidades
+    que se relacionan con ellas y todas las relaciones que tocan la unidad
+    (activas e inactivas), indexadas por id
+    """
+    __slots__ = ('unit_id', 'members', 'relations')
+
+    def __init__(self, unit_id, members, relations):
+        self.unit_id = unit_id
+        self.members = members
+        self.relations = relations
+
+    @staticmethod
+    def load_rows(unit_id=None):
+        """
+        Dos consultas: relaciones que tocan la unidad y membresías involucradas.
+        Devuelve las filas planas (membresías, relaciones), que es lo que se guarda en caché.
+        """
+        from .models import HierarchyRelation, TeamMembership
+
+        relations = HierarchyRelation.objects.order_by('-created_at', '-id')
+        memberships = TeamMembership.objects.order_by('position_type__hierarchy_level', 'id')
+        if unit_id is not None:
+            relations = relations.filter(
+                Q(supervisor_membership__organizational_unit_id=unit_id) |
+                Q(subordinate_membership__organizational_unit_id=unit_id)
+            )
+        relation_rows = list(relations.values_list(
+            'id', 'supervisor_membership_id', 'subordinate_membership_id', 'relation_type',
+            'authority_level', 'is_primary', 'is_active', 'created_at',
+        ))
+
+        if unit_id is not None:
+            endpoints = {row[1] for row in relation_rows} | {row[2] for row in relation_rows}
+            memberships = memberships.filter(Q(organizational_unit_id=unit_id) | Q(id__in=endpoints))
+        membership_rows = list(memberships.values_list(
+            'id', 'is_active', 'status', 'created_at',
+            'user_id', 'user__username', 'user__first_name', 'user__last_name', 'user__is_active',
+            'position_type_id', 'position_type__code', 'position_type__name', 'position_type__hierarchy_level',
+            'organizational_unit_id', 'organizational_unit__name', 'organizational_unit__unit_type',
+        ))
+        return membership_rows, relation_rows
+
+    @classmethod
+    def build(cls, unit_id=None):
+        """Árbol de la unidad (None: todas) leído de la BD"""
+        return cls.from_rows(unit_id, *cls.load_rows(unit_id))
+
+    @classmethod
+    def from_rows(cls, unit_id, membership_rows, relation_rows):
+        """Arma los nodos enlazados a partir de las filas planas"""
+        users, positions, units, members = {}, {}, {}, {}
+        for row in membership_rows:
+            user = users.get(row[4]) or users.setdefault(row[4], TreeUser(*row[4:9]))
+            position = positions.get(row[9]) or positions.setdefault(row[9], TreePosition(*row[9:13]))
+            unit = units.get(row[13]) or units.setdefault(row[13], TreeUnit(*row[13:16]))
+            members[row[0]] = MemberNode(row[0], user, position, unit, row[1], row[2], row[3])
+
+        edges = []
+        for relation_id, supervisor_id, subordinate_id, *rest in relation_rows:
+            supervisor, subordinate = members.get(supervisor_id), members.get(subordinate_id)
+            if supervisor is None or subordinate is None:
+                continue
+            edge = RelationEdge(relation_id, supervisor, subordinate, *rest)
+            supervisor.children.append(edge)
+            subordinate.supervisors.append(edge)
+            edges.append(edge)
+
+        return cls(unit_id, members, edges)
+
+    # ------------------------------------------------------------
+    # Vistas sobre el árbol
+    # ------------------------------------------------------------
+
+    def in_unit(self, member):
+        return self.unit_id is None or member.organizational_unit.id == self.unit_id
+
+    def unit_members(self, active_only=False):
+        """Membresías de la unidad ordenadas por nivel jerárquico"""
+        return [
+            member for member in self.members.values()
+            if self.in_unit(member) and (member.is_active or not active_only)
+        ]
+
+    def unit_relations(self, active_only=False):
+        """Relaciones cuyo supervisor pertenece a la unidad"""
+        return [
+            edge for edge in self.relations
+            if self.in_unit(edge.supervisor_membership) and (edge.is_active or not active_only)
+        ]
+
+    def forest(self):
+        """
+        Árbol anidado de las membresías activas de la unidad según las relaciones
+        activas de sus supervisores; raíces: membresías sin supervisor en la unidad.
+        Quien tiene varios supervisores aparece bajo cada uno; un ciclo de reporte
+        se corta al volver a una membresía de la misma rama.
+        """
+        members = self.unit_members(active_only=True)
+        member_ids = {member.id for member in members}
+        children_of, subordinates = {}, set()
+        for edge in self.unit_relations(active_only=True):
+            children_of.setdefault(edge.supervisor_membership.id, []).append(edge.subordinate_membership)
+            subordinates.add(edge.subordinate_membership.id)
+
+        forest = [ForestNode(member, []) for member in members if member.id not in subordinates]
+        stack = [(node, frozenset((node.membership.id,))) for node in forest]
+        while stack:
+            node, branch = stack.pop()
+            for child in children_of.get(node.membership.id, ()):
+                if child.id in member_ids and child.id not in branch:
+                    child_node = ForestNode(child, [])
+                    node.children.append(child_node)
+                    stack.append((child_node, branch | {child.id}))
+        return forest
+
+    def list_rows(self):
+        """
+        Filas de la lista de jerarquía: todas las relaciones y, para cada membresía
+        de la unidad que no es subordinada en ninguna, una fila HEAD (nivel 1) o
+        UNASSIGNED. Primero usuarios y membresías inactivos, luego por fecha.
+        """
+        rows = list(self.relations)
+        with_supervisor = {edge.subordinate_membership.id for edge in self.relations}
+        for member in self.unit_members():
+            if member.id in with_supervisor:
+                continue
+            if member.position_type.hierarchy_level == 1:
+                rows.append(RelationEdge(
+                    f'head_{member.id}', None, member, HEAD, 'FULL', True, member.is_active, member.created_at
+                ))
+            else:
+                rows.append(RelationEdge(
+                    f'unassigned_{member.id}', None, member, UNASSIGNED, 'NONE', False, member.is_active, member.created_at
+                ))
+
+        rows.sort(key=lambda row: (
+            row.subordinate_membership.user.is_active,
+            row.subordinate_membership.is_active,
+            row.created_at,
+        ))
+        return rows
+
+    def as_json(self):
+        """Miembros activos de la unidad y relaciones activas de sus supervisores"""
+        return {
+            'members': [
+                {
+                    'id': member.id,
+                    'user_id': member.user.id,
+                    'user_name': member.user.get_full_name(),
+                    'username': member.user.username,
+                    'position': member.position_type.name,
+                    'position_code': member.position_type.code,
+                    'hierarchy_level': member.position_type.hierarchy_level,
+                }
+                for member in self.unit_members(active_only=True)
+            ],
+            'relations': [
+                {
+                    'id': edge.id,
+                    'supervisor_id': edge.supervisor_membership.id,
+                    'subordinate_id': edge.subordinate_membership.id,
+                    'relation_type': edge.relation_type,
+                    'is_primary': edge.is_primary,
+                    'authority_level': edge.authority_level,
+                }
+                for edge in self.unit_relations(active_only=True)
+            ],
+        }
+
+
+def get_hierarchy_tree(unit_id=None):
+    """
+    Árbol vigente de la unidad (None: todas), desde el proceso, la caché de Django o la BD.
+    En la caché de Django van las filas planas: el grafo de nodos enlazados en ambos
+    sentidos no se puede serializar con pickle en jerarquías profundas.
+    """
+    try:
+        version = hierarchy_version()
+        if _local['version'] != version:
+            _local['version'], _local['trees'] = version, {}
+        tree = _local['trees'].get(unit_id)
+        if tree is not None:
+            return tree
+        clave = f"{PREFIX}:arbol:{version}:{unit_id if unit_id is not None else 'todas'}"
+        rows = cache.get(clave)
+    except Exception as e:
+        logger.warning(f"Caché de jerarquía no disponible: {e}")
+        return HierarchyTree.build(unit_id)
+
+    if rows is None:
+        rows = HierarchyTree.load_rows(unit_id)
+        try:
+            cache.set(clave, rows, timeout=HIERARCHY_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar el árbol de jerarquía en caché: {e}")
+
+    tree = _local['trees'][unit_id] = HierarchyTree.from_rows(unit_id, *rows)
+    return tree
@@ -0,0 +1,151 @@
+# apps/sales_team_management/hierarchy_validator.py
+"""
+Validación de la jerarquía sobre el índice en memoria (hierarchy_index):
+ciclos de reporte de cualquier largo (componentes fuertemente conexas, Tarjan)
+y membresías con varios supervisores primarios, en tiempo lineal y sin una
+consulta por relación o por membresía.
+"""
+from collections import Counter, deque
+
+from .hierarchy_index import get_hierarchy_index
+
+
+class HierarchyValidator:
+    """
+    Audita todas las relaciones activas o solo las que afectan a una unidad.
+    Las aristas van del subordinado a su supervisor ("reporta a").
+    """
+
+    def __init__(self, index=None, unit_id=None):
+        self.index = index or get_hierarchy_index()
+        self.unit_id = unit_id
+
+    def _in_scope(self, membership_id):
+        return self.unit_id is None or self.index.memberships[membership_id].unit_id == self.unit_id
+
+    def _upward(self, membership_id):
+        return [relation.supervisor for relation in self.index.supervisor_relations(membership_id)]
+
+    def strongly_connected_components(self):
+        """Tarjan iterativo sobre todo el grafo (sin recursión: soporta cadenas largas)"""
+        index_of, lowlink = {}, {}
+        on_stack, stack, components = set(), [], []
+        counter = 0
+
+        for root in sorted(self.index.memberships):
+            if root in index_of:
+                continue
+            work = [(root, iter(self._upward(root)))]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+
+            while work:
+                node, neighbors = work[-1]
+                advanced = False
+                for neighbor in neighbors:
+                    if neighbor not in index_of:
+                        index_of[neighbor] = lowlink[neighbor] = counter
+                        counter += 1
+                        stack.append(neighbor)
+                        on_stack.add(neighbor)
+                        work.append((neighbor, iter(self._upward(neighbor))))
+                        advanced = True
+                        break
+                    if neighbor in on_stack:
+                        lowlink[node] = min(lowlink[node], index_of[neighbor])
+                if advanced:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index_of[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+        return components
+
+    def _cycle_path(self, component):
+        """Ciclo más corto que pasa por la menor membresía de la componente (BFS)"""
+        members = set(component)
+        start = min(component)
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for supervisor in self._upward(node):
+                if supervisor == start:
+                    path = [node]
+                    while parents[path[-1]] is not None:
+                        path.append(parents[path[-1]])
+                    return list(reversed(path)) + [start]
+                if supervisor in members and supervisor not in parents:
+                    parents[supervisor] = node
+                    queue.append(supervisor)
+        return [start, start]
+
+    def cycles(self):
+        """
+        Cada grupo de reporte circular: [{'members': [...], 'path': [a, b, ..., a]}].
+        Una componente con más de una membresía (o una auto-relación) contiene
+        al menos un ciclo; 'path' es uno concreto para mostrarlo.
+        """
+        result = []
+        for component in self.strongly_connected_components():
+            if len(component) == 1 and component[0] not in self._upward(component[0]):
+                continue
+            if not any(self._in_scope(member) for member in component):
+                continue
+            result.append({'members': sorted(component), 'path': self._cycle_path(component)})
+        return result
+
+    def memberships_reaching_cycle(self, cycles=None):
+        """Membresías desde las que, subiendo, se llega a un ciclo (las del ciclo y todas las de abajo)"""
+        reached = set()
+        queue = deque(member for cycle in (cycles if cycles is not None else self.cycles()) for member in cycle['members'])
+        reached.update(queue)
+        while queue:
+            node = queue.popleft()
+            for relation in self.index.subordinate_relations(node):
+                if relation.subordinate not in reached:
+                    reached.add(relation.subordinate)
+                    queue.append(relation.subordinate)
+        return {member for member in reached if self._in_scope(member)}
+
+    def multiple_primary(self):
+        """{membresía: supervisores primarios} para las que tienen más de uno"""
+        counts = Counter(
+            subordinate
+            for subordinate, relations in self.index.supervisors_of.items()
+            for relation in relations if relation.is_primary
+        )
+        return {
+            membership_id: count for membership_id, count in counts.items()
+            if count > 1 and self._in_scope(membership_id)
+        }
+
+    def validate(self):
+        """
+        Ciclos y supervisores primarios múltiples, con las membresías involucradas
+        cargadas en una consulta: {'cycles', 'multiple_primary', 'memberships'}
+        """
+        from .models import TeamMembership
+
+        cycles = self.cycles()
+        multiple_primary = self.multiple_primary()
+        involved = {member for cycle in cycles for member in cycle['members']} | set(multiple_primary)
+
+        return {
+            'cycles': cycles,
+            'multiple_primary': multiple_primary,
+            'memberships': TeamMembership.objects.select_related('user').in_bulk(involved) if involved else {},
+        }
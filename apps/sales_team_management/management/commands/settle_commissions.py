@@ -0,0 +1,86 @@
+# apps/sales_team_management/management/commands/settle_commissions.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.sales_team_management.commission_settlement import CommissionSettlementEngine
+from apps.sales_team_management.models import OrganizationalUnit
+
+
+class Command(BaseCommand):
+    help = (
+        'Liquida las comisiones de las ventas (VentaInmutable) de un rango de fechas '
+        'y las guarda en el libro de comisiones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', required=True, help='Primera fecha de venta (AAAA-MM-DD)')
+        parser.add_argument('--hasta', required=True, help='Última fecha de venta, incluida (AAAA-MM-DD)')
+        parser.add_argument(
+            '--unidad',
+            type=int,
+            default=None,
+            help='Solo ventas de esta unidad organizacional (ID)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Calcula la liquidación sin guardar nada',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['desde'])
+            date_to = date.fromisoformat(options['hasta'])
+        except ValueError:
+            raise CommandError('Las fechas deben tener el formato AAAA-MM-DD')
+        if date_from > date_to:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        unit = None
+        if options['unidad']:
+            unit = OrganizationalUnit.objects.filter(id=options['unidad']).first()
+            if unit is None:
+                raise CommandError(f"No existe la unidad {options['unidad']}")
+
+        scope = unit.name if unit else 'todas las unidades'
+        if options['dry_run']:
+            self.stdout.write(f'🧪 Simulando liquidación {date_from} a {date_to} ({scope}, no se guarda nada)...')
+        else:
+            self.stdout.write(f'💰 Liquidando comisiones {date_from} a {date_to} ({scope})...')
+
+        engine = CommissionSettlementEngine(date_from, date_to, organizational_unit=unit)
+        run, entries = engine.settle(dry_run=options['dry_run'])
+
+        self.show_report(run, entries)
+
+        if run.sales_skipped:
+            self.stdout.write(self.style.WARNING(f'⚠️ {run.sales_skipped} ventas sin liquidar:'))
+            for item in run.skipped_detail[:20]:
+                self.stdout.write(f"   - Venta {item['venta_id']}: {item['motivo']}")
+            if run.sales_skipped > 20:
+                self.stdout.write(f'   ... y {run.sales_skipped - 20} más')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✅ Simulación: {run.entries_created} comisiones se registrarían'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ Liquidación #{run.id}: {run.entries_created} comisiones registradas'
+            ))
+
+    def show_report(self, run, entries):
+        timings = run.timings
+        self.stdout.write(f'\n📊 Ventas liquidadas: {run.sales_processed}')
+        self.stdout.write(f'🧾 Comisiones: {run.entries_created} por un total de {run.total_amount}')
+
+        by_role = {}
+        for entry in entries:
+            by_role[entry.get_role_display()] = by_role.get(entry.get_role_display(), 0) + entry.amount
+        for role, amount in sorted(by_role.items()):
+            self.stdout.write(f'   - {role}: {amount}')
+
+        self.stdout.write(
+            f"⏱️ Carga {timings.get('carga', 0):.3f}s | Cálculo {timings.get('calculo', 0):.3f}s | "
+            f"Escritura {timings.get('escritura', 0):.3f}s | Total {timings.get('total', 0):.3f}s "
+            f"({timings.get('ventas_por_segundo', 0)} ventas/s)\n"
+        )
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.2 on 2026-10-18 11:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communications', '0016_lead_distribution_counter'),
+        ('sales_team_management', '0010_remove_supervisiondirecta_equipo_venta_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionSettlementRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_from', models.DateField(verbose_name='Ventas Desde')),
+                ('date_to', models.DateField(verbose_name='Ventas Hasta')),
+                ('status', models.CharField(choices=[('RUNNING', 'En Ejecución'), ('COMPLETED', 'Completada'), ('FAILED', 'Fallida')], default='RUNNING', max_length=20)),
+                ('sales_processed', models.PositiveIntegerField(default=0)),
+                ('sales_skipped', models.PositiveIntegerField(default=0)),
+                ('entries_created', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('timings', models.JSONField(blank=True, default=dict, help_text='Segundos por etapa (carga, cálculo, escritura, total)')),
+                ('skipped_detail', models.JSONField(blank=True, default=list, help_text='Ventas sin liquidar y motivo')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('executed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='commission_settlement_runs', to=settings.AUTH_USER_MODEL)),
+                ('organizational_unit', models.ForeignKey(blank=True, help_text='Unidad liquidada (vacío: todas)', null=True, on_delete=django.db.models.deletion.SET_NULL, to='sales_team_management.organizationalunit')),
+            ],
+            options={
+                'verbose_name': 'Liquidación de Comisiones',
+                'verbose_name_plural': 'Liquidaciones de Comisiones',
+                'db_table': 'sales_team_management_commissionsettlementrun',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommissionLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('SELLER', 'Vendedor'), ('SUPERVISOR', 'Supervisor')], max_length=20)),
+                ('relation_type', models.CharField(blank=True, max_length=20)),
+                ('sale_date', models.DateField()),
+                ('sale_amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('percentage', models.DecimalField(decimal_places=4, max_digits=7)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('commission_structure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='sales_team_management.commissionstructure')),
+                ('membership', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='sales_team_management.teammembership')),
+                ('organizational_unit', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='sales_team_management.organizationalunit')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='commission_entries', to=settings.AUTH_USER_MODEL)),
+                ('venta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='commission_entries', to='communications.ventainmutable')),
+                ('settlement_run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='sales_team_management.commissionsettlementrun')),
+            ],
+            options={
+                'verbose_name': 'Comisión Liquidada',
+                'verbose_name_plural': 'Comisiones Liquidadas',
+                'db_table': 'sales_team_management_commissionledgerentry',
+                'ordering': ['-sale_date', 'venta_id', 'id'],
+                'indexes': [models.Index(fields=['user', 'sale_date'], name='sales_team__user_id_e9eb1f_idx'), models.Index(fields=['organizational_unit', 'sale_date'], name='sales_team__organiz_b34315_idx')],
+                'constraints': [models.UniqueConstraint(fields=('venta', 'user'), name='unique_commission_per_sale_user')],
+            },
+        ),
+    ]
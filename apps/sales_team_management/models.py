@@ -181,6 +181,87 @@ class CommissionStructure(models.Model):
     def __str__(self):
         return f"{self.structure_name} - {self.organizational_unit.name}"
 
+    def get_commission_for_position(self, position_code):
+        """Porcentaje configurado para la posición (0 si no tiene)"""
+        try:
+            return Decimal(str(self.position_percentages.get(position_code) or 0))
+        except (ArithmeticError, ValueError):
+            return Decimal('0')
+
+
+class CommissionSettlementRun(models.Model):
+    """Ejecución de liquidación de comisiones sobre un rango de ventas"""
+    STATUS_CHOICES = [
+        ('RUNNING', 'En Ejecución'),
+        ('COMPLETED', 'Completada'),
+        ('FAILED', 'Fallida'),
+    ]
+
+    date_from = models.DateField(verbose_name='Ventas Desde')
+    date_to = models.DateField(verbose_name='Ventas Hasta')
+    organizational_unit = models.ForeignKey(
+        OrganizationalUnit, null=True, blank=True, on_delete=models.SET_NULL,
+        help_text='Unidad liquidada (vacío: todas)'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='RUNNING')
+    sales_processed = models.PositiveIntegerField(default=0)
+    sales_skipped = models.PositiveIntegerField(default=0)
+    entries_created = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    timings = models.JSONField(default=dict, blank=True, help_text='Segundos por etapa (carga, cálculo, escritura, total)')
+    skipped_detail = models.JSONField(default=list, blank=True, help_text='Ventas sin liquidar y motivo')
+    executed_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='commission_settlement_runs')
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Liquidación de Comisiones'
+        verbose_name_plural = 'Liquidaciones de Comisiones'
+        ordering = ['-started_at']
+        db_table = 'sales_team_management_commissionsettlementrun'
+
+    def __str__(self):
+        return f"Liquidación {self.date_from} a {self.date_to} ({self.get_status_display()})"
+
+
+class CommissionLedgerEntry(models.Model):
+    """Comisión liquidada a un usuario por una venta (libro de comisiones)"""
+    ROLES = [
+        ('SELLER', 'Vendedor'),
+        ('SUPERVISOR', 'Supervisor'),
+    ]
+
+    settlement_run = models.ForeignKey(CommissionSettlementRun, on_delete=models.CASCADE, related_name='entries')
+    venta = models.ForeignKey('communications.VentaInmutable', on_delete=models.CASCADE, related_name='commission_entries')
+    user = models.ForeignKey(User, on_delete=models.PROTECT, related_name='commission_entries')
+    membership = models.ForeignKey(TeamMembership, null=True, blank=True, on_delete=models.SET_NULL)
+    organizational_unit = models.ForeignKey(OrganizationalUnit, on_delete=models.PROTECT)
+    commission_structure = models.ForeignKey(CommissionStructure, null=True, blank=True, on_delete=models.SET_NULL)
+    role = models.CharField(max_length=20, choices=ROLES)
+    relation_type = models.CharField(max_length=20, blank=True)
+    sale_date = models.DateField()
+    sale_amount = models.DecimalField(max_digits=15, decimal_places=2)
+    percentage = models.DecimalField(max_digits=7, decimal_places=4)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    reason = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Comisión Liquidada'
+        verbose_name_plural = 'Comisiones Liquidadas'
+        ordering = ['-sale_date', 'venta_id', 'id']
+        db_table = 'sales_team_management_commissionledgerentry'
+        constraints = [
+            models.UniqueConstraint(fields=['venta', 'user'], name='unique_commission_per_sale_user'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'sale_date']),
+            models.Index(fields=['organizational_unit', 'sale_date']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.get_full_name()} - {self.amount} ({self.venta_id})"
+
 
 # ============================================================
 # LEGACY MODELS ELIMINADOS - MIGRACION 0008 COMPLETADA
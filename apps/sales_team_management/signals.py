@@ -0,0 +1,30 @@
+"""
+Signals para invalidar el índice y los árboles de jerarquía (hierarchy_index,
+hierarchy_tree) cuando cambian relaciones jerárquicas, membresías o los datos
+de posiciones, unidades y usuarios que guardan sus nodos
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .hierarchy_index import invalidar_jerarquia
+from .models import HierarchyRelation, OrganizationalUnit, PositionType, TeamMembership
+
+
+@receiver(post_save, sender=HierarchyRelation)
+@receiver(post_delete, sender=HierarchyRelation)
+@receiver(post_save, sender=TeamMembership)
+@receiver(post_delete, sender=TeamMembership)
+@receiver(post_save, sender=PositionType)
+@receiver(post_save, sender=OrganizationalUnit)
+def jerarquia_changed(sender, instance, **kwargs):
+    """Cualquier cambio de relación, membresía, posición o unidad invalida el índice"""
+    invalidar_jerarquia()
+
+
+@receiver(post_save, sender=get_user_model())
+def usuario_changed(sender, instance, update_fields=None, **kwargs):
+    """Nombre o estado del usuario (no el simple registro de último login)"""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidar_jerarquia()
@@ -5,6 +5,9 @@ from decimal import Decimal
 from typing import Dict, List, Tuple
 from django.db.models import Q
 from .models import TeamMembership, HierarchyRelation, CommissionStructure, PositionType
+from .hierarchy_index import get_hierarchy_index
+from .hierarchy_tree import get_hierarchy_tree
+from .hierarchy_validator import HierarchyValidator
 
 
 class CommissionCalculator:
@@ -13,9 +16,12 @@ class CommissionCalculator:
     según quién hace la venta y la estructura jerárquica
     """
     
-    def __init__(self, commission_structure: CommissionStructure):
+    def __init__(self, commission_structure: CommissionStructure, position_hierarchy: Dict[str, int] = None):
         self.commission_structure = commission_structure
-        self.position_hierarchy = self._build_position_hierarchy()
+        # La liquidación en lote pasa la jerarquía ya cargada (una vez por tipo de unidad)
+        self.position_hierarchy = (
+            position_hierarchy if position_hierarchy is not None else self._build_position_hierarchy()
+        )
     
     def _build_position_hierarchy(self) -> Dict[str, int]:
         """Construye diccionario de jerarquía de posiciones"""
@@ -61,7 +67,10 @@ class CommissionCalculator:
         Calcula la comisión total que recibe quien hace la venta
         (su nivel + todos los niveles inferiores)
         """
-        seller_level = seller_membership.position_type.hierarchy_level
+        return self.seller_commission_for_level(seller_membership.position_type.hierarchy_level)
+    
+    def seller_commission_for_level(self, seller_level: int) -> Decimal:
+        """Comisión de quien vende en el nivel dado (su nivel + todos los inferiores)"""
         positions_covered = self._get_positions_at_or_below(seller_level)
         
         total_commission = Decimal('0')
@@ -90,18 +99,12 @@ class CommissionCalculator:
         for supervisor_relation in supervision_chain:
             supervisor_membership = supervisor_relation.supervisor_membership
             
-            if supervisor_relation.relation_type == 'DIRECT':
-                # Supervisión directa: recibe comisiones de niveles saltados
-                commission = self._calculate_direct_supervision_commission(
-                    seller_membership, 
-                    supervisor_membership,
-                    supervisor_relation
-                )
-            else:
-                # Supervisión normal: recibe su comisión normal
-                commission = self.commission_structure.get_commission_for_position(
-                    supervisor_membership.position_type.code
-                )
+            commission = self.supervisor_commission(
+                supervisor_relation.relation_type,
+                supervisor_membership.position_type.code,
+                supervisor_membership.position_type.hierarchy_level,
+                seller_membership.position_type.hierarchy_level
+            )
             
             if commission > 0:
                 supervisor_distributions[supervisor_membership.user.id] = {
@@ -118,28 +121,24 @@ class CommissionCalculator:
     def _get_supervision_chain(self, membership: TeamMembership) -> List[HierarchyRelation]:
         """
         Obtiene la cadena de supervisión hacia arriba para una membresía
+        (recorrida en el índice de jerarquía; las relaciones se cargan en una consulta)
         """
-        chain = []
-        current_membership = membership
-        visited_memberships = set()  # Para evitar ciclos infinitos
-        
-        while current_membership and current_membership.id not in visited_memberships:
-            visited_memberships.add(current_membership.id)
-            
-            # Buscar supervisor directo (prioridad a supervisión directa)
-            supervisor_relations = HierarchyRelation.objects.filter(
-                subordinate_membership=current_membership,
-                is_active=True
-            ).order_by('relation_type')  # DIRECT aparece antes que NORMAL
-            
-            supervisor_relation = supervisor_relations.first()
-            if supervisor_relation:
-                chain.append(supervisor_relation)
-                current_membership = supervisor_relation.supervisor_membership
-            else:
-                break
+        chain_ids = [relation.id for relation in get_hierarchy_index().supervision_chain(membership.id)]
+        relations = HierarchyRelation.objects.select_related(
+            'supervisor_membership__user', 'supervisor_membership__position_type'
+        ).in_bulk(chain_ids)
         
-        return chain
+        return [relations[relation_id] for relation_id in chain_ids if relation_id in relations]
+    
+    def supervisor_commission(
+        self, relation_type: str, supervisor_code: str, supervisor_level: int, seller_level: int
+    ) -> Decimal:
+        """Comisión de un supervisor de la cadena según el tipo de relación"""
+        if relation_type == 'DIRECT':
+            # Supervisión directa: recibe comisiones de niveles saltados
+            return self._direct_supervision_commission(supervisor_code, supervisor_level, seller_level)
+        # Supervisión normal: recibe su comisión normal
+        return Decimal(str(self.commission_structure.get_commission_for_position(supervisor_code)))
     
     def _calculate_direct_supervision_commission(
         self, 
@@ -150,9 +149,14 @@ class CommissionCalculator:
         """
         Calcula comisión para supervisión directa (acumula niveles saltados)
         """
-        seller_level = seller_membership.position_type.hierarchy_level
-        supervisor_level = supervisor_membership.position_type.hierarchy_level
-        
+        return self._direct_supervision_commission(
+            supervisor_membership.position_type.code,
+            supervisor_membership.position_type.hierarchy_level,
+            seller_membership.position_type.hierarchy_level
+        )
+    
+    def _direct_supervision_commission(self, supervisor_code: str, supervisor_level: int, seller_level: int) -> Decimal:
+        """Comisión del supervisor + la de los niveles entre él y el vendedor"""
         # Niveles saltados (entre supervisor y subordinado)
         skipped_levels = []
         for code, level in self.position_hierarchy.items():
@@ -160,9 +164,7 @@ class CommissionCalculator:
                 skipped_levels.append(code)
         
         # Comisión del supervisor + comisiones de niveles saltados
-        total_commission = self.commission_structure.get_commission_for_position(
-            supervisor_membership.position_type.code
-        )
+        total_commission = self.commission_structure.get_commission_for_position(supervisor_code)
         
         for skipped_position in skipped_levels:
             total_commission += self.commission_structure.get_commission_for_position(skipped_position)
@@ -179,22 +181,16 @@ class HierarchyAnalyzer:
     def get_team_hierarchy_tree(organizational_unit):
         """
         Obtiene el árbol jerárquico completo de una unidad organizacional
+        (nodos de hierarchy_tree en lugar de instancias de modelos)
         """
-        memberships = TeamMembership.objects.filter(
-            organizational_unit=organizational_unit,
-            is_active=True,
-            status='ACTIVE'
-        ).select_related('user', 'position_type')
+        tree = get_hierarchy_tree(organizational_unit.id)
         
-        # Construir árbol jerárquico
+        # Construir árbol jerárquico (nodos del árbol compartido, sin consultas por membresía)
         hierarchy_tree = {}
         
-        for membership in memberships:
-            # Obtener subordinados
-            subordinates = HierarchyRelation.objects.filter(
-                supervisor_membership=membership,
-                is_active=True
-            ).select_related('subordinate_membership__user', 'subordinate_membership__position_type')
+        for membership in tree.unit_members(active_only=True):
+            if membership.status != 'ACTIVE':
+                continue
             
             hierarchy_tree[membership.id] = {
                 'membership': membership,
@@ -204,7 +200,7 @@ class HierarchyAnalyzer:
                         'relation_type': rel.relation_type,
                         'authority_level': rel.authority_level
                     }
-                    for rel in subordinates
+                    for rel in membership.children if rel.is_active
                 ]
             }
         
@@ -265,27 +261,26 @@ class HierarchyAnalyzer:
         """
         conflicts = []
         
-        # Buscar ciclos en jerarquía
+        # Buscar ciclos en jerarquía (Tarjan sobre el índice, lineal)
         memberships = TeamMembership.objects.filter(
             organizational_unit=organizational_unit,
             is_active=True
-        )
+        ).select_related('user')
+        validator = HierarchyValidator(unit_id=organizational_unit.id)
+        reaching_cycle = validator.memberships_reaching_cycle()
         
         for membership in memberships:
-            if HierarchyAnalyzer._has_circular_reporting(membership):
+            if membership.id in reaching_cycle:
                 conflicts.append({
                     'type': 'CIRCULAR_REPORTING',
                     'membership': membership,
                     'description': f'Usuario {membership.user.username} tiene reporte circular'
                 })
         
-        # Buscar múltiples supervisores primarios
+        # Buscar múltiples supervisores primarios (conteo agrupado)
+        multiple_primary = validator.multiple_primary()
         for membership in memberships:
-            primary_supervisors = HierarchyRelation.objects.filter(
-                subordinate_membership=membership,
-                is_primary=True,
-                is_active=True
-            ).count()
+            primary_supervisors = multiple_primary.get(membership.id, 0)
             
             if primary_supervisors > 1:
                 conflicts.append({
@@ -295,28 +290,6 @@ class HierarchyAnalyzer:
                 })
         
         return conflicts
-    
-    @staticmethod
-    def _has_circular_reporting(membership, visited=None):
-        """Verifica si existe reporte circular"""
-        if visited is None:
-            visited = set()
-        
-        if membership.id in visited:
-            return True
-        
-        visited.add(membership.id)
-        
-        supervisors = HierarchyRelation.objects.filter(
-            subordinate_membership=membership,
-            is_active=True
-        )
-        
-        for supervisor_rel in supervisors:
-            if HierarchyAnalyzer._has_circular_reporting(supervisor_rel.supervisor_membership, visited.copy()):
-                return True
-        
-        return False
 
 
 # Funciones de utilidad
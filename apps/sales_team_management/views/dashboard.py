@@ -10,6 +10,7 @@ from ..models import (
     OrganizationalUnit, PositionType, TeamMembership, 
     HierarchyRelation, CommissionStructure
 )
+from ..hierarchy_validator import HierarchyValidator
 from apps.real_estate_projects.models import Proyecto, Inmueble
 
 
@@ -193,17 +194,12 @@ def analyze_hierarchy_health():
     # Detectar inconsistencias básicas
     inconsistencies_count = 0
     
-    # Relaciones circulares
-    circular_relations = detect_circular_relations()
+    # Relaciones circulares y múltiples supervisores primarios (índice en memoria)
+    validator = HierarchyValidator()
+    circular_relations = validator.cycles()
     inconsistencies_count += len(circular_relations)
     
-    # Múltiples supervisores primarios
-    multiple_primary_supervisors = HierarchyRelation.objects.filter(
-        is_active=True,
-        is_primary=True
-    ).values('subordinate_membership').annotate(
-        count=Count('id')
-    ).filter(count__gt=1).count()
+    multiple_primary_supervisors = len(validator.multiple_primary())
     
     inconsistencies_count += multiple_primary_supervisors
     
@@ -221,26 +217,3 @@ def analyze_hierarchy_health():
         'multiple_primary_supervisors_count': multiple_primary_supervisors,
         'relation_type_stats': list(relation_type_stats)
     }
-
-
-def detect_circular_relations():
-    """Detecta relaciones circulares en la jerarquía"""
-    circular_relations = []
-    
-    relations = HierarchyRelation.objects.filter(is_active=True)
-    
-    for relation in relations:
-        # Buscar si existe una relación que cree un ciclo
-        reverse_relation = HierarchyRelation.objects.filter(
-            supervisor_membership=relation.subordinate_membership,
-            subordinate_membership=relation.supervisor_membership,
-            is_active=True
-        ).first()
-        
-        if reverse_relation:
-            circular_relations.append({
-                'relation_1': relation,
-                'relation_2': reverse_relation
-            })
-    
-    return circular_relations
\ No newline at end of file
@@ -3,7 +3,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Avg, Sum
+from django.db.models import Count, Avg, Sum
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.urls import reverse
@@ -16,6 +16,8 @@ from ..models import (
     OrganizationalUnit, PositionType, TeamMembership, 
     HierarchyRelation, CommissionStructure
 )
+from ..hierarchy_tree import get_hierarchy_tree
+from ..hierarchy_validator import HierarchyValidator
 from apps.accounts.models import User
 
 
@@ -98,108 +100,11 @@ def jerarquia_list(request):
         # Solo mostrar su equipo en la lista
         equipos = OrganizationalUnit.objects.filter(id=user_team.id)
     
-    # Obtener todas las membresías activas E INACTIVAS (para incluir usuarios públicos)
-    memberships = TeamMembership.objects.select_related(
-        'user',
-        'position_type',
-        'organizational_unit'
-    ).order_by(
-        'user__is_active',  # Usuarios inactivos primero (False < True)
-        'is_active',        # Membresías inactivas primero
-        'organizational_unit__name', 
-        'position_type__hierarchy_level'
-    )
-    
-    # Aplicar filtro por equipo si se especifica
-    if equipo_filter:
-        memberships = memberships.filter(organizational_unit_id=equipo_filter)
-    
-    # Obtener relaciones jerárquicas existentes (activas e inactivas)
-    existing_relations = HierarchyRelation.objects.select_related(
-        'supervisor_membership__user',
-        'supervisor_membership__position_type',
-        'supervisor_membership__organizational_unit',
-        'subordinate_membership__user',
-        'subordinate_membership__position_type',
-        'subordinate_membership__organizational_unit'
-    ).order_by(
-        'subordinate_membership__user__is_active',  # Usuarios inactivos primero
-        'is_active',  # Relaciones inactivas primero
-        'created_at'
-    )
-    
-    # Aplicar filtros a las relaciones existentes
-    if equipo_filter:
-        existing_relations = existing_relations.filter(
-            Q(supervisor_membership__organizational_unit_id=equipo_filter) |
-            Q(subordinate_membership__organizational_unit_id=equipo_filter)
-        )
-    
-    if relation_type_filter:
-        existing_relations = existing_relations.filter(relation_type=relation_type_filter)
-    
-    # Crear un diccionario de relaciones por subordinado para referencias rápidas
-    relations_dict = {}
-    for relation in existing_relations:
-        subordinate_id = relation.subordinate_membership.id
-        relations_dict[subordinate_id] = relation
-    
-    # Mostrar relaciones existentes Y miembros sin supervisor para poder asignarlos
-    all_hierarchy_items = []
-    processed_memberships = set()
-    
-    # Primero agregar todas las relaciones explícitas
-    for relation in existing_relations:
-        all_hierarchy_items.append(relation)
-        # Marcar subordinados como procesados (ya tienen supervisor)
-        processed_memberships.add(relation.subordinate_membership.id)
-    
-    # Luego agregar miembros que NO tienen supervisor asignado (para poder asignarlos)
-    for membership in memberships:
-        if membership.id not in processed_memberships:
-            # Determinar si este miembro debería tener supervisor
-            is_top_level = membership.position_type.hierarchy_level == 1  # Gerentes son nivel 1
-            
-            if is_top_level:
-                # Los gerentes/directores no necesitan supervisor - crear pseudo-relación como "Cabeza de Jerarquía"
-                pseudo_relation = type('PseudoRelation', (), {
-                    'id': f'head_{membership.id}',
-                    'supervisor_membership': None,
-                    'subordinate_membership': membership,
-                    'relation_type': 'HEAD',
-                    'authority_level': 'FULL',
-                    'is_active': membership.is_active,
-                    'is_primary': True,
-                    'created_at': membership.created_at,
-                    'get_relation_type_display': lambda: 'Cabeza de Jerarquía',
-                    'pk': f'head_{membership.id}'
-                })()
-                all_hierarchy_items.append(pseudo_relation)
-            else:
-                # Crear entrada para miembro sin supervisor (para asignación)
-                unassigned_item = type('UnassignedMember', (), {
-                    'id': f'unassigned_{membership.id}',
-                    'supervisor_membership': None,
-                    'subordinate_membership': membership,
-                    'relation_type': 'UNASSIGNED',
-                    'authority_level': 'NONE',
-                    'is_active': membership.is_active,
-                    'is_primary': False,
-                    'created_at': membership.created_at,
-                    'get_relation_type_display': lambda: 'Sin Supervisor',
-                    'pk': f'unassigned_{membership.id}'
-                })()
-                all_hierarchy_items.append(unassigned_item)
-    
-    # Ordenar para que usuarios inactivos aparezcan primero
-    def sort_key(item):
-        subordinate_user = item.subordinate_membership.user
-        user_priority = 0 if not subordinate_user.is_active else 1  # Inactivos primero (0 < 1)
-        membership_priority = 0 if not item.subordinate_membership.is_active else 1  # Membresías inactivas primero
-        time_priority = item.created_at
-        return (user_priority, membership_priority, time_priority)
-    
-    all_hierarchy_items.sort(key=sort_key)
+    # Árbol de la unidad filtrada o de todas (dos consultas, en caché hasta que
+    # cambie una relación o membresía): todas las relaciones, activas e
+    # inactivas, más una fila por miembro sin supervisor para poder asignarlo
+    tree = get_hierarchy_tree(int(equipo_filter) if equipo_filter.isdigit() else None)
+    all_hierarchy_items = tree.list_rows()
     
     # Aplicar filtro de tipo de relación
     if relation_type_filter:
@@ -208,7 +113,7 @@ def jerarquia_list(request):
     # Organizar por equipo
     relations_by_team = {}
     for item in all_hierarchy_items:
-        if hasattr(item, 'supervisor_membership') and item.supervisor_membership:
+        if item.supervisor_membership:
             team_name = item.supervisor_membership.organizational_unit.name
         else:
             team_name = item.subordinate_membership.organizational_unit.name
@@ -231,12 +136,10 @@ def jerarquia_list(request):
     page_obj = paginator.get_page(page_number)
     
     # Obtener estadísticas actualizadas
-    total_memberships = memberships.count()
-    
     stats = {
         'total_relations': len(all_hierarchy_items),
         'active_relations': len([item for item in all_hierarchy_items if item.is_active]),
-        'direct_relations': existing_relations.filter(relation_type='DIRECT').count(),
+        'direct_relations': len([item for item in all_hierarchy_items if item.relation_type == 'DIRECT']),
         'units_with_relations': equipos.count(),
     }
 
@@ -304,37 +207,19 @@ def jerarquia_equipo(request, equipo_id):
     
     equipo = get_object_or_404(OrganizationalUnit, id=equipo_id, is_active=True)
     
-    # Obtener todas las membresías del equipo
-    memberships = TeamMembership.objects.filter(
-        organizational_unit=equipo,
-        is_active=True
-    ).select_related('user', 'position_type').order_by('position_type__hierarchy_level')
-    
-    # Obtener relaciones jerárquicas del equipo
-    relations = HierarchyRelation.objects.filter(
-        supervisor_membership__organizational_unit=equipo,
-        is_active=True
-    ).select_related(
-        'supervisor_membership__user',
-        'subordinate_membership__user',
-        'supervisor_membership__position_type',
-        'subordinate_membership__position_type'
-    )
-    
-    # Construir árbol jerárquico
-    hierarchy_tree = build_hierarchy_tree(memberships, relations)
-    
-    # Obtener supervisión directa
-    direct_supervision = relations.filter(relation_type='DIRECT')
+    # Árbol del equipo (compartido con la lista y el endpoint JSON)
+    tree = get_hierarchy_tree(equipo.id)
+    memberships = tree.unit_members(active_only=True)
+    relations = tree.unit_relations(active_only=True)
     
     context = {
         'equipo': equipo,
         'memberships': memberships,
         'relations': relations,
-        'hierarchy_tree': hierarchy_tree,
-        'direct_supervision': direct_supervision,
-        'total_members': memberships.count(),
-        'total_relations': relations.count()
+        'hierarchy_tree': tree.forest(),
+        'direct_supervision': [relation for relation in relations if relation.relation_type == 'DIRECT'],
+        'total_members': len(memberships),
+        'total_relations': len(relations)
     }
     
     return render(request, 'sales_team_management/jerarquia/equipo_detail.html', context)
@@ -836,10 +721,15 @@ def analisis_jerarquia(request):
         subordinates_count=Count('subordinate_membership')
     ).order_by('-subordinates_count')[:10]
     
-    # Detectar posibles inconsistencias
-    inconsistencies = detect_hierarchy_inconsistencies()
+    # Detectar posibles inconsistencias (de todas las unidades o de ?unidad=<id>)
+    audited_unit = None
+    unidad_filter = request.GET.get('unidad', '')
+    if unidad_filter.isdigit():
+        audited_unit = get_object_or_404(OrganizationalUnit, pk=int(unidad_filter))
+    inconsistencies = detect_hierarchy_inconsistencies(audited_unit)
     
     context = {
+        'audited_unit': audited_unit,
         'total_units': total_units,
         'total_memberships': total_memberships,
         'total_relations': total_relations,
@@ -856,88 +746,37 @@ def analisis_jerarquia(request):
 # FUNCIONES AUXILIARES
 # ============================================================
 
-def build_hierarchy_tree(memberships, relations):
-    """Construye un árbol jerárquico a partir de membresías y relaciones"""
-    
-    # Crear diccionario de relaciones
-    relations_dict = {}
-    for relation in relations:
-        supervisor_id = relation.supervisor_membership.id
-        subordinate_id = relation.subordinate_membership.id
-        
-        if supervisor_id not in relations_dict:
-            relations_dict[supervisor_id] = []
-        relations_dict[supervisor_id].append(subordinate_id)
-    
-    # Encontrar raíces (usuarios sin supervisor)
-    all_subordinates = set()
-    for subordinates in relations_dict.values():
-        all_subordinates.update(subordinates)
-    
-    roots = []
-    for membership in memberships:
-        if membership.id not in all_subordinates:
-            roots.append(membership)
-    
-    # Construir árbol recursivamente
-    def build_node(membership):
-        node = {
-            'membership': membership,
-            'children': []
-        }
-        
-        subordinate_ids = relations_dict.get(membership.id, [])
-        for subordinate_id in subordinate_ids:
-            subordinate_membership = next(
-                (m for m in memberships if m.id == subordinate_id), None
-            )
-            if subordinate_membership:
-                node['children'].append(build_node(subordinate_membership))
-        
-        return node
-    
-    tree = [build_node(root) for root in roots]
-    return tree
-
-
-def detect_hierarchy_inconsistencies():
-    """Detecta inconsistencias en la estructura jerárquica"""
+def detect_hierarchy_inconsistencies(organizational_unit=None):
+    """
+    Detecta inconsistencias en la estructura jerárquica: ciclos de reporte de
+    cualquier largo y múltiples supervisores primarios (HierarchyValidator)
+    """
     
     inconsistencies = []
+    result = HierarchyValidator(
+        unit_id=organizational_unit.id if organizational_unit else None
+    ).validate()
+    memberships = result['memberships']
+    
+    def username(membership_id):
+        membership = memberships.get(membership_id)
+        return membership.user.username if membership else f'#{membership_id}'
     
     # Detectar relaciones circulares
-    relations = HierarchyRelation.objects.filter(is_active=True)
-    
-    for relation in relations:
-        # Buscar si existe una relación inversa
-        reverse_relation = HierarchyRelation.objects.filter(
-            supervisor_membership=relation.subordinate_membership,
-            subordinate_membership=relation.supervisor_membership,
-            is_active=True
-        ).first()
-        
-        if reverse_relation:
-            inconsistencies.append({
-                'type': 'circular',
-                'description': f'Relación circular entre {relation.supervisor_membership.user.username} y {relation.subordinate_membership.user.username}',
-                'relation_1': relation,
-                'relation_2': reverse_relation
-            })
+    for cycle in result['cycles']:
+        inconsistencies.append({
+            'type': 'circular',
+            'description': 'Relación circular: ' + ' → '.join(username(member) for member in cycle['path']),
+            'memberships': [memberships[member] for member in cycle['members'] if member in memberships],
+            'path': cycle['path'],
+        })
     
     # Detectar múltiples supervisores primarios
-    subordinates_with_multiple_primary = HierarchyRelation.objects.filter(
-        is_active=True,
-        is_primary=True
-    ).values('subordinate_membership').annotate(
-        count=Count('id')
-    ).filter(count__gt=1)
-    
-    for item in subordinates_with_multiple_primary:
-        membership = TeamMembership.objects.get(id=item['subordinate_membership'])
+    for membership_id, count in result['multiple_primary'].items():
         inconsistencies.append({
             'type': 'multiple_primary',
-            'description': f'{membership.user.username} tiene múltiples supervisores primarios',
-            'membership': membership
+            'description': f'{username(membership_id)} tiene {count} supervisores primarios',
+            'membership': memberships.get(membership_id),
         })
     
     return inconsistencies
@@ -953,43 +792,6 @@ def get_hierarchy_json(request, equipo_id):
     
     equipo = get_object_or_404(OrganizationalUnit, id=equipo_id)
     
-    memberships = TeamMembership.objects.filter(
-        organizational_unit=equipo,
-        is_active=True
-    ).select_related('user', 'position_type')
-    
-    relations = HierarchyRelation.objects.filter(
-        supervisor_membership__organizational_unit=equipo,
-        is_active=True
-    ).select_related(
-        'supervisor_membership__user',
-        'subordinate_membership__user'
-    )
-    
-    # Construir datos para JSON
-    members_data = []
-    for membership in memberships:
-        members_data.append({
-            'id': membership.id,
-            'user_id': membership.user.id,
-            'user_name': membership.user.get_full_name(),
-            'username': membership.user.username,
-            'position': membership.position_type.name,
-            'position_code': membership.position_type.code,
-            'hierarchy_level': membership.position_type.hierarchy_level
-        })
-    
-    relations_data = []
-    for relation in relations:
-        relations_data.append({
-            'id': relation.id,
-            'supervisor_id': relation.supervisor_membership.id,
-            'subordinate_id': relation.subordinate_membership.id,
-            'relation_type': relation.relation_type,
-            'is_primary': relation.is_primary,
-            'authority_level': relation.authority_level
-        })
-    
     return JsonResponse({
         'success': True,
         'equipo': {
@@ -997,8 +799,7 @@ def get_hierarchy_json(request, equipo_id):
             'name': equipo.name,
             'unit_type': equipo.unit_type
         },
-        'members': members_data,
-        'relations': relations_data
+        **get_hierarchy_tree(equipo.id).as_json()
     })
 
 
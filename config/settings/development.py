@@ -28,6 +28,11 @@ CSRF_TRUSTED_ORIGINS = [
 # MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
 # INTERNAL_IPS = ['127.0.0.1']
 
+# Sin workers en desarrollo: webhook y conversión de audios dentro de la petición
+# (en true, levantar process_webhook_queue y process_audio_queue)
+WEBHOOK_QUEUE_ENABLED = False
+AUDIO_TRANSCODE_QUEUE_ENABLED = False
+
 # Email backend for development
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -62,6 +62,20 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
+# Entrega de archivos de chat: 'nginx' (X-Accel-Redirect), 'sendfile' (X-Sendfile) o 'django'
+MEDIA_DELIVERY_MODE = os.getenv('MEDIA_DELIVERY_MODE', 'django')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/_protected_media/')
+
+# Colas de procesamiento en segundo plano (tabla en la BD, sin broker).
+# Con la cola activa, los eventos solo se encolan: los workers deben estar corriendo
+#   python manage.py process_webhook_queue --workers 2   (callbacks del webhook de WhatsApp)
+#   python manage.py process_audio_queue --workers 1     (conversión de audios a OGG)
+# Con la cola desactivada se procesan dentro de la misma petición (sin workers)
+# Ponderadores con fecha de activación/desactivación: precio_final se actualiza por cron
+#   * * * * * python manage.py recalcular_precios --programados
+WEBHOOK_QUEUE_ENABLED = os.getenv('WEBHOOK_QUEUE_ENABLED', 'true').lower() == 'true'
+AUDIO_TRANSCODE_QUEUE_ENABLED = os.getenv('AUDIO_TRANSCODE_QUEUE_ENABLED', 'true').lower() == 'true'
+
 # Logging
 LOGGING = {
     'version': 1,